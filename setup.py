@@ -20,6 +20,13 @@ setup(
         "requests",
         "python-dotenv",
     ],
+    extras_require={
+        "async": ["aiohttp"],
+        "fast": ["orjson"],
+        "zstd": ["zstandard"],
+        "pandas": ["numpy", "pandas"],
+        "arrow": ["numpy", "pyarrow"],
+    },
     entry_points={
         'console_scripts': [
             'py-insee-setup=pyinsee.setup_cli:main',
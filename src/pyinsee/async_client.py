@@ -0,0 +1,338 @@
+"""This module contains the asyncio INSEE API client.
+
+`AsyncInseeClient` has the same surface as `InseeClient` (`get_bulk`,
+`get_by_number` and `iter_bulk`) but runs its requests on an event loop, so
+many lookups can be in flight at once. The number of concurrent requests is
+bounded by `concurrency`.
+
+It requires the optional `aiohttp` dependency:
+
+    pip install pyinsee[async]
+
+Example:
+    import asyncio
+    from pyinsee.async_client import AsyncInseeClient
+
+    async def main(sirens):
+        async with AsyncInseeClient(concurrency=20) as client:
+            return await asyncio.gather(*(
+                client.get_by_number(data_type="siren", id_code=siren)
+                for siren in sirens
+            ))
+
+    results = asyncio.run(main(["000325175", "005520135"]))
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import time
+from typing import AsyncIterator, Callable, TypeVar
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+from . import config
+from .auth import TokenManager
+from .cache import ResponseCache
+from .config import RESPONSE_CODES
+from .insee_client import BulkParams, InseeClient
+from .logger import log_request, logger
+from .records import RECORD_TYPES, to_records
+from .store import STORE_HEADER, RecordStore
+from .transport import RequestAttempts, Transport
+
+T = TypeVar("T")
+
+
+async def _in_thread(func: Callable[..., T], *args: object) -> T:
+    """Run a blocking call (file lock, SQLite, disk read) in the default executor."""
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, *args))
+
+
+class AsyncInseeClient:
+    """Asyncio client for the INSEE API with bounded concurrency.
+
+    Query validation, URL building and response unwrapping are delegated to an
+    `InseeClient`, so both clients accept and return exactly the same things.
+
+    Args:
+        content_type (str, optional): The content type of the API response.
+        Defaults to "json".
+        concurrency (int, optional): The maximum number of requests in flight.
+        Defaults to 10.
+        base_url (str | None, optional): The API base URL. Defaults to INSEE_DATA_URL.
+        transport (Transport | None, optional): The transport used by the
+        underlying sync client. Defaults to the shared transport.
+        token_manager (TokenManager | None, optional): The OAuth token manager.
+        Defaults to the process-wide shared token manager.
+        cache (ResponseCache | None, optional): A persistent cache for
+        `get_by_number` results. Defaults to None (no cache).
+        store (RecordStore | None, optional): A local record store for
+        `get_by_number` lookups, see `InseeClient`. Defaults to None (no store).
+
+    Attributes:
+        content_type (str): The content type of the API response.
+        concurrency (int): The maximum number of requests in flight.
+    """
+
+    def __init__(self,
+                 content_type : str = "json",
+                 concurrency : int = 10,
+                 base_url : str | None = None,
+                 transport : Transport | None = None,
+                 token_manager : TokenManager | None = None,
+                 cache : ResponseCache | None = None,
+                 store : RecordStore | None = None) -> None:
+        """Initialize the AsyncInseeClient class.
+
+        Raises:
+            ImportError: If aiohttp is not installed.
+            ValueError: If the content type is not 'json' or 'csv' or if
+            `concurrency` is not a positive integer.
+        """
+        if aiohttp is None:
+            msg = "AsyncInseeClient requires aiohttp. Install it with `pip install pyinsee[async]`."
+            raise ImportError(msg)
+        if concurrency < 1:
+            msg = "concurrency must be a positive integer."
+            raise ValueError(msg)
+
+        self._client = InseeClient(content_type=content_type,
+                                   transport=transport,
+                                   base_url=base_url,
+                                   token_manager=token_manager,
+                                   cache=cache,
+                                   store=store)
+        self.content_type = content_type
+        self.concurrency = concurrency
+        self._session: aiohttp.ClientSession | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    async def __aenter__(self) -> AsyncInseeClient:
+        """Enter the async context manager."""
+        return self
+
+    async def __aexit__(self, *exc_info: object) -> None:
+        """Close the client when leaving the async context manager."""
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the HTTP session and its connections."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Get the HTTP session, creating it on the running event loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.concurrency)
+            timeout = aiohttp.ClientTimeout(sock_connect=config.HTTP_CONNECT_TIMEOUT,
+                                            sock_read=config.HTTP_READ_TIMEOUT)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        return self._session
+
+    async def _get_request(self, url: str, context: str) -> tuple[int, bytes, dict]:
+        """Get the request for the API.
+
+        Args:
+            url (str): The URL for the API request.
+            context (str): The context of the API request.
+
+        Returns:
+            tuple[int, bytes, dict]: The status code, body and headers of the response.
+
+        Raises:
+            InseeRequestError: If the request still fails once the retries run out.
+        """
+        session = self._get_session()
+        async with self._semaphore:
+            log_request(logging.INFO, "Requesting %s", context, method="GET", url=url)
+            token = await self._get_token()
+            status, body, headers = await self._send(session, url, token)
+            if status == RESPONSE_CODES["UNAUTHORIZED"]:
+                # The token was revoked or expired early: refresh it and retry once
+                await _in_thread(self._client.token_manager.invalidate, token)
+                status, body, headers = await self._send(session, url, await self._get_token())
+        if status >= RESPONSE_CODES["BAD_REQUEST"]:
+            logger.error("HTTP error occurred: %d for url: %s", status, url)
+        return status, body, headers
+
+    async def _get_token(self) -> str:
+        """Get a valid API token, refreshing it in a worker thread if needed."""
+        token = self._client.token_manager.cached_token()
+        if token is None:
+            token = await _in_thread(self._client.token_manager.get_token)
+        return token
+
+    async def _send(self, session: aiohttp.ClientSession, url: str, token: str) -> tuple[int, bytes, dict]:
+        """Send one GET request with the given token and read the whole body.
+
+        The request waits for the rate limiter of the sync client's transport,
+        and its attempts are retried and reported by `RequestAttempts`, like
+        the requests of the sync client.
+        """
+        headers = {**self._client.headers, "X-INSEE-Api-Key-Integration": token}
+        transport = self._client.transport
+        attempts = RequestAttempts(transport, "GET", url)
+
+        while True:
+            attempts.start(waited=await transport.rate_limiter.acquire_async())
+            status = response_headers = error = None
+            body = b""
+            try:
+                async with session.get(url, headers=headers) as response:
+                    status, body, response_headers = response.status, await response.read(), dict(response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+                error = err
+            finally:
+                attempts.end(status=status, size=len(body))
+
+            delay = attempts.next_delay(status=status, headers=response_headers, error=error)
+            if delay is None:
+                return status, body, response_headers
+            if attempts.pause_limiter:
+                # The next acquire waits for the pause, which may lock the limiter's state file
+                await _in_thread(transport.rate_limiter.pause, delay)
+            else:
+                await asyncio.sleep(delay)
+
+    async def get_bulk(self,
+                       data_type: str = "siren",
+                       as_records: bool = False,
+                       **kwargs: BulkParams) -> tuple | None:
+        """Get bulk data (SIREN or SIRET) from INSEE API.
+
+        See `InseeClient.get_bulk` for the accepted query parameters and `as_records`.
+
+        Raises:
+            ValueError: If the query parameters are not valid or if `data_type` is not valid.
+            InseeRequestError: If the request still fails once the retries run out.
+
+        Returns:
+            tuple | None: The records and the header (or the raw content and the
+            headers for non-JSON content types), or None if the request failed.
+        """
+        url = self._client._build_bulk_url(data_type=data_type, query_kwargs=kwargs)  # noqa: SLF001
+        return await self._fetch_bulk_page(data_type=data_type, url=url, as_records=as_records)
+
+    async def _fetch_bulk_page(self, data_type: str, url: str, as_records: bool = False) -> tuple | None:
+        """Get one bulk page from its URL (see `get_bulk`)."""
+        context = f"Fetching bulk {data_type.upper()} data from {url} | [{self.content_type}]"
+
+        status_code, body, headers = await self._get_request(url=url, context=context)
+
+        if self.content_type == "json":
+            page = self._client._unwrap_bulk(data_type=data_type,  # noqa: SLF001
+                                             status_code=status_code,
+                                             payload=self._client._decode_json(body))  # noqa: SLF001
+            if as_records and page is not None:
+                return to_records(data_type, page[0]), page[1]
+            return page
+
+        # Return raw content for non-JSON content types
+        return body, headers
+
+    async def iter_bulk(self,
+                        data_type: str = "siren",
+                        by_page: bool = False,
+                        **kwargs: BulkParams) -> AsyncIterator[dict | tuple[list, dict]]:
+        """Iterate over every result of a bulk query by following the cursor.
+
+        See `InseeClient.iter_bulk`.
+
+        Raises:
+            ValueError: If the query parameters are not valid, if the client
+            content type is not "json" or if a page after the first one fails.
+
+        Yields:
+            dict | tuple[list, dict]: A record, or a `(records, header)` page.
+        """
+        cursor = self._client._prepare_cursor(kwargs)  # noqa: SLF001
+        prepared = self._client.prepare_bulk(data_type, **kwargs)
+        page_number = 0
+
+        while True:
+            start = time.monotonic()
+            response = await self._fetch_bulk_page(data_type=data_type, url=prepared.url(curseur=cursor))
+            if response is None:
+                if page_number == 0:
+                    return
+                msg = f"Failed to fetch page {page_number + 1} of bulk {data_type.upper()} data (curseur={cursor})."
+                raise ValueError(msg)
+
+            records, header = response
+            page_number += 1
+            self._client.transport.metrics.emit("page", data_type=data_type, page=page_number,
+                                                records=len(records), elapsed=time.monotonic() - start)
+            if by_page:
+                if records:
+                    # The last page of a cursor may be empty: there is nothing to hand over
+                    yield records, header
+            else:
+                for record in records:
+                    yield record
+
+            cursor = self._client._next_cursor(records, header, cursor)  # noqa: SLF001
+            if cursor is None:
+                logger.info("Reached the end of the %s cursor after %d page(s).",
+                            data_type.upper(), page_number)
+                return
+
+    async def get_by_number(self,
+                            data_type: str = "siren",
+                            id_code : str | int | None = None,
+                            as_record: bool = False,
+                            **kwargs: dict) -> tuple | None:
+        """Get legal data from INSEE API for a given siren or siret number.
+
+        See `InseeClient.get_by_number` for the accepted query parameters and `as_record`.
+
+        Raises:
+            ValueError: If the query parameters are not valid or if `data_type` is not valid.
+            InseeRequestError: If the request still fails once the retries run out.
+
+        Returns:
+            tuple | None: The record and the header, or None if the request failed.
+        """
+        url = self._client._build_number_url(data_type=data_type,  # noqa: SLF001
+                                             id_code=id_code,
+                                             query_kwargs=kwargs)
+        metrics = self._client.transport.metrics
+        store = self._client.store
+        use_store = store is not None and not kwargs
+        if use_store:
+            record = await _in_thread(store.get, data_type, id_code)
+            metrics.emit("cache_hit" if record is not None else "cache_miss", source="store", data_type=data_type)
+            if record is not None:
+                return (RECORD_TYPES[data_type](record) if as_record else record), dict(STORE_HEADER)
+
+        cache = self._client.cache
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.make_key(data_type, id_code, kwargs)
+            cached = await _in_thread(cache.get, cache_key)
+            metrics.emit("cache_hit" if cached is not None else "cache_miss", source="cache", data_type=data_type)
+            if cached is not None:
+                return (RECORD_TYPES[data_type](cached[0]), cached[1]) if as_record else cached
+
+        context = f"Fetching {data_type.upper()} data from {url} | [{self.content_type}]"
+
+        status_code, body, _ = await self._get_request(url=url, context=context)
+        if status_code >= RESPONSE_CODES["BAD_REQUEST"]:
+            logger.error(" Error fetching legal data for siren number %s", str(id_code))
+            return None
+
+        result = self._client._unwrap_by_number(data_type=data_type,  # noqa: SLF001
+                                                payload=self._client._decode_json(body))  # noqa: SLF001
+        if cache_key is not None and result is not None:
+            await _in_thread(cache.set, cache_key, *result)
+        if use_store and result is not None:
+            await _in_thread(store.put, data_type, result[0])
+        if as_record and result is not None:
+            return RECORD_TYPES[data_type](result[0]), result[1]
+        return result
@@ -0,0 +1,239 @@
+"""OAuth token management for the INSEE API client.
+
+The token manager keeps the access token returned by the INSEE `/token`
+endpoint together with its expiry. It refreshes the token shortly before it
+expires and shares it between processes through an on-disk cache guarded by a
+lock file, so a fleet of workers makes a single token request.
+
+Example:
+    from pyinsee.auth import TokenManager
+    from pyinsee.insee_client import InseeClient
+
+    token_manager = TokenManager(cache_path="/shared/insee_token.json")
+    client = InseeClient(token_manager=token_manager)
+"""
+from __future__ import annotations
+
+import base64
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from . import config
+from .config import RESPONSE_CODES
+from .logger import logger
+from .transport import Transport, get_default_transport
+from .utils import file_lock
+
+# Default of the arguments where None has a meaning of its own
+_FROM_SETTINGS = object()
+
+
+class TokenManager:
+    """Expiry-aware OAuth token cache.
+
+    Args:
+        client_key (str, optional): The INSEE consumer key. Defaults to CLIENT_KEY.
+        client_secret (str, optional): The INSEE consumer secret. Defaults to CLIENT_SECRET.
+        token_url (str, optional): The token endpoint. Defaults to INSEE_TOKEN_URL.
+        cache_path (str | Path | None, optional): The on-disk token cache shared
+            between processes, or None to keep the token in memory only.
+            Defaults to INSEE_TOKEN_CACHE.
+        refresh_margin (float, optional): Refresh the token this many seconds
+            before it expires. Defaults to TOKEN_REFRESH_MARGIN.
+        fallback_api_key (str | None, optional): The key used when the OAuth flow
+            fails. Defaults to API_KEY.
+        transport (Transport | None, optional): The transport used for the token
+            request. Defaults to the shared transport.
+    """
+
+    def __init__(self,
+                 client_key: str | None = None,
+                 client_secret: str | None = None,
+                 token_url: str | None = None,
+                 cache_path: str | Path | None = _FROM_SETTINGS,
+                 refresh_margin: float | None = None,
+                 fallback_api_key: str | None = _FROM_SETTINGS,
+                 transport: Transport | None = None) -> None:
+        """Initialize the token manager without requesting a token."""
+        settings = config.get_settings()
+        client_key = client_key or settings.client_key
+        client_secret = client_secret or settings.client_secret
+        token_url = token_url or settings.insee_token_url
+        if cache_path is _FROM_SETTINGS:
+            cache_path = settings.insee_token_cache
+        if refresh_margin is None:
+            refresh_margin = settings.token_refresh_margin
+        if fallback_api_key is _FROM_SETTINGS:
+            fallback_api_key = settings.api_key
+        if not client_key or not client_secret:
+            msg = "One or more required environment variables are missing."
+            raise ValueError(msg)
+
+        self.token_url = token_url
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.refresh_margin = refresh_margin
+        self.fallback_api_key = fallback_api_key
+        self.transport = transport
+        self._credentials = base64.b64encode(
+            f"{client_key}:{client_secret}".encode()).decode("utf-8")
+        self._token: str | None = None
+        self._expires_at: float = 0.0
+        self._lock = threading.Lock()
+
+    def _is_fresh(self, expires_at: float) -> bool:
+        """Check whether a token expiring at `expires_at` can still be used."""
+        return time.time() < expires_at - self.refresh_margin
+
+    def cached_token(self) -> str | None:
+        """Get the in-memory token if it is still fresh, without any I/O.
+
+        Returns:
+            str | None: The token, or None if it must be (re)fetched.
+        """
+        if self._token is not None and self._is_fresh(self._expires_at):
+            return self._token
+        return None
+
+    def get_token(self) -> str:
+        """Get a valid token, refreshing it if it is about to expire.
+
+        Returns:
+            str: The access token (or the fallback API key).
+
+        Raises:
+            ValueError: If no token can be obtained and no fallback key is set.
+        """
+        token = self.cached_token()
+        if token is not None:
+            return token
+
+        with self._lock:
+            # Another thread may have refreshed the token while we waited
+            token = self.cached_token()
+            if token is not None:
+                return token
+
+            if self.cache_path is None:
+                self._token, self._expires_at = self._fetch_token()
+                return self._token
+
+            with file_lock(self.cache_path.with_suffix(".lock")):
+                # Another process may have refreshed the token while we waited
+                cached = self._read_cache()
+                if cached is not None and self._is_fresh(cached[1]):
+                    logger.debug("Using the cached INSEE token from %s.", self.cache_path)
+                    self._token, self._expires_at = cached
+                    return self._token
+
+                self._token, self._expires_at = self._fetch_token()
+                self._write_cache(self._token, self._expires_at)
+                return self._token
+
+    def invalidate(self, token: str | None = None) -> None:
+        """Discard a token rejected by the API (401), so the next call refreshes it.
+
+        Args:
+            token (str | None, optional): The rejected token. If another thread
+            already replaced it, nothing is discarded. Defaults to the current token.
+        """
+        with self._lock:
+            if token is not None and token != self._token:
+                return
+            logger.info("Discarding the rejected INSEE token.")
+            self._token = None
+            self._expires_at = 0.0
+            if self.cache_path is not None:
+                with file_lock(self.cache_path.with_suffix(".lock")):
+                    cached = self._read_cache()
+                    if cached is not None and (token is None or cached[0] == token):
+                        self.cache_path.unlink(missing_ok=True)
+
+    def _fetch_token(self) -> tuple[str, float]:
+        """Fetch a new token by authenticating with the INSEE API.
+
+        Returns:
+            tuple[str, float]: The token and its expiry as a UNIX timestamp.
+
+        Raises:
+            ValueError: If the response is invalid, or if authentication fails
+            and no fallback API key is set.
+        """
+        logger.info("Fetching new API key from INSEE.")
+        headers = {
+            "Authorization": f"Basic {self._credentials}",
+            "Content-Type": "application/x-www-form-urlencoded",
+        }
+        data = {"grant_type": "client_credentials"}
+        transport = self.transport if self.transport is not None else get_default_transport()
+
+        start = time.monotonic()
+        response = transport.post(self.token_url, headers=headers, data=data, rate_limited=False)
+        transport.metrics.emit("token_refresh", status=response.status_code, elapsed=time.monotonic() - start)
+
+        if response.status_code == RESPONSE_CODES["OK"]:
+            try:
+                data = response.json()
+            except json.JSONDecodeError as err:
+                logger.exception("Failed to decode JSON response for API key.")
+                msg = "Invalid API response."
+                raise ValueError(msg) from err
+            expires_in = data.get("expires_in")
+            logger.info("API key retrieved successfully (%s, expires in %s seconds).",
+                        data.get("token_type"), expires_in)
+            expires_at = time.time() + float(expires_in) if expires_in else float("inf")
+            return data.get("access_token"), expires_at
+
+        msg = f"Failed to authenticate with INSEE: {response.status_code}, {response.text}"
+        logger.error(msg)
+        msg = "Failed to authenticate with INSEE API. setting the api key from env variable."
+        logger.warning(msg)
+
+        # setting up the API key from the env variable if the retrieval fails
+        if self.fallback_api_key:
+            return self.fallback_api_key, float("inf")
+        msg = "API_KEY is not set in the environment variables."
+        raise ValueError(msg)
+
+    def _read_cache(self) -> tuple[str, float] | None:
+        """Read the token shared by other processes, if any."""
+        try:
+            with self.cache_path.open() as f:
+                cached = json.load(f)
+            return cached["access_token"], float(cached["expires_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_cache(self, token: str, expires_at: float) -> None:
+        """Atomically write the token for other processes (readable by the owner only)."""
+        if expires_at == float("inf"):
+            # Never share the fallback API key (or a token without expiry) through the cache
+            return
+        tmp_path = self.cache_path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump({"access_token": token, "expires_at": expires_at}, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            logger.warning("Could not write the INSEE token cache %s: %s", self.cache_path, e)
+
+
+_default_token_manager: TokenManager | None = None
+_default_token_manager_lock = threading.Lock()
+
+
+def get_default_token_manager() -> TokenManager:
+    """Get the process-wide token manager shared by clients created without one.
+
+    Returns:
+        TokenManager: The shared token manager, created on first use.
+    """
+    global _default_token_manager  # noqa: PLW0603
+    if _default_token_manager is None:
+        with _default_token_manager_lock:
+            if _default_token_manager is None:
+                _default_token_manager = TokenManager()
+    return _default_token_manager
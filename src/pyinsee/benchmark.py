@@ -0,0 +1,233 @@
+"""Startup benchmark: import and first request latency.
+
+Short-lived workers and the CLI pay for the package start-up before they do
+anything useful. `measure_startup` runs a fresh interpreter several times and
+times, in each one:
+
+    interpreter  - until the first line of the script runs (measured outside)
+    import       - `import pyinsee.insee_client`
+    client       - `InseeClient(...)`
+    first_request - the first `get_bulk` (or `get_by_number`), token included
+
+and reports the median, min and max of each phase (in milliseconds), so the
+numbers can be tracked from one version to the next (`--output` appends them
+to a JSON lines file).
+
+`measure_record_memory` compares the memory held by decoded API records
+(nested dicts) with the compact `UniteLegale` records, on a synthetic page.
+
+Example:
+    python -m pyinsee.benchmark --runs 10 --output startup.jsonl
+    python -m pyinsee.benchmark --backend mirror --id 000325175
+    python -m pyinsee.benchmark --memory --records 20000
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import gc
+import json
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable
+
+from ._version import __version__
+
+# Phases timed in the child interpreter, in order
+PHASES = ("import", "client", "first_request")
+
+# Script run by the child interpreter, printing the phase durations as JSON
+_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from pyinsee.insee_client import InseeClient
+imported = time.perf_counter()
+client = InseeClient(backend={backend!r})
+created = time.perf_counter()
+if {id_code!r}:
+    result = client.get_by_number(data_type={data_type!r}, id_code={id_code!r})
+else:
+    result = client.get_bulk(data_type={data_type!r}, nombre=1)
+done = time.perf_counter()
+print(json.dumps({{"import": imported - start, "client": created - imported,
+                  "first_request": done - created, "ok": result is not None}}))
+"""
+
+
+def measure_startup(data_type: str = "siren",
+                    id_code: str | None = None,
+                    backend: str = "api",
+                    runs: int = 5) -> dict:
+    """Time the start-up of fresh interpreters up to their first request.
+
+    Args:
+        data_type (str, optional): The type of data of the first request, either
+        "siren" or "siret". Defaults to "siren".
+        id_code (str | None, optional): Look this number up with `get_by_number`
+        instead of fetching one bulk record. Defaults to None.
+        backend (str, optional): The client backend, "api" or "mirror". Defaults to "api".
+        runs (int, optional): The number of interpreters started. Defaults to 5.
+
+    Raises:
+        ValueError: If `runs` is not positive.
+        RuntimeError: If a child interpreter fails.
+
+    Returns:
+        dict: The phases' median, min and max in milliseconds (`total` is the
+        whole child process, `interpreter` its start-up before the script),
+        with the settings of the run.
+    """
+    if runs < 1:
+        msg = "runs must be a positive integer."
+        raise ValueError(msg)
+    script = _SCRIPT.format(backend=backend, data_type=data_type, id_code=id_code)
+    samples: dict[str, list[float]] = {phase: [] for phase in ("total", "interpreter", *PHASES)}
+    failures = 0
+    for _ in range(runs):
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, check=False)
+        total = time.perf_counter() - start
+        if completed.returncode != 0:
+            msg = f"The benchmark interpreter failed: {completed.stderr.strip()[-2000:]}"
+            raise RuntimeError(msg)
+        timings = json.loads(completed.stdout.strip().splitlines()[-1])
+        failures += not timings.pop("ok")
+        samples["total"].append(total)
+        samples["interpreter"].append(total - sum(timings.values()))
+        for phase in PHASES:
+            samples[phase].append(timings[phase])
+
+    return {
+        "time": dt.datetime.now().isoformat(timespec="seconds"),
+        "version": __version__,
+        "python": sys.version.split()[0],
+        "backend": backend,
+        "request": f"get_by_number {data_type} {id_code}" if id_code else f"get_bulk {data_type} nombre=1",
+        "runs": runs,
+        "failed_requests": failures,
+        "phases": {phase: {"median": round(statistics.median(values) * 1000, 2),
+                           "min": round(min(values) * 1000, 2),
+                           "max": round(max(values) * 1000, 2)}
+                   for phase, values in samples.items()},
+    }
+
+
+def _synthetic_page(count: int, periods: int) -> bytes:
+    """Build a `siren` search response of `count` records with `periods` periods each."""
+    categories = ("5710", "5499", "1000", "5720", "9220")
+    activities = ("62.01Z", "70.22Z", "68.20B", "56.10A", "47.11B", "43.21A")
+    records = []
+    for number in range(count):
+        records.append({
+            "siren": f"{number:09d}",
+            "statutDiffusionUniteLegale": "O",
+            "unitePurgeeUniteLegale": None,
+            "dateCreationUniteLegale": f"{1990 + number % 30}-{1 + number % 12:02d}-{1 + number % 28:02d}",
+            "sigleUniteLegale": None,
+            "sexeUniteLegale": None,
+            "prenom1UniteLegale": None,
+            "identifiantAssociationUniteLegale": None,
+            "trancheEffectifsUniteLegale": ("NN", "00", "01", "02", "11")[number % 5],
+            "anneeEffectifsUniteLegale": None if number % 5 == 0 else "2021",
+            "dateDernierTraitementUniteLegale": "2024-03-22T14:11:07.000",
+            "nombrePeriodesUniteLegale": periods,
+            "categorieEntreprise": ("PME", "ETI", "GE")[number % 3],
+            "anneeCategorieEntreprise": "2021",
+            "periodesUniteLegale": [{
+                "dateFin": None if period == 0 else f"{2023 - period}-12-31",
+                "dateDebut": f"{2024 - period}-01-01",
+                "etatAdministratifUniteLegale": "A" if period == 0 else "C",
+                "changementEtatAdministratifUniteLegale": period == periods - 1,
+                "nomUniteLegale": None,
+                "denominationUniteLegale": f"SOCIETE {number} {period}",
+                "categorieJuridiqueUniteLegale": categories[(number + period) % len(categories)],
+                "activitePrincipaleUniteLegale": activities[(number + period) % len(activities)],
+                "nomenclatureActivitePrincipaleUniteLegale": "NAFRev2",
+                "nicSiegeUniteLegale": f"{number % 100000:05d}",
+                "economieSocialeSolidaireUniteLegale": "N",
+                "societeMissionUniteLegale": None,
+                "caractereEmployeurUniteLegale": ("O", "N")[number % 2],
+            } for period in range(periods)],
+        })
+    return json.dumps({"header": {"statut": 200, "message": "OK"}, "unitesLegales": records}).encode()
+
+
+def _traced_bytes(build: Callable[[], object]) -> int:
+    """Measure the memory still allocated by `build` once it has returned its result."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = build()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del result
+    return size
+
+
+def measure_record_memory(count: int = 20_000, periods: int = 3) -> dict:
+    """Compare the memory of decoded API records with compact `UniteLegale` records.
+
+    Args:
+        count (int, optional): The number of records of the synthetic page. Defaults to 20000.
+        periods (int, optional): The number of periods of each record. Defaults to 3.
+
+    Raises:
+        ValueError: If `count` or `periods` is not positive.
+
+    Returns:
+        dict: The bytes per record of the `dicts` and of the `records`, and the
+        `reduction` (a fraction of the dicts' size), with the settings of the run.
+    """
+    if count < 1 or periods < 1:
+        msg = "count and periods must be positive integers."
+        raise ValueError(msg)
+    from .records import to_records
+
+    document = _synthetic_page(count, periods)
+    dicts = _traced_bytes(lambda: json.loads(document)["unitesLegales"])
+    records = _traced_bytes(lambda: to_records("siren", json.loads(document)["unitesLegales"]))
+    return {
+        "time": dt.datetime.now().isoformat(timespec="seconds"),
+        "version": __version__,
+        "python": sys.version.split()[0],
+        "records": count,
+        "periods": periods,
+        "bytes_per_record": {"dicts": round(dicts / count), "records": round(records / count)},
+        "reduction": round(1 - records / dicts, 3),
+    }
+
+
+def main() -> None:
+    """Run the benchmark from the command line."""
+    parser = argparse.ArgumentParser(description="Time the pyinsee import and first request, or the memory of records.")
+    parser.add_argument("--data-type", choices=["siren", "siret"], default="siren",
+                        help="Type of data of the first request")
+    parser.add_argument("--id", dest="id_code", help="Look this number up instead of fetching one bulk record")
+    parser.add_argument("--backend", choices=["api", "mirror"], default="api", help="Client backend")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters started")
+    parser.add_argument("--memory", action="store_true",
+                        help="Compare the memory of API records and compact records instead")
+    parser.add_argument("--records", type=int, default=20_000, help="Number of records of the --memory page")
+    parser.add_argument("--output", help="Append the result to this JSON lines file")
+    args = parser.parse_args()
+
+    if args.memory:
+        result = measure_record_memory(count=args.records)
+    else:
+        result = measure_startup(data_type=args.data_type, id_code=args.id_code, backend=args.backend,
+                                 runs=args.runs)
+    print(json.dumps(result, indent=2))
+    if args.output:
+        with Path(args.output).open("a", encoding="utf-8") as f:
+            f.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
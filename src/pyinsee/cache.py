@@ -0,0 +1,208 @@
+"""Persistent response cache for `InseeClient.get_by_number`.
+
+Decoded `uniteLegale` / `etablissement` records and their header are kept in
+a SQLite database under `DATA_DIR/cache`, keyed on the lookup parameters
+`(data_type, id_code, date, champs, masquerValeursNulles)`. Entries expire
+after a TTL, and the least recently used entries are evicted once the cache
+holds more than `max_entries` (accesses are recorded to within
+`TOUCH_INTERVAL` seconds, so that hits do not write). The database can be
+shared by several processes.
+
+Example:
+    from pyinsee.cache import ResponseCache
+    from pyinsee.insee_client import InseeClient
+
+    client = InseeClient(cache=ResponseCache(ttl=7 * 24 * 3600))
+    client.get_by_number(data_type="siren", id_code="000325175")  # API
+    client.get_by_number(data_type="siren", id_code="000325175")  # cache
+    print(client.cache.stats())
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+from . import config
+from .logger import logger
+
+# Default of `ttl`, where None means no expiry
+_DEFAULT_TTL = object()
+
+# Seconds after which a hit records its access again: the LRU order is only
+# kept to this precision, so most hits stay read-only
+TOUCH_INTERVAL = 60.0
+
+
+class ResponseCache:
+    """SQLite-backed cache with TTL, LRU eviction and hit/miss counters.
+
+    Args:
+        path (str | Path | None, optional): The SQLite database. Defaults to
+            `DATA_DIR/cache/insee_responses.sqlite`.
+        ttl (float | None, optional): The lifetime of an entry in seconds, or
+            None for entries that never expire. Defaults to INSEE_CACHE_TTL.
+        max_entries (int, optional): The number of entries kept before the
+            least recently used ones are evicted. Defaults to INSEE_CACHE_MAX_ENTRIES.
+
+    Attributes:
+        path (Path): The SQLite database.
+        hits (int): The lookups answered by the cache.
+        misses (int): The lookups not found (or expired) in the cache.
+        evictions (int): The entries evicted to stay under `max_entries`.
+    """
+
+    def __init__(self,
+                 path: str | Path | None = None,
+                 ttl: float | None = _DEFAULT_TTL,
+                 max_entries: int | None = None) -> None:
+        """Initialize the cache and create the database if needed."""
+        if ttl is _DEFAULT_TTL:
+            ttl = config.INSEE_CACHE_TTL
+        if max_entries is None:
+            max_entries = config.INSEE_CACHE_MAX_ENTRIES
+        if max_entries < 1:
+            msg = "max_entries must be a positive integer."
+            raise ValueError(msg)
+
+        self.path = Path(path) if path else Path(config.DATA_DIR) / "cache" / "insee_responses.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._inserts = 0
+        self._eviction_interval = max(1, min(1000, max_entries // 100))
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+
+        connection = self._connection()
+        connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL
+            )""")
+        connection.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the SQLite connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def make_key(data_type: str, id_code: str | int, query_kwargs: dict) -> str:
+        """Build the cache key of a lookup.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            id_code (str | int): The siren or siret number.
+            query_kwargs (dict): The query parameters (`date`, `champs`,
+                `masquerValeursNulles`).
+
+        Returns:
+            str: The cache key.
+        """
+        champs = query_kwargs.get("champs")
+        if isinstance(champs, list):
+            champs = ",".join(str(item) for item in champs)
+        masquer = query_kwargs.get("masquerValeursNulles")
+        if masquer is not None:
+            masquer = str(masquer).lower()
+        return json.dumps([data_type, str(id_code), query_kwargs.get("date"), champs, masquer])
+
+    def get(self, key: str) -> tuple[dict, dict] | None:
+        """Get a cached `(record, header)` pair.
+
+        Args:
+            key (str): The cache key (see `make_key`).
+
+        Returns:
+            tuple[dict, dict] | None: The record and its header, or None on a miss.
+        """
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, expires_at, last_access FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] is not None and row[1] <= now):
+            with self._counter_lock:
+                self.misses += 1
+            return None
+
+        if now - row[2] >= TOUCH_INTERVAL:
+            connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        with self._counter_lock:
+            self.hits += 1
+        record, header = json.loads(row[0])
+        return record, header
+
+    def set(self, key: str, record: dict, header: dict) -> None:
+        """Store a `(record, header)` pair and evict the least recently used entries if needed.
+
+        Args:
+            key (str): The cache key (see `make_key`).
+            record (dict): The decoded `uniteLegale` or `etablissement`.
+            header (dict): The response header.
+        """
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        connection = self._connection()
+        connection.execute(
+            "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+            (key, json.dumps([record, header]), expires_at, now))
+
+        # Counting the entries is not free: only check the size cap every few inserts
+        with self._counter_lock:
+            self._inserts += 1
+            evict = self._inserts >= self._eviction_interval
+            if evict:
+                self._inserts = 0
+        if evict:
+            self._evict(connection)
+
+    def _evict(self, connection: sqlite3.Connection) -> None:
+        """Delete expired entries, then the least recently used ones above `max_entries`."""
+        (count,) = connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        if count <= self.max_entries:
+            return
+        connection.execute("DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?",
+                           (time.time(),))
+        (count,) = connection.execute("SELECT COUNT(*) FROM responses").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            # Leave some headroom below the cap before the next check
+            excess += self.max_entries // 100
+            evicted = connection.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", (excess,)).rowcount
+            with self._counter_lock:
+                self.evictions += evicted
+            logger.debug("Evicted %d entries from the response cache.", evicted)
+
+    def clear(self) -> None:
+        """Delete every entry of the cache."""
+        self._connection().execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        """Get the cache counters.
+
+        Returns:
+            dict: `hits`, `misses` and `evictions` of this process, and the
+            number of `entries` in the cache.
+        """
+        (entries,) = self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": entries,
+        }
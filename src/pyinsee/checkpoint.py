@@ -0,0 +1,170 @@
+"""Checkpoint journal for resumable bulk exports.
+
+Every page of a bulk export read with `InseeClient.iter_bulk(resume=True)` is
+recorded in an append-only journal under `DATA_DIR/metadata/checkpoints`,
+one JSON line per page:
+
+    {"fingerprint": "...", "page": 4000, "curseur": "...", "curseurSuivant": "...",
+     "records": 1000, "bytes": 2894311, "elapsed": 0.42, "time": "2024-05-02T10:31:07"}
+
+A page is recorded (and synced to disk) once the consumer has asked for the
+following one, i.e. once it is done with the page. An export started again
+with `resume=True` continues after the last recorded page. A consumer whose
+output only becomes durable from time to time (e.g. segment files) can use
+a buffered journal and `commit` it whenever its output is durable, and record
+where that output goes in the journal's `context` (e.g. the segment prefix,
+so that a resumed export appends to the same segments).
+
+Example:
+    from pyinsee.checkpoint import CheckpointJournal
+
+    journal = CheckpointJournal()
+    fingerprint = journal.fingerprint("siren", {"q": "periode(etatAdministratifUniteLegale:A)"})
+    print(journal.last(fingerprint))
+"""
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import json
+import os
+from pathlib import Path
+
+from . import config
+from .logger import logger
+
+
+class CheckpointJournal:
+    """Append-only journal of the pages read by bulk exports, one file per query.
+
+    Args:
+        directory (str | Path | None, optional): The journal directory.
+        Defaults to `DATA_DIR/metadata/checkpoints`.
+        buffered (bool, optional): Keep the new entries in memory until `commit`
+        is called. Defaults to False.
+        context (dict | None, optional): Fields recorded with every entry, e.g.
+        `{"prefix": ...}` for the output of the export. Defaults to None.
+
+    Attributes:
+        directory (Path): The journal directory.
+        buffered (bool): Whether the entries wait for `commit`.
+        context (dict): The fields recorded with every entry.
+    """
+
+    def __init__(self,
+                 directory: str | Path | None = None,
+                 buffered: bool = False,
+                 context: dict | None = None) -> None:
+        """Initialize the journal and create its directory if needed."""
+        self.directory = Path(directory) if directory else Path(config.DATA_DIR) / "metadata" / "checkpoints"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.buffered = buffered
+        self.context = dict(context or {})
+        self._pending: list[dict] = []
+        self._write_through = False
+
+    @staticmethod
+    def fingerprint(data_type: str, query_kwargs: dict) -> str:
+        """Identify a bulk query, whatever its current cursor.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            query_kwargs (dict): The query parameters (`curseur` is ignored).
+
+        Returns:
+            str: The query fingerprint.
+        """
+        query = {key: value for key, value in query_kwargs.items() if key != "curseur"}
+        canonical = json.dumps([data_type, query], sort_keys=True, default=str)
+        return hashlib.sha256(canonical.encode()).hexdigest()[:20]
+
+    def path(self, fingerprint: str) -> Path:
+        """Get the journal file of a query."""
+        return self.directory / f"{fingerprint}.jsonl"
+
+    def append(self, entry: dict) -> None:
+        """Record a page and sync it to disk (or keep it until `commit` if buffered).
+
+        Args:
+            entry (dict): The page entry, with at least `fingerprint`.
+        """
+        entry = {**self.context, **entry, "time": dt.datetime.now().isoformat(timespec="seconds")}
+        if self.buffered:
+            self._pending.append(entry)
+            if self._write_through:
+                self.commit()
+        else:
+            self._write(entry["fingerprint"], [entry])
+
+    def mark_durable(self) -> None:
+        """Tell a buffered journal that the consumer's output is durable.
+
+        The buffered entries are written, and so is the entry of the page the
+        consumer is holding, as soon as it is recorded (a page is recorded when
+        the consumer asks for the next one).
+        """
+        self.commit()
+        self._write_through = True
+
+    def commit(self) -> None:
+        """Write the buffered entries and sync them to disk."""
+        self._write_through = False
+        pending, self._pending = self._pending, []
+        for fingerprint in dict.fromkeys(entry["fingerprint"] for entry in pending):
+            self._write(fingerprint, [entry for entry in pending if entry["fingerprint"] == fingerprint])
+
+    def _write(self, fingerprint: str, entries: list[dict]) -> None:
+        """Append entries to the journal of a query and sync it to disk."""
+        line = "".join(json.dumps(entry) + "\n" for entry in entries).encode()
+        fd = os.open(self.path(fingerprint), os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if os.lseek(fd, 0, os.SEEK_END) > 0:
+                os.lseek(fd, -1, os.SEEK_END)
+                if os.read(fd, 1) != b"\n":
+                    # Start a new line after a line cut short by a crash
+                    line = b"\n" + line
+            os.write(fd, line)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def entries(self, fingerprint: str) -> list[dict]:
+        """Get the pages recorded for a query, in order.
+
+        A last line cut short by a crash is ignored.
+
+        Args:
+            fingerprint (str): The query fingerprint.
+
+        Returns:
+            list[dict]: The page entries.
+        """
+        try:
+            lines = self.path(fingerprint).read_bytes().splitlines()
+        except FileNotFoundError:
+            return []
+
+        entries = []
+        for number, line in enumerate(lines, start=1):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.warning("Ignoring the damaged line %d of the checkpoint journal %s.",
+                               number, self.path(fingerprint))
+        return entries
+
+    def last(self, fingerprint: str) -> dict | None:
+        """Get the last page recorded for a query.
+
+        Args:
+            fingerprint (str): The query fingerprint.
+
+        Returns:
+            dict | None: The last page entry, or None if the query has no journal.
+        """
+        entries = self.entries(fingerprint)
+        return entries[-1] if entries else None
+
+    def clear(self, fingerprint: str) -> None:
+        """Delete the journal of a query, e.g. to export it again from the start."""
+        self.path(fingerprint).unlink(missing_ok=True)
@@ -5,15 +5,19 @@ They enable you to access the legal data API.
 To use the API, you need to register for API keys at https://api.insee.fr/
 and https://api.inpi.fr/ and then set the API KEYS variables in utils.py to your
 API key.
+
+Nothing is read at import: the settings are read from the environment (and
+the dotenv files written by the setup CLI) the first time one of them is
+used, e.g. `config.DATA_DIR`, and missing required settings are reported
+then. `configure(Settings(...))` installs explicit settings instead.
 """
+from __future__ import annotations
+
 import os
-import logging
-from pathlib import Path
 import site
-from dotenv import load_dotenv
-
-# setting up the logger
-logging.getLogger(__name__)
+import threading
+from collections.abc import Callable
+from pathlib import Path
 
 
 def get_env_file_path():
@@ -29,39 +33,246 @@ def get_env_file_path():
     
     return str(default_env_path)
 
-DEFAULT_ENV_PATH = get_env_file_path()
-
-load_dotenv(dotenv_path=DEFAULT_ENV_PATH)
-ENV_FILE_PATH = os.getenv("PYINSEE_ENV_FILE_PATH")
-
-if ENV_FILE_PATH is None:
-    msg = "ENV_FILE_PATH is not set in the environment variables."
-    raise ValueError(msg)
-
-load_dotenv(dotenv_path=ENV_FILE_PATH, override=True)
-
-DATA_DIR = os.environ.get("DATA_DIR")
-API_KEY = os.environ.get("API_KEY")
-CLIENT_KEY = os.environ.get("CLIENT_KEY")
-CLIENT_SECRET = os.environ.get("CLIENT_SECRET")
-INSEE_DATA_URL = os.environ.get("INSEE_DATA_URL")
-
-if DATA_DIR is None:
-    msg = "DATA_DIR is not set in the environment variables."
-    raise ValueError(msg)
-if CLIENT_KEY is None:
-    msg = "CLIENT_KEY is not set in the environment variables."
-    raise ValueError(msg)
-if CLIENT_SECRET is None:
-    msg = "CLIENT_SECRET is not set in the environment variables."
-    raise ValueError(msg)
-if INSEE_DATA_URL is None:
-    msg = "INSEE_DATA_URL is not set in the environment variables."
-    raise ValueError(msg)
-
-if API_KEY is None:
-    msg = "API_KEY is not set in the environment variables. Please set it in the .env file using the setup_cli script in case the OAuth2 flow is not working."
-    logging.warning(msg)
+
+def _or_none(value: str | None) -> str | None:
+    """Read an optional setting, where an empty value means None."""
+    return value or None
+
+
+# Settings and their types and defaults, read from the environment variable
+# of the same name in upper case
+_FIELDS: dict[str, tuple[Callable[[str], object], object]] = {
+    "data_dir": (str, None),
+    "api_key": (str, None),
+    "client_key": (str, None),
+    "client_secret": (str, None),
+    "insee_data_url": (str, None),
+    # OAuth token endpoint and on-disk token cache shared between processes
+    # (set INSEE_TOKEN_CACHE to an empty value to keep the token in memory only,
+    # defaults to DATA_DIR/metadata/insee_token.json)
+    "insee_token_url": (str, "https://api.insee.fr/token"),
+    "insee_token_cache": (str, None),
+    "token_refresh_margin": (float, 60.0),
+    # Client-side rate limit in requests per minute (0 disables it), the number of
+    # requests that may be sent back to back, and an optional state file used to
+    # share the limit between processes
+    "insee_rate_limit": (float, 30.0),
+    "insee_rate_burst": (int, 1),
+    "insee_rate_limit_file": (_or_none, None),
+    # Retry policy for timeouts, connection errors, 429 and 5xx responses
+    "insee_retry_max_attempts": (int, 5),
+    "insee_retry_backoff": (float, 0.5),
+    "insee_retry_deadline": (float, 300.0),
+    # Persistent get_by_number response cache: entry lifetime in seconds and size cap
+    "insee_cache_ttl": (float, float(7 * 24 * 3600)),
+    "insee_cache_max_entries": (int, 1000000),
+    # JSON decoder backend: "auto" (orjson when installed), "orjson" or "json"
+    "insee_json_backend": (str, "auto"),
+    # Saved exports: compression ("none", "gzip" or "zstd") and segment size caps
+    # (uncompressed bytes and records per segment file, 0 for no cap)
+    "insee_save_compression": (str, "gzip"),
+    "insee_segment_max_bytes": (int, 256 * 1024 * 1024),
+    "insee_segment_max_records": (int, 0),
+    # Local record store: segment file size cap and number of journal entries
+    # merged into the sorted index at once
+    "insee_store_segment_max_bytes": (int, 1024 ** 3),
+    "insee_store_journal_max_entries": (int, 100000),
+    # Offline mirror of the Sirene stock files: rows inserted per transaction
+    "insee_mirror_chunk_size": (int, 50000),
+    # Processing of raw data into tables: worker processes (defaults to the
+    # number of CPUs) and records per part file
+    "insee_process_workers": (int, None),
+    "insee_process_batch_size": (int, 50000),
+    # Logging: the file handler level, "sync" (records written by the logging
+    # thread) or "queue" (written by a background thread), "text" or "json"
+    # records, and the share of per-request messages logged (0.01 for 1 in 100)
+    "insee_log_level": (str, "DEBUG"),
+    "insee_log_mode": (str, "sync"),
+    "insee_log_format": (str, "text"),
+    "insee_log_sample_rate": (float, 1.0),
+    # Request metrics: a Prometheus text file written every few seconds (none by default)
+    "insee_metrics_file": (_or_none, None),
+    "insee_metrics_interval": (float, 15.0),
+    # HTTP transport settings (connection pooling and timeouts)
+    "http_pool_connections": (int, 10),
+    "http_pool_maxsize": (int, 10),
+    "http_connect_timeout": (float, 5.0),
+    "http_read_timeout": (float, 30.0),
+}
+
+# Settings without which the client cannot work, checked when they are used
+REQUIRED_SETTINGS = ("data_dir", "client_key", "client_secret", "insee_data_url")
+
+
+class Settings:
+    """The package settings, as an explicit object.
+
+    Every setting has an environment variable of the same name in upper case
+    (`data_dir` is `DATA_DIR`, ...). `Settings.from_env()` reads them from the
+    environment and the dotenv files written by the setup CLI; `Settings(...)`
+    builds them from values alone, e.g. for workers configured by their parent
+    or for tests. Settings that are not given take their default.
+
+    Args:
+        **values (object): The settings, by lower case name. Strings (as read
+        from the environment) are converted to the type of the setting.
+
+    Raises:
+        TypeError: If a setting is unknown.
+
+    Example:
+        from pyinsee import config
+
+        config.configure(config.Settings(data_dir="/srv/insee", client_key="...", client_secret="...",
+                                         insee_data_url="https://api.insee.fr/api-sirene/3.11/"))
+    """
+
+    __slots__ = tuple(_FIELDS)
+
+    def __init__(self, **values: object) -> None:
+        """Set the settings, converting them to their type."""
+        unknown = set(values) - set(_FIELDS)
+        if unknown:
+            msg = f"Unknown setting(s): {sorted(unknown)}."
+            raise TypeError(msg)
+        for name, (kind, default) in _FIELDS.items():
+            value = values.get(name)
+            setattr(self, name, default if value is None else kind(value) if isinstance(value, str) else value)
+        if "insee_token_cache" not in values and self.data_dir:
+            self.insee_token_cache = os.path.join(self.data_dir, "metadata", "insee_token.json")
+        if self.insee_process_workers is None:
+            self.insee_process_workers = os.cpu_count() or 1
+
+    @classmethod
+    def from_env(cls, env_file: str | Path | None = None, **values: object) -> Settings:
+        """Read the settings from the environment.
+
+        The dotenv file of the setup CLI (`default-env-files/default.env` in
+        the site packages, which points at `PYINSEE_ENV_FILE_PATH`) is loaded
+        first when it exists, then `env_file` or the `PYINSEE_ENV_FILE_PATH`
+        file, overriding the environment.
+
+        Args:
+            env_file (str | Path | None, optional): The .env file. Defaults to
+            `PYINSEE_ENV_FILE_PATH`.
+            **values (object): Settings replacing the environment's.
+
+        Returns:
+            Settings: The settings.
+        """
+        from dotenv import load_dotenv  # only needed when the settings are first read
+
+        try:
+            load_dotenv(dotenv_path=get_env_file_path())
+        except FileNotFoundError:
+            pass
+        env_file = env_file or os.getenv("PYINSEE_ENV_FILE_PATH")
+        if env_file:
+            load_dotenv(dotenv_path=env_file, override=True)
+        environ = {name: os.environ[name.upper()] for name in _FIELDS if name.upper() in os.environ}
+        return cls(**{**environ, **values})
+
+    def require(self, name: str) -> object:
+        """Get a setting that must be set.
+
+        Args:
+            name (str): The setting, by lower case name.
+
+        Raises:
+            ValueError: If the setting is not set.
+
+        Returns:
+            object: The setting.
+        """
+        value = getattr(self, name)
+        if value is None:
+            msg = f"{name.upper()} is not set in the environment variables."
+            raise ValueError(msg)
+        return value
+
+    def replace(self, **values: object) -> Settings:
+        """Get a copy of the settings with some of them replaced.
+
+        Args:
+            **values (object): The settings to replace, by lower case name.
+
+        Returns:
+            Settings: The new settings.
+        """
+        current = {name: getattr(self, name) for name in _FIELDS}
+        if self.data_dir and self.insee_token_cache == os.path.join(self.data_dir, "metadata", "insee_token.json"):
+            # Derived from `data_dir`: follow it
+            del current["insee_token_cache"]
+        return Settings(**{**current, **values})
+
+    def __repr__(self) -> str:
+        """Show the settings, hiding the credentials."""
+        hidden = ("api_key", "client_key", "client_secret")
+        shown = ", ".join(f"{name}={'***' if name in hidden and getattr(self, name) else repr(getattr(self, name))}"
+                          for name in _FIELDS)
+        return f"Settings({shown})"
+
+
+_settings: Settings | None = None
+_settings_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """Get the package settings, read from the environment on first use.
+
+    Returns:
+        Settings: The settings installed with `configure`, or `Settings.from_env()`.
+    """
+    global _settings  # noqa: PLW0603
+    if _settings is None:
+        with _settings_lock:
+            if _settings is None:
+                _settings = Settings.from_env()
+    return _settings
+
+
+def configure(settings: Settings | None = None, **values: object) -> Settings:
+    """Install the package settings, instead of reading them from the environment.
+
+    Objects created afterwards (clients, stores, ...) use them; the default
+    transport, token manager and rate limiter are created on first use, so
+    configuring before the first request is enough.
+
+    Args:
+        settings (Settings | None, optional): The settings. Defaults to the
+        current ones (read from the environment if needed).
+        **values (object): Settings replacing those of `settings`.
+
+    Returns:
+        Settings: The installed settings.
+    """
+    global _settings  # noqa: PLW0603
+    settings = settings if settings is not None else get_settings()
+    if values:
+        settings = settings.replace(**values)
+    with _settings_lock:
+        _settings = settings
+    return settings
+
+
+def __getattr__(name: str) -> object:
+    """Read the settings lazily as module constants (`config.DATA_DIR`, ...).
+
+    Raises:
+        ValueError: If a required setting is not set.
+        AttributeError: If there is no such setting.
+    """
+    setting = name.lower()
+    if setting in _FIELDS:
+        settings = get_settings()
+        return settings.require(setting) if setting in REQUIRED_SETTINGS else getattr(settings, setting)
+    if name == "DEFAULT_ENV_PATH":
+        return get_env_file_path()
+    if name == "ENV_FILE_PATH":
+        get_settings()
+        return os.getenv("PYINSEE_ENV_FILE_PATH")
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
 
 # Set up the response codes
 RESPONSE_CODES = {
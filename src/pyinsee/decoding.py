@@ -0,0 +1,248 @@
+"""JSON decoding of the INSEE API responses (and encoding of the records).
+
+`loads` decodes a response body, and `dumps` encodes a record as compact
+JSON, with orjson when it is installed (several times faster than the
+standard library on bulk pages), or with `json` otherwise:
+
+    pip install pyinsee[fast]
+
+`JsonArrayStream` decodes a response incrementally: the records of the
+`unitesLegales` or `etablissements` array are decoded one by one as the bytes
+arrive, so only one record (plus a network chunk) is held in memory instead
+of the whole page and its decoded copy.
+
+Example:
+    from pyinsee.decoding import JsonArrayStream
+
+    stream = JsonArrayStream("unitesLegales")
+    for chunk in response.iter_content(chunk_size=65536):
+        for record in stream.feed(chunk):
+            ...
+    header = stream.close()["header"]
+"""
+from __future__ import annotations
+
+import json
+import re
+
+from . import config
+
+# orjson, imported with the backend on first use
+orjson = None
+
+# The JSON backend in use, "orjson" or "json", chosen on first use
+_backend: str | None = None
+
+
+def json_backend() -> str:
+    """Get the JSON backend in use, choosing it from INSEE_JSON_BACKEND on first use.
+
+    Raises:
+        ValueError: If INSEE_JSON_BACKEND is not "auto", "orjson" or "json".
+        ImportError: If INSEE_JSON_BACKEND is "orjson" and orjson is not installed.
+
+    Returns:
+        str: "orjson" or "json".
+    """
+    global _backend, orjson  # noqa: PLW0603
+    if _backend is None:
+        setting = config.INSEE_JSON_BACKEND
+        if setting not in ("auto", "orjson", "json"):
+            msg = f"Invalid INSEE_JSON_BACKEND: {setting}. Must be 'auto', 'orjson' or 'json'."
+            raise ValueError(msg)
+        if setting != "json":
+            try:
+                import orjson
+            except ImportError:  # pragma: no cover - optional dependency
+                orjson = None
+        if setting == "orjson" and orjson is None:
+            msg = "INSEE_JSON_BACKEND is 'orjson' but orjson is not installed. Install it with `pip install pyinsee[fast]`."
+            raise ImportError(msg)
+        _backend = "orjson" if orjson is not None and setting != "json" else "json"
+    return _backend
+
+
+def __getattr__(name: str) -> object:
+    """Resolve `JSON_BACKEND` lazily."""
+    if name == "JSON_BACKEND":
+        return json_backend()
+    msg = f"module {__name__!r} has no attribute {name!r}"
+    raise AttributeError(msg)
+
+
+def loads(content: bytes | bytearray | str) -> object:
+    """Decode a JSON document with the configured backend.
+
+    Args:
+        content (bytes | bytearray | str): The JSON document.
+
+    Raises:
+        ValueError: If the document is not valid JSON.
+
+    Returns:
+        object: The decoded document.
+    """
+    if (_backend or json_backend()) == "orjson":
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def dumps(obj: object) -> bytes:
+    """Encode an object as compact UTF-8 JSON with the configured backend.
+
+    Args:
+        obj (object): The object to encode.
+
+    Raises:
+        TypeError: If the object cannot be encoded.
+
+    Returns:
+        bytes: The JSON document.
+    """
+    if (_backend or json_backend()) == "orjson":
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+# A complete string, a structural character, or the opening quote of a string
+# that is not complete yet
+_TOKEN = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\],]|"')
+
+
+class JsonArrayStream:
+    """Incremental decoder for the items of one top-level array of a JSON object.
+
+    Bytes are fed as they arrive; each call returns the items of the array that
+    were completed by the new bytes. The rest of the document (e.g. the
+    `header`) is kept and decoded by `close`, with the array left empty.
+
+    Args:
+        key (str): The top-level key of the array, e.g. "unitesLegales".
+
+    Attributes:
+        key (str): The top-level key of the array.
+        count (int): The number of items decoded so far.
+    """
+
+    def __init__(self, key: str) -> None:
+        """Initialize the decoder."""
+        self.key = key
+        self.count = 0
+        self._key = json.dumps(key).encode()
+        self._buffer = bytearray()
+        self._rest = bytearray()   # the document outside the array
+        self._pos = 0              # the next byte of the buffer to scan
+        self._depth = 0
+        self._last_key = None      # the last string closed at depth 1 and where it ended
+        self._last_key_end = 0
+        self._in_array = False
+        self._done = False
+        self._item_start = 0       # the start of the current item in the buffer
+
+    def feed(self, chunk: bytes) -> list:
+        """Decode the array items completed by a new chunk of the document.
+
+        Args:
+            chunk (bytes): The next bytes of the document.
+
+        Raises:
+            ValueError: If an item is not valid JSON.
+
+        Returns:
+            list: The items completed by this chunk, in order.
+        """
+        if self._done:
+            self._rest += chunk
+            return []
+
+        self._buffer += chunk
+        items = []
+        while self._scan(items):
+            pass
+        if self._in_array and self._item_start:
+            # Drop the items already decoded from the buffer
+            del self._buffer[:self._item_start]
+            self._pos -= self._item_start
+            self._item_start = 0
+        return items
+
+    def _scan(self, items: list) -> bool:
+        """Scan the buffer, appending the completed items.
+
+        Returns:
+            bool: True if the scan must be restarted because the array started.
+        """
+        buffer = self._buffer
+        depth = self._depth
+        in_array = self._in_array
+        item_start = self._item_start
+        pos = self._pos
+        array_start = None
+
+        for match in _TOKEN.finditer(buffer, pos):
+            j = match.start()
+            char = buffer[j]
+            pos = match.end()
+
+            if char == 0x22:  # "
+                if pos - j == 1:
+                    # The string is not complete yet: scan it again with the next chunk
+                    pos = j
+                    break
+                if depth == 1 and not in_array:
+                    self._last_key = match.group()
+                    self._last_key_end = pos
+            elif char == 0x2C:  # ,
+                if in_array and depth == 2:  # noqa: PLR2004
+                    self._emit(buffer[item_start:j], items)
+                    item_start = pos
+            elif char in (0x7B, 0x5B):  # { [
+                depth += 1
+                if (char == 0x5B and depth == 2 and not in_array  # noqa: PLR2004
+                        and self._last_key == self._key
+                        and buffer[self._last_key_end:j].strip() == b":"):
+                    array_start = pos
+                    break
+            else:  # } ]
+                depth -= 1
+                if in_array and depth == 1:
+                    # The array ends: decode its last item and keep the rest of the document
+                    self._emit(buffer[item_start:j], items)
+                    self._rest += buffer[j:]
+                    self._buffer = bytearray()
+                    self._in_array = False
+                    self._done = True
+                    return False
+
+        if array_start is not None:
+            # The array starts: keep the document up to "[" and drop it from the buffer
+            self._rest += buffer[:array_start]
+            del buffer[:array_start]
+            self._depth, self._in_array, self._item_start, self._pos = depth, True, 0, 0
+            return True
+
+        self._depth, self._item_start, self._pos = depth, item_start, pos
+        return False
+
+    def _emit(self, item: bytearray, items: list) -> None:
+        """Decode one item of the array, ignoring the empty array."""
+        item = item.strip()
+        if item:
+            items.append(loads(item))
+            self.count += 1
+
+    def close(self) -> dict:
+        """Decode the rest of the document once every chunk was fed.
+
+        Raises:
+            ValueError: If the document is truncated or not valid JSON.
+
+        Returns:
+            dict: The document without the array items (the array is empty,
+            or missing if the document had no such array).
+        """
+        if self._in_array:
+            msg = f"Truncated JSON document: the '{self.key}' array is not closed."
+            raise ValueError(msg)
+        document = self._rest if self._done else self._buffer
+        return loads(bytes(document))
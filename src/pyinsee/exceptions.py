@@ -0,0 +1,56 @@
+"""Exceptions raised by the pyinsee package."""
+from __future__ import annotations
+
+import requests
+
+
+class InseeError(Exception):
+    """Base class for the errors raised by pyinsee."""
+
+
+class InseeRequestError(InseeError):
+    """A request to the INSEE API failed, after any retries.
+
+    Args:
+        message (str): The error message.
+        status_code (int | None, optional): The HTTP status code of the last response.
+        response (requests.Response | None, optional): The last response, if any.
+        attempts (int, optional): The number of attempts made. Defaults to 1.
+    """
+
+    def __init__(self,
+                 message: str,
+                 status_code: int | None = None,
+                 response: requests.Response | None = None,
+                 attempts: int = 1) -> None:
+        """Initialize the error."""
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+        self.attempts = attempts
+
+
+class InseeTimeoutError(InseeRequestError):
+    """The INSEE API did not answer in time."""
+
+
+class InseeConnectionError(InseeRequestError):
+    """The connection to the INSEE API failed or was reset."""
+
+
+class InseeRateLimitError(InseeRequestError):
+    """The INSEE API kept answering 429 (too many requests)."""
+
+
+class InseeServerError(InseeRequestError):
+    """The INSEE API kept answering with a 5xx server error."""
+
+
+# Exception raised for each retry error class (see `pyinsee.retry`)
+ERRORS_BY_CLASS: dict[str | None, type[InseeRequestError]] = {
+    "timeout": InseeTimeoutError,
+    "connection": InseeConnectionError,
+    "throttle": InseeRateLimitError,
+    "server": InseeServerError,
+    None: InseeRequestError,
+}
@@ -0,0 +1,268 @@
+"""Partitioned bulk exports.
+
+INSEE cursors are sequential: a bulk query can only be read one page after
+the other, which takes days for a national export. `export_bulk` splits one
+query into disjoint partitions (SIREN ranges, creation date ranges,
+departments, ...) and reads each partition on its own cursor, in parallel.
+When `tri` is given, the partitions are merged back in order (k-way merge),
+so the output is the same as with a single cursor.
+
+The partitions must be disjoint and together cover the whole query, otherwise
+records are duplicated or missed.
+
+Example:
+    from pyinsee.export import export_bulk, siren_partitions
+    from pyinsee.insee_client import InseeClient
+
+    client = InseeClient()
+    for record in export_bulk(client,
+                              data_type="siret",
+                              partitions=siren_partitions(8),
+                              q="etatAdministratifEtablissement:A",
+                              tri="siret"):
+        ...
+"""
+from __future__ import annotations
+
+import datetime as dt
+import heapq
+import queue
+import threading
+from typing import TYPE_CHECKING, Callable, Iterator
+
+from .logger import logger
+from .utils import get_record_field
+
+if TYPE_CHECKING:
+    from .insee_client import BulkParams, InseeClient
+
+# Department codes, as the first digits of `codeCommuneEtablissement` (97 and 98
+# cover the overseas departments and collectivities)
+DEPARTMENTS = (
+    [f"{code:02d}" for code in range(1, 20)]
+    + ["2A", "2B"]
+    + [f"{code:02d}" for code in range(21, 96)]
+    + ["97", "98"]
+)
+
+# Marks the end of a partition in its queue
+_DONE = object()
+
+
+def siren_partitions(count: int, field: str = "siren") -> list[str]:
+    """Split the SIREN number space into equal ranges.
+
+    Args:
+        count (int): The number of partitions.
+        field (str, optional): The field holding the SIREN number. Defaults to "siren".
+
+    Raises:
+        ValueError: If `count` is not a positive integer.
+
+    Returns:
+        list[str]: The range queries, e.g. `siren:[000000000 TO 499999999]`.
+    """
+    if count < 1:
+        msg = "count must be a positive integer."
+        raise ValueError(msg)
+    size = 10 ** 9
+    bounds = [size * index // count for index in range(count + 1)]
+    return [f"{field}:[{low:09d} TO {high - 1:09d}]" for low, high in zip(bounds, bounds[1:])]
+
+
+def date_partitions(field: str, start: str, end: str, count: int) -> list[str]:
+    """Split a date range into equal ranges.
+
+    Args:
+        field (str): The date field, e.g. "dateCreationUniteLegale".
+        start (str): The first date (YYYY-MM-DD).
+        end (str): The last date (YYYY-MM-DD), included.
+        count (int): The number of partitions.
+
+    Raises:
+        ValueError: If the dates are not valid or if `count` is not a positive integer.
+
+    Returns:
+        list[str]: The range queries, e.g. `dateCreationUniteLegale:[2000-01-01 TO 2009-12-31]`.
+    """
+    first = dt.date.fromisoformat(start)
+    last = dt.date.fromisoformat(end)
+    days = (last - first).days + 1
+    if days < 1:
+        msg = f"Invalid date range: {start} is after {end}."
+        raise ValueError(msg)
+    if count < 1:
+        msg = "count must be a positive integer."
+        raise ValueError(msg)
+
+    count = min(count, days)
+    bounds = [first + dt.timedelta(days=days * index // count) for index in range(count + 1)]
+    return [f"{field}:[{low.isoformat()} TO {(high - dt.timedelta(days=1)).isoformat()}]"
+            for low, high in zip(bounds, bounds[1:])]
+
+
+def department_partitions(departments: list[str] | None = None) -> list[str]:
+    """Split establishments by department.
+
+    Only for `siret` queries. Establishments located abroad have no
+    `codeCommuneEtablissement` and are not covered by these partitions.
+
+    Args:
+        departments (list[str] | None, optional): The department codes.
+        Defaults to every department.
+
+    Returns:
+        list[str]: The prefix queries, e.g. `codeCommuneEtablissement:75*`.
+    """
+    return [f"codeCommuneEtablissement:{code}*" for code in departments or DEPARTMENTS]
+
+
+def _merge_key(data_type: str, tri: str | list) -> Callable[[dict], tuple]:
+    """Build the sort key matching the `tri` parameter of a bulk query.
+
+    Raises:
+        ValueError: If a `tri` field asks for a descending order.
+    """
+    fields = tri.split(",") if isinstance(tri, str) else list(tri)
+    fields = [field.strip() for field in fields if field.strip()]
+    if any(" " in field for field in fields):
+        msg = f"Only ascending sorts can be merged: {tri}."
+        raise ValueError(msg)
+    # The identifier breaks ties, like the INSEE cursor does
+    fields.append(data_type)
+
+    def key(record: dict) -> tuple:
+        values = []
+        for field in fields:
+            value = get_record_field(record, field)
+            # Missing values sort last
+            values.append((1, "") if value is None else (0, value))
+        return tuple(values)
+
+    return key
+
+
+def _put(out: queue.Queue, item: tuple, stop: threading.Event) -> bool:
+    """Put an item in a queue unless the export is stopped, returning False if it is."""
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=0.5)
+        except queue.Full:
+            continue
+        return True
+    return False
+
+
+def _export_partition(client: InseeClient,
+                      data_type: str,
+                      index: int,
+                      query: str,
+                      query_kwargs: dict,
+                      out: queue.Queue,
+                      stop: threading.Event) -> None:
+    """Read every page of a partition into a queue (runs in a worker thread)."""
+    try:
+        pages = client.iter_bulk(data_type=data_type, by_page=True, q=query, **query_kwargs)
+        for records, _ in pages:
+            if not _put(out, (index, records), stop):
+                pages.close()
+                return
+        logger.info("Partition %d (%s) is complete.", index, query)
+        _put(out, (index, _DONE), stop)
+    except Exception as err:  # noqa: BLE001 - forwarded to the consumer
+        _put(out, (index, err), stop)
+
+
+def _read_partition(out: queue.Queue) -> Iterator[dict]:
+    """Yield the records of a partition from its queue."""
+    while True:
+        _, item = out.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield from item
+
+
+def export_bulk(client: InseeClient,
+                data_type: str = "siren",
+                partitions: list[str] | None = None,
+                prefetch: int = 2,
+                **kwargs: BulkParams) -> Iterator[dict]:
+    """Export every result of a bulk query, reading its partitions in parallel.
+
+    Each partition is read on its own cursor by a worker thread, sharing the
+    client (and so its connection pool, rate limiter and token). Without
+    `tri`, records are yielded as the pages arrive, in no particular order.
+    With `tri` (ascending fields only), the partitions are merged so that the
+    records come in the order a single cursor would have produced.
+
+    Args:
+        client (InseeClient): The client used to query the API ("json" content type).
+        data_type (str): The type of data to retrieve, either "siren" or "siret".
+        partitions (list[str]): The disjoint queries splitting the export, see
+        `siren_partitions`, `date_partitions` and `department_partitions`.
+        prefetch (int, optional): The number of pages each partition may read
+        ahead of the consumer. Defaults to 2.
+        **kwargs (dict | None): The query parameters accepted by `iter_bulk`.
+        `q` is combined with each partition.
+
+    Raises:
+        ValueError: If no partition is given, if the query parameters are not
+        valid or if a partition fails.
+        InseeRequestError: If a request still fails once the retries run out.
+
+    Yields:
+        dict: A record.
+    """
+    if not partitions:
+        msg = "export_bulk requires at least one partition."
+        raise ValueError(msg)
+    if prefetch < 1:
+        msg = "prefetch must be a positive integer."
+        raise ValueError(msg)
+    if kwargs.get("resume") or kwargs.get("checkpoint") is not None:
+        # Workers read ahead of the consumer, so their pages are not done when journaled
+        msg = "Partitioned exports cannot be resumed."
+        raise ValueError(msg)
+
+    query = kwargs.pop("q", None)
+    queries = [f"({query}) AND {partition}" if query else partition for partition in partitions]
+    tri = kwargs.get("tri")
+    key = _merge_key(data_type, tri) if tri else None
+
+    # Ordered exports need one queue per partition to merge them
+    stop = threading.Event()
+    if key is None:
+        shared = queue.Queue(maxsize=prefetch * len(queries))
+        queues = [shared] * len(queries)
+    else:
+        queues = [queue.Queue(maxsize=prefetch) for _ in queries]
+    workers = [
+        threading.Thread(target=_export_partition,
+                         args=(client, data_type, index, partition_query, kwargs, queues[index], stop),
+                         name=f"insee-export-{index}",
+                         daemon=True)
+        for index, partition_query in enumerate(queries)
+    ]
+    logger.info("Exporting %s data over %d partitions.", data_type.upper(), len(queries))
+    for worker in workers:
+        worker.start()
+
+    try:
+        if key is not None:
+            yield from heapq.merge(*(_read_partition(out) for out in queues), key=key)
+            return
+
+        remaining = len(queries)
+        while remaining:
+            _, item = shared.get()
+            if item is _DONE:
+                remaining -= 1
+            elif isinstance(item, Exception):
+                raise item
+            else:
+                yield from item
+    finally:
+        # Also stops the workers when the consumer does not read every record
+        stop.set()
@@ -0,0 +1,430 @@
+"""Local facet counts over stored, mirrored or exported records.
+
+`facette.champ` breakdowns (counts by `activitePrincipaleUniteLegale`,
+`trancheEffectifsUniteLegale`, ...) cost API requests. A `FacetIndex`
+computes the same `facettes` structure locally, over one of these sources:
+
+    FacetIndex.for_store(store, "siret")     the records of a `RecordStore`
+    FacetIndex.for_mirror(mirror, "siret")   the rows of a `SireneMirror`
+    FacetIndex.for_files("siret", paths)     raw NDJSON / JSON files (the saved exports by
+                                             default) or processed CSV / parquet tables
+
+Each field is dictionary-encoded the first time it is asked for: one pass
+over the source gives its distinct values and one uint32 code per record (0
+for a missing value), saved under `DATA_DIR/facets/<source>`. The encodings
+are dropped and rebuilt when the source changes. A breakdown is then a
+histogram of the codes (`numpy.bincount` when NumPy is installed), and `q`
+filters are evaluated once per distinct value and mapped onto the codes, so
+a multi-facet breakdown over millions of records takes seconds and no
+request. Queries are evaluated against the current values of the records
+(`periode(...)` included).
+
+Facets have the structure returned by the API:
+
+    [{"nom": "activitePrincipaleUniteLegale", "total": 57, "manquants": 0, "modalites": 2,
+      "valeurs": [{"valeur": "62.01Z", "nombre": 29}, {"valeur": "47.11F", "nombre": 28}]}]
+
+Example:
+    from pyinsee.facets import FacetIndex
+
+    index = FacetIndex.for_mirror(SireneMirror(), "siret")
+    facettes = index.facettes(["trancheEffectifsEtablissement", "activitePrincipaleEtablissement"],
+                              q="etatAdministratifEtablissement:A")
+"""
+from __future__ import annotations
+
+import csv
+import hashlib
+import json
+import os
+import threading
+from array import array
+from collections import Counter
+from itertools import compress
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator
+
+from . import config
+from .processing import iter_raw_files, iter_raw_records
+from .query import And, MatchAll, Node, Not, Or, Periode, parse_query, record_fields
+
+if TYPE_CHECKING:
+    from .mirror import SireneMirror
+    from .store import RecordStore
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+# Code of a missing value
+MISSING = 0
+
+# Passes over the source before giving up when it keeps changing while it is read
+ENCODE_ATTEMPTS = 3
+
+# Flip a bytearray mask of 0 and 1
+_FLIP = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+
+def _facet_value(value: object) -> str:
+    """Format a value as the API does in facets."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _split_fields(fields: str | list[str]) -> list[str]:
+    """Split a `facette.champ` parameter into field names."""
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return [field.strip() for field in fields if field.strip()]
+
+
+class _StoreSource:
+    """The records of a `RecordStore`."""
+
+    def __init__(self, store: RecordStore, data_type: str) -> None:
+        self.store = store
+        self.data_type = data_type
+        self.name = f"store-{data_type}"
+
+    def fingerprint(self) -> str:
+        parts = [str(self.store.directory)]
+        for name in ("index", "journal"):
+            try:
+                stat = (self.store.directory / self.data_type / name).stat()
+                parts.append(f"{stat.st_size}:{stat.st_mtime_ns}")
+            except FileNotFoundError:
+                parts.append("-")
+        return "|".join(parts)
+
+    def rows(self, fields: list[str]) -> Iterator[tuple]:
+        for record in self.store.records(self.data_type):
+            values = record_fields(record)[0]
+            yield tuple(values.get(field) for field in fields)
+
+
+class _MirrorSource:
+    """The rows of a `SireneMirror`."""
+
+    def __init__(self, mirror: SireneMirror, data_type: str) -> None:
+        self.mirror = mirror
+        self.data_type = data_type
+        self.name = f"mirror-{data_type}"
+
+    def fingerprint(self) -> str:
+        ingests = self.mirror.ingests()
+        return f"{self.mirror.path}|{len(ingests)}|{ingests[-1]['ingested_at'] if ingests else '-'}"
+
+    def rows(self, fields: list[str]) -> Iterator[tuple]:
+        return self.mirror.iter_values(self.data_type, fields)
+
+
+class _FileSource:
+    """Raw files (NDJSON segments, JSON bodies) or processed tables (CSV, parquet)."""
+
+    def __init__(self, data_type: str, paths: list[Path]) -> None:
+        self.data_type = data_type
+        self.paths = paths
+        names = "\n".join(str(path.resolve()) for path in paths)
+        self.name = f"files-{data_type}-{hashlib.sha256(names.encode()).hexdigest()[:12]}"
+
+    def fingerprint(self) -> str:
+        stats = []
+        for path in self.paths:
+            stat = path.stat()
+            stats.append(f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}")
+        return hashlib.sha256("\n".join(stats).encode()).hexdigest()
+
+    def rows(self, fields: list[str]) -> Iterator[tuple]:
+        for path in self.paths:
+            if path.name.endswith(".parquet"):
+                import pyarrow.parquet as pq
+                parquet = pq.ParquetFile(path)
+                present = [field for field in fields if field in parquet.schema_arrow.names]
+                for batch in parquet.iter_batches(columns=present):
+                    columns = {name: batch.column(name).to_pylist() for name in present}
+                    empty = [None] * batch.num_rows
+                    yield from zip(*(columns.get(field, empty) for field in fields))
+            elif path.name.endswith(".csv"):
+                with path.open(newline="", encoding="utf-8") as f:
+                    for row in csv.DictReader(f):
+                        yield tuple(row.get(field) or None for field in fields)
+            else:
+                for record in iter_raw_records(path, self.data_type):
+                    values = record_fields(record)[0]
+                    yield tuple(values.get(field) for field in fields)
+
+
+class FacetIndex:
+    """Dictionary-encoded fields of a source of records, for local facets.
+
+    Use `for_store`, `for_mirror` or `for_files` to build one.
+
+    Args:
+        source (object): The source of the records.
+        directory (str | Path | None, optional): The directory of the encodings.
+        Defaults to `DATA_DIR/facets/<source>`.
+
+    Attributes:
+        directory (Path): The directory of the encodings.
+    """
+
+    def __init__(self, source: object, directory: str | Path | None = None) -> None:
+        """Initialize the index; fields are encoded when first asked for."""
+        self.source = source
+        self.directory = Path(directory) if directory else Path(config.DATA_DIR) / "facets" / source.name
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._meta: dict | None = None
+        self._columns: dict[str, tuple[list, object]] = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def for_store(cls, store: RecordStore, data_type: str, directory: str | Path | None = None) -> FacetIndex:
+        """Get the facet index of the records of a store.
+
+        Args:
+            store (RecordStore): The store.
+            data_type (str): The type of data, either "siren" or "siret".
+            directory (str | Path | None, optional): The directory of the encodings.
+
+        Returns:
+            FacetIndex: The index.
+        """
+        return cls(_StoreSource(store, data_type), directory)
+
+    @classmethod
+    def for_mirror(cls, mirror: SireneMirror, data_type: str, directory: str | Path | None = None) -> FacetIndex:
+        """Get the facet index of the rows of a mirror.
+
+        Args:
+            mirror (SireneMirror): The mirror.
+            data_type (str): The type of data, either "siren" or "siret".
+            directory (str | Path | None, optional): The directory of the encodings.
+
+        Returns:
+            FacetIndex: The index.
+        """
+        return cls(_MirrorSource(mirror, data_type), directory)
+
+    @classmethod
+    def for_files(cls,
+                  data_type: str,
+                  paths: list[str | Path] | None = None,
+                  directory: str | Path | None = None) -> FacetIndex:
+        """Get the facet index of exported records.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            paths (list[str | Path] | None, optional): Raw NDJSON / JSON files, or
+            parts of a processed table (CSV or parquet). Defaults to every raw
+            file saved for the data type.
+            directory (str | Path | None, optional): The directory of the encodings.
+
+        Returns:
+            FacetIndex: The index.
+        """
+        files = [Path(path) for path in paths] if paths is not None else iter_raw_files(data_type)
+        return cls(_FileSource(data_type, sorted(files)), directory)
+
+    def _check(self) -> dict:
+        """Load the metadata, dropping the encodings if the source changed."""
+        fingerprint = self.source.fingerprint()
+        if self._meta is not None and self._meta["source"] == fingerprint:
+            return self._meta
+        try:
+            meta = json.loads((self.directory / "meta.json").read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            meta = None
+        if meta is None or meta.get("source") != fingerprint:
+            for path in [*self.directory.glob("*.codes"), *self.directory.glob("*.values.json")]:
+                path.unlink()
+            meta = {"source": fingerprint, "count": None, "fields": []}
+        self._meta = meta
+        self._columns = {}
+        return meta
+
+    def _write_meta(self, meta: dict) -> None:
+        """Save the metadata, atomically."""
+        tmp_path = self.directory / ".meta.json.tmp"
+        tmp_path.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp_path, self.directory / "meta.json")
+
+    def ensure(self, fields: list[str]) -> None:
+        """Encode the fields that are not encoded yet, in one pass over the source.
+
+        The first pass also counts the records, even with no fields. A pass
+        during which the source changes is started again, up to
+        `ENCODE_ATTEMPTS` times.
+
+        Args:
+            fields (list[str]): The field names.
+
+        Raises:
+            RuntimeError: If the source keeps changing while it is read.
+        """
+        with self._lock:
+            for _ in range(ENCODE_ATTEMPTS):
+                meta = self._check()
+                missing = [field for field in dict.fromkeys(fields) if field not in meta["fields"]]
+                if not missing and meta["count"] is not None:
+                    return
+                encoders, codes, count = self._encode(missing)
+                if self.source.fingerprint() == meta["source"] and meta["count"] in (None, count):
+                    break
+                # The source changed while it was read: start again
+                self._meta = None
+                (self.directory / "meta.json").unlink(missing_ok=True)
+            else:
+                msg = (f"The source {self.source.name} changed while it was read, "
+                       f"{ENCODE_ATTEMPTS} times in a row: try again once it is stable.")
+                raise RuntimeError(msg)
+
+            for field, encoder, column in zip(missing, encoders, codes):
+                with (self.directory / f"{field}.codes").open("wb") as f:
+                    column.tofile(f)
+                (self.directory / f"{field}.values.json").write_text(json.dumps([None, *encoder]), encoding="utf-8")
+                self._columns[field] = ([None, *encoder], np.frombuffer(column, dtype=np.uint32)
+                                        if np is not None else column)
+            meta["fields"].extend(missing)
+            meta["count"] = count
+            self._write_meta(meta)
+
+    def _encode(self, fields: list[str]) -> tuple[list[dict], list[array], int]:
+        """Read the source once, dictionary-encoding some fields.
+
+        Returns:
+            tuple[list[dict], list[array], int]: The code of each value and the
+            codes of the records, per field, and the number of records.
+        """
+        encoders: list[dict] = [{} for _ in fields]
+        codes = [array("I") for _ in fields]
+        count = 0
+        for row in self.source.rows(fields):
+            count += 1
+            for value, encoder, column in zip(row, encoders, codes):
+                if value is None or value == "":
+                    column.append(MISSING)
+                    continue
+                code = encoder.get(value)
+                if code is None:
+                    code = encoder[value] = len(encoder) + 1
+                column.append(code)
+        return encoders, codes, count
+
+    def column(self, field: str) -> tuple[list, object]:
+        """Get the encoding of a field.
+
+        Args:
+            field (str): The field name.
+
+        Returns:
+            tuple[list, object]: The values (None first, for missing values) and
+            the code of each record (a NumPy array, or an `array` without NumPy).
+        """
+        with self._lock:
+            self.ensure([field])
+            if field not in self._columns:
+                values = json.loads((self.directory / f"{field}.values.json").read_text(encoding="utf-8"))
+                path = self.directory / f"{field}.codes"
+                if np is not None:
+                    codes = np.fromfile(path, dtype=np.uint32)
+                else:
+                    codes = array("I")
+                    with path.open("rb") as f:
+                        codes.fromfile(f, path.stat().st_size // codes.itemsize)
+                self._columns[field] = (values, codes)
+            return self._columns[field]
+
+    def _mask(self, node: Node, count: int) -> object:
+        """Evaluate a compiled query over the encodings.
+
+        Leaf clauses are evaluated once per distinct value of their field.
+
+        Returns:
+            object: A boolean NumPy array, or a bytearray of 0 and 1 without NumPy.
+        """
+        if isinstance(node, Periode):
+            return self._mask(node.clause, count)
+        if isinstance(node, MatchAll):
+            return np.ones(count, dtype=bool) if np is not None else bytearray(b"\x01" * count)
+        if isinstance(node, Not):
+            mask = self._mask(node.clause, count)
+            return ~mask if np is not None else mask.translate(_FLIP)
+        if isinstance(node, (And, Or)):
+            masks = [self._mask(clause, count) for clause in node.clauses]
+            if np is not None:
+                combine = np.logical_and if isinstance(node, And) else np.logical_or
+                return combine.reduce(masks)
+            bits = [int.from_bytes(mask, "little") for mask in masks]
+            result = bits[0]
+            for other in bits[1:]:
+                result = result & other if isinstance(node, And) else result | other
+            return bytearray(result.to_bytes(count, "little"))
+        values, codes = self.column(node.field)
+        table = [node.matches({node.field: value}, []) for value in values]
+        if np is not None:
+            return np.array(table, dtype=bool)[codes]
+        table = bytes(table)
+        return bytearray(table[code] for code in codes)
+
+    def count(self, q: str | None = None) -> int:
+        """Count the records, or the records matching a query.
+
+        Args:
+            q (str | None, optional): The query, in the syntax of the API.
+
+        Raises:
+            ValueError: If the query is malformed.
+
+        Returns:
+            int: The number of records.
+        """
+        with self._lock:
+            query = parse_query(q) if q else None
+            self.ensure(sorted(query.fields()) if query else [])
+            count = self._meta["count"]
+            if query is None:
+                return count
+            mask = self._mask(query.root, count)
+            return int(mask.sum()) if np is not None else sum(mask)
+
+    def facettes(self, fields: str | list[str], q: str | None = None) -> list[dict]:
+        """Count the records by value of some fields, like the API's `facette.champ`.
+
+        Args:
+            fields (str | list[str]): The field names (a list or a comma-separated string).
+            q (str | None, optional): Only count the records matching this query.
+
+        Raises:
+            ValueError: If the query is malformed.
+
+        Returns:
+            list[dict]: One facet per field: `nom`, `total`, `manquants` (records
+            with no value), `modalites` (distinct values) and `valeurs`, the
+            `valeur` / `nombre` pairs by decreasing count.
+        """
+        fields = _split_fields(fields)
+        with self._lock:
+            query = parse_query(q) if q else None
+            self.ensure([*fields, *(sorted(query.fields()) if query else [])])
+            mask = self._mask(query.root, self._meta["count"]) if query else None
+            facettes = []
+            for field in fields:
+                values, codes = self.column(field)
+                if np is not None:
+                    counts = np.bincount(codes if mask is None else codes[mask], minlength=len(values)).tolist()
+                else:
+                    counter = Counter(codes if mask is None else compress(codes, mask))
+                    counts = [counter.get(code, 0) for code in range(len(values))]
+                valeurs = sorted(((_facet_value(values[code]), number) for code, number in enumerate(counts)
+                                  if code != MISSING and number), key=lambda item: (-item[1], item[0]))
+                facettes.append({
+                    "nom": field,
+                    "total": sum(counts),
+                    "manquants": counts[MISSING],
+                    "modalites": len(valeurs),
+                    "valeurs": [{"valeur": valeur, "nombre": nombre} for valeur, nombre in valeurs],
+                })
+            return facettes
@@ -0,0 +1,307 @@
+"""Column-oriented result frames.
+
+A `ColumnarFrame` keeps bulk results as one typed buffer per field instead of
+one nested dict per record, which uses a fraction of the memory and can be
+handed to NumPy, pandas or Arrow for vectorized analytics:
+
+    date fields               days since 1970-01-01 (int64, NULL_INT if missing)
+    dateDernierTraitement*    seconds since 1970-01-01 (int64, NULL_INT if missing)
+    codes (categorieJuridique*, activitePrincipale*, trancheEffectifs*, ...)
+                              dictionary encoded: int32 codes (-1 if missing)
+                              and the list of categories
+    booleans                  int8 (1, 0, or -1 if missing)
+    counts and years          int64 (NULL_INT if missing)
+    other fields              Python strings
+
+Fields are looked up in the record, its nested objects and its current
+period (see `utils.get_record_field`). The buffers are standard library
+`array.array`s; NumPy, pandas and pyarrow are only needed for the conversions:
+
+    pip install pyinsee[pandas]   # or pyinsee[arrow]
+
+Example:
+    client = InseeClient()
+    frame = client.to_frame(data_type="siren",
+                            q="periode(activitePrincipaleUniteLegale:62.01Z)",
+                            champs="siren,dateCreationUniteLegale,categorieJuridiqueUniteLegale")
+    df = frame.to_pandas()
+"""
+from __future__ import annotations
+
+import datetime as dt
+import importlib
+from array import array
+from typing import Iterable
+
+from .utils import get_record_field
+
+# Null value of the int64 columns (also NaT once viewed as datetime64)
+NULL_INT = -(2 ** 63)
+
+# Column kinds by field name prefix, checked in order (other fields are strings)
+FIELD_KINDS = (
+    ("dateDernierTraitement", "datetime"),
+    ("date", "date"),
+    ("nombrePeriodes", "int"),
+    ("anneeEffectifs", "int"),
+    ("anneeCategorieEntreprise", "int"),
+    ("changement", "bool"),
+    ("etablissementSiege", "bool"),
+    ("unitePurgee", "bool"),
+    ("categorieJuridique", "category"),
+    ("categorieEntreprise", "category"),
+    ("trancheEffectifs", "category"),
+    ("activitePrincipale", "category"),
+    ("nomenclatureActivitePrincipale", "category"),
+    ("etatAdministratif", "category"),
+    ("caractereEmployeur", "category"),
+    ("economieSocialeSolidaire", "category"),
+    ("societeMission", "category"),
+    ("statutDiffusion", "category"),
+    ("sexe", "category"),
+    ("codePostal", "category"),
+    ("codeCommune", "category"),
+    ("libelleCommune", "category"),
+    ("typeVoie", "category"),
+    ("codePays", "category"),
+)
+
+_EPOCH_ORDINAL = dt.date(1970, 1, 1).toordinal()
+_EPOCH = dt.datetime(1970, 1, 1)  # noqa: DTZ001 - INSEE timestamps are naive
+
+
+def field_kind(field: str) -> str:
+    """Get the column kind of a field ("date", "datetime", "int", "bool", "category" or "str")."""
+    for prefix, kind in FIELD_KINDS:
+        if field.startswith(prefix):
+            return kind
+    return "str"
+
+
+def record_fields(record: dict) -> list[str]:
+    """List the scalar fields of a record, its nested objects and its current period.
+
+    Args:
+        record (dict): The `uniteLegale` or `etablissement` record.
+
+    Returns:
+        list[str]: The field names, in order of appearance.
+    """
+    fields = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            fields.update(dict.fromkeys(k for k, v in value.items() if not isinstance(v, (dict, list))))
+        elif isinstance(value, list):
+            if key in ("periodesUniteLegale", "periodesEtablissement") and value:
+                fields.update(dict.fromkeys(k for k, v in value[0].items() if not isinstance(v, (dict, list))))
+        else:
+            fields[key] = None
+    return list(fields)
+
+
+def _import(module: str, extra: str) -> object:
+    """Import an optional dependency, with a helpful message if it is missing."""
+    try:
+        return importlib.import_module(module)
+    except ImportError as err:
+        msg = f"This conversion requires {module}. Install it with `pip install pyinsee[{extra}]`."
+        raise ImportError(msg) from err
+
+
+class Column:
+    """A typed buffer holding the values of one field.
+
+    Args:
+        name (str): The field name.
+        kind (str | None, optional): The column kind. Defaults to `field_kind(name)`.
+
+    Attributes:
+        name (str): The field name.
+        kind (str): The column kind.
+        values (array | list): The values, or the codes of a category column.
+        categories (list[str]): The categories of a category column.
+    """
+
+    __slots__ = ("name", "kind", "values", "categories", "_codes")
+
+    def __init__(self, name: str, kind: str | None = None) -> None:
+        """Initialize an empty column."""
+        self.name = name
+        self.kind = kind or field_kind(name)
+        self.categories: list[str] = []
+        self._codes: dict[str, int] = {}
+        if self.kind in ("date", "datetime", "int"):
+            self.values = array("q")
+        elif self.kind == "bool":
+            self.values = array("b")
+        elif self.kind == "category":
+            self.values = array("i")
+        else:
+            self.values = []
+
+    def __len__(self) -> int:
+        """Get the number of values."""
+        return len(self.values)
+
+    def append(self, value: object) -> None:
+        """Append a raw JSON value, converting it to the column type."""
+        kind = self.kind
+        if value is None:
+            self.values.append(None if kind == "str" else NULL_INT if kind in ("date", "datetime", "int") else -1)
+        elif kind == "category":
+            code = self._codes.get(value)
+            if code is None:
+                code = self._codes[value] = len(self.categories)
+                self.categories.append(value)
+            self.values.append(code)
+        elif kind == "date":
+            try:
+                self.values.append(dt.date.fromisoformat(value).toordinal() - _EPOCH_ORDINAL)
+            except ValueError:
+                self.values.append(NULL_INT)
+        elif kind == "datetime":
+            try:
+                self.values.append((dt.datetime.fromisoformat(value) - _EPOCH) // dt.timedelta(seconds=1))
+            except ValueError:
+                self.values.append(NULL_INT)
+        elif kind == "int":
+            try:
+                self.values.append(int(value))
+            except ValueError:
+                self.values.append(NULL_INT)
+        elif kind == "bool":
+            self.values.append(1 if value is True or value == "true" else 0)
+        else:
+            self.values.append(value)
+
+    def to_numpy(self) -> object:
+        """Get the column as a NumPy array (dates as datetime64, codes as int32).
+
+        The numeric buffers are shared, not copied.
+        """
+        np = _import("numpy", "pandas")
+        if self.kind == "str":
+            return np.array(self.values, dtype=object)
+        dtype = {"date": np.int64, "datetime": np.int64, "int": np.int64, "bool": np.int8, "category": np.int32}
+        values = np.frombuffer(self.values, dtype=dtype[self.kind]) if len(self.values) else np.empty(0, dtype[self.kind])
+        if self.kind == "date":
+            return values.view("datetime64[D]")
+        if self.kind == "datetime":
+            return values.view("datetime64[s]")
+        return values
+
+
+class ColumnarFrame:
+    """Column-oriented records.
+
+    Args:
+        columns (list[str] | str | None, optional): The fields to keep, as a list
+        or a comma separated string (like `champs`). Defaults to the fields of
+        the first record appended.
+
+    Attributes:
+        columns (dict[str, Column]): The columns, by field name.
+    """
+
+    def __init__(self, columns: list[str] | str | None = None) -> None:
+        """Initialize an empty frame."""
+        if isinstance(columns, str):
+            columns = [column.strip() for column in columns.split(",") if column.strip()]
+        self.columns: dict[str, Column] = {name: Column(name) for name in columns or []}
+        self._length = 0
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], columns: list[str] | str | None = None) -> ColumnarFrame:
+        """Build a frame from records.
+
+        Args:
+            records (Iterable[dict]): The records.
+            columns (list[str] | str | None, optional): The fields to keep.
+
+        Returns:
+            ColumnarFrame: The frame.
+        """
+        frame = cls(columns)
+        frame.extend(records)
+        return frame
+
+    def __len__(self) -> int:
+        """Get the number of records."""
+        return self._length
+
+    def __getitem__(self, name: str) -> Column:
+        """Get a column by field name."""
+        return self.columns[name]
+
+    def append(self, record: dict) -> None:
+        """Append one record (its other fields are ignored)."""
+        if not self.columns:
+            self.columns = {name: Column(name) for name in record_fields(record)}
+        for name, column in self.columns.items():
+            column.append(get_record_field(record, name))
+        self._length += 1
+
+    def extend(self, records: Iterable[dict]) -> None:
+        """Append several records, e.g. a page."""
+        for record in records:
+            self.append(record)
+
+    def to_numpy(self) -> dict:
+        """Get the columns as NumPy arrays (see `Column.to_numpy`).
+
+        Returns:
+            dict: The arrays, by field name.
+        """
+        return {name: column.to_numpy() for name, column in self.columns.items()}
+
+    def to_pandas(self) -> object:
+        """Get the frame as a pandas DataFrame.
+
+        Dates are datetime64 columns, codes are categoricals, and booleans and
+        counts are nullable columns.
+
+        Returns:
+            pandas.DataFrame: The data frame.
+        """
+        pd = _import("pandas", "pandas")
+        data = {}
+        for name, column in self.columns.items():
+            values = column.to_numpy()
+            if column.kind == "category":
+                data[name] = pd.Categorical.from_codes(values, categories=column.categories)
+            elif column.kind == "int":
+                data[name] = pd.arrays.IntegerArray(values, mask=values == NULL_INT)
+            elif column.kind == "bool":
+                data[name] = pd.arrays.BooleanArray(values == 1, mask=values == -1)
+            else:
+                data[name] = values
+        return pd.DataFrame(data)
+
+    def to_arrow(self) -> object:
+        """Get the frame as an Arrow table.
+
+        Dates are date32 and timestamp columns, and codes are dictionary columns.
+
+        Returns:
+            pyarrow.Table: The table.
+        """
+        pa = _import("pyarrow", "arrow")
+        data = {}
+        for name, column in self.columns.items():
+            values = column.to_numpy()
+            if column.kind == "str":
+                data[name] = pa.array(values, type=pa.string())
+            elif column.kind == "category":
+                indices = pa.array(values, mask=values == -1)
+                data[name] = pa.DictionaryArray.from_arrays(indices, pa.array(column.categories, type=pa.string()))
+            elif column.kind == "bool":
+                data[name] = pa.array(values == 1, mask=values == -1)
+            elif column.kind == "date":
+                days = values.view("int64")
+                data[name] = pa.array(days.astype("int32"), type=pa.date32(), mask=days == NULL_INT)
+            elif column.kind == "datetime":
+                seconds = values.view("int64")
+                data[name] = pa.array(seconds, type=pa.timestamp("s"), mask=seconds == NULL_INT)
+            else:
+                data[name] = pa.array(values, mask=values == NULL_INT)
+        return pa.table(data)
@@ -1,17 +1,29 @@
 """insee client CLI module."""
 from __future__ import annotations
+
 # testing random stuff using ssh
+import argparse
 import json
 import pprint
 import sys
-import argparse
 from pathlib import Path
+from typing import Iterator
+
 import requests
+
 sys.path.append(str(Path(__file__).parent.parent))
 
+from .checkpoint import CheckpointJournal
+from .exceptions import InseeError
+from .export import export_bulk, siren_partitions
+from .insee_client import MAX_PAGE_SIZE, InseeClient
 from .logger import logger
-from .insee_client import InseeClient
-from .utils import get_today_date, save_data
+from .mirror import SireneMirror
+from .processing import OUTPUT_FORMATS, process_raw
+from .store import RecordStore
+from .sync import DeltaSync
+from .utils import get_save_dir, get_today_date, save_data
+from .writer import SegmentWriter
 
 
 def parse_args() -> argparse.Namespace:
@@ -44,8 +56,7 @@ def parse_args() -> argparse.Namespace:
                              help="Start date or number")
     bulk_parser.add_argument("--nombre",
                              type=str,
-                             help="Number of items",
-                             default=20)
+                             help="Number of items per page (defaults to 20, or to the maximum page size with --all)")
     bulk_parser.add_argument("--tri",
                              type=str,
                              nargs="*",
@@ -65,6 +76,22 @@ def parse_args() -> argparse.Namespace:
                              type=bool,
                              help="Save data to a file",
                              default=False)
+    bulk_parser.add_argument("--compression",
+                             choices=["none", "gzip", "zstd"],
+                             help="Compression of the saved NDJSON segments (json only, "
+                                  "defaults to INSEE_SAVE_COMPRESSION)")
+    bulk_parser.add_argument("--raw",
+                             action="store_true",
+                             help="With --save, save the response body as-is (always the case for csv)")
+    bulk_parser.add_argument("--all",
+                             action="store_true",
+                             help="Follow the cursor and fetch every page (json only)")
+    bulk_parser.add_argument("--partitions",
+                             type=int,
+                             help="With --all, split the query into N SIREN ranges read in parallel")
+    bulk_parser.add_argument("--resume",
+                             action="store_true",
+                             help="With --all, continue after the last page recorded in the checkpoint journal")
 
     # Subparser for the 'get_by_number' command
     by_number_parser = subparsers.add_parser("insee_get_by_number",
@@ -89,6 +116,57 @@ def parse_args() -> argparse.Namespace:
                                   type=bool,
                                   help="Save data to a file",
                                   default=False)
+    by_number_parser.add_argument("--store",
+                                  action="store_true",
+                                  help="Serve the lookup from the local store, falling back to the API")
+
+    # Subparser for the 'store' command
+    store_parser = subparsers.add_parser("insee_store",
+                                         help="Import the saved raw data into the local store")
+    store_parser.add_argument("data_type",
+                              choices=["siren", "siret"],
+                              help="Type of data to import")
+
+    # Subparser for the 'sync' command
+    sync_parser = subparsers.add_parser("insee_sync",
+                                        help="Fetch the records changed since the last sync into the local store")
+    sync_parser.add_argument("data_type",
+                             choices=["siren", "siret"],
+                             help="Type of data to sync")
+    sync_parser.add_argument("--since",
+                             type=str,
+                             help="Start from this date (YYYY-MM-DD[THH:MM:SS]) instead of the last sync")
+    sync_parser.add_argument("--save",
+                             action="store_true",
+                             help="Also save the changed records as NDJSON segments")
+    sync_parser.add_argument("--compression",
+                             choices=["none", "gzip", "zstd"],
+                             help="Compression of the saved NDJSON segments "
+                                  "(defaults to INSEE_SAVE_COMPRESSION)")
+
+    # Subparser for the 'mirror' command
+    mirror_parser = subparsers.add_parser("insee_mirror",
+                                          help="Load Sirene stock files into the local mirror")
+    mirror_parser.add_argument("files",
+                               nargs="+",
+                               help="Stock files (CSV, gzipped CSV or zip archives)")
+
+    # Subparser for the 'process' command
+    process_parser = subparsers.add_parser("insee_process",
+                                           help="Flatten the saved raw data into processed tables")
+    process_parser.add_argument("data_type",
+                                choices=["siren", "siret"],
+                                help="Type of data to process")
+    process_parser.add_argument("--format",
+                                choices=list(OUTPUT_FORMATS),
+                                default="csv",
+                                help="Format of the processed tables")
+    process_parser.add_argument("--workers",
+                                type=int,
+                                help="Number of worker processes (defaults to INSEE_PROCESS_WORKERS)")
+    process_parser.add_argument("--batch-size",
+                                type=int,
+                                help="Number of records per part file (defaults to INSEE_PROCESS_BATCH_SIZE)")
     return parser.parse_args()
 
 
@@ -119,6 +197,95 @@ def save_metadata(response: requests.Response, data_type: str, response_type: st
                                data_type="metadata")
 
 
+def fetch_all_pages(client: InseeClient, args: argparse.Namespace, kwargs: dict) -> None:
+    """Fetch every page of a bulk query by following the cursor.
+
+    Each page is saved (or printed) as soon as it arrives, so memory use does not
+    grow with the number of pages. Saved pages go to compressed NDJSON segment
+    files with a manifest. Every page is recorded in the checkpoint journal once
+    it is printed or its segment is complete, so an interrupted export can be
+    continued with `--resume`; saved exports then append to the segments of the
+    interrupted run (the journal records their prefix).
+
+    Args:
+        client (InseeClient): The client used to query the API.
+        args (argparse.Namespace): The parsed command-line arguments.
+        kwargs (dict): The query parameters for the bulk request.
+
+    Returns:
+        None
+    """
+    journal = None if args.partitions else CheckpointJournal(buffered=args.save)
+    writer = None
+    if args.save:
+        # A resumed export appends to the segments of the interrupted one
+        last = None
+        if journal is not None and args.resume:
+            last = journal.last(client.checkpoint_fingerprint(args.data_type, **kwargs))
+        resumed_prefix = last.get("prefix") if last is not None else None
+        writer = SegmentWriter(directory=get_save_dir(response_data_type=args.data_type),
+                               prefix=resumed_prefix or f"{args.data_type}_{get_today_date()}",
+                               compression=args.compression,
+                               resume=resumed_prefix is not None)
+        if journal is not None:
+            journal.context["prefix"] = writer.prefix
+
+    if args.partitions:
+        pages = iter_partitioned_pages(client=client, args=args, kwargs=kwargs)
+    else:
+        # Saved pages are only durable once their segment is complete
+        pages = client.iter_bulk(data_type=args.data_type,
+                                 by_page=True,
+                                 resume=args.resume,
+                                 checkpoint=journal,
+                                 **kwargs)
+
+    try:
+        for records, _ in pages:
+            if writer is None:
+                pprint.pprint(records)
+                continue
+            segments = len(writer.segments)
+            writer.write_many(records)
+            if journal is not None and len(writer.segments) > segments:
+                journal.mark_durable()
+    except BaseException:
+        if writer is not None:
+            writer.abort()
+        raise
+
+    if writer is not None:
+        writer.close()
+        if journal is not None:
+            journal.commit()
+
+
+def iter_partitioned_pages(client: InseeClient, args: argparse.Namespace, kwargs: dict) -> Iterator[tuple[list, dict]]:
+    """Export a bulk query over SIREN range partitions, grouped in pages.
+
+    Args:
+        client (InseeClient): The client used to query the API.
+        args (argparse.Namespace): The parsed command-line arguments.
+        kwargs (dict): The query parameters for the bulk request.
+
+    Yields:
+        tuple[list, dict]: A `(records, header)` page of `nombre` records.
+    """
+    page_size = int(kwargs.get("nombre", MAX_PAGE_SIZE))
+    kwargs = {k: v for k, v in kwargs.items() if k != "curseur"}
+    records = []
+    for record in export_bulk(client,
+                              data_type=args.data_type,
+                              partitions=siren_partitions(args.partitions),
+                              **kwargs):
+        records.append(record)
+        if len(records) == page_size:
+            yield records, {"nombre": len(records), "partitions": args.partitions}
+            records = []
+    if records:
+        yield records, {"nombre": len(records), "partitions": args.partitions}
+
+
 def main() -> None:
     """Main function."""
     args = parse_args()
@@ -140,9 +307,58 @@ def main() -> None:
 
     print(title)
 
+    if args.command == "insee_process":
+        try:
+            logger.info("CLI command: insee_process | Processing raw data ...")
+            process_raw(data_type=args.data_type,
+                        output_format=args.format,
+                        workers=args.workers,
+                        batch_size=args.batch_size)
+        except (ValueError, OSError, ImportError) as e:
+            msg = f"Error: {e}"
+            logger.exception(msg)
+            sys.exit(1)
+        return
+
+    if args.command == "insee_store":
+        try:
+            logger.info("CLI command: insee_store | Importing raw data ...")
+            store = RecordStore()
+            stored = store.import_files(data_type=args.data_type)
+            logger.info("Imported %d record(s), the store holds %d %s record(s).",
+                        stored, store.count(args.data_type), args.data_type.upper())
+        except (ValueError, OSError) as e:
+            msg = f"Error: {e}"
+            logger.exception(msg)
+            sys.exit(1)
+        return
+
+    if args.command == "insee_sync":
+        try:
+            logger.info("CLI command: insee_sync | Syncing changed records ...")
+            sync = DeltaSync(client=InseeClient(content_type="json"), save=args.save, compression=args.compression)
+            pprint.pprint(sync.run(data_type=args.data_type, since=args.since))
+        except (ValueError, OSError, InseeError) as e:
+            msg = f"Error: {e}"
+            logger.exception(msg)
+            sys.exit(1)
+        return
+
+    if args.command == "insee_mirror":
+        try:
+            logger.info("CLI command: insee_mirror | Loading stock files ...")
+            mirror = SireneMirror()
+            for path in args.files:
+                mirror.ingest(path)
+        except (ValueError, OSError) as e:
+            msg = f"Error: {e}"
+            logger.exception(msg)
+            sys.exit(1)
+        return
+
     # Create an instance of InseeClient
     if args.command == "insee_get_by_number":
-        client = InseeClient(content_type="json")
+        client = InseeClient(content_type="json", store=RecordStore() if args.store else None)
     else:
         client = InseeClient(content_type=args.content_type)
 
@@ -151,6 +367,11 @@ def main() -> None:
                                                                    "content_type",
                                                                    "command",
                                                                    "save",
+                                                                   "all",
+                                                                   "partitions",
+                                                                   "resume",
+                                                                   "raw",
+                                                                   "compression",
                                                                    ] and v not in [
                                                                        None,
                                                                        "",
@@ -159,7 +380,30 @@ def main() -> None:
         # To ensure that the masquerValeursNulles parameter is correctly set as a key
         if 'mvn' in kwargs.keys():
             kwargs['masquerValeursNulles'] = kwargs.pop('mvn')
+        if args.all and args.content_type != "json":
+            logger.error("--all is only supported with the json content type.")
+            sys.exit(1)
+        if (args.partitions or args.resume) and not args.all:
+            logger.error("--partitions and --resume require --all.")
+            sys.exit(1)
+        if args.partitions and args.resume:
+            logger.error("--partitions cannot be combined with --resume.")
+            sys.exit(1)
         try:
+            if args.all:
+                logger.info("CLI command: insee_get_bulk | Fetching all pages ...")
+                fetch_all_pages(client=client, args=args, kwargs=kwargs)
+                return
+            if args.save and (args.raw or args.content_type == "csv"):
+                # Stream the response body to disk as-is instead of decoding it
+                logger.info("CLI command: insee_get_bulk | Downloading bulk data ...")
+                download = client.download_bulk(data_type=args.data_type, **kwargs)
+                if download is not None:
+                    save_metadata(response=download,
+                                  data_type=args.data_type,
+                                  response_type="csv",
+                                  response_data_type=args.data_type)
+                return
             logger.info("CLI command: insee_get_bulk | Fetching bulk data ...")
             response = client.get_bulk(data_type=args.data_type, **kwargs)
 
@@ -170,27 +414,19 @@ def main() -> None:
                               response_data_type=args.data_type)
                 if args.content_type == "json":
                     if args.save:
-                        data_list = response[0]
-                        data_dict = {}
-                        for item in data_list:
-                            data_dict[item["siren"]] = item
-
-                        save_data(data=data_dict, 
-                              filename=f"{args.data_type}_{args.content_type}_{get_today_date()}.{args.content_type}", 
-                              response_type=args.content_type, response_data_type=args.data_type)
+                        with SegmentWriter(directory=get_save_dir(response_data_type=args.data_type),
+                                           prefix=f"{args.data_type}_{get_today_date()}",
+                                           compression=args.compression) as writer:
+                            writer.write_many(response[0])
                     else:
                         pprint.pprint(response[0])
                     
                 else:
-                    if args.save:
-                        save_data(data=response[0].decode("utf-8"),
-                              filename=f"{args.data_type}_{args.content_type}_{get_today_date()}.{args.content_type}",
-                              response_type=args.content_type, response_data_type=args.data_type)
-                    else:
-                        print(type(response[0].decode("utf-8")))
-                        print(response[0].decode("utf-8").replace("\\n", "\n"))
+                    # csv responses saved to disk were streamed by download_bulk above
+                    print(type(response[0].decode("utf-8")))
+                    print(response[0].decode("utf-8").replace("\\n", "\n"))
 
-        except ValueError as e:
+        except (ValueError, OSError, InseeError) as e:
             msg = f"Error: {e}"
             logger.exception(msg)
             sys.exit(1)
@@ -201,6 +437,7 @@ def main() -> None:
                                                                    "id_code",
                                                                    "command",
                                                                    "save",
+                                                                   "store",
                                                                    ] and v not in [None,
                                                                                   "",
                                                                                   [],
@@ -234,7 +471,7 @@ def main() -> None:
                               filename=f"{args.data_type}_{args.content_type}_{get_today_date()}.{args.content_type}", 
                               response_type=args.content_type, response_data_type=args.data_type)
 
-        except ValueError as e:
+        except (ValueError, InseeError) as e:
             msg = f"Error: {e}"
             logger.exception(msg)
             sys.exit(1)
@@ -24,24 +24,75 @@ Example:
 """
 from __future__ import annotations
 
-import base64
-import json
-from .logger import logger
-from typing import ClassVar, TypedDict
+import logging
+import re
+import time
+from pathlib import Path
+from typing import ClassVar, Iterator, TypedDict
+
 import requests
 
-from .config import (
-    CLIENT_KEY,
-    CLIENT_SECRET,
-    INSEE_DATA_URL,
-    RESPONSE_CODES,
-    API_KEY,
-)
-from .utils import QueryBuilder
+from . import config
+from .auth import TokenManager, get_default_token_manager
+from .cache import ResponseCache
+from .checkpoint import CheckpointJournal
+from .config import RESPONSE_CODES
+from .decoding import JsonArrayStream, loads
+from .frames import ColumnarFrame
+from .logger import log_request, logger
+from .mirror import SireneMirror
+from .query import parse_query
+from .records import RECORD_TYPES, to_records
+from .store import STORE_HEADER, RecordStore
+from .transport import Transport, get_default_transport
+from .utils import PreparedQuery, QueryBuilder, get_today_date, save_stream
 
 # adding the query bulder to the class
 QUERY_BUILDER = QueryBuilder()
 
+# Parameters accepted by each endpoint, with their types and validations
+_DATE_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}")
+_BULK_TYPES: dict[str, type | tuple] = {
+    "q": str,
+    "date": str,
+    "curseur": str,
+    "debut": (str, int),
+    "nombre": (str, int),
+    "tri": (str, list),
+    "champs": (str, list),
+    "facette.champ": (str, list),
+    "masquerValeursNulles": (str, bool),
+}
+_BULK_PATTERNS = {"date": _DATE_PATTERN}
+# Malformed `q` queries are rejected before they cost a request
+_BULK_VALIDATORS = {"q": parse_query}
+_NUMBER_TYPES: dict[str, type | tuple] = {
+    "date": str,
+    "champs": (str, list),
+    "masquerValeursNulles": (str, bool),
+}
+_NUMBER_PATTERNS = {"date": _DATE_PATTERN}
+_MANY_TYPES: dict[str, type | tuple] = {
+    "q": str,
+    "nombre": int,
+    "date": str,
+    "champs": (str, list),
+    "masquerValeursNulles": (str, bool),
+}
+_MANY_PATTERNS = {
+    "q": re.compile(r"^(siren|siret):\(\d+( OR \d+)*\)$"),
+    "date": _DATE_PATTERN,
+}
+
+# Largest page size accepted by the INSEE API when paging with a cursor
+MAX_PAGE_SIZE = 1000
+
+# Size of the network chunks fed to the streaming JSON decoder
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Size of the chunks written to disk by `download_bulk`
+RAW_CHUNK_SIZE = 1024 * 1024
+
 class BulkParams(TypedDict, total=False):
     """TypedDict for the BulkParams."""
     q: str | None
@@ -64,30 +115,36 @@ class InseeClient:
     Args:
         content_type (str, optional): The content type of the API response.
         Defaults to "json".
+        transport (Transport | None, optional): The pooled HTTP transport to use.
+        Defaults to the process-wide shared transport.
+        base_url (str | None, optional): The API base URL. Defaults to INSEE_DATA_URL.
+        token_manager (TokenManager | None, optional): The OAuth token manager.
+        Defaults to the process-wide shared token manager.
+        cache (ResponseCache | None, optional): A persistent cache for
+        `get_by_number` results. Defaults to None (no cache).
 
     Attributes:
         content_type (str): The content type of the API response.
+        transport (Transport): The pooled, keep-alive HTTP transport.
+        base_url (str): The API base URL.
+        token_manager (TokenManager): The OAuth token manager, created on first use.
+        cache (ResponseCache | None): The `get_by_number` response cache.
 
     Methods:
-        __init__(self, content_type : str = "json")
+        __init__(self, content_type : str = "json", transport : Transport | None = None,
+                 base_url : str | None = None, token_manager : TokenManager | None = None,
+                 cache : ResponseCache | None = None)
 
     class variables:
-        __api_key: ClassVar[str | None] = None
-        __base_url: ClassVar[str] = INSEE_DATA_URL
-        __credentials: ClassVar[str] = base64.b64encode(
-            f"{CONSUMER_KEY}:{CONSUMER_SECRET}".encode()).decode("utf-8")
         __response_codes: ClassVar[dict] = RESPONSE_CODES
-        __token_url: ClassVar[str] = "https://api.insee.fr/token"
-        )
 
     public methods:
         get_legal_data(self, data_type: str, id_code: str)
         get_bulk_data(self, data_type: str, **kwargs)
 
     private methods:
-        _set_class_variables(self)
+        _authorize(self)
         _save_data(self, data : dict, filename : str)
-        _get_token(self)
         _get_data(self, url : str)
         _get_bulk_data(self, url : str)
         _get_legal_data(self, url : str)
@@ -95,93 +152,90 @@ class InseeClient:
     """
 
     # Setting up the class variables
-    __api_key: ClassVar[str | None] = None
-    __base_url: ClassVar[str] = INSEE_DATA_URL
-    __credentials: ClassVar[str] = base64.b64encode(
-        f"{CLIENT_KEY}:{CLIENT_SECRET}".encode()).decode("utf-8")
     __response_codes: ClassVar[dict] = RESPONSE_CODES
-    __token_url: ClassVar[str] = "https://api.insee.fr/token"
 
-    def __init__(self, content_type : str = "json") -> None:
+    def __init__(self,
+                 content_type : str = "json",
+                 transport : Transport | None = None,
+                 base_url : str | None = None,
+                 token_manager : TokenManager | None = None,
+                 cache : ResponseCache | None = None,
+                 store : RecordStore | None = None,
+                 backend : str = "api",
+                 mirror : SireneMirror | None = None) -> None:
         """Initialize the LegalData class.
 
+        No request is sent here: the token manager is created, and the API
+        token fetched (or read from the shared token cache), on the first request.
+
         Args:
-            api_key (str): The API key for the insee API.
             content_type (str, optional): The content type of the API response.
             Defaults to "json".
+            transport (Transport | None, optional): The pooled HTTP transport.
+            Defaults to the process-wide shared transport.
+            base_url (str | None, optional): The API base URL. Defaults to INSEE_DATA_URL.
+            token_manager (TokenManager | None, optional): The OAuth token manager.
+            Defaults to the process-wide shared token manager.
+            cache (ResponseCache | None, optional): A persistent cache for
+            `get_by_number` results. Defaults to None (no cache).
+            store (RecordStore | None, optional): A local record store serving
+            `get_by_number` lookups without query parameters, and filled with
+            their API results. Defaults to None (no store).
+            backend (str, optional): "api" to query the INSEE API, or "mirror" to
+            answer `get_by_number`, `get_many` and bulk queries from the local
+            Sirene stock mirror. Defaults to "api".
+            mirror (SireneMirror | None, optional): The mirror used by the "mirror"
+            backend. Defaults to the mirror under `DATA_DIR/mirror`.
 
         Returns:
             None
 
         Raises:
-            ValueError: If the content type is not 'json' or 'csv'.
+            ValueError: If the content type is not 'json' or 'csv', if the backend
+            is not 'api' or 'mirror', or if the mirror backend is asked for csv.
         """
         if content_type not in ["json", "csv"]:
             msg = "Unsupported content type. Use 'json' or 'csv'."
             raise ValueError(msg)
+        if backend not in ["api", "mirror"]:
+            msg = "Unsupported backend. Use 'api' or 'mirror'."
+            raise ValueError(msg)
+        if backend == "mirror" and content_type != "json":
+            msg = "The mirror backend requires the 'json' content type."
+            raise ValueError(msg)
+        # The mirror backend answers locally and does not need the API settings
+        self.base_url = base_url or config.get_settings().insee_data_url
+        if backend == "api" and not all([InseeClient.__response_codes, self.base_url]):
+            msg = "One or more required environment variables are missing."
+            raise ValueError(msg)
 
-        # Ensure class-level variables are set (this method will run once per class)
-        self._set_class_variables()
+        self.transport = transport if transport is not None else get_default_transport()
+        self._token_manager = token_manager
+        self.cache = cache
+        self.store = store
+        self.backend = backend
+        self.mirror = (mirror if mirror is not None else SireneMirror()) if backend == "mirror" else None
 
         self.content_type = content_type
-        self.headers = {
-            'X-INSEE-Api-Key-Integration': f"{InseeClient.__api_key}",
-        }
+        self.headers = {}
         self._set_headers(content_type=content_type)
 
-    @classmethod
-    def _set_class_variables(cls) -> None:
-        """Set the class-level variables such as API key and credentials."""
-        # Check if essential variables are set
-        if not all([cls.__response_codes, cls.__base_url, cls.__credentials]):
-            msg = "One or more required environment variables are missing."
-            raise ValueError(msg)
-
-        # Only request a new API key if it's not already set
-        if cls.__api_key is None:
-            logger.info("Fetching new API key from INSEE.")
-            cls._fetch_api_key()
-
-    @classmethod
-    def _fetch_api_key(cls) -> None:
-        """Fetch the API key (token) by authenticating with the INSEE API."""
-        url = cls.__token_url
-        headers = {
-            "Authorization": f"Basic {cls.__credentials}",
-            "Content-Type": "application/x-www-form-urlencoded",
-            "grant_type": "client_credentials",
-        }
-        data = {"grant_type": "client_credentials"}
-
-        response = requests.post(url, headers=headers, data=data, timeout=10)
-
-        if response.status_code == cls.__response_codes["OK"]:
-            try:
-                data = response.json()
-                msg = f" Expires in: {data.get('expires_in')} Seconds"
-                logger.warning(msg)
-                msg = f" Token type: {data.get('token_type')}"
-                logger.warning(msg)
-                cls.__api_key = data.get("access_token")
-                logger.info("API key retrieved successfully.")
-            except json.JSONDecodeError:
-                logger.exception("Failed to decode JSON response for API key.")
-                msg = "Invalid API response."
-                raise ValueError(msg) from json.JSONDecodeError
-        else:
-            msg = f"Failed to authenticate with INSEE: {response.status_code}, {response.text}"
-            logger.error(msg)
-            msg = "Failed to authenticate with INSEE API. setting the api key from env variable."
-            logger.warning(msg)
-
-            # setting up the API key from the env variable if the retrieval fails
-            if API_KEY:
-                cls.__api_key = API_KEY 
-            else:
-                msg = "API_KEY is not set in the environment variables."
-                raise ValueError(msg)
+    @property
+    def token_manager(self) -> TokenManager:
+        """The OAuth token manager (the shared one unless given), created on first use."""
+        if self._token_manager is None:
+            self._token_manager = get_default_token_manager()
+        return self._token_manager
 
+    def _authorize(self) -> str:
+        """Set the current API token in the headers, refreshing it if needed.
 
+        Returns:
+            str: The token sent with the next request.
+        """
+        token = self.token_manager.get_token()
+        self.headers["X-INSEE-Api-Key-Integration"] = token
+        return token
 
     def _set_headers(self, content_type: str = "json") -> None:
         """Set headers according to the content type.
@@ -196,7 +250,7 @@ class InseeClient:
         Raises:
             ValueError: If the content type is not 'json' or 'csv'.
         """
-        logger.info("Setting headers' content type...")
+        logger.debug("Setting headers' content type...")
         if content_type == "json":
             self.headers["Accept"] = "application/json"
         elif content_type == "csv":
@@ -204,8 +258,7 @@ class InseeClient:
         else:
             msg = "Unsupported content type. Use 'json' or 'csv'."
             raise ValueError(msg)
-        msg = f"Content type is set to {content_type}."
-        logger.info(msg)
+        logger.debug("Content type is set to %s.", content_type)
 
     def _get_headers(self) -> dict:
         """Get the headers for the API request.
@@ -217,39 +270,85 @@ class InseeClient:
 
     def _get_info(self) -> dict:
         """Get the information about the API."""
-        url = f"{InseeClient.__base_url}informations"
+        url = f"{self.base_url}informations"
         context = f" Getting information... | [{self.content_type}]"
         response = self._get_request(url=url, headers=self.headers, context=context)
         return response.json()
 
-    def _get_request(self, url: str, headers: dict, context: str) -> requests.Response:  # noqa: E501
-        """Get the request for the API.
-    
+    def _send_request(self, method: str, url: str, headers: dict, context: str, **kwargs: dict) -> requests.Response:
+        """Send a request to the API with the current token.
+
+        Timeouts, connection errors, 429 and 5xx responses are retried by the
+        transport. A 401 response refreshes the token and the request is sent
+        once more. Other client errors (4xx) are logged and returned.
+
         Args:
+            method (str): The HTTP method ("GET" or "POST").
             url (str): The URL for the API request.
             headers (dict): The headers for the API request.
             context (str): The context of the API request.
-    
+            **kwargs (dict): Extra arguments for the transport (e.g. `data`).
+
         Returns:
             requests.Response: The response from the API.
-    
+
         Raises:
-            requests.exceptions.RequestException: If the request fails.
+            InseeRequestError: If the request still fails once the retries run out.
         """
-        logger.info("Requesting %s", context)
+        log_request(logging.INFO, "Requesting %s", context, method=method, url=url)
+        token = self._authorize()
+        response = self.transport.request(method, url, headers=headers, **kwargs)
+        if response.status_code == RESPONSE_CODES["UNAUTHORIZED"]:
+            # The token was revoked or expired early: refresh it and retry once. The
+            # short error body of a streamed response is read before closing it, so
+            # that its connection goes back to the pool instead of being dropped
+            _ = response.content
+            response.close()
+            self.token_manager.invalidate(token)
+            self._authorize()
+            response = self.transport.request(method, url, headers=headers, **kwargs)
         try:
-            response = requests.get(url=url, headers=headers, timeout=10)
             response.raise_for_status()  # Raise HTTPError for bad responses
         except requests.exceptions.HTTPError as http_err:
             logger.error(f"HTTP error occurred: {http_err}")
-        except requests.exceptions.RequestException as req_err:
-            logger.error(f"Request error occurred: {req_err}")
-        except Exception as err:
-            logger.error(f"An unexpected error occurred: {err}")
-        else:
-            return response
         return response
 
+    def _get_request(self, url: str, headers: dict, context: str) -> requests.Response:  # noqa: E501
+        """Get the request for the API.
+    
+        Args:
+            url (str): The URL for the API request.
+            headers (dict): The headers for the API request.
+            context (str): The context of the API request.
+    
+        Returns:
+            requests.Response: The response from the API.
+    
+        Raises:
+            InseeRequestError: If the request still fails once the retries run out.
+        """
+        return self._send_request("GET", url=url, headers=headers, context=context)
+
+    def _post_request(self, url: str, headers: dict, data: dict, context: str) -> requests.Response:
+        """Post a form-encoded request to the API.
+
+        The INSEE search endpoints accept their parameters as a POST form, which
+        avoids `URI_TOO_LONG` errors for long `q` queries.
+
+        Args:
+            url (str): The URL for the API request.
+            headers (dict): The headers for the API request.
+            data (dict): The form parameters for the API request.
+            context (str): The context of the API request.
+
+        Returns:
+            requests.Response: The response from the API.
+
+        Raises:
+            InseeRequestError: If the request still fails once the retries run out.
+        """
+        return self._send_request("POST", url=url, headers=headers, context=context, data=data)
+
     @staticmethod
     def verify_siren(siren : (int | str)) -> bool:
         """Verify if the siren is valid.
@@ -278,11 +377,17 @@ class InseeClient:
 
     def get_bulk(self,
                       data_type: str = "siren",
+                      as_columns: bool = False,
+                      as_records: bool = False,
                       **kwargs: BulkParams) -> dict:
         """Get bulk data (SIREN or SIRET) from INSEE API.
 
         Args:
             data_type (str): The type of data to retrieve, either "siren" or "siret".
+            as_columns (bool, optional): Return the records as a `ColumnarFrame`
+            of the `champs` fields (json only). Defaults to False.
+            as_records (bool, optional): Return the records as compact `UniteLegale`
+            or `Etablissement` objects (json only). Defaults to False.
             **kwargs (dict | None): The query parameters for the API request.
                 q: str
                 date: str
@@ -296,106 +401,632 @@ class InseeClient:
 
         Raises:
             ValueError: If the query parameters are not valid or if `data_type` is not valid.
+            InseeRequestError: If the request still fails once the retries run out.
 
         Returns:
             dict: The response from the API.
         """
+        url = self._build_bulk_url(data_type=data_type, query_kwargs=kwargs)
+
+        # Logging the request (for a sample of the requests)
+        log_request(logging.INFO, "Fetching bulk %s data...", data_type.upper(), data_type=data_type)
+        context = f"Fetching bulk {data_type.upper()} data from {url} | [{self.content_type}]"
+
+        # Make the request (or answer it from the mirror)
+        response = None
+        if self.mirror is None:
+            response = self._get_request(url=url, headers=self.headers, context=context)
+
+        # Handle response
+        if self.content_type == "json":
+            if self.mirror is not None:
+                page = self.mirror.get_bulk(data_type=data_type, **kwargs)
+            else:
+                page = self._unwrap_bulk(data_type=data_type,
+                                         status_code=response.status_code,
+                                         payload=self._decode_json(response.content))
+            if as_columns and page is not None:
+                return ColumnarFrame.from_records(page[0], columns=kwargs.get("champs")), page[1]
+            if as_records and page is not None:
+                return to_records(data_type, page[0]), page[1]
+            return page
+
+        # Return raw content for non-JSON content types
+        return response.content, response.headers
+
+    def download_bulk(self,
+                      data_type: str = "siren",
+                      filename: str | None = None,
+                      **kwargs: BulkParams) -> tuple[Path, dict] | None:
+        """Save the raw response of a bulk query to `raw/insee/<type>/<format>`.
+
+        The response body (JSON or CSV, as the client content type) is written
+        to disk in fixed-size chunks as it is downloaded, without being decoded,
+        then synced and atomically renamed. Memory use stays flat whatever the
+        size of the page.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            filename (str | None, optional): The name of the file. Defaults to
+            `{data_type}_{content_type}_{date}.{content_type}`.
+            **kwargs (dict | None): The query parameters accepted by `get_bulk`.
+
+        Raises:
+            ValueError: If the query parameters are not valid or if `data_type` is not valid.
+            InseeRequestError: If the request still fails once the retries run out.
+
+        Returns:
+            tuple[Path, dict] | None: The saved file and the response headers, or
+            None if the request failed.
+        """
+        if self.mirror is not None:
+            msg = "download_bulk saves API responses and is not available with the mirror backend."
+            raise ValueError(msg)
+        url = self._build_bulk_url(data_type=data_type, query_kwargs=kwargs)
+        context = f"Downloading bulk {data_type.upper()} data from {url} | [{self.content_type}]"
+        if filename is None:
+            filename = f"{data_type}_{self.content_type}_{get_today_date()}.{self.content_type}"
+
+        with self._send_request("GET", url=url, headers=self.headers, context=context, stream=True) as response:
+            if response.status_code >= RESPONSE_CODES["BAD_REQUEST"]:
+                # Log the error message of the API
+                self._unwrap_bulk(data_type=data_type,
+                                  status_code=response.status_code,
+                                  payload=self._decode_json(response.content))
+                return None
+
+            path = save_stream(chunks=response.iter_content(chunk_size=RAW_CHUNK_SIZE),
+                               filename=filename,
+                               response_data_type=data_type,
+                               response_type=self.content_type)
+            logger.info("Saved bulk %s data to %s.", data_type.upper(), path)
+            return path, dict(response.headers)
+
+    def prepare_bulk(self, data_type: str = "siren", **kwargs: BulkParams) -> PreparedQuery:
+        """Validate and encode a bulk query once, to send it many times.
+
+        The returned query is rebound with the parameters that change between
+        requests, e.g. `prepared.url(curseur=cursor)`, without validating the
+        other parameters again. `iter_bulk` prepares its query this way.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            **kwargs (dict | None): The query parameters accepted by `get_bulk`.
+
+        Raises:
+            ValueError: If the query parameters are not valid or if `data_type` is not valid.
+            TypeError: If a query parameter is not of the expected type.
+
+        Returns:
+            PreparedQuery: The query, with the bulk endpoint of `data_type` as base URL.
+        """
         # Validate the data_type
         if data_type not in ["siren", "siret"]:
             msg = f"Invalid data type: {data_type}. Must be 'siren' or 'siret'."
             raise ValueError(msg)
 
-        # Expected keys
-        expected_keys: dict = {
-            "q": str,
-            "date": str,
-            "curseur": str,
-            "debut": (str, int),
-            "nombre": (str, int),
-            "tri": (str, list),
-            "champs": (str, list),
-            "facette.champ": (str, list),
-            "masquerValeursNulles": (str, bool),
-        }
-
-        # Regex patterns for special validations
-        regex_patterns: dict = {
-            "q": r"^[\w\s:()]+$",
-            "date": r"\d{4}-\d{2}-\d{2}",
-        }
-
         # Adjust the `facette.champ` argument if needed
         if "facette" in kwargs:
             kwargs["facette.champ"] = kwargs.pop("facette")
 
-        # Build the query string
-        query_string = QUERY_BUILDER.set_query_string(
-            query_kwargs=kwargs,
-            expected_types=expected_keys,
-            regex_patterns=regex_patterns,
-        )
+        return PreparedQuery(kwargs,
+                             expected_types=_BULK_TYPES,
+                             regex_patterns=_BULK_PATTERNS,
+                             validators=_BULK_VALIDATORS,
+                             base_url=f"{self.base_url}{data_type}")
 
-        # Build the URL based on the data type (siren or siret)
-        url = f"{InseeClient.__base_url}{data_type}?{query_string}"
+    def _build_bulk_url(self, data_type: str, query_kwargs: dict) -> str:
+        """Validate the bulk query parameters and build the request URL.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            query_kwargs (dict): The query parameters for the API request.
+
+        Raises:
+            ValueError: If the query parameters are not valid or if `data_type` is not valid.
+
+        Returns:
+            str: The URL for the API request.
+        """
+        return self.prepare_bulk(data_type, **query_kwargs).url()
+
+    @staticmethod
+    def _decode_json(content: bytes) -> dict | None:
+        """Decode a JSON response body, returning None if it is not valid JSON."""
+        try:
+            return loads(content)
+        except ValueError:
+            return None
 
-        # Logging the request
-        msg = f"Fetching bulk {data_type.upper()} data..."
-        logger.info(msg)
+    @staticmethod
+    def _unwrap_bulk(data_type: str, status_code: int, payload: dict | None) -> tuple[list, dict] | None:
+        """Extract the records and the header from a bulk JSON response.
+
+        Args:
+            data_type (str): The type of data requested, either "siren" or "siret".
+            status_code (int): The HTTP status code of the response.
+            payload (dict | None): The decoded JSON body of the response.
+
+        Returns:
+            tuple[list, dict] | None: The records and the header, or None if the
+            request failed.
+        """
+        # Handle errors
+        if status_code >= RESPONSE_CODES["BAD_REQUEST"] or payload is None:
+            status = f"Response code: {status_code}"
+            message = (payload or {}).get("header", {}).get("message")
+            description = f"Description: {message}"
+            msg = f"{status} - {description}"
+            logger.error(msg)
+            return None
+
+        # Facets (`facette.champ`) are returned with the header
+        header = payload["header"]
+        if "facettes" in payload:
+            header = {**header, "facettes": payload["facettes"]}
+
+        # Return the appropriate data based on the type
+        if data_type == "siren":
+            return payload["unitesLegales"], header
+        # "etablissements" if data_type == "siret":
+        return payload["etablissements"], header
+
+    def iter_bulk(self,
+                  data_type: str = "siren",
+                  by_page: bool = False,
+                  stream: bool = False,
+                  resume: bool = False,
+                  checkpoint: CheckpointJournal | None = None,
+                  **kwargs: BulkParams) -> Iterator[dict | tuple[list, dict]]:
+        """Iterate over every result of a bulk query by following the cursor.
+
+        Pages are requested one at a time with `curseur`, starting from "*" (or
+        the given `curseur`) and following `header["curseurSuivant"]` until it
+        stops changing, so only one page is held in memory at any time. With
+        `stream=True`, the records of each page are decoded one by one as the
+        response body arrives, so only one record is held in memory.
+
+        With `resume=True` (or a `checkpoint` journal), every page is recorded
+        in the checkpoint journal once the consumer is done with it, and an
+        export started again with `resume=True` continues after the last
+        recorded page. Pages are the unit of recovery: records of a page that
+        was being consumed when the export died are yielded again.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            by_page (bool, optional): Yield `(records, header)` pages instead of
+            single records (empty pages are skipped). Defaults to False.
+            stream (bool, optional): Decode the records while the response is
+            downloaded. Cannot be combined with `by_page`. Defaults to False.
+            resume (bool, optional): Continue after the last page recorded in
+            the checkpoint journal, and record the new pages. Defaults to False.
+            checkpoint (CheckpointJournal | None, optional): The checkpoint
+            journal. Defaults to the journal under `DATA_DIR/metadata` when
+            `resume` is True, and to no journal otherwise.
+            **kwargs (dict | None): The query parameters accepted by `get_bulk`,
+            except `debut`. `nombre` defaults to the maximum page size.
+
+        Raises:
+            ValueError: If the query parameters are not valid, if the client
+            content type is not "json" or if a page after the first one fails.
+            InseeRequestError: If the request still fails once the retries run out.
+
+        Yields:
+            dict | tuple[list, dict]: A record, or a `(records, header)` page.
+        """
+        if stream and by_page:
+            msg = "'stream' cannot be combined with 'by_page'."
+            raise ValueError(msg)
+        cursor = self._prepare_cursor(kwargs)
+        prepared = self.prepare_bulk(data_type, **kwargs)
+        page_number = 0
+
+        journal = checkpoint if checkpoint is not None or not resume else CheckpointJournal()
+        if journal is not None:
+            fingerprint = self.checkpoint_fingerprint(data_type, **kwargs)
+            last = journal.last(fingerprint) if resume else None
+            if last is not None:
+                if last["curseurSuivant"] is None:
+                    logger.info("The %s export %s is already complete (%d page(s)).",
+                                data_type.upper(), fingerprint, last["page"])
+                    return
+                cursor, page_number = last["curseurSuivant"], last["page"]
+                logger.info("Resuming the %s export %s after page %d.",
+                            data_type.upper(), fingerprint, page_number)
+
+        while True:
+            start = time.monotonic()
+            if stream:
+                response = yield from self._stream_bulk_page(data_type=data_type, prepared=prepared, curseur=cursor)
+            else:
+                response = self._fetch_bulk_page(data_type=data_type, prepared=prepared, curseur=cursor)
+            elapsed = time.monotonic() - start
+            if response is None:
+                if page_number == 0:
+                    # Nothing matched the query (or the first request failed)
+                    return
+                msg = f"Failed to fetch page {page_number + 1} of bulk {data_type.upper()} data (curseur={cursor})."
+                raise ValueError(msg)
+
+            records, header, size = response
+            page_number += 1
+            record_count = records if isinstance(records, int) else len(records)
+            self.transport.metrics.emit("page", data_type=data_type, page=page_number,
+                                        records=record_count, elapsed=elapsed)
+            if by_page:
+                if records:
+                    # The last page of a cursor may be empty: there is nothing to hand over
+                    yield records, header
+            elif not stream:
+                yield from records
+
+            next_cursor = self._next_cursor(records, header, cursor)
+            if journal is not None:
+                # The consumer asked for the next page: this one is done
+                journal.append({
+                    "fingerprint": fingerprint,
+                    "page": page_number,
+                    "curseur": cursor,
+                    "curseurSuivant": next_cursor,
+                    "records": record_count,
+                    "bytes": size,
+                    "elapsed": round(elapsed, 3),
+                })
+            cursor = next_cursor
+            if cursor is None:
+                logger.info("Reached the end of the %s cursor after %d page(s).",
+                            data_type.upper(), page_number)
+                return
+
+    def to_frame(self,
+                 data_type: str = "siren",
+                 **kwargs: BulkParams) -> ColumnarFrame:
+        """Get every result of a bulk query as a `ColumnarFrame`.
+
+        The pages are streamed (see `iter_bulk`) and each record is added to the
+        column buffers as soon as it is decoded, so the records are never all
+        held as dicts.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            **kwargs (dict | None): The query parameters accepted by `iter_bulk`.
+            The frame holds the `champs` fields, or every field of the first record.
+
+        Raises:
+            ValueError: If the query parameters are not valid or if a page fails.
+            InseeRequestError: If the request still fails once the retries run out.
+
+        Returns:
+            ColumnarFrame: The records.
+        """
+        frame = ColumnarFrame(columns=kwargs.get("champs"))
+        for record in self.iter_bulk(data_type=data_type, stream=True, **kwargs):
+            frame.append(record)
+        return frame
+
+    def _fetch_bulk_page(self,
+                         data_type: str,
+                         prepared: PreparedQuery,
+                         **kwargs: BulkParams) -> tuple[list, dict, int] | None:
+        """Get one bulk page with its size.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            prepared (PreparedQuery): The query prepared by `prepare_bulk`.
+            **kwargs (dict | None): The query parameters of this page, e.g. `curseur`.
+
+        Raises:
+            ValueError: If the query parameters are not valid.
+            InseeRequestError: If the request still fails once the retries run out.
+
+        Returns:
+            tuple[list, dict, int] | None: The records, the header and the size of
+            the response body in bytes, or None if the request failed.
+        """
+        url = prepared.url(**kwargs)
         context = f"Fetching bulk {data_type.upper()} data from {url} | [{self.content_type}]"
 
-        # Make the request
+        if self.mirror is not None:
+            page = self.mirror.get_bulk(data_type=data_type, **{**prepared.values, **kwargs})
+            return None if page is None else (page[0], page[1], 0)
+
         response = self._get_request(url=url, headers=self.headers, context=context)
+        page = self._unwrap_bulk(data_type=data_type,
+                                 status_code=response.status_code,
+                                 payload=self._decode_json(response.content))
+        if page is None:
+            return None
+        return page[0], page[1], len(response.content)
 
-        # Handle response
-        if self.content_type == "json":
-            # Handle errors
+    def _stream_bulk_page(self,
+                          data_type: str,
+                          prepared: PreparedQuery,
+                          **kwargs: BulkParams) -> Iterator[dict]:
+        """Yield the records of one bulk page as the response body arrives.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            prepared (PreparedQuery): The query prepared by `prepare_bulk`.
+            **kwargs (dict | None): The query parameters of this page, e.g. `curseur`.
+
+        Raises:
+            ValueError: If the query parameters are not valid or if the response
+            is not valid JSON.
+            InseeRequestError: If the request still fails once the retries run out.
+
+        Yields:
+            dict: A record.
+
+        Returns:
+            tuple[int, dict, int] | None: The number of records, the header and
+            the size of the response body in bytes, or None if the request failed.
+        """
+        url = prepared.url(**kwargs)
+        context = f"Streaming bulk {data_type.upper()} data from {url} | [{self.content_type}]"
+
+        if self.mirror is not None:
+            # Mirror pages are read from the local database, there is nothing to stream
+            page = self.mirror.get_bulk(data_type=data_type, **{**prepared.values, **kwargs})
+            if page is None:
+                return None
+            yield from page[0]
+            return len(page[0]), page[1], 0
+
+        with self._send_request("GET", url=url, headers=self.headers, context=context, stream=True) as response:
             if response.status_code >= RESPONSE_CODES["BAD_REQUEST"]:
-                status_code = f"Response code: {response.status_code}"
-                description = f"Description: {response.json()['header']['message']}"
-                msg = f"{status_code} - {description}"
+                return self._unwrap_bulk(data_type=data_type,
+                                         status_code=response.status_code,
+                                         payload=self._decode_json(response.content))
+
+            decoder = JsonArrayStream("unitesLegales" if data_type == "siren" else "etablissements")
+            size = 0
+            for chunk in response.iter_content(chunk_size=STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                yield from decoder.feed(chunk)
+            return decoder.count, decoder.close()["header"], size
+
+    def checkpoint_fingerprint(self, data_type: str = "siren", **kwargs: BulkParams) -> str:
+        """Identify a bulk query in the checkpoint journal, as `iter_bulk` records it.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            **kwargs (dict | None): The query parameters accepted by `iter_bulk`.
+
+        Raises:
+            ValueError: If the query cannot be paged with a cursor.
+
+        Returns:
+            str: The fingerprint of the query's journal (see `CheckpointJournal.last`).
+        """
+        kwargs = dict(kwargs)
+        self._prepare_cursor(kwargs)
+        return CheckpointJournal.fingerprint(data_type, kwargs)
+
+    def _prepare_cursor(self, query_kwargs: dict) -> str:
+        """Check that a query can be paged with a cursor and pop its start cursor.
+
+        Args:
+            query_kwargs (dict): The bulk query parameters, updated in place.
+
+        Raises:
+            ValueError: If the client content type is not "json" or if `debut` is given.
+
+        Returns:
+            str: The cursor of the first page.
+        """
+        if self.content_type != "json":
+            msg = "Cursor pagination requires a client with the 'json' content type."
+            raise ValueError(msg)
+        if "debut" in query_kwargs:
+            msg = "'debut' cannot be combined with cursor pagination."
+            raise ValueError(msg)
+
+        query_kwargs.setdefault("nombre", MAX_PAGE_SIZE)
+        return query_kwargs.pop("curseur", "*")
+
+    @staticmethod
+    def _next_cursor(records: list | int, header: dict, cursor: str) -> str | None:
+        """Get the cursor of the next page, or None once the cursor stops changing.
+
+        `records` is the page records, or their number for streamed pages.
+        """
+        next_cursor = header.get("curseurSuivant")
+        if not records or not next_cursor or next_cursor == cursor:
+            return None
+        return next_cursor
+
+    def get_many(self,
+                 data_type: str = "siren",
+                 ids: list[str | int] | None = None,
+                 batch_size: int = MAX_PAGE_SIZE,
+                 **kwargs: dict) -> tuple[list[dict], list[str]]:
+        """Get legal data for many siren or siret numbers with batched bulk queries.
+
+        The identifiers are packed into `q=siren:(A OR B OR ...)` queries posted
+        to the search endpoint, so one request fetches up to `batch_size`
+        records. When the server rejects a batch as too large (413/414), the
+        batch size is halved and the batch is sent again.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            ids (list[str | int]): The siren or siret numbers to look up.
+            batch_size (int, optional): The maximum number of identifiers per
+            request. Defaults to (and is capped at) 1000.
+            kwargs (dict | None): The query parameters for the API request.
+                date : str
+                champs : (str, list)
+                masquerValeursNulles: (str, bool)
+
+        Raises:
+            ValueError: If the query parameters, `data_type` or an identifier are
+            not valid, or if a batch fails.
+            InseeRequestError: If the request still fails once the retries run out.
+
+        Returns:
+            tuple[list[dict], list[str]]: The records found, in the order of the
+            input identifiers (duplicates removed), and the identifiers that were
+            not found.
+        """
+        # Validate the data_type
+        if data_type not in ["siren", "siret"]:
+            msg = f"Invalid data type: {data_type}. Must be 'siren' or 'siret'."
+            raise ValueError(msg)
+        if self.content_type != "json":
+            msg = "get_many requires a client with the 'json' content type."
+            raise ValueError(msg)
+        if batch_size < 1:
+            msg = "batch_size must be a positive integer."
+            raise ValueError(msg)
+
+        # Validate the identifiers, keeping the first occurrence of each one
+        verify = self.verify_siren if data_type == "siren" else self.verify_siret
+        unique_ids = list(dict.fromkeys(str(id_code) for id_code in ids or []))
+        for id_code in unique_ids:
+            if not id_code.isdigit() or not verify(id_code):
+                msg = f"Invalid {data_type.upper()} number: {id_code}."
+                raise ValueError(msg)
+
+        # The identifier is needed to put the records back in input order
+        champs = kwargs.get("champs")
+        if isinstance(champs, str) and data_type not in champs.split(","):
+            kwargs["champs"] = f"{champs},{data_type}"
+        elif isinstance(champs, list) and data_type not in champs:
+            kwargs["champs"] = [*champs, data_type]
+
+        if self.mirror is not None:
+            found = {record[data_type]: record
+                     for record in self.mirror.get_many(data_type=data_type, ids=unique_ids, **kwargs)}
+            missing = [id_code for id_code in unique_ids if id_code not in found]
+            return [found[id_code] for id_code in unique_ids if id_code in found], missing
+
+        # The common parameters are validated once, each batch only binds `q` and `nombre`; `q` is
+        # built from the identifiers checked above, so it is not validated again
+        prepared = PreparedQuery(kwargs, expected_types=_MANY_TYPES, regex_patterns=_MANY_PATTERNS,
+                                 base_url=f"{self.base_url}{data_type}", trusted=("q",))
+        url = prepared.base_url
+        records_key = "unitesLegales" if data_type == "siren" else "etablissements"
+        found: dict[str, dict] = {}
+        batch_size = min(batch_size, MAX_PAGE_SIZE)
+        position = 0
+
+        while position < len(unique_ids):
+            batch = unique_ids[position:position + batch_size]
+            params = prepared.params(q=QUERY_BUILDER.build_id_query(data_type, batch), nombre=len(batch))
+            context = (f"Fetching {len(batch)} {data_type.upper()} records "
+                       f"({position + len(batch)}/{len(unique_ids)}) | [{self.content_type}]")
+            response = self._post_request(url=url, headers=self.headers, data=params, context=context)
+
+            status_code = response.status_code
+            if status_code in (RESPONSE_CODES["URI_TOO_LONG"],
+                               RESPONSE_CODES["PAYLOAD_TOO_LARGE"]) and len(batch) > 1:
+                batch_size = len(batch) // 2
+                logger.warning("Batch rejected with status %d, reducing batch size to %d.",
+                               status_code, batch_size)
+                continue
+            if status_code == RESPONSE_CODES["NOT_FOUND"]:
+                # None of the identifiers of the batch exist
+                position += len(batch)
+                continue
+            if status_code >= RESPONSE_CODES["BAD_REQUEST"]:
+                msg = f"Failed to fetch {data_type.upper()} batch: response code {status_code} - {response.text}"
                 logger.error(msg)
-                return None
+                raise ValueError(msg)
 
-            # Return the appropriate data based on the type
-            if data_type == "siren":
-                return response.json()["unitesLegales"], response.json()["header"]
-            # "etablissements" if data_type == "siret":
-            return response.json()["etablissements"], response.json()["header"]
+            for record in response.json()[records_key]:
+                found[record[data_type]] = record
+            position += len(batch)
 
-        # Return raw content for non-JSON content types
-        return response.content, response.headers
+        missing = [id_code for id_code in unique_ids if id_code not in found]
+        if missing:
+            logger.warning("%d %s number(s) not found.", len(missing), data_type.upper())
+        return [found[id_code] for id_code in unique_ids if id_code in found], missing
 
     def get_by_number(self,
                        data_type: str = "siren",
                        id_code : str | int | None = None,
+                       as_record: bool = False,
                        **kwargs: dict) -> dict:
         """Get legal data from INSEE API for a given sirnen or siret number.
 
         Args:
             data_type (str): The type of data to retrieve, either "siren" or "siret".
             id_code (str | int): The id_code of the company.
+            as_record (bool, optional): Return the record as a compact `UniteLegale`
+            or `Etablissement` object. Defaults to False.
             kwargs (dict | None): The query parameters for the API request.
             date : str                    champs : (str, list)
             masquerValeurNulles: (str, bool)
 
         Raises:
             ValueError: If the query parameters are not valid or if `data_type` is not valid.
+            InseeRequestError: If the request still fails once the retries run out.
 
         Returns:
             dict: The legal data for the company.
         """
-        # Expected keys
-        expected_keys : dict = {
-            "date": str,
-            "champs": (str, list),
-            "masquerValeursNulles": (str, bool),
-        }
-
-        # Regex patterns
-        regex_patterns : dict = {
-            "date": r"\d{4}-\d{2}-\d{2}",
-        }
+        url = self._build_number_url(data_type=data_type, id_code=id_code, query_kwargs=kwargs)
+
+        if self.mirror is not None:
+            result = self.mirror.get_by_number(data_type=data_type, id_code=id_code, **kwargs)
+            if as_record and result is not None:
+                return RECORD_TYPES[data_type](result[0]), result[1]
+            return result
+
+        # Serve the lookup from the local store if possible (full records only)
+        metrics = self.transport.metrics
+        use_store = self.store is not None and not kwargs
+        if use_store:
+            record = self.store.get(data_type, id_code)
+            metrics.emit("cache_hit" if record is not None else "cache_miss", source="store", data_type=data_type)
+            if record is not None:
+                logger.debug("Serving %s %s from the local store.", data_type.upper(), id_code)
+                return (RECORD_TYPES[data_type](record) if as_record else record), dict(STORE_HEADER)
+
+        # Serve the lookup from the cache if possible
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(data_type, id_code, kwargs)
+            cached = self.cache.get(cache_key)
+            metrics.emit("cache_hit" if cached is not None else "cache_miss", source="cache", data_type=data_type)
+            if cached is not None:
+                return (RECORD_TYPES[data_type](cached[0]), cached[1]) if as_record else cached
+
+        # Logging the request (for a sample of the requests)
+        log_request(logging.INFO, "Fetching legal data for %s number %s", data_type.upper(), id_code,
+                    data_type=data_type, id_code=str(id_code))
+        context = f"Fetching {data_type.upper()} data from {url} | [{self.content_type}]"
+
+        # Make the request
+        response = self._get_request(url=url, headers=self.headers, context=context)
+        if not response:
+            logger.error(" Error fetching legal data for siren number %s", str(id_code))
+            return None
+
+        # Handle response
+        result = self._unwrap_by_number(data_type=data_type,
+                                        payload=self._decode_json(response.content))
+        if cache_key is not None and result is not None:
+            self.cache.set(cache_key, *result)
+        if use_store and result is not None:
+            self.store.put(data_type, result[0])
+        if as_record and result is not None:
+            return RECORD_TYPES[data_type](result[0]), result[1]
+        return result
+
+    def _build_number_url(self, data_type: str, id_code: str | int | None, query_kwargs: dict) -> str:
+        """Validate a siren or siret lookup and build the request URL.
+
+        Args:
+            data_type (str): The type of data to retrieve, either "siren" or "siret".
+            id_code (str | int): The id_code of the company.
+            query_kwargs (dict): The query parameters for the API request.
+
+        Raises:
+            ValueError: If the query parameters, `data_type` or `id_code` are not valid.
 
+        Returns:
+            str: The URL for the API request.
+        """
         # Validate the data_type
         if data_type not in ["siren", "siret"]:
             msg = f"Invalid data type: {data_type}. Must be 'siren' or 'siret'."
@@ -412,33 +1043,33 @@ class InseeClient:
             msg = f"Invalid {data_type.upper()} number."
             raise ValueError(msg)
 
-        # Build the query string
-        query_string = QUERY_BUILDER.set_query_string(query_kwargs=kwargs,
-                                                      expected_types=expected_keys,
-                                                      regex_patterns=regex_patterns)
-
         # Build the URL based on the data type (siren or siret)
-        url = f"{InseeClient.__base_url}{data_type}/{id_code}?{query_string}"
+        return PreparedQuery(query_kwargs,
+                             expected_types=_NUMBER_TYPES,
+                             regex_patterns=_NUMBER_PATTERNS,
+                             base_url=f"{self.base_url}{data_type}/{id_code}").url()
 
-        # Logging the request
-        logger.info("Fetching legal data for siren number " + str(id_code))  # noqa: G003
-        context = f"Fetching {data_type.upper()} data from {url} | [{self.content_type}]"
+    @staticmethod
+    def _unwrap_by_number(data_type: str, payload: dict | None) -> tuple[dict, dict] | None:
+        """Extract the record and the header from a siren or siret JSON response.
 
-        # Make the request
-        response = self._get_request(url=url, headers=self.headers, context=context)
-        if not response:
-            logger.error(" Error fetching legal data for siren number %s", str(id_code))
+        Args:
+            data_type (str): The type of data requested, either "siren" or "siret".
+            payload (dict | None): The decoded JSON body of the response.
+
+        Returns:
+            tuple[dict, dict] | None: The record and the header, or None if the
+            body is not valid JSON.
+        """
+        if payload is None:
+            logger.error("Invalid JSON response for %s data.", data_type.upper())
             return None
 
-        # Handle response
         # Return the appropriate data based on the type
         if data_type == "siren":
-            return response.json()["uniteLegale"], response.json()["header"]
-        elif data_type == "siret":  # data_type == "siret"
-            return response.json()["etablissement"], response.json()["header"]
-
-        # Return raw content for non-JSON content types
-        return response.content, response.header
+            return payload["uniteLegale"], payload["header"]
+        # "etablissement" if data_type == "siret":
+        return payload["etablissement"], payload["header"]
 
 # ????????????????????????????????????????????????????????????????????????????
 # ? TESTS FOR THE LEGAL DATA CLASS
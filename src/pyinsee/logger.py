@@ -1,71 +1,252 @@
-"""logger module."""
+"""logger module.
+
+Logging is set up on first use rather than at import: the first record logged
+by the package (or an explicit `setup_logging()` call) installs the console
+handler and the rotating file handler under `DATA_DIR/logs`.
+
+At high request rates, logging should not cost more as the throughput grows:
+
+- `INSEE_LOG_MODE=queue` hands the records to a background writer thread
+  (`QueueHandler` / `QueueListener`), so the requesting threads neither format
+  them nor wait for the console or the file.
+- `INSEE_LOG_FORMAT=json` writes one JSON object per record, with the fields
+  passed in `extra` (`method`, `url`, `data_type`, ...) as keys.
+- `INSEE_LOG_SAMPLE_RATE` logs only a share of the per-request messages
+  (`log_request`), e.g. 0.01 for one request in 100. Warnings and errors are
+  never sampled.
+- `INSEE_LOG_LEVEL` is the level of the file handler; the package logger
+  drops records below both handler levels before they are built, and callers
+  guard costly messages with `logger.isEnabledFor(...)`.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import itertools
+import json
 import logging
-import logging.config
-from pathlib import Path
 import os
-from dotenv import load_dotenv
-from .config import DEFAULT_ENV_PATH
-
-# Load environment variables from default.env file
-load_dotenv(dotenv_path=DEFAULT_ENV_PATH)
-# Getting .evn file path
-ENV_FILE_PATH = os.getenv("PYINSEE_ENV_FILE_PATH")
-if ENV_FILE_PATH is None:
-    raise ValueError("ENV_FILE_PATH is not set in the environment variables.")
-
-# Load environment variables from .env file
-load_dotenv(ENV_FILE_PATH)
-
-# Retrieve the data and log directories from environment variables
-DATA_DIR = os.getenv("DATA_DIR", "data") # Set default data directory
-LOG_DIR = os.path.join(DATA_DIR, "logs") # Set default log directory
-RAW_DIT = os.path.join(DATA_DIR, "raw") # Set default raw directory
-PROCESSED_DIR = os.path.join(DATA_DIR, "processed") # Set default processed directory
-METADATA_DIR = os.path.join(DATA_DIR, "metadata") # Set default metadata directory
-
-if DATA_DIR is None:
-    msg = "DATA_DIR is not set in the environment variables. Please set it in the .env file using the setup_cli script."
-    raise ValueError(msg)
-
-# Ensure the log directory exists
-Path(LOG_DIR).mkdir(parents=True, exist_ok=True)
-
-# Set up logging
-LOG_FILE = os.path.join(LOG_DIR, "insee_client.log")  # Correct path to log file
-
-# Define logging configuration
-logging_config = {
-    'version': 1,
-    'disable_existing_loggers': False,
-    'formatters': {
-        'standard': {
-            'format': '%(asctime)s | %(name)s | %(levelname)s : %(message)s'
-        },
-    },
-    'handlers': {
-        'file_handler': {
-            'class': 'logging.handlers.RotatingFileHandler',
-            'formatter': 'standard',
-            'filename': LOG_FILE,
-            'level': 'DEBUG',
-            'maxBytes': 5 * 1024 * 1024,  # 5MB
-            'backupCount': 5,
-        },
-        'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'standard',
-            'level': 'INFO',
+import threading
+from pathlib import Path
+
+from . import config
+
+# Attributes of every log record, the others come from `extra`
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+# The format of the text records
+_TEXT_FORMAT = "%(asctime)s | %(name)s | %(levelname)s : %(message)s"
+
+_setup_done = False
+_setup_lock = threading.Lock()
+_listener = None
+_sample_counter = itertools.count()
+_sample_every = 1
+
+
+class JsonFormatter(logging.Formatter):
+    """Format each record as one JSON object.
+
+    The object holds `time`, `level`, `logger` and `message`, the fields given
+    in `extra`, and `exception` when there is one.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        """Format a record as JSON."""
+        entry = {
+            "time": dt.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _queue_handler_class() -> type:
+    """Get the queue handler, which leaves the formatting to the writer thread."""
+    import logging.handlers
+
+    class _DeferredQueueHandler(logging.handlers.QueueHandler):
+        """Enqueue the records as they are.
+
+        The standard `QueueHandler` formats each record before enqueuing it,
+        in the logging thread; the package's records only carry immutable
+        arguments, so they are formatted by the writer thread instead.
+        """
+
+        def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+            """Keep the record unformatted."""
+            return record
+
+    return _DeferredQueueHandler
+
+
+def setup_logging(log_dir: str | Path | None = None,
+                  console_level: str = "INFO",
+                  file_level: str | None = None,
+                  mode: str | None = None,
+                  log_format: str | None = None,
+                  sample_rate: float | None = None) -> None:
+    """Install the console and rotating file handlers on the root logger.
+
+    Only the first call (or the first record logged by the package) has an
+    effect; call it early to choose the log directory, the levels or the mode.
+
+    Args:
+        log_dir (str | Path | None, optional): The directory of `insee_client.log`.
+        Defaults to `DATA_DIR/logs` (or `data/logs` when DATA_DIR is not set).
+        console_level (str, optional): The console handler level. Defaults to "INFO".
+        file_level (str | None, optional): The file handler level. Defaults to INSEE_LOG_LEVEL.
+        mode (str | None, optional): "sync" to write the records in the logging
+        thread, or "queue" to hand them to a background writer thread.
+        Defaults to INSEE_LOG_MODE.
+        log_format (str | None, optional): "text" or "json". Defaults to INSEE_LOG_FORMAT.
+        sample_rate (float | None, optional): The share of per-request messages
+        logged, between 0 and 1. Defaults to INSEE_LOG_SAMPLE_RATE.
+
+    Raises:
+        ValueError: If the mode, the format or the sample rate is not valid.
+    """
+    import logging.config  # pulls in logging.handlers, only needed here
+
+    global _setup_done, _listener  # noqa: PLW0603
+    with _setup_lock:
+        if _setup_done:
+            return
+
+        # Retrieve the log directory and the logging settings
+        settings = config.get_settings()
+        if log_dir is None:
+            log_dir = os.path.join(settings.data_dir or "data", "logs")
+        file_level = file_level or settings.insee_log_level
+        mode = mode or settings.insee_log_mode
+        log_format = log_format or settings.insee_log_format
+        if mode not in ("sync", "queue"):
+            msg = f"Invalid logging mode: {mode}. Must be 'sync' or 'queue'."
+            raise ValueError(msg)
+        if log_format not in ("text", "json"):
+            msg = f"Invalid log format: {log_format}. Must be 'text' or 'json'."
+            raise ValueError(msg)
+        set_sample_rate(sample_rate if sample_rate is not None else settings.insee_log_sample_rate)
+        _setup_done = True
+
+        # Ensure the log directory exists
+        Path(log_dir).mkdir(parents=True, exist_ok=True)
+
+        # Define logging configuration
+        logging_config = {
+            'version': 1,
+            'disable_existing_loggers': False,
+            'formatters': {
+                'standard': {'format': _TEXT_FORMAT} if log_format == "text" else {'()': JsonFormatter},
+            },
+            'handlers': {
+                'file_handler': {
+                    'class': 'logging.handlers.RotatingFileHandler',
+                    'formatter': 'standard',
+                    'filename': os.path.join(log_dir, "insee_client.log"),
+                    'level': file_level,
+                    'maxBytes': 5 * 1024 * 1024,  # 5MB
+                    'backupCount': 5,
+                },
+                'console': {
+                    'class': 'logging.StreamHandler',
+                    'formatter': 'standard',
+                    'level': console_level,
+                }
+            },
+            'root': {
+                'handlers': ['file_handler', 'console'],
+                'level': 'DEBUG',
+            }
         }
-    },
-    'root': {
-        'handlers': ['file_handler', 'console'],
-        'level': 'DEBUG',
-    }
-}
 
-# Apply logging configuration
-logging.config.dictConfig(logging_config)
+        # Apply logging configuration
+        logging.config.dictConfig(logging_config)
+        root = logging.getLogger()
+        if mode == "queue":
+            # The handlers now run in the writer thread, behind a queue
+            import atexit
+            import queue
+
+            handlers = list(root.handlers)
+            records = queue.SimpleQueue()
+            for handler in handlers:
+                root.removeHandler(handler)
+            root.addHandler(_queue_handler_class()(records))
+            _listener = logging.handlers.QueueListener(records, *handlers, respect_handler_level=True)
+            _listener.start()
+            atexit.register(shutdown_logging)
+
+        # Records below both handler levels are dropped before they are built
+        logger.setLevel(min(logging.getLevelName(console_level.upper()), logging.getLevelName(file_level.upper())))
+        logger.removeHandler(_setup_handler)
+
+
+def shutdown_logging() -> None:
+    """Stop the writer thread of the "queue" mode, once the queued records are written."""
+    global _listener  # noqa: PLW0603
+    with _setup_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def set_sample_rate(rate: float) -> None:
+    """Set the share of per-request messages logged by `log_request`.
+
+    Args:
+        rate (float): Between 0 (none) and 1 (all); 0.01 logs one request in 100.
+
+    Raises:
+        ValueError: If the rate is not between 0 and 1.
+    """
+    global _sample_every  # noqa: PLW0603
+    if not 0 <= rate <= 1:
+        msg = f"Invalid log sample rate: {rate}. Must be between 0 and 1."
+        raise ValueError(msg)
+    _sample_every = round(1 / rate) if rate else 0
+
+
+def log_request(level: int, msg: str, *args: object, **fields: object) -> None:
+    """Log a per-request message, for a sample of the requests only.
+
+    One message in `1 / INSEE_LOG_SAMPLE_RATE` is logged (the counter is shared
+    by every per-request message), with `fields` as structured fields.
+
+    Args:
+        level (int): The level, e.g. `logging.INFO`.
+        msg (str): The message, formatted with `args` only if it is logged.
+        *args (object): The message arguments.
+        **fields (object): Extra fields of the record, e.g. `url=...`.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    every = _sample_every
+    if every == 1 or (every and next(_sample_counter) % every == 0):
+        logger.log(level, msg, *args, extra=fields or None)
+
+
+class _SetupOnFirstRecord(logging.Handler):
+    """Set up logging when the package logs its first record.
+
+    The record then propagates to the handlers just installed on the root logger.
+    """
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Set up logging (the record itself is emitted by the root handlers)."""
+        try:
+            setup_logging()
+        except Exception:
+            # Invalid logging settings: report them once, then log without the setup
+            logger.removeHandler(self)
+            self.handleError(record)
+
 
 # Define a global logger
 logger = logging.getLogger(__name__)
-
+logger.setLevel(logging.DEBUG)
+_setup_handler = _SetupOnFirstRecord()
+logger.addHandler(_setup_handler)
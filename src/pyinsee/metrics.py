@@ -0,0 +1,412 @@
+"""Request metrics and instrumentation hooks.
+
+Every transport reports what happens on the request path to its `Metrics`
+(by default the process-wide one, see `get_default_metrics`) as events:
+
+    request_start - an attempt is sent: method, url, endpoint, attempt
+    request_end   - an attempt is done: method, url, endpoint, attempt, status
+                    (None on a timeout or connection error), elapsed, bytes
+    retry         - an attempt failed and is retried: method, url, endpoint,
+                    attempt, error_class, status, delay
+    throttle      - a request waited for the rate limiter (reason "limiter",
+                    `wait` seconds blocked) or got a 429 (reason "server",
+                    `wait` the Retry-After delay): endpoint, reason, wait
+    cache_hit     - a `get_by_number` lookup served locally: source ("store"
+    cache_miss      or "cache"), data_type
+    token_refresh - a token was requested: status, elapsed
+    page          - a bulk page was received: data_type, page, records, elapsed
+
+The built-in metrics are updated from these events: request counters and
+latency histograms per endpoint and status code, response bytes, retries,
+throttling, cache hits and misses, token refreshes and records per page.
+`Metrics.add_hook` plugs extra callbacks on any event, e.g. to feed another
+monitoring system. The metrics are read in process with `snapshot()` or
+written in the Prometheus text format with `write_prometheus()` (or every
+`INSEE_METRICS_INTERVAL` seconds to INSEE_METRICS_FILE, e.g. for the node
+exporter textfile collector).
+
+Example:
+    from pyinsee.metrics import get_default_metrics
+
+    metrics = get_default_metrics()
+    metrics.add_hook("retry", lambda event, fields: print(event, fields))
+    ...
+    print(metrics.snapshot()["pyinsee_requests_total"])
+    metrics.write_prometheus("/var/lib/node_exporter/pyinsee.prom")
+"""
+from __future__ import annotations
+
+import threading
+from bisect import bisect_left
+from pathlib import Path
+from typing import Callable, ClassVar
+from urllib.parse import urlsplit
+
+from . import config
+from .logger import logger
+
+# The events reported on the request path
+EVENTS = ("request_start", "request_end", "retry", "throttle",
+          "cache_hit", "cache_miss", "token_refresh", "page")
+
+# Histogram buckets: request and token latencies (seconds) and records per page
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RECORDS_BUCKETS = (0, 1, 10, 20, 50, 100, 200, 500, 1000)
+
+# The built-in metrics: type, label names and help text
+_METRICS = {
+    "pyinsee_requests_total": (
+        "counter", ("method", "endpoint", "status"), "HTTP requests sent (one per attempt)."),
+    "pyinsee_request_duration_seconds": (
+        "histogram", ("endpoint", "status"), "HTTP request latency, per attempt."),
+    "pyinsee_requests_in_flight": (
+        "gauge", (), "HTTP requests waiting for their response."),
+    "pyinsee_response_bytes_total": (
+        "counter", ("endpoint",), "Response body bytes received."),
+    "pyinsee_retries_total": (
+        "counter", ("endpoint", "error_class"), "Failed attempts that were retried."),
+    "pyinsee_throttles_total": (
+        "counter", ("reason",), "Requests held by the rate limiter or answered 429."),
+    "pyinsee_throttle_wait_seconds_total": (
+        "counter", ("reason",), "Time waited for the rate limiter, or asked by Retry-After."),
+    "pyinsee_cache_hits_total": (
+        "counter", ("source",), "get_by_number lookups served by the store or the cache."),
+    "pyinsee_cache_misses_total": (
+        "counter", ("source",), "get_by_number lookups missed by the store or the cache."),
+    "pyinsee_token_refreshes_total": (
+        "counter", ("status",), "OAuth token requests."),
+    "pyinsee_token_refresh_duration_seconds": (
+        "histogram", (), "OAuth token request latency."),
+    "pyinsee_page_records": (
+        "histogram", ("data_type",), "Records per bulk page."),
+}
+
+
+def endpoint_label(url: str) -> str:
+    """Get the endpoint of a URL, as a low-cardinality label.
+
+    Args:
+        url (str): The request URL.
+
+    Returns:
+        str: The last path segment ("siren", "siret", "token", ...), with
+        numbers replaced by "{id}" (e.g. "siren/{id}").
+    """
+    parent, _, name = urlsplit(url).path.rstrip("/").rpartition("/")
+    if name.isdigit():
+        return f"{parent.rpartition('/')[2]}/{{id}}"
+    return name or "/"
+
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    """Format the labels of a Prometheus sample."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: object) -> str:
+    """Escape a Prometheus label value."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Histogram:
+    """Fixed-bucket histogram (non-cumulative counts, the last bucket is +Inf)."""
+
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: tuple) -> None:
+        """Initialize an empty histogram."""
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Count a value in its bucket."""
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class Metrics:
+    """Request metrics registry with event hooks.
+
+    Thread-safe: the transports of every thread report to the same registry.
+    Hooks are called in the thread that reports the event, after the built-in
+    metrics are updated; an exception raised by a hook is logged and ignored.
+
+    Example:
+        from pyinsee.insee_client import InseeClient
+        from pyinsee.metrics import Metrics
+        from pyinsee.transport import Transport
+
+        metrics = Metrics()
+        client = InseeClient(transport=Transport(metrics=metrics))
+    """
+
+    __slots__ = ("_counters", "_export_stop", "_export_thread", "_histograms", "_hooks", "_in_flight", "_lock")
+
+    def __init__(self) -> None:
+        """Initialize the metrics with no recorded event and no hook."""
+        self._lock = threading.Lock()
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._histograms: dict[tuple[str, tuple], _Histogram] = {}
+        self._in_flight = 0
+        self._hooks: dict[str, tuple[Callable[[str, dict], object], ...]] = {}
+        self._export_thread: threading.Thread | None = None
+        self._export_stop = threading.Event()
+
+    def add_hook(self, event: str, callback: Callable[[str, dict], object]) -> None:
+        """Call `callback(event, fields)` whenever `event` is reported.
+
+        Args:
+            event (str): One of `EVENTS`.
+            callback (Callable[[str, dict], object]): The hook. It should be
+            fast, it runs on the request path.
+
+        Raises:
+            ValueError: If the event is unknown.
+        """
+        if event not in EVENTS:
+            msg = f"Unknown metrics event: {event}. Must be one of {EVENTS}."
+            raise ValueError(msg)
+        with self._lock:
+            self._hooks[event] = (*self._hooks.get(event, ()), callback)
+
+    def remove_hook(self, event: str, callback: Callable[[str, dict], object]) -> None:
+        """Stop calling a hook added with `add_hook` (nothing happens if it was not added)."""
+        with self._lock:
+            hooks = tuple(hook for hook in self._hooks.get(event, ()) if hook is not callback)
+            self._hooks[event] = hooks
+
+    def emit(self, event: str, **fields: object) -> None:
+        """Report an event: update the built-in metrics, then call the hooks.
+
+        Args:
+            event (str): One of `EVENTS`.
+            **fields (object): The fields of the event (see the module docstring).
+        """
+        with self._lock:
+            self._RECORDERS[event](self, fields)
+        for hook in self._hooks.get(event, ()):
+            try:
+                hook(event, fields)
+            except Exception:
+                logger.exception("The %s metrics hook %r failed.", event, hook)
+
+    def _inc(self, name: str, labels: tuple, value: float = 1) -> None:
+        """Increment a counter (the lock is held)."""
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name: str, labels: tuple, value: float, bounds: tuple = LATENCY_BUCKETS) -> None:
+        """Count a value in a histogram (the lock is held)."""
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram(bounds)
+        histogram.observe(value)
+
+    def _on_request_start(self, fields: dict) -> None:
+        """Count a request in flight."""
+        self._in_flight += 1
+
+    def _on_request_end(self, fields: dict) -> None:
+        """Count a finished request, its latency and its response bytes."""
+        self._in_flight -= 1
+        endpoint = fields["endpoint"]
+        status = "error" if fields["status"] is None else str(fields["status"])
+        self._inc("pyinsee_requests_total", (fields["method"], endpoint, status))
+        self._observe("pyinsee_request_duration_seconds", (endpoint, status), fields["elapsed"])
+        if fields["bytes"]:
+            self._inc("pyinsee_response_bytes_total", (endpoint,), fields["bytes"])
+
+    def _on_retry(self, fields: dict) -> None:
+        """Count a retried attempt."""
+        self._inc("pyinsee_retries_total", (fields["endpoint"], fields["error_class"]))
+
+    def _on_throttle(self, fields: dict) -> None:
+        """Count a throttled request and its wait."""
+        self._inc("pyinsee_throttles_total", (fields["reason"],))
+        self._inc("pyinsee_throttle_wait_seconds_total", (fields["reason"],), fields["wait"])
+
+    def _on_cache_hit(self, fields: dict) -> None:
+        """Count a lookup served locally."""
+        self._inc("pyinsee_cache_hits_total", (fields["source"],))
+
+    def _on_cache_miss(self, fields: dict) -> None:
+        """Count a lookup missed locally."""
+        self._inc("pyinsee_cache_misses_total", (fields["source"],))
+
+    def _on_token_refresh(self, fields: dict) -> None:
+        """Count a token request and its latency."""
+        self._inc("pyinsee_token_refreshes_total", (str(fields["status"]),))
+        self._observe("pyinsee_token_refresh_duration_seconds", (), fields["elapsed"])
+
+    def _on_page(self, fields: dict) -> None:
+        """Count the records of a bulk page."""
+        self._observe("pyinsee_page_records", (fields["data_type"],), fields["records"], RECORDS_BUCKETS)
+
+    # The built-in metrics updated by each event
+    _RECORDERS: ClassVar[dict[str, Callable[[Metrics, dict], None]]] = {
+        "request_start": _on_request_start,
+        "request_end": _on_request_end,
+        "retry": _on_retry,
+        "throttle": _on_throttle,
+        "cache_hit": _on_cache_hit,
+        "cache_miss": _on_cache_miss,
+        "token_refresh": _on_token_refresh,
+        "page": _on_page,
+    }
+
+    def _copy(self) -> tuple[dict, dict, int]:
+        """Copy the counters, the histograms and the in-flight gauge."""
+        with self._lock:
+            histograms = {key: (histogram.bounds, list(histogram.counts), histogram.sum)
+                          for key, histogram in self._histograms.items()}
+            return dict(self._counters), histograms, self._in_flight
+
+    def snapshot(self) -> dict:
+        """Get the current value of every built-in metric.
+
+        Returns:
+            dict: For each metric name, the list of its samples. A counter or
+            gauge sample is `{"labels": {...}, "value": ...}`; a histogram sample
+            is `{"labels": {...}, "count": ..., "sum": ..., "buckets": {...}}`
+            with the cumulative count of each upper bound ("+Inf" included).
+        """
+        counters, histograms, in_flight = self._copy()
+        result: dict[str, list[dict]] = {name: [] for name in _METRICS}
+        result["pyinsee_requests_in_flight"].append({"labels": {}, "value": in_flight})
+        for (name, values), value in sorted(counters.items()):
+            result[name].append({"labels": dict(zip(_METRICS[name][1], values)), "value": value})
+        for (name, values), (bounds, counts, total) in sorted(histograms.items(), key=lambda item: item[0]):
+            cumulative = 0
+            buckets = {}
+            for bound, count in zip((*bounds, "+Inf"), counts):
+                cumulative += count
+                buckets[bound if bound == "+Inf" else f"{bound:g}"] = cumulative
+            result[name].append({"labels": dict(zip(_METRICS[name][1], values)),
+                                 "count": cumulative, "sum": total, "buckets": buckets})
+        return result
+
+    def prometheus_text(self) -> str:
+        """Get the metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The metrics, with their HELP and TYPE lines.
+        """
+        lines = []
+        for name, samples in self.snapshot().items():
+            kind, label_names, help_text = _METRICS[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample in samples:
+                values = tuple(sample["labels"].values())
+                if kind != "histogram":
+                    lines.append(f"{name}{_format_labels(label_names, values)} {sample['value']:g}")
+                    continue
+                for bound, count in sample["buckets"].items():
+                    labels = _format_labels(label_names, values, extra=f'le="{bound}"')
+                    lines.append(f"{name}_bucket{labels} {count}")
+                labels = _format_labels(label_names, values)
+                lines.append(f"{name}_sum{labels} {sample['sum']:g}")
+                lines.append(f"{name}_count{labels} {sample['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str | Path) -> Path:
+        """Write the metrics to a Prometheus text file, atomically.
+
+        Args:
+            path (str | Path): The file, e.g. in the directory of the node
+            exporter textfile collector.
+
+        Returns:
+            Path: The file written.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Readers (the textfile collector) never see a partly written file
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        tmp_path.write_text(self.prometheus_text(), encoding="utf-8")
+        tmp_path.replace(path)
+        return path
+
+    def start_export(self, path: str | Path | None = None, interval: float | None = None) -> None:
+        """Write the Prometheus text file periodically from a background thread.
+
+        The file is written once more by `stop_export`, which runs at exit.
+
+        Args:
+            path (str | Path | None, optional): The file. Defaults to INSEE_METRICS_FILE.
+            interval (float | None, optional): Seconds between two writes.
+            Defaults to INSEE_METRICS_INTERVAL.
+
+        Raises:
+            ValueError: If no file is given or the interval is not positive.
+        """
+        path = path or config.INSEE_METRICS_FILE
+        interval = interval if interval is not None else config.INSEE_METRICS_INTERVAL
+        if not path:
+            msg = "INSEE_METRICS_FILE is not set in the environment variables."
+            raise ValueError(msg)
+        if interval <= 0:
+            msg = "The metrics export interval must be positive."
+            raise ValueError(msg)
+        self.stop_export()
+        import atexit
+
+        self._export_stop = stop = threading.Event()
+
+        def export() -> None:
+            while not stop.wait(interval):
+                self._write_safely(path)
+            self._write_safely(path)
+
+        self._export_thread = threading.Thread(target=export, name="pyinsee-metrics", daemon=True)
+        self._export_thread.start()
+        atexit.register(self.stop_export)
+        logger.debug("Writing the metrics to %s every %s seconds.", path, interval)
+
+    def stop_export(self) -> None:
+        """Stop the periodic export, after writing the file one last time."""
+        thread, self._export_thread = self._export_thread, None
+        if thread is not None:
+            self._export_stop.set()
+            thread.join()
+
+    def _write_safely(self, path: str | Path) -> None:
+        """Write the Prometheus text file, logging the errors instead of raising them."""
+        try:
+            self.write_prometheus(path)
+        except OSError:
+            logger.exception("Failed to write the metrics to %s.", path)
+
+    def reset(self) -> None:
+        """Forget the recorded values (the in-flight gauge and the hooks are kept)."""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+_default_metrics: Metrics | None = None
+_default_metrics_lock = threading.Lock()
+
+
+def get_default_metrics() -> Metrics:
+    """Get the process-wide metrics shared by transports created without their own.
+
+    The periodic Prometheus export starts with it when INSEE_METRICS_FILE is set.
+
+    Returns:
+        Metrics: The shared metrics, created on first use.
+    """
+    global _default_metrics  # noqa: PLW0603
+    if _default_metrics is None:
+        with _default_metrics_lock:
+            if _default_metrics is None:
+                metrics = Metrics()
+                if config.INSEE_METRICS_FILE:
+                    metrics.start_export()
+                _default_metrics = metrics
+    return _default_metrics
@@ -0,0 +1,595 @@
+"""Offline mirror of the INSEE Sirene stock files.
+
+INSEE publishes the whole Sirene database as stock files
+(`StockUniteLegale_utf8.zip`, `StockEtablissement_utf8.zip`, ...). A
+`SireneMirror` loads them into a SQLite database under `DATA_DIR/mirror`,
+reading the CSV in chunks so memory use stays flat, and answers lookups and
+bulk queries locally with the same return shapes as the API:
+
+    mirror = SireneMirror()
+    mirror.ingest("StockUniteLegale_utf8.zip")
+    mirror.ingest("StockEtablissement_utf8.zip")
+
+    client = InseeClient(backend="mirror")
+    unite_legale, header = client.get_by_number(data_type="siren", id_code="552100554")
+    for etablissement in client.iter_bulk(data_type="siret", q="codePostalEtablissement:75001"):
+        ...
+
+Stock files hold the current state of each record, so records have a single
+(current) period and `periodesUniteLegale` / `periodesEtablissement` only
+list that one, and `date` queries are not supported. Établissements get their
+`uniteLegale` object from the unités légales stock when it is loaded too.
+
+`q` queries are compiled by `pyinsee.query` and translated to SQL; on
+établissements, fields of the unité légale (`categorieJuridiqueUniteLegale`,
+...) can be used too.
+"""
+from __future__ import annotations
+
+import base64
+import csv
+import gzip
+import io
+import json
+import re
+import sqlite3
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import TYPE_CHECKING, Iterator, TextIO
+
+from . import config
+from .logger import logger
+from .processing import TABLES
+from .query import (
+    And,
+    Exists,
+    Fuzzy,
+    MatchAll,
+    Node,
+    Not,
+    Or,
+    Periode,
+    Range,
+    Wildcard,
+    fuzzy_match,
+    parse_query,
+)
+
+if TYPE_CHECKING:
+    from .facets import FacetIndex
+
+# Primary key of each data type
+KEYS = {"siren": "siren", "siret": "siret"}
+
+# Fields of the current period of each data type
+PERIOD_FIELDS = {
+    "siren": (
+        "dateFin", "dateDebut", "etatAdministratifUniteLegale", "nomUniteLegale",
+        "nomUsageUniteLegale", "denominationUniteLegale", "denominationUsuelle1UniteLegale",
+        "denominationUsuelle2UniteLegale", "denominationUsuelle3UniteLegale",
+        "categorieJuridiqueUniteLegale", "activitePrincipaleUniteLegale",
+        "nomenclatureActivitePrincipaleUniteLegale", "nicSiegeUniteLegale",
+        "economieSocialeSolidaireUniteLegale", "societeMissionUniteLegale",
+        "caractereEmployeurUniteLegale",
+    ),
+    "siret": (
+        "dateFin", "dateDebut", "etatAdministratifEtablissement", "enseigne1Etablissement",
+        "enseigne2Etablissement", "enseigne3Etablissement", "denominationUsuelleEtablissement",
+        "activitePrincipaleEtablissement", "nomenclatureActivitePrincipaleEtablissement",
+        "caractereEmployeurEtablissement",
+    ),
+}
+
+# Address fields of an établissement (without their `Etablissement` / `2Etablissement` suffix)
+ADDRESS_FIELDS = (
+    "complementAdresse", "numeroVoie", "indiceRepetition", "dernierNumeroVoie",
+    "indiceRepetitionDernierNumeroVoie", "typeVoie", "libelleVoie", "codePostal",
+    "libelleCommune", "libelleCommuneEtranger", "distributionSpeciale", "codeCommune",
+    "codeCedex", "libelleCedex", "codePaysEtranger", "libellePaysEtranger",
+    "identifiantAdresse", "coordonneeLambertAbscisse", "coordonneeLambertOrdonnee",
+)
+
+# Unité légale fields that are not part of the `uniteLegale` object of an établissement
+_NOT_NESTED = ("siren", "unitePurgeeUniteLegale", "dateDebut", "nombrePeriodesUniteLegale")
+
+# Fields converted from the CSV text
+_BOOLEAN_FIELDS = ("etablissementSiege", "unitePurgeeUniteLegale")
+_INTEGER_FIELDS = ("nombrePeriodesUniteLegale", "nombrePeriodesEtablissement")
+
+# Largest number of SQLite parameters used in one IN (...) clause
+_MAX_PARAMS = 900
+
+
+def _open_csv(path: Path) -> TextIO:
+    """Open a stock file (CSV, gzipped CSV or zip archive) as text."""
+    if path.suffix == ".zip":
+        archive = zipfile.ZipFile(path)
+        members = [name for name in archive.namelist() if name.endswith(".csv")]
+        if not members:
+            msg = f"No CSV file in {path}."
+            raise ValueError(msg)
+        return io.TextIOWrapper(archive.open(members[0]), encoding="utf-8", newline="")
+    if path.suffix == ".gz":
+        return gzip.open(path, "rt", encoding="utf-8", newline="")
+    return path.open(encoding="utf-8", newline="")
+
+
+def _like_escape(text: str) -> str:
+    """Escape the LIKE wildcards of a value."""
+    return re.sub(r"([%_\\])", r"\\\1", text)
+
+
+def _encode_cursor(values: list) -> str:
+    """Encode the sort key of the last record of a page as a cursor."""
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> list:
+    """Decode a cursor built by `_encode_cursor`."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError as err:
+        msg = f"Invalid mirror cursor: {cursor}."
+        raise ValueError(msg) from err
+
+
+def _split_list(value: str | list | None) -> list[str]:
+    """Split a `champs` or `tri` parameter into field names."""
+    if value is None:
+        return []
+    items = value.split(",") if isinstance(value, str) else value
+    return [item.strip() for item in items if item.strip()]
+
+
+class SireneMirror:
+    """Local SQLite mirror of the Sirene stock files.
+
+    Args:
+        path (str | Path | None, optional): The SQLite database. Defaults to
+            `DATA_DIR/mirror/sirene.sqlite`.
+
+    Attributes:
+        path (Path): The SQLite database.
+    """
+
+    def __init__(self, path: str | Path | None = None) -> None:
+        """Initialize the mirror and create the database if needed."""
+        self.path = Path(path) if path else Path(config.DATA_DIR) / "mirror" / "sirene.sqlite"
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._totals: dict[tuple, int] = {}
+        self._facets: dict[str, FacetIndex] = {}
+        self._connection().execute("""
+            CREATE TABLE IF NOT EXISTS ingests (
+                file TEXT NOT NULL,
+                data_type TEXT NOT NULL,
+                rows INTEGER NOT NULL,
+                ingested_at REAL NOT NULL
+            )""")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Get the SQLite connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.row_factory = sqlite3.Row
+            connection.create_function("pyinsee_fuzzy", 3, fuzzy_match, deterministic=True)
+            self._local.connection = connection
+        return connection
+
+    def columns(self, data_type: str) -> list[str]:
+        """Get the columns loaded for a data type (empty if its stock was never ingested).
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+
+        Returns:
+            list[str]: The column names.
+        """
+        table = self._table(data_type)
+        return [row["name"] for row in self._connection().execute(f'PRAGMA table_info("{table}")')]
+
+    @staticmethod
+    def _table(data_type: str) -> str:
+        """Get the table of a data type."""
+        if data_type not in TABLES:
+            msg = f"Invalid data type: {data_type}. Must be 'siren' or 'siret'."
+            raise ValueError(msg)
+        return TABLES[data_type][0]
+
+    def ingest(self, path: str | Path, chunk_size: int | None = None) -> int:
+        """Load a stock file into the mirror, replacing the records already loaded.
+
+        The data type is detected from the CSV header (`siret` column or not).
+
+        Args:
+            path (str | Path): The stock file: CSV, gzipped CSV or zip archive.
+            chunk_size (int, optional): The number of rows inserted per transaction.
+            Defaults to INSEE_MIRROR_CHUNK_SIZE.
+
+        Raises:
+            ValueError: If the file has no CSV or no `siren` column.
+
+        Returns:
+            int: The number of rows loaded.
+        """
+        path = Path(path)
+        chunk_size = chunk_size or config.INSEE_MIRROR_CHUNK_SIZE
+        connection = self._connection()
+        with _open_csv(path) as f:
+            reader = csv.reader(f)
+            header = next(reader, None)
+            if not header or "siren" not in header:
+                msg = f"{path} is not a Sirene stock file (no siren column)."
+                raise ValueError(msg)
+            data_type = "siret" if "siret" in header else "siren"
+            table = self._table(data_type)
+            self._create_table(table, KEYS[data_type], header)
+
+            names = ", ".join(f'"{name}"' for name in header)
+            insert = f'INSERT OR REPLACE INTO "{table}" ({names}) VALUES ({", ".join("?" * len(header))})'
+            logger.info("Loading %s into the %s mirror...", path, data_type.upper())
+            rows = 0
+            chunk = []
+            for row in reader:
+                chunk.append([value or None for value in row])
+                if len(chunk) >= chunk_size:
+                    rows += self._insert(connection, insert, chunk)
+                    chunk = []
+                    logger.info("Loaded %d %s row(s).", rows, data_type.upper())
+            rows += self._insert(connection, insert, chunk)
+
+        if data_type == "siret":
+            connection.execute(f'CREATE INDEX IF NOT EXISTS "{table}_siren" ON "{table}" (siren)')
+        connection.execute("INSERT INTO ingests VALUES (?, ?, ?, ?)", (path.name, data_type, rows, time.time()))
+        connection.execute("ANALYZE")
+        self._totals.clear()
+        logger.info("Loaded %d %s row(s) from %s.", rows, data_type.upper(), path)
+        return rows
+
+    def _create_table(self, table: str, key: str, header: list[str]) -> None:
+        """Create the table of a stock file, or add the columns it is missing."""
+        connection = self._connection()
+        existing = [row["name"] for row in connection.execute(f'PRAGMA table_info("{table}")')]
+        if not existing:
+            columns = ", ".join(f'"{name}" TEXT' + (" PRIMARY KEY" if name == key else "") for name in header)
+            connection.execute(f'CREATE TABLE "{table}" ({columns}) WITHOUT ROWID')
+            return
+        for name in header:
+            if name not in existing:
+                connection.execute(f'ALTER TABLE "{table}" ADD COLUMN "{name}" TEXT')
+
+    @staticmethod
+    def _insert(connection: sqlite3.Connection, insert: str, chunk: list[list]) -> int:
+        """Insert a chunk of rows in one transaction."""
+        if not chunk:
+            return 0
+        connection.execute("BEGIN")
+        try:
+            connection.executemany(insert, chunk)
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+        return len(chunk)
+
+    def _build_record(self, data_type: str, row: sqlite3.Row, unite_legale: sqlite3.Row | None = None) -> dict:
+        """Turn a stock row into a record with the API structure."""
+        values = {name: row[name] for name in row.keys()}  # noqa: SIM118 - sqlite3.Row
+        for name in _BOOLEAN_FIELDS:
+            if values.get(name) is not None:
+                values[name] = values[name] == "true"
+        for name in _INTEGER_FIELDS:
+            if values.get(name) is not None:
+                values[name] = int(values[name])
+
+        period_fields = PERIOD_FIELDS[data_type]
+        period = {name: values.pop(name, None) for name in period_fields}
+        record = {}
+        if data_type == "siret":
+            address = {f"{name}Etablissement": values.pop(f"{name}Etablissement", None) for name in ADDRESS_FIELDS}
+            address2 = {f"{name}2Etablissement": values.pop(f"{name}2Etablissement", None) for name in ADDRESS_FIELDS}
+            record.update(values)
+            if unite_legale is not None:
+                nested = {name: unite_legale[name] for name in unite_legale.keys()  # noqa: SIM118
+                          if name not in _NOT_NESTED}
+                record["uniteLegale"] = nested
+            record["adresseEtablissement"] = address
+            record["adresse2Etablissement"] = address2
+            record["periodesEtablissement"] = [period]
+        else:
+            record.update(values)
+            record["periodesUniteLegale"] = [period]
+        return record
+
+    def _records(self, data_type: str, rows: list[sqlite3.Row]) -> list[dict]:
+        """Build the records of stock rows, joining the unités légales of établissements."""
+        if data_type == "siren" or not rows:
+            return [self._build_record(data_type, row) for row in rows]
+        unites_legales = {}
+        if self.columns("siren"):
+            sirens = list({row["siren"] for row in rows})
+            for start in range(0, len(sirens), _MAX_PARAMS):
+                batch = sirens[start:start + _MAX_PARAMS]
+                for unite_legale in self._connection().execute(
+                        f'SELECT * FROM "{TABLES["siren"][0]}" WHERE siren IN ({", ".join("?" * len(batch))})', batch):
+                    unites_legales[unite_legale["siren"]] = unite_legale
+        return [self._build_record(data_type, row, unites_legales.get(row["siren"])) for row in rows]
+
+    @staticmethod
+    def _project(record: dict, champs: list[str], hide_nulls: bool) -> dict:
+        """Keep the `champs` fields (at every level) and drop null values if asked."""
+        def keep(name: str, value: object) -> bool:
+            return (not champs or name in champs) and not (hide_nulls and value is None)
+
+        projected = {}
+        for name, value in record.items():
+            if isinstance(value, dict):
+                nested = {key: item for key, item in value.items() if keep(key, item)}
+                if nested:
+                    projected[name] = nested
+            elif isinstance(value, list):
+                periods = [{key: item for key, item in period.items() if keep(key, item)} for period in value]
+                if any(periods):
+                    projected[name] = periods
+            elif keep(name, value):
+                projected[name] = value
+        return projected
+
+    def _where(self, data_type: str, q: str | None) -> tuple[str, list]:
+        """Translate a `q` query into a SQL condition.
+
+        Raises:
+            ValueError: If the query is malformed or uses a field not loaded.
+        """
+        if not q:
+            return "1", []
+        params = []
+        return self._condition(data_type, parse_query(q).root, params), params
+
+    def _condition(self, data_type: str, node: Node, params: list) -> str:
+        """Translate a node of a compiled query into a SQL condition, adding its parameters."""
+        if isinstance(node, MatchAll):
+            return "1"
+        if isinstance(node, (And, Or)):
+            operator = " AND " if isinstance(node, And) else " OR "
+            return "(" + operator.join(self._condition(data_type, clause, params) for clause in node.clauses) + ")"
+        if isinstance(node, Not):
+            # Lucene negations also match the rows where the field is null
+            return f"NOT IFNULL({self._condition(data_type, node.clause, params)}, 0)"
+        if isinstance(node, Periode):
+            # Stock rows hold a single period, whose fields are columns
+            return self._condition(data_type, node.clause, params)
+
+        if node.field in self.columns(data_type):
+            return self._leaf(data_type, node, params)
+        if data_type == "siret" and node.field in self.columns("siren"):
+            # A field of the unité légale of the établissements
+            return f'"siren" IN (SELECT "siren" FROM "{TABLES["siren"][0]}" WHERE {self._leaf("siren", node, params)})'
+        msg = f"Unknown field for the {data_type.upper()} mirror: {node.field}."
+        raise ValueError(msg)
+
+    @staticmethod
+    def _leaf(data_type: str, node: Node, params: list) -> str:
+        """Translate a clause on a column into a SQL condition, adding its parameters."""
+        column = f'"{node.field}"'
+        # Text is matched against the whole value or a sequence of its words (LIKE ignores case)
+        words = f"""(' ' || {column} || ' ') LIKE ? ESCAPE '\\'"""
+        if isinstance(node, Exists):
+            return f"IFNULL({column}, '') <> ''"
+        if isinstance(node, Fuzzy):
+            params.extend([node.value, node.distance])
+            return f"pyinsee_fuzzy({column}, ?, ?)"
+        if isinstance(node, Range):
+            if node.field in _INTEGER_FIELDS:
+                column = f"CAST({column} AS INTEGER)"
+            conditions = []
+            for bound, include, operator in ((node.low, node.include_low, ">"), (node.high, node.include_high, "<")):
+                if bound is not None:
+                    conditions.append(f"{column} {operator}{'=' if include else ''} ?")
+                    params.append(float(bound) if node.field in _INTEGER_FIELDS else bound)
+            return "(" + " AND ".join(conditions) + ")" if conditions else f"{column} IS NOT NULL"
+        if isinstance(node, Wildcard):
+            prefix = node.pattern[:-1]
+            if node.field == KEYS[data_type] and node.pattern.endswith("*") and not re.search(r"[*?\\]", prefix):
+                # A number prefix, read from the primary key
+                params.extend([prefix, prefix + "\uffff"])
+                return f"({column} >= ? AND {column} < ?)"
+            parts = re.split(r"(\\.|[*?])", node.pattern)
+            pattern = "".join("%" if part == "*" else "_" if part == "?"
+                              else _like_escape(part[1:] if part.startswith("\\") else part) for part in parts)
+            params.append(f"% {pattern} %")
+            return words
+        if node.field == KEYS[data_type]:
+            params.append(node.value)
+            return f"{column} = ?"
+        params.append(f"% {_like_escape(node.value)} %")
+        return words
+
+    def get_by_number(self, data_type: str, id_code: str | int, **kwargs: dict) -> tuple[dict, dict] | None:
+        """Get a record with the return shape of `InseeClient.get_by_number`.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            id_code (str | int): The siren or siret number.
+            **kwargs (dict | None): `champs` and `masquerValeursNulles`.
+
+        Raises:
+            ValueError: If `date` is given (the mirror only holds current values).
+
+        Returns:
+            tuple[dict, dict] | None: The record and the header, or None if the
+            record is not in the mirror.
+        """
+        if kwargs.get("date"):
+            msg = "The mirror only holds current values: 'date' is not supported."
+            raise ValueError(msg)
+        table = self._table(data_type)
+        if not self.columns(data_type):
+            return None
+        row = self._connection().execute(f'SELECT * FROM "{table}" WHERE "{KEYS[data_type]}" = ?',
+                                         (str(id_code),)).fetchone()
+        if row is None:
+            logger.error("%s %s not found in the mirror.", data_type.upper(), id_code)
+            return None
+        record = self._records(data_type, [row])[0]
+        record = self._project(record, _split_list(kwargs.get("champs")),
+                               str(kwargs.get("masquerValeursNulles")).lower() == "true")
+        return record, {"statut": 200, "message": "OK"}
+
+    def get_many(self, data_type: str, ids: list[str], **kwargs: dict) -> list[dict]:
+        """Get the records of several numbers (the ones not in the mirror are left out).
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            ids (list[str]): The siren or siret numbers.
+            **kwargs (dict | None): `champs` and `masquerValeursNulles`.
+
+        Returns:
+            list[dict]: The records found, in no particular order.
+        """
+        if kwargs.get("date"):
+            msg = "The mirror only holds current values: 'date' is not supported."
+            raise ValueError(msg)
+        if not self.columns(data_type):
+            return []
+        table, key = self._table(data_type), KEYS[data_type]
+        rows = []
+        for start in range(0, len(ids), _MAX_PARAMS):
+            batch = [str(id_code) for id_code in ids[start:start + _MAX_PARAMS]]
+            rows.extend(self._connection().execute(
+                f'SELECT * FROM "{table}" WHERE "{key}" IN ({", ".join("?" * len(batch))})', batch))
+        champs = _split_list(kwargs.get("champs"))
+        hide_nulls = str(kwargs.get("masquerValeursNulles")).lower() == "true"
+        return [self._project(record, champs, hide_nulls) for record in self._records(data_type, rows)]
+
+    def get_bulk(self, data_type: str, **kwargs: dict) -> tuple[list[dict], dict] | None:
+        """Run a bulk query with the return shape of `InseeClient.get_bulk`.
+
+        Pages are read with `debut` (offset) or with `curseur` (the mirror's
+        cursors are opaque strings, starting from "*"). Facets are counted by
+        a `FacetIndex` over the mirror and returned in `header["facettes"]`.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            **kwargs (dict | None): `q`, `curseur`, `debut`, `nombre`, `tri`,
+            `champs`, `masquerValeursNulles` and `facette.champ` (or `facette`).
+
+        Raises:
+            ValueError: If the query uses a parameter or a syntax the mirror
+            does not support.
+
+        Returns:
+            tuple[list[dict], dict] | None: The records and the header, or None
+            if nothing matches the query.
+        """
+        if kwargs.get("date"):
+            msg = "'date' is not supported by the mirror."
+            raise ValueError(msg)
+        table, key = self._table(data_type), KEYS[data_type]
+        if not self.columns(data_type):
+            return None
+        where, params = self._where(data_type, kwargs.get("q"))
+
+        tri = [field for field in _split_list(kwargs.get("tri")) if field != key]
+        unknown = set(tri) - set(self.columns(data_type))
+        if unknown:
+            msg = f"Unknown 'tri' field(s) for the mirror: {sorted(unknown)}."
+            raise ValueError(msg)
+        order = [f"""IFNULL("{field}", '')""" for field in tri] + [f'"{key}"']
+
+        nombre = int(kwargs.get("nombre", 20))
+        debut = int(kwargs.get("debut", 0))
+        cursor = kwargs.get("curseur")
+        condition, condition_params = where, list(params)
+        if cursor and cursor != "*":
+            condition += f" AND ({', '.join(order)}) > ({', '.join('?' * len(order))})"
+            condition_params.extend(_decode_cursor(cursor))
+
+        connection = self._connection()
+        rows = connection.execute(
+            f'SELECT * FROM "{table}" WHERE {condition} ORDER BY {", ".join(order)} LIMIT ? OFFSET ?',
+            [*condition_params, nombre + 1, debut]).fetchall()
+        if not rows:
+            return None
+
+        # The total is counted once per query, not once per page
+        total_key = (data_type, where, tuple(params))
+        if total_key not in self._totals:
+            self._totals[total_key] = connection.execute(f'SELECT COUNT(*) FROM "{table}" WHERE {where}',
+                                                         params).fetchone()[0]
+        header = {"statut": 200, "message": "OK", "total": self._totals[total_key],
+                  "debut": debut, "nombre": min(len(rows), nombre)}
+        if cursor:
+            # The cursor stops changing on the last page, like the API's
+            last = rows[nombre - 1] if len(rows) > nombre else None
+            header["curseur"] = cursor
+            header["curseurSuivant"] = (_encode_cursor([row_value or "" for row_value in
+                                                        [last[field] for field in tri]] + [last[key]])
+                                        if last is not None else cursor)
+
+        champs = _split_list(kwargs.get("champs"))
+        hide_nulls = str(kwargs.get("masquerValeursNulles")).lower() == "true"
+        records = [self._project(record, champs, hide_nulls) for record in self._records(data_type, rows[:nombre])]
+        facette = kwargs.get("facette.champ") or kwargs.get("facette")
+        if facette:
+            # numpy is only imported when facets are asked for
+            from .facets import FacetIndex
+
+            if data_type not in self._facets:
+                self._facets[data_type] = FacetIndex.for_mirror(self, data_type,
+                                                                self.path.parent / "facets" / data_type)
+            header["facettes"] = self._facets[data_type].facettes(facette, q=kwargs.get("q"))
+        return records, header
+
+    def ingests(self) -> list[dict]:
+        """Get the stock files loaded into the mirror, oldest first.
+
+        Returns:
+            list[dict]: The file name, data type, number of rows and load time of each file.
+        """
+        return [dict(row) for row in self._connection().execute("SELECT * FROM ingests ORDER BY ingested_at")]
+
+    def iter_values(self, data_type: str, fields: list[str]) -> Iterator[tuple]:
+        """Read the values of some fields for every row, in key order.
+
+        On établissements, the fields of their unité légale can be read too.
+        Fields that are not loaded are read as None.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            fields (list[str]): The field names.
+
+        Yields:
+            tuple: The values of the fields in a row.
+        """
+        table, key = self._table(data_type), KEYS[data_type]
+        if not self.columns(data_type):
+            return
+        columns = set(self.columns(data_type))
+        joined = set(self.columns("siren")) if data_type == "siret" else set()
+        selected = [f't."{field}"' if field in columns else f'u."{field}"' if field in joined else "NULL"
+                    for field in fields] or ["NULL"]
+        join = f' LEFT JOIN "{TABLES["siren"][0]}" AS u ON u.siren = t.siren' if any(
+            column.startswith("u.") for column in selected) else ""
+        converters = [(lambda value: value == "true") if field in _BOOLEAN_FIELDS else
+                      int if field in _INTEGER_FIELDS else None for field in fields]
+        # A connection of its own, as the rows are read lazily
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            for row in connection.execute(f'SELECT {", ".join(selected)} FROM "{table}" AS t{join} ORDER BY t."{key}"'):
+                yield tuple(value if value is None or converter is None else converter(value)
+                            for value, converter in zip(row, converters))
+        finally:
+            connection.close()
+
+    def close(self) -> None:
+        """Close the connection of the current thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
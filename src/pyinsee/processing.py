@@ -0,0 +1,314 @@
+"""Flatten raw INSEE data into tabular datasets.
+
+`process_raw` reads the raw files saved under `DATA_DIR/raw/insee/<type>/json`
+(NDJSON segments, compressed or not, and JSON response bodies) and writes
+wide tables under `DATA_DIR/processed/insee/<type>/<format>`:
+
+    siren   unites_legales            one row per unité légale, with its current period
+            periodes_unites_legales   one row per period (history)
+    siret   etablissements            one row per établissement, with its unité légale,
+                                      its addresses and its current period
+            periodes_etablissements   one row per period (history)
+
+Each raw file is flattened by a worker process, in batches of `batch_size`
+records, and each batch is written as one part file named after the raw file
+(e.g. `unites_legales/siren_2024_0502T103107-00001.00001.csv`), so memory use
+is bounded by the batch size and the number of workers. Processing a raw file
+again replaces its parts.
+
+Parquet output requires the optional `pyarrow` dependency:
+
+    pip install pyinsee[arrow]
+
+Example:
+    from pyinsee.processing import process_raw
+
+    process_raw("siren", output_format="parquet", workers=8)
+"""
+from __future__ import annotations
+
+import csv
+import gzip
+import io
+import os
+from pathlib import Path
+from typing import Iterator
+
+from . import config
+from .decoding import loads
+from .logger import logger
+from .utils import get_save_dir
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# Output tables of each data type: (current table, history table)
+TABLES = {
+    "siren": ("unites_legales", "periodes_unites_legales"),
+    "siret": ("etablissements", "periodes_etablissements"),
+}
+
+# Period list and identifiers copied to the history rows of each data type
+PERIODS = {"siren": "periodesUniteLegale", "siret": "periodesEtablissement"}
+IDENTIFIERS = {"siren": ("siren",), "siret": ("siren", "siret")}
+
+# Supported output formats and their file extension
+OUTPUT_FORMATS = {"csv": ".csv", "parquet": ".parquet"}
+
+# Raw files that can be processed
+RAW_PATTERNS = ("*.ndjson", "*.ndjson.gz", "*.ndjson.zst", "*.json")
+
+
+def flatten_record(data_type: str, record: dict) -> dict:
+    """Flatten a record and its current period into a single row.
+
+    Nested objects (`uniteLegale`, `adresseEtablissement`, ...) are merged into
+    the row, as INSEE field names are unique across them.
+
+    Args:
+        data_type (str): The type of data, either "siren" or "siret".
+        record (dict): The `uniteLegale` or `etablissement` record.
+
+    Returns:
+        dict: The row.
+    """
+    row = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            row.update(value)
+        elif key == PERIODS[data_type]:
+            if value:
+                row.update(value[0])
+        elif not isinstance(value, list):
+            row[key] = value
+    return row
+
+
+def flatten_periods(data_type: str, record: dict) -> list[dict]:
+    """Flatten the periods of a record into one row each.
+
+    Args:
+        data_type (str): The type of data, either "siren" or "siret".
+        record (dict): The `uniteLegale` or `etablissement` record.
+
+    Returns:
+        list[dict]: The rows, the current period first.
+    """
+    identifiers = {key: record.get(key) for key in IDENTIFIERS[data_type]}
+    return [{**identifiers, **period} for period in record.get(PERIODS[data_type]) or []]
+
+
+def iter_raw_records(path: str | Path, data_type: str) -> Iterator[dict]:
+    """Read the records of a raw file, one at a time for NDJSON segments.
+
+    Args:
+        path (str | Path): The raw file: an NDJSON segment (`.ndjson`, `.ndjson.gz`
+        or `.ndjson.zst`) or a JSON response body.
+        data_type (str): The type of data, either "siren" or "siret".
+
+    Raises:
+        ValueError: If the file is not a supported raw file.
+
+    Yields:
+        dict: A record.
+    """
+    path = Path(path)
+    if path.name.endswith(".json"):
+        yield from _json_records(loads(path.read_bytes()), data_type)
+        return
+    if path.name.endswith(".ndjson.gz"):
+        f = gzip.open(path, "rb")
+    elif path.name.endswith(".ndjson.zst"):
+        if zstandard is None:
+            msg = f"Reading {path.name} requires zstandard. Install it with `pip install pyinsee[zstd]`."
+            raise ImportError(msg)
+        f = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(path.open("rb"), closefd=True))
+    elif path.name.endswith(".ndjson"):
+        f = path.open("rb")
+    else:
+        msg = f"Unsupported raw file: {path}."
+        raise ValueError(msg)
+    with f:
+        for line in f:
+            if line.strip():
+                yield loads(line)
+
+
+def iter_raw_files(data_type: str) -> list[Path]:
+    """List the raw files saved for a data type (manifests and temporary files excluded).
+
+    Args:
+        data_type (str): The type of data, either "siren" or "siret".
+
+    Returns:
+        list[Path]: The raw files, sorted by name.
+    """
+    raw_dir = get_save_dir(response_data_type=data_type, response_type="json")
+    return sorted({path for pattern in RAW_PATTERNS for path in raw_dir.glob(pattern)
+                   if not path.name.startswith(".") and not path.name.endswith(".manifest.json")})
+
+
+def _json_records(payload: object, data_type: str) -> list[dict]:
+    """Extract the records of a saved JSON response body or lookup."""
+    many, one = ("unitesLegales", "uniteLegale") if data_type == "siren" else ("etablissements", "etablissement")
+    if isinstance(payload, dict):
+        if many in payload:
+            return payload[many]
+        if one in payload:
+            return [payload[one]]
+        if data_type in payload:
+            return [payload]
+        # Records keyed by their number
+        return [value for value in payload.values() if isinstance(value, dict) and data_type in value]
+    if isinstance(payload, list):
+        # A saved (record, header) pair or a list of records
+        return [item for item in payload if isinstance(item, dict) and data_type in item]
+    return []
+
+
+def _write_part(rows: list[dict], path: Path, output_format: str) -> None:
+    """Write one part file of a table, atomically."""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    if output_format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.Table.from_pylist(rows)
+        # Columns that are empty in this batch would otherwise have no type
+        table = table.cast(pa.schema([pa.field(field.name, pa.string()) if pa.types.is_null(field.type) else field
+                                      for field in table.schema]))
+        pq.write_table(table, tmp_path)
+    else:
+        # Every field of the batch, in order of appearance
+        fields = list(dict.fromkeys(key for row in rows for key in row))
+        with tmp_path.open("w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({key: ("true" if value else "false") if isinstance(value, bool) else value
+                                 for key, value in row.items()})
+    os.replace(tmp_path, path)
+
+
+def process_file(path: str | Path,
+                 data_type: str,
+                 output_dir: str | Path,
+                 output_format: str = "csv",
+                 batch_size: int | None = None) -> dict[str, int]:
+    """Flatten one raw file into part files of the current and history tables.
+
+    Args:
+        path (str | Path): The raw file.
+        data_type (str): The type of data, either "siren" or "siret".
+        output_dir (str | Path): The directory holding one subdirectory per table.
+        output_format (str, optional): "csv" or "parquet". Defaults to "csv".
+        batch_size (int, optional): The number of records per part file.
+        Defaults to INSEE_PROCESS_BATCH_SIZE.
+
+    Returns:
+        dict[str, int]: The number of rows written to each table.
+    """
+    path = Path(path)
+    batch_size = batch_size or config.INSEE_PROCESS_BATCH_SIZE
+    stem = path.name.split(".")[0]
+    extension = OUTPUT_FORMATS[output_format]
+    directories = [Path(output_dir) / table for table in TABLES[data_type]]
+    for directory in directories:
+        directory.mkdir(parents=True, exist_ok=True)
+        # Drop the parts of a previous run, which may have had more batches
+        for old_part in directory.glob(f"{stem}.*{extension}"):
+            old_part.unlink()
+
+    counts = dict.fromkeys(TABLES[data_type], 0)
+    current, history, part = [], [], 0
+
+    def flush() -> None:
+        nonlocal part
+        part += 1
+        for directory, rows in zip(directories, (current, history)):
+            if rows:
+                _write_part(rows, directory / f"{stem}.{part:05d}{extension}", output_format)
+                counts[directory.name] += len(rows)
+        current.clear()
+        history.clear()
+
+    for record in iter_raw_records(path, data_type):
+        current.append(flatten_record(data_type, record))
+        history.extend(flatten_periods(data_type, record))
+        if len(current) >= batch_size:
+            flush()
+    if current:
+        flush()
+    return counts
+
+
+def process_raw(data_type: str = "siren",
+                output_format: str = "csv",
+                workers: int | None = None,
+                batch_size: int | None = None,
+                files: list[str | Path] | None = None) -> dict[str, int]:
+    """Flatten the raw files of a data type into processed tables, in parallel.
+
+    Args:
+        data_type (str, optional): The type of data, either "siren" or "siret".
+        Defaults to "siren".
+        output_format (str, optional): "csv" or "parquet". Defaults to "csv".
+        workers (int, optional): The number of worker processes (1 to process the
+        files in this process). Defaults to INSEE_PROCESS_WORKERS.
+        batch_size (int, optional): The number of records per part file.
+        Defaults to INSEE_PROCESS_BATCH_SIZE.
+        files (list[str | Path] | None, optional): The raw files to process.
+        Defaults to every raw file of the data type.
+
+    Raises:
+        ValueError: If `data_type`, `output_format` or `batch_size` is not valid.
+        ImportError: If the parquet format is asked for without pyarrow.
+
+    Returns:
+        dict[str, int]: The number of rows written to each table.
+    """
+    workers = workers if workers is not None else config.INSEE_PROCESS_WORKERS
+    batch_size = batch_size if batch_size is not None else config.INSEE_PROCESS_BATCH_SIZE
+    if data_type not in TABLES:
+        msg = f"Invalid data type: {data_type}. Must be 'siren' or 'siret'."
+        raise ValueError(msg)
+    if output_format not in OUTPUT_FORMATS:
+        msg = f"Unsupported output format: {output_format}. Must be one of {list(OUTPUT_FORMATS)}."
+        raise ValueError(msg)
+    if batch_size < 1:
+        msg = "batch_size must be a positive integer."
+        raise ValueError(msg)
+    if output_format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401
+        except ImportError as err:
+            msg = "The parquet format requires pyarrow. Install it with `pip install pyinsee[arrow]`."
+            raise ImportError(msg) from err
+
+    if files is None:
+        files = iter_raw_files(data_type)
+    output_dir = get_save_dir(response_data_type=data_type, response_type=output_format, data_type="processed")
+    logger.info("Processing %d raw %s file(s) into %s.", len(files), data_type.upper(), output_dir)
+
+    totals = dict.fromkeys(TABLES[data_type], 0)
+    if workers <= 1:
+        for path in files:
+            for table, count in process_file(path, data_type, output_dir, output_format, batch_size).items():
+                totals[table] += count
+            logger.info("Processed %s.", path)
+    else:
+        # Heavy, only needed here
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_file, str(path), data_type, str(output_dir), output_format, batch_size): path
+                       for path in files}
+            for future in as_completed(futures):
+                for table, count in future.result().items():
+                    totals[table] += count
+                logger.info("Processed %s.", futures[future])
+
+    logger.info("Processed %s data: %s.", data_type.upper(),
+                ", ".join(f"{count} row(s) in {table}" for table, count in totals.items()))
+    return totals
@@ -0,0 +1,587 @@
+"""Parse and evaluate INSEE `q` queries locally.
+
+Bulk queries are filtered with `q`, which uses the Sirene API's Lucene-like
+syntax:
+
+    siren:552100554                            a value
+    denominationUniteLegale:"ACME SERVICES"    a phrase
+    codePostalEtablissement:75*                a wildcard (`*` and `?`)
+    denominationUniteLegale:ACMF~1             an approximate value (edit distance, 2 by default)
+    dateCreationUniteLegale:[2020-01-01 TO *]  a range ([ ] inclusive, { } exclusive, * open)
+    codeCommuneEtablissement:(75101 OR 75102)  several values of a field
+    nomUsageUniteLegale:*                      any value (the field is not null)
+    periode(etatAdministratifEtablissement:A AND activitePrincipaleEtablissement:56.10A)
+                                               conditions met by the same period
+    a AND b, a OR b, NOT a, -a, (a b)          boolean operators (clauses with no
+                                               operator between them are ORed)
+
+`parse_query` compiles a query into a tree of nodes and raises `ValueError`
+on malformed queries, so they are rejected before reaching the API.
+`Query.matches` evaluates the tree against a record held locally (a dict in
+the API structure or a compact `Record`), so cached, stored and mirrored
+records can be searched without network calls:
+
+- outside `periode(...)`, period fields are matched against the current period;
+- text is compared without case, against the whole value or one of its words;
+- ranges compare numbers as numbers and everything else (codes, ISO dates) as text.
+
+Example:
+    query = parse_query("periode(etatAdministratifUniteLegale:A) AND categorieEntreprise:PME")
+    active_smes = [record for record in records if query.matches(record)]
+"""
+from __future__ import annotations
+
+import re
+from collections.abc import Iterable, Iterator, Mapping
+from functools import lru_cache
+
+# Tokens of a query, tried in this order
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<phrase>"(?:[^"\\]|\\.)*")
+  | (?P<and>&&)
+  | (?P<or>\|\|)
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<lrange>[\[{])
+  | (?P<rrange>[\]}])
+  | (?P<field>(?:\w+|\*)):
+  | (?<![^\s(])(?P<not>[-!])(?=\S)
+  | (?<![^\s(])(?P<plus>\+)(?=\S)
+  | (?P<word>(?:[^\s()\[\]{}"\\]|\\.)+)
+""", re.VERBOSE)
+
+# Words used as operators
+_KEYWORDS = {"AND": "and", "OR": "or", "NOT": "not"}
+
+# Description of the tokens, for error messages
+_EXPECTED = {"word": "a value", "phrase": "a value", "lparen": "'('", "rparen": "')'", "rrange": "']' or '}'"}
+
+# Approximate value: `value~` or `value~N`
+_FUZZY = re.compile(r"^(.*[^\\])~(\d?)$")
+
+_DEFAULT_DISTANCE = 2
+
+
+def _text(value: object) -> str:
+    """Get the text of a field value, for comparisons."""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value).casefold()
+
+
+def _is_number(value: object) -> bool:
+    """Tell whether a field value is a number (and not a boolean)."""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _unescape(text: str) -> str:
+    """Remove the backslash escapes of a value."""
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Get the Levenshtein distance between two strings, up to a limit.
+
+    Args:
+        a (str): The first string.
+        b (str): The second string.
+        limit (int): The largest distance of interest.
+
+    Returns:
+        int: The distance, or `limit + 1` if it is larger than `limit`.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def fuzzy_match(value: object, expected: str, distance: int) -> bool:
+    """Tell whether a field value, or one of its words, is close to a value.
+
+    Args:
+        value (object): The field value.
+        expected (str): The value searched.
+        distance (int): The largest edit distance.
+
+    Returns:
+        bool: Whether the value matches.
+    """
+    if value is None:
+        return False
+    text, expected = _text(value), expected.casefold()
+    return any(edit_distance(candidate, expected, distance) <= distance for candidate in (text, *text.split()))
+
+
+class Node:
+    """A node of a compiled query."""
+
+    __slots__ = ()
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:
+        """Evaluate the node.
+
+        Args:
+            fields (Mapping): The fields of the record, with its current period.
+            periods (list[Mapping]): The periods of the record.
+
+        Returns:
+            bool: Whether the record matches.
+        """
+        raise NotImplementedError
+
+    def __eq__(self, other: object) -> bool:
+        """Compare the node type and attributes."""
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        """Show the node type and attributes."""
+        return f"{type(self).__name__}({', '.join(repr(getattr(self, name)) for name in self.__slots__)})"
+
+
+class MatchAll(Node):
+    """`*:*`: every record."""
+
+    __slots__ = ()
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:  # noqa: ARG002
+        """Match every record."""
+        return True
+
+
+class Term(Node):
+    """`field:value` or `field:"a phrase"`."""
+
+    __slots__ = ("field", "value")
+
+    def __init__(self, field: str, value: str) -> None:
+        """Keep the field and the value."""
+        self.field = field
+        self.value = value
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:  # noqa: ARG002
+        """Match the whole value or a sequence of its words."""
+        value = fields.get(self.field)
+        if value is None:
+            return False
+        text, expected = _text(value), self.value.casefold()
+        if text == expected:
+            return True
+        words, expected_words = text.split(), expected.split()
+        size = len(expected_words)
+        return size > 0 and any(words[i:i + size] == expected_words for i in range(len(words) - size + 1))
+
+
+class Exists(Node):
+    """`field:*`: the field is not null."""
+
+    __slots__ = ("field",)
+
+    def __init__(self, field: str) -> None:
+        """Keep the field."""
+        self.field = field
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:  # noqa: ARG002
+        """Match a non-null, non-empty value."""
+        return fields.get(self.field) not in (None, "")
+
+
+class Wildcard(Node):
+    """`field:pat*ern?`: `*` stands for any characters and `?` for one."""
+
+    __slots__ = ("field", "pattern", "regex")
+
+    def __init__(self, field: str, pattern: str) -> None:
+        """Keep the field and the pattern (a value with unescaped wildcards)."""
+        self.field = field
+        self.pattern = pattern
+        parts = re.split(r"(\\.|[*?])", pattern)
+        self.regex = re.compile("".join(".*" if part == "*" else "." if part == "?"
+                                        else re.escape(part[1:] if part.startswith("\\") else part)
+                                        for part in parts), re.IGNORECASE | re.DOTALL)
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:  # noqa: ARG002
+        """Match the whole value or one of its words."""
+        value = fields.get(self.field)
+        if value is None:
+            return False
+        text = _text(value)
+        return self.regex.fullmatch(text) is not None or any(self.regex.fullmatch(word) for word in text.split())
+
+
+class Fuzzy(Node):
+    """`field:value~N`: a value within an edit distance of N."""
+
+    __slots__ = ("field", "value", "distance")
+
+    def __init__(self, field: str, value: str, distance: int = _DEFAULT_DISTANCE) -> None:
+        """Keep the field, the value and the distance."""
+        self.field = field
+        self.value = value
+        self.distance = distance
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:  # noqa: ARG002
+        """Match the whole value or one of its words."""
+        return fuzzy_match(fields.get(self.field), self.value, self.distance)
+
+
+class Range(Node):
+    """`field:[low TO high]` (inclusive) or `field:{low TO high}` (exclusive); None for an open bound."""
+
+    __slots__ = ("field", "low", "high", "include_low", "include_high")
+
+    def __init__(self,
+                 field: str,
+                 low: str | None,
+                 high: str | None,
+                 include_low: bool = True,
+                 include_high: bool = True) -> None:
+        """Keep the field and the bounds."""
+        self.field = field
+        self.low = low
+        self.high = high
+        self.include_low = include_low
+        self.include_high = include_high
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:  # noqa: ARG002
+        """Match a value between the bounds."""
+        value = fields.get(self.field)
+        if value is None or value == "":
+            return False
+        for bound, include, sign in ((self.low, self.include_low, 1), (self.high, self.include_high, -1)):
+            if bound is None:
+                continue
+            if _is_number(value):
+                try:
+                    bound_value = float(bound)
+                except ValueError:
+                    return False
+                compared = value
+            else:
+                compared, bound_value = _text(value), bound.casefold()
+            if compared == bound_value:
+                if not include:
+                    return False
+            elif (compared > bound_value) != (sign > 0):
+                return False
+        return True
+
+
+class And(Node):
+    """Every clause matches."""
+
+    __slots__ = ("clauses",)
+
+    def __init__(self, clauses: list[Node]) -> None:
+        """Keep the clauses."""
+        self.clauses = clauses
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:
+        """Match every clause."""
+        return all(clause.matches(fields, periods) for clause in self.clauses)
+
+
+class Or(Node):
+    """At least one clause matches."""
+
+    __slots__ = ("clauses",)
+
+    def __init__(self, clauses: list[Node]) -> None:
+        """Keep the clauses."""
+        self.clauses = clauses
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:
+        """Match any clause."""
+        return any(clause.matches(fields, periods) for clause in self.clauses)
+
+
+class Not(Node):
+    """`NOT clause` or `-clause`."""
+
+    __slots__ = ("clause",)
+
+    def __init__(self, clause: Node) -> None:
+        """Keep the negated clause."""
+        self.clause = clause
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:
+        """Match when the clause does not."""
+        return not self.clause.matches(fields, periods)
+
+
+class Periode(Node):
+    """`periode(clause)`: one period of the record matches the whole clause."""
+
+    __slots__ = ("clause",)
+
+    def __init__(self, clause: Node) -> None:
+        """Keep the clause."""
+        self.clause = clause
+
+    def matches(self, fields: Mapping, periods: list[Mapping]) -> bool:
+        """Match any period, with the fields of the record that are not historized."""
+        if not periods:
+            return self.clause.matches(fields, periods)
+        return any(self.clause.matches({**fields, **period}, periods) for period in periods)
+
+
+def record_fields(record: Mapping) -> tuple[dict, list[Mapping]]:
+    """Get the fields and the periods of a record, for evaluation.
+
+    Nested objects (`uniteLegale`, `adresseEtablissement`, ...) are merged into
+    the fields, as INSEE field names are unique across them, and so is the
+    current period.
+
+    Args:
+        record (Mapping): The `uniteLegale` or `etablissement` record.
+
+    Returns:
+        tuple[dict, list[Mapping]]: The fields and the periods.
+    """
+    fields, periods = {}, []
+    for key, value in record.items():
+        if isinstance(value, Mapping):
+            fields.update(value)
+        elif key.startswith("periodes") and isinstance(value, (list, tuple)):
+            periods = list(value)
+        else:
+            fields[key] = value
+    if periods:
+        fields.update(periods[0])
+    return fields, periods
+
+
+class _Parser:
+    """Recursive descent parser of `q` queries.
+
+    Precedence, from the loosest: OR (and clauses with no operator), AND, NOT.
+    """
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.tokens = []
+        position = 0
+        while position < len(text):
+            match = _TOKEN.match(text, position)
+            if match is None:
+                self.error(position, f"unexpected character {text[position]!r}")
+            kind, value = match.lastgroup, match.group(match.lastgroup)
+            if kind == "word" and value in _KEYWORDS:
+                kind = _KEYWORDS[value]
+            if kind != "space":
+                self.tokens.append((kind, value, position))
+            position = match.end()
+        self.position = 0
+
+    def error(self, position: int, message: str) -> None:
+        msg = f"Invalid q query {self.text!r} at position {position}: {message}."
+        raise ValueError(msg)
+
+    def peek(self) -> tuple[str, str, int]:
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return "end", "", len(self.text)
+
+    def take(self, *kinds: str) -> tuple[str, str, int]:
+        token = self.peek()
+        if token[0] not in kinds:
+            found = "the end of the query" if token[0] == "end" else repr(token[1])
+            expected = " or ".join(dict.fromkeys(_EXPECTED[kind] for kind in kinds))
+            self.error(token[2], f"expected {expected}, found {found}")
+        self.position += 1
+        return token
+
+    def parse(self) -> Node:
+        if not self.tokens:
+            self.error(0, "the query is empty")
+        node = self.parse_or(None)
+        if self.peek()[0] != "end":
+            self.error(self.peek()[2], f"unexpected {self.peek()[1]!r}")
+        return node
+
+    def parse_or(self, field: str | None) -> Node:
+        clauses = [self.parse_and(field)]
+        while True:
+            kind = self.peek()[0]
+            if kind == "or":
+                self.position += 1
+            elif kind in ("end", "rparen", "and"):
+                break
+            clauses.append(self.parse_and(field))
+        return clauses[0] if len(clauses) == 1 else Or(clauses)
+
+    def parse_and(self, field: str | None) -> Node:
+        clauses = [self.parse_not(field)]
+        while self.peek()[0] == "and":
+            self.position += 1
+            clauses.append(self.parse_not(field))
+        return clauses[0] if len(clauses) == 1 else And(clauses)
+
+    def parse_not(self, field: str | None) -> Node:
+        kind = self.peek()[0]
+        if kind == "not":
+            self.position += 1
+            return Not(self.parse_not(field))
+        if kind == "plus":
+            self.position += 1
+        return self.parse_primary(field)
+
+    def parse_primary(self, field: str | None) -> Node:
+        kind, value, position = self.peek()
+        if kind == "lparen":
+            self.position += 1
+            node = self.parse_or(field)
+            self.take("rparen")
+            return node
+        if kind == "word" and value == "periode" and field is None:
+            self.position += 1
+            self.take("lparen")
+            node = Periode(self.parse_or(None))
+            self.take("rparen")
+            return node
+        if kind == "field":
+            if field is not None:
+                self.error(position, f"field {value!r} inside the values of {field!r}")
+            self.position += 1
+            return self.parse_value(value)
+        if kind in ("word", "phrase", "lrange"):
+            if field is None:
+                self.error(position, f"{value!r} has no field (expected field:value)")
+            return self.parse_value(field)
+        found = "the end of the query" if kind == "end" else repr(value)
+        self.error(position, f"expected a clause, found {found}")
+        return None
+
+    def parse_value(self, field: str) -> Node:
+        kind, value, position = self.peek()
+        if kind == "lparen":
+            self.position += 1
+            node = self.parse_or(field)
+            self.take("rparen")
+            return node
+        if kind == "lrange":
+            self.position += 1
+            low = self.take("word", "phrase")[1]
+            if self.take("word")[1] != "TO":
+                self.error(self.tokens[self.position - 1][2], "expected TO in the range")
+            high = self.take("word", "phrase")[1]
+            closing = self.take("rrange")[1]
+            return Range(field, self.bound(low), self.bound(high), value == "[", closing == "]")
+        self.take("word", "phrase")
+        if field == "*":
+            if value != "*":
+                self.error(position, "only *:* can have no field")
+            return MatchAll()
+        if kind == "phrase":
+            return Term(field, _unescape(value[1:-1]))
+        fuzzy = _FUZZY.match(value)
+        if fuzzy:
+            text, distance = fuzzy.groups()
+            return Fuzzy(field, _unescape(text), int(distance) if distance else _DEFAULT_DISTANCE)
+        if value == "*":
+            return Exists(field)
+        if re.search(r"(?<!\\)(?:\\\\)*[*?]", value):
+            return Wildcard(field, value)
+        return Term(field, _unescape(value))
+
+    @staticmethod
+    def bound(value: str) -> str | None:
+        if value == "*":
+            return None
+        return _unescape(value[1:-1] if value.startswith('"') else value)
+
+
+class Query:
+    """A compiled `q` query.
+
+    Args:
+        text (str): The query.
+
+    Raises:
+        ValueError: If the query is malformed.
+
+    Attributes:
+        text (str): The query.
+        root (Node): The compiled query.
+    """
+
+    __slots__ = ("text", "root")
+
+    def __init__(self, text: str) -> None:
+        """Compile the query."""
+        self.text = text
+        self.root = _Parser(text).parse()
+
+    def __repr__(self) -> str:
+        """Show the query."""
+        return f"Query({self.text!r})"
+
+    def matches(self, record: Mapping) -> bool:
+        """Tell whether a record matches the query.
+
+        Args:
+            record (Mapping): The `uniteLegale` or `etablissement` record, as a
+            dict in the API structure or a compact `Record`.
+
+        Returns:
+            bool: Whether the record matches.
+        """
+        return self.root.matches(*record_fields(record))
+
+    def filter(self, records: Iterable[Mapping]) -> Iterator[Mapping]:
+        """Keep the records matching the query.
+
+        Args:
+            records (Iterable[Mapping]): The records.
+
+        Yields:
+            Mapping: The records matching the query.
+        """
+        for record in records:
+            if self.matches(record):
+                yield record
+
+    def fields(self) -> set[str]:
+        """Get the fields the query uses.
+
+        Returns:
+            set[str]: The field names.
+        """
+        found = set()
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            if hasattr(node, "field"):
+                found.add(node.field)
+            nodes.extend(getattr(node, "clauses", ()))
+            if hasattr(node, "clause"):
+                nodes.append(node.clause)
+        return found
+
+
+@lru_cache(maxsize=256)
+def parse_query(text: str) -> Query:
+    """Compile a `q` query (compiled queries are cached).
+
+    Args:
+        text (str): The query.
+
+    Raises:
+        ValueError: If the query is malformed.
+
+    Returns:
+        Query: The compiled query.
+    """
+    return Query(text)
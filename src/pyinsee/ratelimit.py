@@ -0,0 +1,226 @@
+"""Client-side rate limiting for the INSEE API.
+
+The INSEE API enforces a per-account quota (30 requests per minute for the
+public plan) and answers 429 beyond it. `RateLimiter` is a token bucket that
+spaces the requests so that the client stays right at the quota. It is shared
+by every thread of the process and, when given a state file, by every process
+using the same file. When the API answers 429, the limiter is paused for the
+`Retry-After` delay.
+
+Example:
+    from pyinsee.ratelimit import RateLimiter
+    from pyinsee.transport import Transport
+
+    limiter = RateLimiter(requests_per_minute=30, state_path="/shared/insee_rate.json")
+    transport = Transport(rate_limiter=limiter)
+"""
+from __future__ import annotations
+
+import email.utils
+import json
+import threading
+import time
+from pathlib import Path
+
+from . import config
+from .logger import logger
+from .utils import file_lock
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse a `Retry-After` header (delay in seconds or HTTP date).
+
+    Args:
+        value (str | None): The header value.
+
+    Returns:
+        float | None: The delay in seconds, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class RateLimiter:
+    """Token bucket shared between threads and, optionally, processes.
+
+    Args:
+        requests_per_minute (float, optional): The sustained request rate.
+            0 disables the limiter. Defaults to INSEE_RATE_LIMIT.
+        burst (int, optional): The number of requests that may be sent back to
+            back after an idle period. Defaults to INSEE_RATE_BURST.
+        state_path (str | Path | None, optional): A state file shared between
+            processes, guarded by a lock file. Defaults to INSEE_RATE_LIMIT_FILE
+            (pass "" for no state file when it is set).
+
+    Attributes:
+        requests_per_minute (float): The sustained request rate.
+        burst (int): The bucket capacity.
+    """
+
+    def __init__(self,
+                 requests_per_minute: float | None = None,
+                 burst: int | None = None,
+                 state_path: str | Path | None = None) -> None:
+        """Initialize the rate limiter with a full bucket."""
+        if requests_per_minute is None:
+            requests_per_minute = config.INSEE_RATE_LIMIT
+        if burst is None:
+            burst = config.INSEE_RATE_BURST
+        if state_path is None:
+            state_path = config.INSEE_RATE_LIMIT_FILE
+        if requests_per_minute < 0 or burst < 1:
+            msg = "requests_per_minute must be positive (or 0) and burst at least 1."
+            raise ValueError(msg)
+
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst
+        self.state_path = Path(state_path) if state_path else None
+        self._lock = threading.Lock()
+        self._state = {"tokens": float(burst), "updated": time.time(), "paused_until": 0.0}
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the limiter throttles requests at all."""
+        return self.requests_per_minute > 0
+
+    def try_acquire(self) -> float:
+        """Take a token if one is available.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds to
+            wait before trying again.
+        """
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            if self.state_path is None:
+                return self._take(self._state)
+            with file_lock(self.state_path.with_suffix(".lock")):
+                state = self._read_state()
+                wait = self._take(state)
+                self._write_state(state)
+                return wait
+
+    def acquire(self) -> float:
+        """Block until a request may be sent.
+
+        Returns:
+            float: The time spent waiting, in seconds.
+        """
+        waited = 0.0
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self) -> float:
+        """Wait on the event loop until a request may be sent.
+
+        Returns:
+            float: The time spent waiting, in seconds.
+        """
+        import asyncio  # only the async client waits on an event loop
+
+        loop = asyncio.get_running_loop()
+        waited = 0.0
+        while True:
+            if self.state_path is None:
+                wait = self.try_acquire()
+            else:
+                # The state file lock may block: take it in a worker thread
+                wait = await loop.run_in_executor(None, self.try_acquire)
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds: float | None = None) -> float:
+        """Stop handing out tokens, e.g. after a 429 response.
+
+        Args:
+            seconds (float | None, optional): The pause, usually the `Retry-After`
+            delay. Defaults to the interval between two requests.
+
+        Returns:
+            float: The pause applied, in seconds.
+        """
+        if not self.enabled:
+            return 0.0
+        if seconds is None:
+            seconds = 60.0 / self.requests_per_minute
+        logger.warning("Rate limited by INSEE, pausing requests for %.1f seconds.", seconds)
+        with self._lock:
+            if self.state_path is None:
+                self._apply_pause(self._state, seconds)
+            else:
+                with file_lock(self.state_path.with_suffix(".lock")):
+                    state = self._read_state()
+                    self._apply_pause(state, seconds)
+                    self._write_state(state)
+        return seconds
+
+    def _take(self, state: dict) -> float:
+        """Refill the bucket and take a token from it (state is updated in place)."""
+        now = time.time()
+        if now < state["paused_until"]:
+            return state["paused_until"] - now
+
+        rate = self.requests_per_minute / 60.0
+        elapsed = max(now - state["updated"], 0.0)
+        state["tokens"] = min(float(self.burst), state["tokens"] + elapsed * rate)
+        state["updated"] = now
+        if state["tokens"] >= 1:
+            state["tokens"] -= 1
+            return 0.0
+        return (1 - state["tokens"]) / rate
+
+    @staticmethod
+    def _apply_pause(state: dict, seconds: float) -> None:
+        """Pause the bucket for `seconds`, then let a single request through (state is updated in place)."""
+        now = time.time()
+        state["paused_until"] = max(state["paused_until"], now + seconds)
+        state["tokens"] = 1.0
+        state["updated"] = state["paused_until"]
+
+    def _read_state(self) -> dict:
+        """Read the bucket shared by other processes, or a full one if there is none."""
+        try:
+            with self.state_path.open() as f:
+                state = json.load(f)
+            return {key: float(state[key]) for key in ("tokens", "updated", "paused_until")}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {"tokens": float(self.burst), "updated": time.time(), "paused_until": 0.0}
+
+    def _write_state(self, state: dict) -> None:
+        """Write the bucket for other processes (called with the lock file held)."""
+        with self.state_path.open("w") as f:
+            json.dump(state, f)
+
+
+_default_rate_limiter: RateLimiter | None = None
+_default_rate_limiter_lock = threading.Lock()
+
+
+def get_default_rate_limiter() -> RateLimiter:
+    """Get the process-wide rate limiter shared by transports created without one.
+
+    Returns:
+        RateLimiter: The shared rate limiter, created on first use.
+    """
+    global _default_rate_limiter  # noqa: PLW0603
+    if _default_rate_limiter is None:
+        with _default_rate_limiter_lock:
+            if _default_rate_limiter is None:
+                _default_rate_limiter = RateLimiter()
+    return _default_rate_limiter
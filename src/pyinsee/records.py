@@ -0,0 +1,242 @@
+"""Compact record types for unités légales and établissements.
+
+The API returns each record as nested dicts. Services holding many records
+for a long time can convert them to `UniteLegale` and `Etablissement`
+objects instead, which take less memory:
+
+- the values are kept in a tuple, and the field names in a schema shared by
+  every record with the same fields (`__slots__`, no per-record dict);
+- code values (legal category, NAF code, administrative state, headcount
+  band, ...) are interned, so each distinct code is stored once;
+- nested sections (`periodesUniteLegale`, `adresseEtablissement`, ...) are
+  kept in the same compact form and only turned into `Periode`, `Adresse`
+  or `UniteLegale` objects on first access.
+
+Records are read-only mappings: fields can be read as attributes or keys,
+and `to_dict` gives back the API structure.
+
+Example:
+    client = InseeClient()
+    unite_legale, header = client.get_by_number(data_type="siren", id_code="552100554", as_record=True)
+    print(unite_legale.denominationUniteLegale, unite_legale.periodes[0].etatAdministratifUniteLegale)
+"""
+from __future__ import annotations
+
+import sys
+from collections.abc import Mapping
+from typing import Iterator
+
+from .frames import field_kind
+
+
+class _Schema:
+    """The field names shared by records with the same fields."""
+
+    __slots__ = ("fields", "index", "interned")
+
+    def __init__(self, fields: tuple) -> None:
+        self.fields = fields
+        self.index = {field: position for position, field in enumerate(fields)}
+        self.interned = tuple(field_kind(field) == "category" for field in fields)
+
+
+_SCHEMAS: dict[tuple, _Schema] = {}
+
+
+def _get_schema(fields: tuple) -> _Schema:
+    """Get the shared schema of a set of fields."""
+    schema = _SCHEMAS.get(fields)
+    if schema is None:
+        schema = _SCHEMAS.setdefault(fields, _Schema(fields))
+    return schema
+
+
+def _compact(data: dict) -> tuple[_Schema, tuple]:
+    """Turn a dict into a schema and a tuple of values, interning the codes.
+
+    Nested dicts and lists of dicts are compacted the same way.
+    """
+    schema = _get_schema(tuple(data))
+    values = []
+    for value, interned in zip(data.values(), schema.interned):
+        if isinstance(value, dict):
+            value = _compact(value)
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            value = tuple(_compact(item) for item in value)
+        elif interned and isinstance(value, str):
+            value = sys.intern(value)
+        values.append(value)
+    return schema, tuple(values)
+
+
+def _is_compact(value: object) -> bool:
+    """Tell whether a value is a nested section not decoded yet."""
+    return type(value) is tuple and len(value) > 0 and type(value[0]) in (_Schema, tuple)
+
+
+def _plain(value: object) -> object:
+    """Convert a value back to the API structure."""
+    if isinstance(value, Record):
+        return value.to_dict()
+    if type(value) is tuple:
+        if len(value) == 2 and type(value[0]) is _Schema:  # noqa: PLR2004 - compact section
+            return dict(zip(value[0].fields, map(_plain, value[1])))
+        return [_plain(item) for item in value]
+    return value
+
+
+class Record(Mapping):
+    """Read-only record with slotted storage.
+
+    Args:
+        data (dict): The record, as returned by the API.
+
+    Fields can be read as attributes (`record.siren`) or keys (`record["siren"]`).
+    """
+
+    __slots__ = ("_schema", "_values")
+
+    # Record type of the nested sections, by field name
+    _sections: dict[str, type[Record]] = {}
+
+    def __init__(self, data: dict) -> None:
+        """Compact the record."""
+        self._schema, self._values = _compact(data)
+
+    @classmethod
+    def _from_compact(cls, schema: _Schema, values: tuple) -> Record:
+        """Build a record from its compact form."""
+        record = cls.__new__(cls)
+        record._schema = schema
+        record._values = values
+        return record
+
+    def _decode(self, position: int) -> object:
+        """Decode a nested section on first access and keep the result."""
+        value = self._values[position]
+        if not _is_compact(value):
+            return value
+        section = self._sections.get(self._schema.fields[position], Record)
+        if type(value[0]) is _Schema:
+            decoded = section._from_compact(*value)
+        else:
+            decoded = tuple(section._from_compact(*item) for item in value)
+        self._values = self._values[:position] + (decoded,) + self._values[position + 1:]
+        return decoded
+
+    def __getattr__(self, name: str) -> object:
+        """Get a field as an attribute."""
+        if name.startswith("_"):
+            raise AttributeError(name)
+        position = self._schema.index.get(name)
+        if position is None:
+            msg = f"{type(self).__name__} has no field {name!r}."
+            raise AttributeError(msg)
+        return self._decode(position)
+
+    def __getitem__(self, name: str) -> object:
+        """Get a field as a key."""
+        position = self._schema.index.get(name)
+        if position is None:
+            raise KeyError(name)
+        return self._decode(position)
+
+    def __contains__(self, name: object) -> bool:
+        """Tell whether the record has a field."""
+        return name in self._schema.index
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over the field names."""
+        return iter(self._schema.fields)
+
+    def __len__(self) -> int:
+        """Get the number of fields."""
+        return len(self._schema.fields)
+
+    def __eq__(self, other: object) -> bool:
+        """Compare with another record or with a dict in the API structure."""
+        if isinstance(other, Record):
+            return self.to_dict() == other.to_dict()
+        if isinstance(other, Mapping):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        """Show the record type and its first field."""
+        first = f"{self._schema.fields[0]}={self[self._schema.fields[0]]!r}" if self._schema.fields else ""
+        return f"{type(self).__name__}({first})"
+
+    def __reduce__(self) -> tuple:
+        """Pickle the record as its dict."""
+        return type(self), (self.to_dict(),)
+
+    def to_dict(self) -> dict:
+        """Convert the record back to the API structure.
+
+        Returns:
+            dict: The record.
+        """
+        return {field: _plain(value) for field, value in zip(self._schema.fields, self._values)}
+
+
+class Periode(Record):
+    """A period of a unité légale or an établissement (`periodesUniteLegale` or `periodesEtablissement`)."""
+
+    __slots__ = ()
+
+
+class Adresse(Record):
+    """The address of an établissement (`adresseEtablissement` or `adresse2Etablissement`)."""
+
+    __slots__ = ()
+
+
+class UniteLegale(Record):
+    """A unité légale (SIREN record)."""
+
+    __slots__ = ()
+
+    _sections = {"periodesUniteLegale": Periode}
+
+    @property
+    def periodes(self) -> tuple[Periode, ...]:
+        """The periods, the current one first."""
+        return self.get("periodesUniteLegale") or ()
+
+
+class Etablissement(Record):
+    """An établissement (SIRET record)."""
+
+    __slots__ = ()
+
+    _sections = {
+        "periodesEtablissement": Periode,
+        "adresseEtablissement": Adresse,
+        "adresse2Etablissement": Adresse,
+        "uniteLegale": UniteLegale,
+    }
+
+    @property
+    def periodes(self) -> tuple[Periode, ...]:
+        """The periods, the current one first."""
+        return self.get("periodesEtablissement") or ()
+
+
+# Record type of each data type
+RECORD_TYPES = {"siren": UniteLegale, "siret": Etablissement}
+
+
+def to_records(data_type: str, records: list[dict]) -> list[Record]:
+    """Convert API records to compact records.
+
+    Args:
+        data_type (str): The type of data, either "siren" or "siret".
+        records (list[dict]): The records.
+
+    Returns:
+        list[Record]: The `UniteLegale` or `Etablissement` records.
+    """
+    record_type = RECORD_TYPES[data_type]
+    return [record_type(record) for record in records]
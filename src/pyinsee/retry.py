@@ -0,0 +1,142 @@
+"""Retry policy for the INSEE API client.
+
+Failures are sorted into four error classes, each with its own attempt budget:
+
+    timeout     the API did not answer in time
+    connection  the connection failed or was reset
+    throttle    429 Too Many Requests (the delay comes from `Retry-After`)
+    server      5xx server errors
+
+Other failures (4xx client errors, invalid requests) are never retried.
+Retries wait an exponentially growing, jittered delay, and stop once the
+total deadline would be exceeded.
+
+Example:
+    from pyinsee.retry import RetryPolicy
+    from pyinsee.transport import Transport
+
+    policy = RetryPolicy(max_attempts={"server": 8, "timeout": 3}, deadline=60)
+    client = InseeClient(transport=Transport(retry_policy=policy))
+"""
+from __future__ import annotations
+
+import random
+import sys
+
+import requests
+
+from . import config
+
+# The error classes that can be retried
+RETRY_CLASSES = ("timeout", "connection", "throttle", "server")
+
+
+class RetryPolicy:
+    """Exponential backoff with jitter, per error class attempt budgets and a total deadline.
+
+    Args:
+        max_attempts (int | dict[str, int], optional): The maximum number of
+            attempts per error class, either one value for every class or a
+            mapping from error class to attempts (missing classes use
+            INSEE_RETRY_MAX_ATTEMPTS). 1 disables retries.
+        backoff_base (float, optional): The delay before the first retry, in
+            seconds. Defaults to INSEE_RETRY_BACKOFF.
+        backoff_max (float, optional): The longest delay between two attempts.
+            Defaults to 30 seconds.
+        jitter (bool, optional): Draw each delay uniformly between 0 and the
+            exponential delay ("full jitter"). Defaults to True.
+        deadline (float, optional): The total time, in seconds, after which no
+            more retries are attempted. Defaults to INSEE_RETRY_DEADLINE.
+        retry_statuses (tuple[int, ...], optional): The 5xx status codes to retry.
+    """
+
+    def __init__(self,
+                 max_attempts: int | dict[str, int] | None = None,
+                 backoff_base: float | None = None,
+                 backoff_max: float = 30.0,
+                 jitter: bool = True,
+                 deadline: float | None = None,
+                 retry_statuses: tuple[int, ...] = (500, 502, 503, 504)) -> None:
+        """Initialize the retry policy."""
+        default_attempts = config.INSEE_RETRY_MAX_ATTEMPTS
+        if max_attempts is None:
+            max_attempts = default_attempts
+        if isinstance(max_attempts, int):
+            max_attempts = dict.fromkeys(RETRY_CLASSES, max_attempts)
+        unknown = set(max_attempts) - set(RETRY_CLASSES)
+        if unknown:
+            msg = f"Unknown error classes: {sorted(unknown)}. Must be in {RETRY_CLASSES}."
+            raise ValueError(msg)
+        if any(attempts < 1 for attempts in max_attempts.values()):
+            msg = "max_attempts must be at least 1."
+            raise ValueError(msg)
+
+        self.max_attempts = {**dict.fromkeys(RETRY_CLASSES, default_attempts), **max_attempts}
+        self.backoff_base = backoff_base if backoff_base is not None else config.INSEE_RETRY_BACKOFF
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.deadline = deadline if deadline is not None else config.INSEE_RETRY_DEADLINE
+        self.retry_statuses = tuple(retry_statuses)
+
+    def classify_status(self, status_code: int) -> str | None:
+        """Get the error class of a response status, or None if it is not retried."""
+        if status_code == 429:  # noqa: PLR2004
+            return "throttle"
+        if status_code in self.retry_statuses:
+            return "server"
+        return None
+
+    @staticmethod
+    def classify_exception(error: BaseException) -> str | None:
+        """Get the error class of a request exception, or None if it is not retried."""
+        # asyncio (only imported by the async client) has its own TimeoutError before Python 3.11
+        asyncio = sys.modules.get("asyncio")
+        if isinstance(error, (requests.exceptions.Timeout, TimeoutError)) or (
+                asyncio is not None and isinstance(error, asyncio.TimeoutError)):
+            return "timeout"
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return "connection"
+        try:
+            import aiohttp
+        except ImportError:  # pragma: no cover - optional dependency
+            return None
+        if isinstance(error, aiohttp.ServerTimeoutError):
+            return "timeout"
+        if isinstance(error, aiohttp.ClientConnectionError):
+            return "connection"
+        return None
+
+    def backoff(self, attempt: int) -> float:
+        """Get the delay before the retry following attempt number `attempt` (from 1)."""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)  # noqa: S311
+        return delay
+
+    def next_delay(self,
+                   error_class: str | None,
+                   class_attempts: int,
+                   attempt: int,
+                   elapsed: float,
+                   retry_after: float | None = None) -> float | None:
+        """Decide whether a failed attempt is retried, and after which delay.
+
+        Args:
+            error_class (str | None): The error class of the failure.
+            class_attempts (int): The attempts that failed with this error class so far.
+            attempt (int): The attempts made so far, all error classes included.
+            elapsed (float): The time spent since the first attempt, in seconds.
+            retry_after (float | None, optional): The `Retry-After` delay, if any.
+
+        Returns:
+            float | None: The delay before the next attempt, or None to give up.
+        """
+        if error_class is None or class_attempts >= self.max_attempts[error_class]:
+            return None
+        if error_class == "throttle" and retry_after is not None:
+            delay = retry_after
+        else:
+            delay = self.backoff(attempt)
+        if elapsed + delay > self.deadline:
+            return None
+        return delay
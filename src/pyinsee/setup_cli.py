@@ -1,6 +1,7 @@
 import argparse
-from pathlib import Path
 import site
+from pathlib import Path
+
 
 def create_default_env_file(env_file_path: Path) -> None:
     """Creates a default.env file with the path to the .env file if it doesn't exist.
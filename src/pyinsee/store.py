@@ -0,0 +1,448 @@
+"""Local log-structured store of SIREN and SIRET records.
+
+`RecordStore` keeps the records already downloaded under `DATA_DIR/store`,
+one directory per data type:
+
+    store/siren/00001.ndjson   append-only segment files, one record per line
+    store/siren/index          sorted SIREN -> (segment, offset, length) index
+    store/siren/journal        index entries appended since the last compaction
+
+The index is memory-mapped and searched by bisection, so opening a store
+costs nothing but a `mmap` and a lookup is O(log n) plus one read. New
+records are appended to the last segment and their index entries to the
+journal, which is loaded in memory and merged into the sorted index once it
+grows past `journal_max_entries` (or when `compact` is called). A record
+stored again shadows the previous copy, which stays in its segment.
+
+`search` evaluates a `q` query against every stored record, so stored
+records can be searched offline.
+
+Writes are serialized between processes with a lock file. Other processes
+see new records once they miss a lookup (the store is then reloaded).
+
+Example:
+    from pyinsee.store import RecordStore
+
+    store = RecordStore()
+    store.import_files("siren")  # the saved raw segments and pages
+    client = InseeClient(store=store)
+    unite_legale, header = client.get_by_number(data_type="siren", id_code="552100554")
+"""
+from __future__ import annotations
+
+import bisect
+import mmap
+import os
+import struct
+import threading
+from array import array
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from . import config
+from .decoding import dumps, loads
+from .logger import logger
+from .processing import iter_raw_files, iter_raw_records
+from .query import parse_query
+from .utils import file_lock, fsync_dir
+
+# Header returned with the records served from the store
+STORE_HEADER = {"statut": 200, "message": "OK"}
+
+# Index file: magic, entry count, the sorted keys (uint64), then one value per key
+_MAGIC = b"PYINSEE1"
+_HEADER = struct.Struct("=8sQ")
+_VALUE = struct.Struct("=IQI")           # segment number, offset, length
+_JOURNAL_ENTRY = struct.Struct("=QIQI")  # key, segment number, offset, length
+
+
+class _StoreTable:
+    """The segments, index and journal of one data type."""
+
+    def __init__(self, directory: Path, data_type: str, segment_max_bytes: int, journal_max_entries: int) -> None:
+        self.directory = directory
+        self.data_type = data_type
+        self.segment_max_bytes = segment_max_bytes
+        self.journal_max_entries = journal_max_entries
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._fds: dict[int, int] = {}
+        self._mmap = None
+        self._keys = None
+        self._journal: dict[int, tuple[int, int, int]] = {}
+        self._journal_size = 0
+        self._index_stat = None
+        self._load()
+
+    @property
+    def index_path(self) -> Path:
+        return self.directory / "index"
+
+    @property
+    def journal_path(self) -> Path:
+        return self.directory / "journal"
+
+    def segment_path(self, segment: int) -> Path:
+        return self.directory / f"{segment:05d}.ndjson"
+
+    def _load(self) -> None:
+        """Map the index and read the journal."""
+        if self._mmap is not None:
+            self._keys.release()
+            self._mmap.close()
+        self._mmap = self._keys = None
+        self._index_stat = None
+        try:
+            with self.index_path.open("rb") as f:
+                stat = os.fstat(f.fileno())
+                if stat.st_size > _HEADER.size:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._index_stat = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            pass
+        if self._mmap is not None:
+            magic, count = _HEADER.unpack_from(self._mmap, 0)
+            if magic != _MAGIC:
+                msg = f"{self.index_path} is not a store index."
+                raise ValueError(msg)
+            self._keys = memoryview(self._mmap)[_HEADER.size:_HEADER.size + 8 * count].cast("Q")
+
+        self._journal = {}
+        try:
+            data = self.journal_path.read_bytes()
+        except FileNotFoundError:
+            data = b""
+        # An entry cut short by a crash is ignored
+        usable = len(data) - len(data) % _JOURNAL_ENTRY.size
+        for key, segment, offset, length in _JOURNAL_ENTRY.iter_unpack(data[:usable]):
+            self._journal[key] = (segment, offset, length)
+        self._journal_size = len(data)
+
+    def _changed(self) -> bool:
+        """Tell whether another process wrote to the store since it was loaded."""
+        try:
+            stat = self.index_path.stat()
+            index_stat = (stat.st_ino, stat.st_mtime_ns)
+        except FileNotFoundError:
+            index_stat = None
+        try:
+            journal_size = self.journal_path.stat().st_size
+        except FileNotFoundError:
+            journal_size = 0
+        return index_stat != self._index_stat or journal_size != self._journal_size
+
+    def __len__(self) -> int:
+        indexed = len(self._keys) if self._keys is not None else 0
+        return indexed + sum(1 for key in self._journal if self._find(key) is None)
+
+    def _find(self, key: int) -> tuple[int, int, int] | None:
+        """Look a key up in the sorted index."""
+        if self._keys is None:
+            return None
+        position = bisect.bisect_left(self._keys, key)
+        if position == len(self._keys) or self._keys[position] != key:
+            return None
+        start = _HEADER.size + 8 * len(self._keys) + _VALUE.size * position
+        return _VALUE.unpack_from(self._mmap, start)
+
+    def locate(self, key: int) -> tuple[int, int, int] | None:
+        with self._lock:
+            location = self._journal.get(key) or self._find(key)
+            if location is None and self._changed():
+                self._load()
+                location = self._journal.get(key) or self._find(key)
+            return location
+
+    def read(self, location: tuple[int, int, int]) -> bytes:
+        segment, offset, length = location
+        with self._lock:
+            fd = self._fds.get(segment)
+            if fd is None:
+                fd = self._fds[segment] = os.open(self.segment_path(segment), os.O_RDONLY | getattr(os, "O_BINARY", 0))
+            if hasattr(os, "pread"):
+                return os.pread(fd, length, offset)
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, length)
+
+    def locations(self) -> list[tuple[int, int, int]]:
+        """Get the location of every stored record, in segment order."""
+        with self._lock:
+            if self._changed():
+                self._load()
+            locations = list(self._journal.values())
+            if self._keys is not None:
+                start = _HEADER.size + 8 * len(self._keys)
+                values = _VALUE.iter_unpack(self._mmap[start:start + _VALUE.size * len(self._keys)])
+                locations.extend(value for key, value in zip(self._keys, values) if key not in self._journal)
+        locations.sort()
+        return locations
+
+    def append(self, items: list[tuple[int, bytes]]) -> None:
+        """Append records to the last segment, then their entries to the journal."""
+        with self._lock, file_lock(self.directory / ".lock"):
+            if self._changed():
+                self._load()
+            segments = sorted(int(path.name.split(".")[0]) for path in self.directory.glob("*.ndjson"))
+            segment = segments[-1] if segments else 1
+            entries = []
+            position = 0
+            while position < len(items):
+                with self.segment_path(segment).open("ab") as f:
+                    offset = f.seek(0, os.SEEK_END)
+                    if offset >= self.segment_max_bytes > 0:
+                        segment += 1
+                        continue
+                    chunk = []
+                    while position < len(items) and (offset < self.segment_max_bytes or not self.segment_max_bytes):
+                        key, line = items[position]
+                        chunk.append(line + b"\n")
+                        entries.append((key, segment, offset, len(line)))
+                        offset += len(line) + 1
+                        position += 1
+                    f.write(b"".join(chunk))
+                    f.flush()
+                    os.fsync(f.fileno())
+            fsync_dir(self.directory)
+
+            # The records are durable: index them (after an entry cut short by a crash)
+            if self._journal_size % _JOURNAL_ENTRY.size:
+                os.truncate(self.journal_path, self._journal_size - self._journal_size % _JOURNAL_ENTRY.size)
+            with self.journal_path.open("ab") as f:
+                f.write(b"".join(_JOURNAL_ENTRY.pack(*entry) for entry in entries))
+                f.flush()
+                os.fsync(f.fileno())
+                self._journal_size = f.tell()
+            for key, segment, offset, length in entries:
+                self._journal[key] = (segment, offset, length)
+            if len(self._journal) >= self.journal_max_entries > 0:
+                self._compact()
+
+    def compact(self) -> None:
+        with self._lock, file_lock(self.directory / ".lock"):
+            if self._changed():
+                self._load()
+            self._compact()
+
+    def _compact(self) -> None:
+        """Merge the journal into the sorted index (the lock is held)."""
+        if not self._journal:
+            return
+        count = len(self._keys) if self._keys is not None else 0
+        old_keys = array("Q", self._keys) if count else array("Q")
+        old_values = self._mmap[_HEADER.size + 8 * count:_HEADER.size + (8 + _VALUE.size) * count] if count else b""
+
+        keys = array("Q")
+        values = []
+        previous = 0
+        for key in sorted(self._journal):
+            position = bisect.bisect_left(old_keys, key, previous)
+            keys.extend(old_keys[previous:position])
+            values.append(old_values[_VALUE.size * previous:_VALUE.size * position])
+            keys.append(key)
+            values.append(_VALUE.pack(*self._journal[key]))
+            previous = position + 1 if position < count and old_keys[position] == key else position
+        keys.extend(old_keys[previous:])
+        values.append(old_values[_VALUE.size * previous:])
+
+        tmp_path = self.index_path.with_name(".index.tmp")
+        with tmp_path.open("wb") as f:
+            f.write(_HEADER.pack(_MAGIC, len(keys)))
+            keys.tofile(f)
+            f.write(b"".join(values))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.index_path)
+        fsync_dir(self.directory)
+        self.journal_path.unlink(missing_ok=True)
+        logger.info("Compacted the %s store index: %d record(s).", self.data_type.upper(), len(keys))
+        self._load()
+
+    def close(self) -> None:
+        with self._lock:
+            for fd in self._fds.values():
+                os.close(fd)
+            self._fds = {}
+            if self._mmap is not None:
+                self._keys.release()
+                self._mmap.close()
+                self._mmap = self._keys = None
+
+
+class RecordStore:
+    """Local store of SIREN and SIRET records with a memory-mapped index.
+
+    Args:
+        directory (str | Path | None, optional): The store directory.
+        Defaults to `DATA_DIR/store`.
+        segment_max_bytes (int, optional): Start a new segment file once the
+        last one holds this many bytes (0 for no cap). Defaults to
+        INSEE_STORE_SEGMENT_MAX_BYTES.
+        journal_max_entries (int, optional): Merge the journal into the index
+        once it holds this many entries (0 to only merge on `compact`).
+        Defaults to INSEE_STORE_JOURNAL_MAX_ENTRIES.
+
+    Attributes:
+        directory (Path): The store directory.
+    """
+
+    def __init__(self,
+                 directory: str | Path | None = None,
+                 segment_max_bytes: int | None = None,
+                 journal_max_entries: int | None = None) -> None:
+        """Initialize the store; each data type is opened on first use."""
+        self.directory = Path(directory) if directory else Path(config.DATA_DIR) / "store"
+        self.segment_max_bytes = (segment_max_bytes if segment_max_bytes is not None
+                                  else config.INSEE_STORE_SEGMENT_MAX_BYTES)
+        self.journal_max_entries = (journal_max_entries if journal_max_entries is not None
+                                    else config.INSEE_STORE_JOURNAL_MAX_ENTRIES)
+        self._tables: dict[str, _StoreTable] = {}
+        self._lock = threading.Lock()
+
+    def _table(self, data_type: str) -> _StoreTable:
+        """Get (and open) the table of a data type."""
+        if data_type not in ("siren", "siret"):
+            msg = f"Invalid data type: {data_type}. Must be 'siren' or 'siret'."
+            raise ValueError(msg)
+        with self._lock:
+            table = self._tables.get(data_type)
+            if table is None:
+                table = self._tables[data_type] = _StoreTable(self.directory / data_type, data_type,
+                                                              self.segment_max_bytes, self.journal_max_entries)
+            return table
+
+    def get(self, data_type: str, id_code: str | int) -> dict | None:
+        """Get a stored record.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            id_code (str | int): The siren or siret number.
+
+        Returns:
+            dict | None: The record, or None if it is not stored.
+        """
+        try:
+            key = int(id_code)
+        except ValueError:
+            return None
+        table = self._table(data_type)
+        location = table.locate(key)
+        return None if location is None else loads(table.read(location))
+
+    def __contains__(self, item: tuple[str, str | int]) -> bool:
+        """Tell whether a `(data_type, id_code)` record is stored."""
+        data_type, id_code = item
+        try:
+            return self._table(data_type).locate(int(id_code)) is not None
+        except ValueError:
+            return False
+
+    def count(self, data_type: str) -> int:
+        """Get the number of records stored for a data type."""
+        return len(self._table(data_type))
+
+    def search(self, data_type: str, q: str) -> Iterator[dict]:
+        """Find the stored records matching a `q` query, with no network calls.
+
+        Every stored record is read and evaluated, in storage order.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            q (str): The query, in the syntax of the API (see `pyinsee.query`).
+
+        Raises:
+            ValueError: If the query is malformed.
+
+        Returns:
+            Iterator[dict]: The records matching the query.
+        """
+        return parse_query(q).filter(self.records(data_type))
+
+    def records(self, data_type: str) -> Iterator[dict]:
+        """Read every stored record, in storage order.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+
+        Yields:
+            dict: A record.
+        """
+        table = self._table(data_type)
+        for location in table.locations():
+            yield loads(table.read(location))
+
+    def put(self, data_type: str, record: dict) -> None:
+        """Store a record, replacing a previous copy.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            record (dict): The `uniteLegale` or `etablissement` record.
+        """
+        self.put_many(data_type, (record,))
+
+    def put_many(self, data_type: str, records: Iterable[dict], batch_size: int = 10000) -> int:
+        """Store records, replacing previous copies.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            records (Iterable[dict]): The `uniteLegale` or `etablissement` records.
+            batch_size (int, optional): The number of records written (and synced)
+            at once. Defaults to 10000.
+
+        Raises:
+            ValueError: If a record has no `data_type` number.
+
+        Returns:
+            int: The number of records stored.
+        """
+        table = self._table(data_type)
+        batch = []
+        stored = 0
+        for record in records:
+            try:
+                key = int(record[data_type])
+            except (KeyError, TypeError, ValueError) as err:
+                msg = f"Cannot store a record without a valid {data_type} number."
+                raise ValueError(msg) from err
+            batch.append((key, dumps(record)))
+            if len(batch) >= batch_size:
+                table.append(batch)
+                stored += len(batch)
+                batch = []
+        if batch:
+            table.append(batch)
+            stored += len(batch)
+        return stored
+
+    def import_files(self, data_type: str, paths: list[str | Path] | None = None) -> int:
+        """Store the records of raw files (NDJSON segments and JSON response bodies).
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+            paths (list[str | Path] | None, optional): The raw files. Defaults to
+            every raw file saved for the data type.
+
+        Returns:
+            int: The number of records stored.
+        """
+        stored = 0
+        for path in paths if paths is not None else iter_raw_files(data_type):
+            stored += self.put_many(data_type, iter_raw_records(path, data_type))
+            logger.info("Imported %s into the %s store.", path, data_type.upper())
+        self.compact(data_type)
+        return stored
+
+    def compact(self, data_type: str | None = None) -> None:
+        """Merge the journal into the sorted index.
+
+        Args:
+            data_type (str | None, optional): The type of data. Defaults to both.
+        """
+        for name in [data_type] if data_type else ["siren", "siret"]:
+            self._table(name).compact()
+
+    def close(self) -> None:
+        """Close the segment files and unmap the indexes."""
+        with self._lock:
+            for table in self._tables.values():
+                table.close()
+            self._tables = {}
@@ -0,0 +1,264 @@
+"""Incremental (delta) sync of SIREN and SIRET records.
+
+INSEE stamps every record with the time it was last processed
+(`dateDernierTraitementUniteLegale`, `dateDernierTraitementEtablissement`).
+`DeltaSync` remembers, per data type, the latest stamp it has seen (the
+watermark) and only asks the API for the records processed since, following
+the cursor:
+
+    q=dateDernierTraitementUniteLegale:[<watermark> TO *]
+
+The changed records are upserted into the local `RecordStore` and, with
+`save=True`, also written as NDJSON segments under the raw data directory
+(`<type>_delta_<run>-00001.ndjson.gz`, ...), which `insee_process` and
+`RecordStore.import_files` pick up like any other export.
+
+Runs are idempotent: the watermark is only moved once the run's records are
+durable, upserting a record again changes nothing, and an interrupted run is
+continued from its checkpoint journal by the next one. The watermark is the
+latest stamp of the records received (not the local clock), and the bound is
+inclusive, so records processed in the same second as the watermark are not
+missed.
+
+Each run returns a change report, also appended to
+`DATA_DIR/metadata/sync/<type>.reports.jsonl`:
+
+    {"data_type": "siren", "since": "2024-05-01T00:00:00", "watermark": "2024-05-02T03:12:44",
+     "records": 1843, "new": 112, "updated": 1690, "unchanged": 41,
+     "changed_fields": {"etatAdministratifUniteLegale": 210, ...}, "elapsed": 12.4, ...}
+
+Example:
+    from pyinsee.sync import DeltaSync
+
+    sync = DeltaSync(InseeClient())
+    sync.run("siren", since="2024-05-01")  # the first run needs a starting point
+    sync.run("siren")                      # then, e.g. every night
+"""
+from __future__ import annotations
+
+import datetime as dt
+import json
+import os
+import time
+from collections import Counter
+from pathlib import Path
+
+from . import config
+from .checkpoint import CheckpointJournal
+from .insee_client import MAX_PAGE_SIZE, InseeClient
+from .logger import logger
+from .processing import flatten_record
+from .store import RecordStore
+from .utils import file_lock, fsync_dir, get_save_dir
+from .writer import SegmentWriter
+
+# Field holding the time each record was last processed by INSEE
+WATERMARK_FIELDS = {
+    "siren": "dateDernierTraitementUniteLegale",
+    "siret": "dateDernierTraitementEtablissement",
+}
+
+
+class DeltaSync:
+    """Fetch the records changed since the last sync and upsert them locally.
+
+    Args:
+        client (InseeClient): The client used to query the API (json content type).
+        store (RecordStore | None, optional): The store the records are upserted
+        into. Defaults to the client's store, or the store under `DATA_DIR/store`.
+        save (bool, optional): Also write the records as NDJSON segments under
+        the raw data directory. Defaults to False.
+        compression (str, optional): The compression of the saved segments.
+        Defaults to INSEE_SAVE_COMPRESSION.
+        directory (str | Path | None, optional): The directory of the watermarks,
+        reports and checkpoints. Defaults to `DATA_DIR/metadata/sync`.
+
+    Raises:
+        ValueError: If the client does not query the API in json.
+
+    Attributes:
+        client (InseeClient): The client used to query the API.
+        store (RecordStore): The store the records are upserted into.
+        directory (Path): The directory of the watermarks and reports.
+    """
+
+    def __init__(self,
+                 client: InseeClient,
+                 store: RecordStore | None = None,
+                 save: bool = False,
+                 compression: str | None = None,
+                 directory: str | Path | None = None) -> None:
+        """Initialize the sync and create its directory if needed."""
+        if client.content_type != "json" or client.backend != "api":
+            msg = "Syncing requires a client querying the API in json."
+            raise ValueError(msg)
+        self.client = client
+        self.store = store or client.store or RecordStore()
+        self.save = save
+        self.compression = compression or config.INSEE_SAVE_COMPRESSION
+        self.directory = Path(directory) if directory else Path(config.DATA_DIR) / "metadata" / "sync"
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _state_path(self, data_type: str) -> Path:
+        """Get the state file of a data type."""
+        if data_type not in WATERMARK_FIELDS:
+            msg = f"Invalid data type: {data_type}. Must be 'siren' or 'siret'."
+            raise ValueError(msg)
+        return self.directory / f"{data_type}.json"
+
+    def watermark(self, data_type: str) -> str | None:
+        """Get the watermark of a data type.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+
+        Returns:
+            str | None: The latest processing time synced, or None before the first sync.
+        """
+        try:
+            return json.loads(self._state_path(data_type).read_text(encoding="utf-8")).get("watermark")
+        except FileNotFoundError:
+            return None
+
+    def _set_watermark(self, data_type: str, watermark: str) -> None:
+        """Save the watermark of a data type, atomically."""
+        path = self._state_path(data_type)
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with tmp_path.open("w", encoding="utf-8") as f:
+            json.dump({"watermark": watermark, "time": dt.datetime.now().isoformat(timespec="seconds")}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        fsync_dir(self.directory)
+
+    def reports(self, data_type: str) -> list[dict]:
+        """Get the change reports of the previous runs, oldest first.
+
+        Args:
+            data_type (str): The type of data, either "siren" or "siret".
+
+        Returns:
+            list[dict]: The reports.
+        """
+        self._state_path(data_type)
+        try:
+            lines = (self.directory / f"{data_type}.reports.jsonl").read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return []
+        return [json.loads(line) for line in lines if line.strip()]
+
+    def _add_report(self, data_type: str, report: dict) -> None:
+        """Append a change report and sync it to disk."""
+        with (self.directory / f"{data_type}.reports.jsonl").open("a", encoding="utf-8") as f:
+            f.write(json.dumps(report) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def run(self, data_type: str = "siren", since: str | None = None) -> dict:
+        """Fetch the records processed since the watermark and upsert them.
+
+        Args:
+            data_type (str, optional): The type of data, either "siren" or "siret".
+            Defaults to "siren".
+            since (str | None, optional): Start from this date or time
+            (`YYYY-MM-DD` or `YYYY-MM-DDTHH:MM:SS`) instead of the watermark.
+            Required for the first sync.
+
+        Raises:
+            ValueError: If there is no watermark and `since` is not given, or if
+            a page fails.
+            InseeRequestError: If a request still fails once the retries run out.
+
+        Returns:
+            dict: The change report.
+        """
+        field = WATERMARK_FIELDS.get(data_type)
+        state_path = self._state_path(data_type)
+        with file_lock(state_path.with_name(f".{data_type}.lock")):
+            start = since or self.watermark(data_type)
+            if not start:
+                msg = f"No {data_type.upper()} watermark yet: pass `since` for the first sync."
+                raise ValueError(msg)
+            query = {"q": f"{field}:[{start} TO *]", "nombre": MAX_PAGE_SIZE}
+            started = time.monotonic()
+            run_time = dt.datetime.now()
+            logger.info("Syncing the %s records processed since %s.", data_type.upper(), start)
+
+            # Saved pages are only durable once their segment is complete
+            journal = CheckpointJournal(directory=self.directory / "checkpoints", buffered=self.save)
+            fingerprint = journal.fingerprint(data_type, query)
+            last = journal.last(fingerprint)
+            resumed = last is not None
+            writer = None
+            if self.save:
+                # A resumed run appends to the segments of the interrupted one
+                resumed_prefix = last.get("prefix") if resumed else None
+                writer = SegmentWriter(directory=get_save_dir(response_data_type=data_type),
+                                       prefix=resumed_prefix or f"{data_type}_delta_{run_time:%Y%m%dT%H%M%S%f}",
+                                       compression=self.compression,
+                                       resume=resumed_prefix is not None)
+                journal.context["prefix"] = writer.prefix
+
+            watermark = start
+            counts = Counter()
+            changed_fields = Counter()
+            try:
+                for records, _ in self.client.iter_bulk(data_type=data_type, by_page=True, resume=True,
+                                                        checkpoint=journal, **query):
+                    for record in records:
+                        watermark = max(watermark, record.get(field) or "")
+                        change = self._classify(data_type, record)
+                        counts[change[0]] += 1
+                        changed_fields.update(change[1])
+                    self.store.put_many(data_type, records)
+                    if writer is not None:
+                        segments = len(writer.segments)
+                        writer.write_many(records)
+                        if len(writer.segments) > segments:
+                            journal.mark_durable()
+            except BaseException:
+                if writer is not None:
+                    writer.abort()
+                raise
+            if writer is not None:
+                writer.close()
+                journal.commit()
+
+            # Everything is durable: move the watermark, then start the next run afresh
+            self._set_watermark(data_type, watermark)
+            journal.clear(fingerprint)
+
+        report = {
+            "data_type": data_type,
+            "time": run_time.isoformat(timespec="seconds"),
+            "since": start,
+            "watermark": watermark,
+            "resumed": resumed,
+            "records": sum(counts.values()),
+            "new": counts["new"],
+            "updated": counts["updated"],
+            "unchanged": counts["unchanged"],
+            "changed_fields": dict(changed_fields.most_common()),
+            "segments": [segment["name"] for segment in writer.segments] if writer is not None else [],
+            "elapsed": round(time.monotonic() - started, 3),
+        }
+        self._add_report(data_type, report)
+        logger.info("Synced %d %s record(s) (%d new, %d updated, %d unchanged), watermark %s.",
+                    report["records"], data_type.upper(), report["new"], report["updated"],
+                    report["unchanged"], watermark)
+        return report
+
+    def _classify(self, data_type: str, record: dict) -> tuple[str, list[str]]:
+        """Compare a record with its stored copy.
+
+        Returns:
+            tuple[str, list[str]]: "new", "updated" or "unchanged", and the
+            fields whose current value changed.
+        """
+        stored = self.store.get(data_type, record.get(data_type, ""))
+        if stored is None:
+            return "new", []
+        if stored == record:
+            return "unchanged", []
+        old, new = flatten_record(data_type, stored), flatten_record(data_type, record)
+        return "updated", [name for name in dict.fromkeys([*old, *new]) if old.get(name) != new.get(name)]
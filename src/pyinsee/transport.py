@@ -0,0 +1,402 @@
+"""HTTP transport for the INSEE API client.
+
+The transport wraps a pooled, keep-alive `requests.Session` so that
+consecutive calls to api.insee.fr reuse the same TCP/TLS connection
+instead of paying a new handshake for every request.
+
+Example:
+    from pyinsee.transport import Transport
+    from pyinsee.insee_client import InseeClient
+
+    transport = Transport(pool_maxsize=20, timeout=(5, 60))
+    client = InseeClient(transport=transport)
+    ...
+    print(transport.stats())
+
+Every request first takes a token from the transport's `RateLimiter`.
+Timeouts, connection errors, 429 and 5xx responses are retried according to
+the transport's `RetryPolicy` (on 429 the limiter is paused for the
+`Retry-After` delay), and a typed `InseeRequestError` is raised once the
+retries run out. Each attempt, retry and rate limiter wait is reported to the
+transport's `Metrics` (see `pyinsee.metrics`). The async client makes the same
+decisions through `RequestAttempts`.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Mapping
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import config
+from .exceptions import ERRORS_BY_CLASS
+from .logger import logger
+from .metrics import Metrics, endpoint_label, get_default_metrics
+from .ratelimit import RateLimiter, get_default_rate_limiter, parse_retry_after
+from .retry import RetryPolicy
+
+if TYPE_CHECKING:
+    from urllib3 import PoolManager
+
+
+class Transport:
+    """Pooled HTTP transport shared by one or several clients.
+
+    Args:
+        pool_connections (int, optional): Number of per-host connection pools to cache.
+            Defaults to HTTP_POOL_CONNECTIONS.
+        pool_maxsize (int, optional): Maximum number of connections kept alive per host.
+            Defaults to HTTP_POOL_MAXSIZE.
+        pool_block (bool, optional): Block when the pool is exhausted instead of
+            opening extra, non-pooled connections. Defaults to False.
+        timeout (float | tuple, optional): Default `(connect, read)` timeout in seconds.
+            Defaults to `(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)`.
+        session (requests.Session | None, optional): An existing session to use.
+            The transport still mounts its pooled adapters on it.
+        rate_limiter (RateLimiter | None, optional): The client-side rate limiter.
+            Defaults to the process-wide shared limiter.
+        retry_policy (RetryPolicy | None, optional): The retry policy for
+            timeouts, connection errors, 429 and 5xx. Defaults to `RetryPolicy()`.
+        metrics (Metrics | None, optional): The metrics the requests are reported
+            to. Defaults to the process-wide metrics.
+
+    Attributes:
+        session (requests.Session): The underlying keep-alive session.
+        timeout (float | tuple): The default timeout for every request.
+        rate_limiter (RateLimiter): The client-side rate limiter.
+        retry_policy (RetryPolicy): The retry policy.
+        metrics (Metrics): The request metrics and hooks.
+    """
+
+    def __init__(self,
+                 pool_connections: int | None = None,
+                 pool_maxsize: int | None = None,
+                 pool_block: bool = False,
+                 timeout: float | tuple | None = None,
+                 session: requests.Session | None = None,
+                 rate_limiter: RateLimiter | None = None,
+                 retry_policy: RetryPolicy | None = None,
+                 metrics: Metrics | None = None) -> None:
+        """Initialize the transport and mount the pooled adapters."""
+        pool_connections = pool_connections if pool_connections is not None else config.HTTP_POOL_CONNECTIONS
+        pool_maxsize = pool_maxsize if pool_maxsize is not None else config.HTTP_POOL_MAXSIZE
+        if timeout is None:
+            timeout = (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT)
+        if pool_connections < 1 or pool_maxsize < 1:
+            msg = "pool_connections and pool_maxsize must be positive integers."
+            raise ValueError(msg)
+
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_default_rate_limiter()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.metrics = metrics if metrics is not None else get_default_metrics()
+        self.session = session if session is not None else requests.Session()
+        self._adapter = _CountingAdapter(pool_connections=pool_connections,
+                                         pool_maxsize=pool_maxsize,
+                                         pool_block=pool_block)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self._lock = threading.Lock()
+        self._requests = 0
+
+    def request(self,
+                method: str,
+                url: str,
+                rate_limited: bool = True,
+                **kwargs: dict) -> requests.Response:
+        """Send a request through the pooled session.
+
+        Args:
+            method (str): The HTTP method ("GET", "POST", ...).
+            url (str): The URL for the request.
+            rate_limited (bool, optional): Count the request against the rate
+            limit (the token endpoint is not). Defaults to True.
+            **kwargs (dict): Extra arguments forwarded to `requests.Session.request`.
+
+        Returns:
+            requests.Response: The response from the server.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = RequestAttempts(self, method, url, rate_limited=rate_limited)
+
+        while True:
+            attempts.start(waited=self.rate_limiter.acquire() if rate_limited else 0.0)
+            response = error = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.exceptions.RequestException as err:
+                error = err
+            finally:
+                with self._lock:
+                    self._requests += 1
+                attempts.end(status=response.status_code if response is not None else None,
+                             size=_body_size(response, streamed=kwargs.get("stream", False)))
+
+            delay = attempts.next_delay(status=response.status_code if response is not None else None,
+                                        headers=response.headers if response is not None else None,
+                                        error=error,
+                                        response=response)
+            if delay is None:
+                break
+            if response is not None:
+                # Release the connection of a streamed response before retrying
+                response.close()
+            if attempts.pause_limiter:
+                # The next acquire() waits for the pause, for every thread
+                self.rate_limiter.pause(delay)
+            else:
+                time.sleep(delay)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            stats = self.stats()
+            logger.debug("Connection pool: %d requests over %d connections (%d reused)",
+                         stats["pool_requests"], stats["connections"], stats["reused"])
+        return response
+
+    def get(self, url: str, **kwargs: dict) -> requests.Response:
+        """Send a GET request through the pooled session."""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs: dict) -> requests.Response:
+        """Send a POST request through the pooled session."""
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        """Get connection reuse statistics.
+
+        Returns:
+            dict: `requests` sent through the transport, `pool_requests` sent
+            over the pooled connections (every attempt, token requests included),
+            `connections` opened, and `reused` (requests that did not need a new
+            connection).
+        """
+        pool_requests, connections = self._adapter.counts()
+        return {
+            "requests": self._requests,
+            "pool_requests": pool_requests,
+            "connections": connections,
+            "reused": max(pool_requests - connections, 0),
+        }
+
+    def close(self) -> None:
+        """Close the session and all pooled connections."""
+        self.session.close()
+
+    def __enter__(self) -> Transport:
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the transport when leaving the context manager."""
+        self.close()
+
+
+class _CountingAdapter(HTTPAdapter):
+    """Pooled adapter counting the requests it sends and the connections it opens.
+
+    The counts are kept here rather than read from the connection pools, which
+    are dropped (with their counts) once more hosts than `pool_connections`
+    were used.
+    """
+
+    def __init__(self, **kwargs: object) -> None:
+        """Initialize the adapter and its counters."""
+        self._counter_lock = threading.Lock()
+        self._sent = 0
+        self._connections = 0
+        super().__init__(**kwargs)
+
+    def counts(self) -> tuple[int, int]:
+        """Get the number of requests sent and of connections opened."""
+        with self._counter_lock:
+            return self._sent, self._connections
+
+    def _count_connection(self) -> None:
+        with self._counter_lock:
+            self._connections += 1
+
+    def _count_connections_of(self, manager: PoolManager) -> PoolManager:
+        """Make the pools of a pool manager count the connections they open."""
+        adapter = self
+
+        def counting(pool_class: type) -> type:
+            class CountingConnection(pool_class.ConnectionCls):
+                def connect(self) -> None:
+                    # Also called when a dropped keep-alive connection is reopened
+                    adapter._count_connection()  # noqa: SLF001
+                    super().connect()
+
+            return type(pool_class.__name__, (pool_class,), {"ConnectionCls": CountingConnection})
+
+        manager.pool_classes_by_scheme = {scheme: counting(pool_class)
+                                          for scheme, pool_class in manager.pool_classes_by_scheme.items()}
+        return manager
+
+    def init_poolmanager(self, *args: object, **kwargs: object) -> None:
+        """Create the pool manager, counting the connections of its pools."""
+        super().init_poolmanager(*args, **kwargs)
+        self._count_connections_of(self.poolmanager)
+
+    def proxy_manager_for(self, proxy: str, **proxy_kwargs: object) -> PoolManager:
+        """Get the pool manager of a proxy, counting the connections of its pools."""
+        new = proxy not in self.proxy_manager
+        manager = super().proxy_manager_for(proxy, **proxy_kwargs)
+        return self._count_connections_of(manager) if new else manager
+
+    def send(self, request: requests.PreparedRequest, *args: object, **kwargs: object) -> requests.Response:
+        """Send a request, counting it."""
+        with self._counter_lock:
+            self._sent += 1
+        return super().send(request, *args, **kwargs)
+
+
+class RequestAttempts:
+    """The attempts of one request: retry decisions, logging and metrics.
+
+    Shared by `Transport.request` and the async client, so that both classify
+    failures, back off, honour `Retry-After` and report their attempts in the
+    same way. It does no I/O: the caller waits for the rate limiter, sends each
+    attempt and waits for the delays returned by `next_delay`.
+
+    Args:
+        transport (Transport): The transport whose retry policy, rate limiter
+            and metrics are used.
+        method (str): The HTTP method.
+        url (str): The URL of the request.
+        rate_limited (bool, optional): Whether the request counts against the
+            rate limit. Defaults to True.
+
+    Attributes:
+        attempt (int): The number of attempts started.
+        pause_limiter (bool): Whether the last delay returned by `next_delay` is
+            to be applied by pausing the rate limiter (429 responses, when the
+            limiter is enabled) rather than by waiting in the caller alone.
+    """
+
+    __slots__ = ("_class_attempts", "_sent", "_start", "attempt", "endpoint", "method", "metrics",
+                 "pause_limiter", "policy", "rate_limited", "url")
+
+    def __init__(self, transport: Transport, method: str, url: str, rate_limited: bool = True) -> None:
+        """Initialize the attempts of a request that has not been sent yet."""
+        self.policy = transport.retry_policy
+        self.metrics = transport.metrics
+        self.rate_limited = rate_limited and transport.rate_limiter.enabled
+        self.method = method
+        self.url = url
+        self.endpoint = endpoint_label(url)
+        self.attempt = 0
+        self.pause_limiter = False
+        self._class_attempts: dict[str | None, int] = {}
+        self._start = time.monotonic()
+        self._sent = self._start
+
+    def start(self, waited: float = 0.0) -> None:
+        """Report that an attempt is sent.
+
+        Args:
+            waited (float, optional): The time spent waiting for the rate limiter.
+        """
+        self.attempt += 1
+        if waited:
+            self.metrics.emit("throttle", endpoint=self.endpoint, reason="limiter", wait=waited)
+        self.metrics.emit("request_start", method=self.method, url=self.url,
+                          endpoint=self.endpoint, attempt=self.attempt)
+        self._sent = time.monotonic()
+
+    def end(self, status: int | None, size: int = 0) -> None:
+        """Report that an attempt is done.
+
+        Args:
+            status (int | None): The response status, or None if the attempt raised.
+            size (int, optional): The size of the response body in bytes.
+        """
+        self.metrics.emit("request_end", method=self.method, url=self.url, endpoint=self.endpoint,
+                          attempt=self.attempt, status=status, elapsed=time.monotonic() - self._sent,
+                          bytes=size)
+
+    def next_delay(self,
+                   status: int | None = None,
+                   headers: Mapping[str, str] | None = None,
+                   error: BaseException | None = None,
+                   response: requests.Response | None = None) -> float | None:
+        """Decide what follows the attempt that just ended.
+
+        Args:
+            status (int | None, optional): The response status, None if the attempt raised.
+            headers (Mapping[str, str] | None, optional): The response headers.
+            error (BaseException | None, optional): The exception raised by the attempt.
+            response (requests.Response | None, optional): The response, attached
+            to the error raised when the retries run out.
+
+        Raises:
+            InseeRequestError: The error of the failure class (`InseeServerError`,
+            `InseeRateLimitError`, ...) if the attempt failed and is not retried.
+
+        Returns:
+            float | None: None if the response is final (a success, or a client
+            error that is not retried), otherwise the delay before the next attempt.
+        """
+        retry_after = None
+        if error is not None:
+            error_class = self.policy.classify_exception(error)
+        else:
+            error_class = self.policy.classify_status(status)
+            if error_class is None:
+                return None
+            retry_after = parse_retry_after((headers or {}).get("Retry-After"))
+
+        self._class_attempts[error_class] = self._class_attempts.get(error_class, 0) + 1
+        delay = self.policy.next_delay(error_class=error_class,
+                                       class_attempts=self._class_attempts[error_class],
+                                       attempt=self.attempt,
+                                       elapsed=time.monotonic() - self._start,
+                                       retry_after=retry_after)
+        # asyncio timeouts have no message
+        failure = (str(error) or repr(error)) if error is not None else f"HTTP {status}"
+        if delay is None:
+            msg = f"{self.method} {self.url} failed after {self.attempt} attempt(s): {failure}"
+            logger.error(msg)
+            raise ERRORS_BY_CLASS[error_class](msg, status_code=status, response=response,
+                                               attempts=self.attempt) from error
+
+        logger.warning("Attempt %d of %s %s failed (%s), retrying in %.2f seconds.",
+                       self.attempt, self.method, self.url, failure, delay)
+        self.metrics.emit("retry", method=self.method, url=self.url, endpoint=self.endpoint,
+                          attempt=self.attempt, error_class=error_class, status=status, delay=delay)
+        if error_class == "throttle":
+            self.metrics.emit("throttle", endpoint=self.endpoint, reason="server", wait=delay)
+        self.pause_limiter = error_class == "throttle" and self.rate_limited
+        return delay
+
+
+def _body_size(response: requests.Response | None, streamed: bool) -> int:
+    """Get the size of a response body, from its Content-Length when it is streamed."""
+    if response is None:
+        return 0
+    if not streamed:
+        return len(response.content)
+    try:
+        return int(response.headers.get("Content-Length", 0))
+    except ValueError:
+        return 0
+
+
+_default_transport: Transport | None = None
+_default_transport_lock = threading.Lock()
+
+
+def get_default_transport() -> Transport:
+    """Get the process-wide transport shared by clients created without one.
+
+    Returns:
+        Transport: The shared transport, created on first use.
+    """
+    global _default_transport  # noqa: PLW0603
+    if _default_transport is None:
+        with _default_transport_lock:
+            if _default_transport is None:
+                _default_transport = Transport()
+    return _default_transport
@@ -4,32 +4,29 @@ from __future__ import annotations
 import datetime as dt
 import json
 import os
-from .logger import logger
 import re
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
 from pathlib import Path
-from .config import DATA_DIR
-
-# Define the regex patterns
-QUERY_URL_REGEX = r"(?:[^=&]+=[^=&]*&?)*"
+from typing import Callable, Iterable, Iterator
+from urllib.parse import quote
 
-def create_data_directories(base_dir: Path) -> None:
-    """Creates necessary data directories if they don't exist.
-
-    Args:
-        base_dir (Path): The base directory for data storage.
+from . import config
+from .logger import logger
 
-    Returns:
-        None
-    """
-    LOGS_DIR = base_dir / "logs"
-    METADATA_DIR = base_dir / "metadata"
-    RAW_DIR = base_dir / "raw"
-    PROCESSED_DIR = base_dir / "processed"
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
-    for directory in [LOGS_DIR, METADATA_DIR, RAW_DIR, PROCESSED_DIR]:
-        directory.mkdir(parents=True, exist_ok=True)
+# Define the regex patterns
+QUERY_URL_REGEX = r"(?:[^=&]+=[^=&]*&?)*"
+_QUERY_URL_PATTERN = re.compile(QUERY_URL_REGEX)
 
-create_data_directories(Path(DATA_DIR))
+# Characters kept as is in the encoded query values, besides letters, digits and `_.-~`
+QUERY_SAFE_CHARACTERS = ",:*"
 
 class QueryBuilder:
     """To build the query string from kwargs."""
@@ -62,19 +59,48 @@ class QueryBuilder:
         if regex_patterns:
             pattern = regex_patterns.get(key)
             if pattern and not re.match(pattern, value):
-                msg = f"Invalid format for {key}: {value} does not match {pattern}"
+                msg = f"Invalid format for {key}: {value} does not match {_pattern_text(pattern)}"
                 raise ValueError(msg)
 
+    def _format_value(self, value: any) -> str:
+        """Format a query value as a string."""
+        return format_query_value(value)
+
     def _build_query_part(self,
                           key: str,
                           value: any) -> str:
         """Build a query string part for the key-value pair."""
-        if isinstance(value, list):
-            # Join the list items into a comma-separated string
-            str_val = ",".join(str(item) for item in value)  # Ensures each item is a string  # noqa: E501
-            return f"{key}={str_val}"
-        # Handle the case where value is not a list (e.g., a string or int)
-        return f"{key}={value}"
+        return f"{key}={quote(self._format_value(value), safe=QUERY_SAFE_CHARACTERS)}"
+
+    def set_query_params(self,
+                         query_kwargs: dict,
+                         expected_types: dict[str, type | tuple],
+                         regex_patterns: dict[str, str] | None = None) -> dict[str, str]:
+        """Validate kwargs and return them as form parameters (for POST requests)."""
+        query_params = {}
+        for key, value in query_kwargs.items():
+            # Validate key and type
+            self._validate_key_and_type(key, value, expected_types)
+
+            # Validate the format using regex (if applicable)
+            if isinstance(value, str):
+                self._validate_regex(key, value, regex_patterns)
+
+            query_params[key] = self._format_value(value)
+        return query_params
+
+    @staticmethod
+    def build_id_query(field: str, ids: list[str]) -> str:
+        """Build a `q` query matching any of the given identifiers.
+
+        Args:
+            field (str): The identifier field, "siren" or "siret".
+            ids (list[str]): The identifiers to match.
+
+        Returns:
+            str: The query, e.g. "siren:(000325175 OR 005520135)".
+        """
+        return f"{field}:({' OR '.join(ids)})"
 
     def set_query_string(self,
                           query_kwargs: dict,
@@ -96,15 +122,228 @@ class QueryBuilder:
             query_part = self._build_query_part(key, value)
             query_string_parts.append(query_part)
         query_string = "&".join(query_string_parts)
-        match = re.match(QUERY_URL_REGEX, query_string)
+        match = _QUERY_URL_PATTERN.match(query_string)
         if match:
-            logger.info("Valid query string")
+            logger.debug("Valid query string")
         if not match:
             logger.error("Invalid query string")
             return ""
 
         return "&".join(query_string_parts)
 
+
+def format_query_value(value: any) -> str:
+    """Format a query value as a string, joining lists with commas."""
+    if isinstance(value, list):
+        # Join the list items into a comma-separated string
+        return ",".join(str(item) for item in value)  # Ensures each item is a string
+    # Handle the case where value is not a list (e.g., a string or int)
+    return str(value)
+
+
+def _pattern_text(pattern: str | re.Pattern) -> str:
+    """Get the text of a regex pattern, compiled or not."""
+    return pattern.pattern if isinstance(pattern, re.Pattern) else pattern
+
+
+class PreparedQuery:
+    """A query validated and encoded once, then rebound with new values.
+
+    `QueryBuilder.set_query_string` validates and formats every parameter each
+    time it is called, so paging through a cursor or looking up identifiers in
+    batches redoes the same work for every request. A prepared query checks the
+    parameters once (with precompiled patterns) and keeps each `key=value` part
+    URL-encoded; `url`, `query_string` and `params` then only validate and
+    encode the values they are given, typically `curseur` or the `q` of a
+    batch of identifiers.
+
+    Values are percent-encoded (except `,`, `:` and `*`), so spaces,
+    parentheses, `&`, `+` or `#` in a `q` query reach the API unchanged.
+
+    Args:
+        query_kwargs (dict): The query parameters.
+        expected_types (dict[str, type | tuple]): The accepted parameters and
+        their types.
+        regex_patterns (dict[str, str | re.Pattern] | None, optional): Patterns
+        the string values must match. Defaults to None.
+        validators (dict[str, Callable[[str], object]] | None, optional): Functions
+        raising ValueError for invalid string values, e.g. `parse_query` for `q`.
+        Defaults to None.
+        base_url (str, optional): The URL the query string is appended to by
+        `url`. Defaults to "".
+        trusted (tuple[str, ...], optional): Parameters whose rebound values are
+        built by the caller from validated parts (e.g. the `q` of a batch of
+        checked identifiers): they are only formatted and encoded when rebound.
+        Defaults to ().
+
+    Raises:
+        ValueError: If a parameter is not expected or a value is not valid.
+        TypeError: If a value is not of the expected type.
+
+    Attributes:
+        base_url (str): The URL the query string is appended to.
+        values (dict): The query parameters, as given.
+
+    Example:
+        prepared = PreparedQuery({"q": "siren:0*", "nombre": 1000}, {"q": str, "nombre": int, "curseur": str},
+                                 base_url="https://api.insee.fr/api-sirene/3.11/siren")
+        prepared.url(curseur="*")  # ...siren?q=siren:0*&nombre=1000&curseur=*
+    """
+
+    __slots__ = ("_expected_types", "_params", "_parts", "_patterns", "_trusted", "_validators", "base_url",
+                 "values")
+
+    def __init__(self,
+                 query_kwargs: dict,
+                 expected_types: dict[str, type | tuple],
+                 regex_patterns: dict[str, str | re.Pattern] | None = None,
+                 validators: dict[str, Callable[[str], object]] | None = None,
+                 base_url: str = "",
+                 trusted: tuple[str, ...] = ()) -> None:
+        """Validate and encode the query parameters."""
+        self._expected_types = {key: expected_type if isinstance(expected_type, tuple) else (expected_type,)
+                                for key, expected_type in expected_types.items()}
+        self._patterns = {key: re.compile(pattern) for key, pattern in (regex_patterns or {}).items()}
+        self._validators = validators or {}
+        self._trusted = frozenset(trusted)
+        self.base_url = base_url
+        self.values = dict(query_kwargs)
+        self._params: dict[str, str] = {}
+        self._parts: dict[str, str] = {}
+        for key, value in self.values.items():
+            self._params[key], self._parts[key] = self._encode(key, value)
+
+    def _encode(self, key: str, value: any) -> tuple[str, str]:
+        """Validate a value and get it formatted, and as an encoded `key=value` part."""
+        self._validate(key, value)
+        formatted = format_query_value(value)
+        return formatted, f"{key}={quote(formatted, safe=QUERY_SAFE_CHARACTERS)}"
+
+    def _rebind(self, key: str, value: any) -> tuple[str, str]:
+        """Encode a rebound value like `_encode`, without validating the trusted parameters."""
+        if key not in self._trusted:
+            return self._encode(key, value)
+        formatted = format_query_value(value)
+        return formatted, f"{key}={quote(formatted, safe=QUERY_SAFE_CHARACTERS)}"
+
+    def _validate(self, key: str, value: any) -> None:
+        """Check that a parameter is expected and its value valid."""
+        expected_type = self._expected_types.get(key)
+        if expected_type is None:
+            msg = f"Unexpected key: {key}"
+            raise ValueError(msg)
+        if not isinstance(value, expected_type):
+            msg = f"Invalid type for {key}: expected {expected_type}, got {type(value)}"
+            raise TypeError(msg)
+        if isinstance(value, str):
+            pattern = self._patterns.get(key)
+            if pattern is not None and not pattern.match(value):
+                msg = f"Invalid format for {key}: {value} does not match {pattern.pattern}"
+                raise ValueError(msg)
+            validator = self._validators.get(key)
+            if validator is not None:
+                validator(value)
+
+    def params(self, **values: any) -> dict[str, str]:
+        """Get the formatted parameters (for POST bodies), with some values replaced.
+
+        Args:
+            **values (any): The values to add or replace, validated on the way.
+
+        Returns:
+            dict[str, str]: The parameters.
+        """
+        if not values:
+            return dict(self._params)
+        return {**self._params, **{key: self._rebind(key, value)[0] for key, value in values.items()}}
+
+    def query_string(self, **values: any) -> str:
+        """Get the encoded query string, with some values replaced.
+
+        Args:
+            **values (any): The values to add or replace, validated on the way.
+
+        Returns:
+            str: The query string, e.g. "q=siren:%28000325175%29&nombre=20".
+        """
+        parts = self._parts
+        if values:
+            parts = {**parts, **{key: self._rebind(key, value)[1] for key, value in values.items()}}
+        return "&".join(parts.values())
+
+    def url(self, **values: any) -> str:
+        """Get the request URL, with some values replaced.
+
+        Args:
+            **values (any): The values to add or replace, validated on the way.
+
+        Returns:
+            str: `base_url?query_string`.
+        """
+        return f"{self.base_url}?{self.query_string(**values)}"
+
+    def __repr__(self) -> str:
+        """Show the query string."""
+        return f"PreparedQuery({self.query_string()!r})"
+
+
+@contextmanager
+def file_lock(path: str | Path) -> Iterator[None]:
+    """Hold an exclusive lock on a lock file, shared between processes.
+
+    Args:
+        path (str | Path): The lock file, created if it doesn't exist.
+
+    Yields:
+        None: While the lock is held.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:  # LK_LOCK gives up after 10 seconds
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def get_record_field(record: Mapping, field: str) -> object:
+    """Get a field of an INSEE record, wherever it is nested.
+
+    Fields are looked up in the record, then in its nested objects
+    (`uniteLegale`, `adresseEtablissement`, ...), then in its current period
+    (the first of `periodesUniteLegale` or `periodesEtablissement`).
+
+    Args:
+        record (Mapping): The `uniteLegale` or `etablissement` record.
+        field (str): The field name.
+
+    Returns:
+        object: The value, or None if the record has no such field.
+    """
+    if field in record:
+        return record[field]
+    for value in record.values():
+        if isinstance(value, Mapping) and field in value:
+            return value[field]
+    for periods in ("periodesUniteLegale", "periodesEtablissement"):
+        if record.get(periods) and field in record[periods][0]:
+            return record[periods][0][field]
+    return None
+
+
 def get_today_date() -> str:
     """Get the current date and time.
 
@@ -114,32 +353,28 @@ def get_today_date() -> str:
     now = dt.datetime.now(tz=dt.datetime.now().astimezone().tzinfo)
     return now.strftime("%Y_%m%dT%H%M%S")
 
-def save_data(data: dict | str,
-              filename: str,
-              response_data_type: str,
-              response_type: str = "json",
-              data_type: str = "raw") -> None:
-    """Save data to a file.
+def get_save_dir(response_data_type: str,
+                 response_type: str = "json",
+                 data_type: str = "raw") -> Path:
+    """Get (and create) the directory where data is saved.
 
     Args:
-        data (dict): The data to be saved.
-        filename (str): The name of the file to save the data to.
+        response_data_type (str): The type of data requested (siren/siret).
         response_type (str, optional): The type of the response (json/csv). Defaults to "json".
         data_type (str, optional): The type of data being saved (logs/metadata/raw/processed). Defaults to "raw".
 
     Returns:
-        None
+        Path: The directory.
     """
-
     # Determine the correct directory based on data_type
     if data_type == "logs":
-        save_dir = os.path.join(Path(DATA_DIR), "logs")
+        save_dir = os.path.join(Path(config.DATA_DIR), "logs")
     elif data_type == "metadata":
-        save_dir = os.path.join(Path(DATA_DIR), "metadata", "insee")
+        save_dir = os.path.join(Path(config.DATA_DIR), "metadata", "insee")
     elif data_type == "processed":
-        save_dir = os.path.join(Path(DATA_DIR), "processed", "insee", response_data_type, response_type)
+        save_dir = os.path.join(Path(config.DATA_DIR), "processed", "insee", response_data_type, response_type)
     else:  # Default to raw
-        save_dir = os.path.join(Path(DATA_DIR), "raw", "insee", response_data_type, response_type)
+        save_dir = os.path.join(Path(config.DATA_DIR), "raw", "insee", response_data_type, response_type)
 
     # Create the directory if it doesn't exist
     if not os.path.exists(save_dir):
@@ -148,9 +383,90 @@ def save_data(data: dict | str,
         except OSError as e:
             logger.error("Error creating directory %s: %s", save_dir, e)
             raise
+    return Path(save_dir)
+
+
+def fsync_dir(path: str | Path) -> None:
+    """Sync a directory to disk, so that the files renamed into it are durable.
+
+    Directories cannot be synced on Windows, where this does nothing.
+
+    Args:
+        path (str | Path): The directory.
+    """
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    dir_fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def save_stream(chunks: Iterable[bytes],
+                filename: str,
+                response_data_type: str,
+                response_type: str = "json",
+                data_type: str = "raw") -> Path:
+    """Save a stream of bytes to a file, atomically.
+
+    The chunks are written as they come to a temporary file next to the target,
+    which is synced to disk and then renamed, so the target is either missing
+    or complete, never partially written.
+
+    Args:
+        chunks (Iterable[bytes]): The bytes to save, e.g. `response.iter_content(...)`.
+        filename (str): The name of the file to save the data to.
+        response_data_type (str): The type of data requested (siren/siret).
+        response_type (str, optional): The type of the response (json/csv). Defaults to "json".
+        data_type (str, optional): The type of data being saved (logs/metadata/raw/processed). Defaults to "raw".
+
+    Returns:
+        Path: The saved file.
+    """
+    file_path = get_save_dir(response_data_type=response_data_type,
+                             response_type=response_type,
+                             data_type=data_type) / filename
+    logger.debug("Streaming data to %s...", file_path)
+    tmp_path = file_path.with_name(f".{filename}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        with tmp_path.open("wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        logger.error("Error saving data to %s", file_path)
+        raise
+
+    # Make the rename itself durable
+    fsync_dir(file_path.parent)
+    return file_path
+
+
+def save_data(data: dict | str,
+              filename: str,
+              response_data_type: str,
+              response_type: str = "json",
+              data_type: str = "raw") -> None:
+    """Save data to a file.
+
+    Args:
+        data (dict): The data to be saved.
+        filename (str): The name of the file to save the data to.
+        response_type (str, optional): The type of the response (json/csv). Defaults to "json".
+        data_type (str, optional): The type of data being saved (logs/metadata/raw/processed). Defaults to "raw".
+
+    Returns:
+        None
+    """
 
     # Build the full file path
-    file_path = Path(save_dir) / filename
+    file_path = get_save_dir(response_data_type=response_data_type,
+                             response_type=response_type,
+                             data_type=data_type) / filename
 
     # Save the data
     if response_type == "json":
@@ -0,0 +1,285 @@
+"""Compressed, segmented and atomic output files for exported records.
+
+`SegmentWriter` writes records as compact NDJSON (one JSON document per line),
+optionally compressed with gzip or zstd, to rolling segment files capped by
+size and/or record count:
+
+    siren_20240502-00001.ndjson.gz
+    siren_20240502-00002.ndjson.gz
+    siren_20240502.manifest.json
+
+Each segment is written to a temporary file, synced and renamed once it is
+complete, so a crash never leaves a half-written segment behind. A manifest
+lists the completed segments with their record counts, sizes and SHA-256
+checksums; it is rewritten after each segment with `"complete": false`, and
+once more on close with `"complete": true`. An interrupted export can be
+continued in the same segments with `resume=True`.
+
+zstd requires the optional `zstandard` dependency:
+
+    pip install pyinsee[zstd]
+
+Example:
+    from pyinsee.writer import SegmentWriter
+
+    with SegmentWriter("/data/raw/insee/siren/json", prefix="siren", compression="zstd") as writer:
+        for page, header in client.iter_bulk(data_type="siren", by_page=True):
+            writer.write_many(page)
+"""
+from __future__ import annotations
+
+import datetime as dt
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import BinaryIO, Iterable
+
+from . import config
+from .decoding import dumps
+from .logger import logger
+from .utils import fsync_dir
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+# File extension of each compression
+COMPRESSION_SUFFIXES = {"none": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+class _HashingFile:
+    """Binary file wrapper computing the SHA-256 and size of what is written."""
+
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def flush(self) -> None:
+        self.f.flush()
+
+
+class SegmentWriter:
+    """Write records to rolling NDJSON segment files with a manifest.
+
+    Args:
+        directory (str | Path): The output directory, created if needed.
+        prefix (str): The prefix of the segment and manifest file names.
+        compression (str, optional): "none", "gzip" or "zstd". Defaults to
+            INSEE_SAVE_COMPRESSION.
+        max_bytes (int, optional): Start a new segment once a segment holds
+            this many uncompressed bytes (0 for no cap). Defaults to
+            INSEE_SEGMENT_MAX_BYTES.
+        max_records (int, optional): Start a new segment once a segment holds
+            this many records (0 for no cap). Defaults to INSEE_SEGMENT_MAX_RECORDS.
+        compression_level (int | None, optional): The compression level.
+            Defaults to 6 for gzip and 3 for zstd.
+        resume (bool, optional): Continue the segments listed in the manifest
+            of an interrupted writer with the same prefix, instead of refusing
+            an existing prefix. Defaults to False.
+
+    Raises:
+        FileExistsError: If files with the same prefix already exist (and
+            `resume` is False).
+        ValueError: If the compression does not match the resumed manifest.
+
+    Attributes:
+        directory (Path): The output directory.
+        prefix (str): The prefix of the file names.
+        segments (list[dict]): The completed segments (name, records, bytes, sha256).
+    """
+
+    def __init__(self,
+                 directory: str | Path,
+                 prefix: str,
+                 compression: str | None = None,
+                 max_bytes: int | None = None,
+                 max_records: int | None = None,
+                 compression_level: int | None = None,
+                 resume: bool = False) -> None:
+        """Initialize the writer; the first segment is opened on the first record."""
+        compression = compression or config.INSEE_SAVE_COMPRESSION
+        max_bytes = max_bytes if max_bytes is not None else config.INSEE_SEGMENT_MAX_BYTES
+        max_records = max_records if max_records is not None else config.INSEE_SEGMENT_MAX_RECORDS
+        if compression not in COMPRESSION_SUFFIXES:
+            msg = f"Unsupported compression: {compression}. Must be one of {list(COMPRESSION_SUFFIXES)}."
+            raise ValueError(msg)
+        if compression == "zstd" and zstandard is None:
+            msg = "zstd compression requires zstandard. Install it with `pip install pyinsee[zstd]`."
+            raise ImportError(msg)
+        if max_bytes < 0 or max_records < 0:
+            msg = "max_bytes and max_records must be positive (or 0 for no cap)."
+            raise ValueError(msg)
+
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prefix = prefix
+        self.compression = compression
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.compression_level = compression_level
+        self.segments: list[dict] = []
+        manifest_path = self.directory / f"{prefix}.manifest.json"
+        if resume and manifest_path.exists():
+            manifest = json.loads(manifest_path.read_text())
+            if manifest["compression"] != compression:
+                msg = (f"Cannot resume the {manifest['compression']} segments of {prefix} "
+                       f"with the {compression} compression.")
+                raise ValueError(msg)
+            # Segments written after the manifest are not listed: they are written again
+            self.segments = manifest["segments"]
+            logger.info("Resuming the segments of %s after segment %d.", prefix, len(self.segments))
+        elif not resume and (any(self.directory.glob(f"{prefix}-*.ndjson*")) or manifest_path.exists()):
+            msg = f"Segments with the prefix {prefix} already exist in {self.directory}."
+            raise FileExistsError(msg)
+        self._file = None        # the temporary file of the open segment
+        self._hashing = None
+        self._stream = None      # what records are written to (compressed or not)
+        self._tmp_path = None
+        self._path = None
+        self._records = 0
+        self._bytes = 0
+        self._closed = False
+
+    def __enter__(self) -> SegmentWriter:
+        """Enter the context manager."""
+        return self
+
+    def __exit__(self, exc_type: type | None, *exc_info: object) -> None:
+        """Close the writer, or abort it if the block raised."""
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, record: dict) -> None:
+        """Write one record.
+
+        Args:
+            record (dict): The record.
+        """
+        self.write_many((record,))
+
+    def write_many(self, records: Iterable[dict]) -> None:
+        """Write several records, e.g. a page, to the same segment.
+
+        The size caps are only checked after the last record, so segments are
+        always cut between two batches.
+
+        Args:
+            records (Iterable[dict]): The records.
+        """
+        if self._closed:
+            msg = "Cannot write to a closed SegmentWriter."
+            raise ValueError(msg)
+        for record in records:
+            if self._stream is None:
+                self._open_segment()
+            line = dumps(record) + b"\n"
+            self._stream.write(line)
+            self._records += 1
+            self._bytes += len(line)
+
+        if ((self.max_records and self._records >= self.max_records)
+                or (self.max_bytes and self._bytes >= self.max_bytes)):
+            self._close_segment()
+
+    def close(self) -> dict:
+        """Complete the last segment and write the manifest.
+
+        Returns:
+            dict: The manifest.
+        """
+        if self._closed:
+            return self._manifest()
+        self._close_segment()
+        self._closed = True
+
+        manifest = self._write_manifest(complete=True)
+        logger.info("Saved %d record(s) in %d segment(s), see %s.",
+                    manifest["records"], len(self.segments), self.directory / f"{self.prefix}.manifest.json")
+        return manifest
+
+    def abort(self) -> None:
+        """Drop the open segment; the completed ones are kept, listed in an incomplete manifest."""
+        if self._stream is not None:
+            if self._stream is not self._hashing:
+                self._stream.close()
+            self._file.close()
+            self._tmp_path.unlink(missing_ok=True)
+            self._stream = None
+        self._closed = True
+
+    def _open_segment(self) -> None:
+        """Open the temporary file of the next segment."""
+        name = f"{self.prefix}-{len(self.segments) + 1:05d}.ndjson{COMPRESSION_SUFFIXES[self.compression]}"
+        self._path = self.directory / name
+        self._tmp_path = self._path.with_name(f".{name}.tmp")
+        self._file = self._tmp_path.open("wb")
+        self._hashing = _HashingFile(self._file)
+        if self.compression == "gzip":
+            level = 6 if self.compression_level is None else self.compression_level
+            self._stream = gzip.GzipFile(filename="", mode="wb", fileobj=self._hashing,
+                                         compresslevel=level, mtime=0)
+        elif self.compression == "zstd":
+            level = 3 if self.compression_level is None else self.compression_level
+            self._stream = zstandard.ZstdCompressor(level=level).stream_writer(self._hashing, closefd=False)
+        else:
+            self._stream = self._hashing
+        self._records = 0
+        self._bytes = 0
+
+    def _close_segment(self) -> None:
+        """Complete the open segment: flush, sync and rename it."""
+        if self._stream is None:
+            return
+        if self._stream is not self._hashing:
+            self._stream.close()  # writes the compression trailer
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self._tmp_path, self._path)
+        fsync_dir(self.directory)
+
+        self.segments.append({
+            "name": self._path.name,
+            "records": self._records,
+            "bytes": self._hashing.size,
+            "sha256": self._hashing.sha256.hexdigest(),
+        })
+        logger.debug("Saved segment %s (%d records).", self._path, self._records)
+        self._stream = None
+        self._write_manifest(complete=False)
+
+    def _write_manifest(self, complete: bool) -> dict:
+        """Write the manifest of the completed segments, atomically."""
+        manifest = self._manifest(complete=complete)
+        path = self.directory / f"{self.prefix}.manifest.json"
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with tmp_path.open("w") as f:
+            json.dump(manifest, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        fsync_dir(self.directory)
+        return manifest
+
+    def _manifest(self, complete: bool = True) -> dict:
+        """Build the manifest of the completed segments."""
+        return {
+            "prefix": self.prefix,
+            "format": "ndjson",
+            "compression": self.compression,
+            "created": dt.datetime.now().isoformat(timespec="seconds"),
+            "complete": complete,
+            "records": sum(segment["records"] for segment in self.segments),
+            "segments": self.segments,
+        }
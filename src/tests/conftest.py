@@ -0,0 +1,213 @@
+"""Shared fixtures: isolated settings and a local stand-in for the INSEE API.
+
+`InseeStub` is an `http.server` running in a thread. Each test scripts the
+responses of the paths it uses, either as a queue of canned responses or as a
+handler called with every request, and reads back the requests received.
+"""
+from __future__ import annotations
+
+import json
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Callable
+from urllib.parse import parse_qsl, urlsplit
+
+import pytest
+
+from pyinsee import auth, config, ratelimit
+from pyinsee import transport as transport_module
+from pyinsee.auth import TokenManager
+from pyinsee.insee_client import InseeClient
+from pyinsee.metrics import Metrics
+from pyinsee.ratelimit import RateLimiter
+from pyinsee.retry import RetryPolicy
+from pyinsee.transport import Transport
+
+
+class InseeStub:
+    """A scripted HTTP server standing in for the INSEE API and its token endpoint.
+
+    `/token` hands out `tok1`, `tok2`, ... Other paths answer with the responses
+    queued by `add`, then with the handler set by `route`, then with a 404.
+
+    Attributes:
+        url (str): The server URL, without a trailing slash.
+        requests (list[SimpleNamespace]): The requests received, with their
+        `method`, `path`, `params` (query string and form) and `headers`.
+        tokens (int): The number of tokens handed out.
+    """
+
+    def __init__(self) -> None:
+        """Start the server on a free local port."""
+        self.requests: list[SimpleNamespace] = []
+        self.tokens = 0
+        self._queues: dict[str, deque] = {}
+        self._routes: dict[str, Callable[[SimpleNamespace], tuple]] = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        self._thread = threading.Thread(target=self._server.serve_forever, kwargs={"poll_interval": 0.05},
+                                        daemon=True)
+        self._thread.start()
+
+    def add(self, path: str, status: int = 200, body: object = None, headers: dict | None = None) -> None:
+        """Queue one response for a path (a dict body is sent as JSON)."""
+        self._queues.setdefault(path, deque()).append((status, body, headers or {}))
+
+    def route(self, path: str, handler: Callable[[SimpleNamespace], tuple]) -> None:
+        """Answer every request of a path with `handler(request) -> (status, body[, headers])`."""
+        self._routes[path] = handler
+
+    def hits(self, path: str) -> list[SimpleNamespace]:
+        """Get the requests received on a path, in order."""
+        return [request for request in self.requests if request.path == path]
+
+    def close(self) -> None:
+        """Stop the server."""
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, request: SimpleNamespace) -> tuple[int, object, dict]:
+        """Pick the response of a request."""
+        with self._lock:
+            self.requests.append(request)
+            if request.path == "/token":
+                self.tokens += 1
+                return 200, {"access_token": f"tok{self.tokens}", "token_type": "Bearer", "expires_in": 3600}, {}
+            queue = self._queues.get(request.path)
+            if queue:
+                return queue.popleft()
+        handler = self._routes.get(request.path)
+        if handler is None:
+            return 404, {"header": {"statut": 404, "message": "Aucun élément trouvé"}}, {}
+        status, body, *headers = handler(request)
+        return status, body, headers[0] if headers else {}
+
+    def _handler_class(self) -> type[BaseHTTPRequestHandler]:
+        """Build the request handler class bound to this stub."""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self) -> None:
+                url = urlsplit(self.path)
+                length = int(self.headers.get("Content-Length") or 0)
+                form = self.rfile.read(length).decode() if length else ""
+                request = SimpleNamespace(method=self.command, path=url.path,
+                                          params={**dict(parse_qsl(url.query)), **dict(parse_qsl(form))},
+                                          headers=dict(self.headers))
+                status, body, headers = stub._respond(request)
+                if callable(body):
+                    # A callable body stalls the response, e.g. to time the client out
+                    body = body()
+                payload = body if isinstance(body, bytes) else json.dumps(body).encode() if body is not None else b""
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST = _serve
+
+            def log_message(self, *args: object) -> None:
+                pass
+
+        return Handler
+
+
+def siren_number(n: int) -> str:
+    """Build the n-th SIREN number."""
+    return f"{n:09d}"
+
+
+def unite_legale(siren: str, **fields: object) -> dict:
+    """Build a minimal `uniteLegale` record."""
+    return {"siren": siren, "periodesUniteLegale": [{"dateFin": None, "etatAdministratifUniteLegale": "A"}],
+            **fields}
+
+
+def cursor_search(records: list[dict]) -> Callable[[SimpleNamespace], tuple]:
+    """Answer bulk searches over `records` with integer cursors ("*", then the offset of the next page).
+
+    Like the API, the last page is empty and its `curseurSuivant` is its `curseur`.
+    """
+    def handler(request: SimpleNamespace) -> tuple:
+        cursor = request.params["curseur"]
+        start = 0 if cursor == "*" else int(cursor)
+        page = records[start:start + int(request.params["nombre"])]
+        next_cursor = str(start + len(page)) if page else cursor
+        return 200, {"header": {"statut": 200, "message": "OK", "total": len(records),
+                                "curseur": cursor, "curseurSuivant": next_cursor},
+                     "unitesLegales": page}
+    return handler
+
+
+@pytest.fixture(autouse=True)
+def settings(tmp_path, monkeypatch) -> config.Settings:
+    """Install settings of their own for each test, restored afterwards."""
+    settings = config.Settings(data_dir=str(tmp_path / "data"),
+                               client_key="key",
+                               client_secret="secret",
+                               insee_data_url="http://127.0.0.1:9/",
+                               insee_token_cache="",
+                               insee_rate_limit=0,
+                               insee_retry_backoff=0.001)
+    monkeypatch.setattr(config, "_settings", settings)
+    return settings
+
+
+@pytest.fixture
+def server() -> InseeStub:
+    """A local stand-in for the INSEE API."""
+    stub = InseeStub()
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def metrics() -> Metrics:
+    """Metrics of their own for each test."""
+    return Metrics()
+
+
+@pytest.fixture
+def transport(metrics) -> Transport:
+    """A transport with no rate limit and fast retries (3 attempts per error class)."""
+    transport = Transport(timeout=(2, 2),
+                          rate_limiter=RateLimiter(requests_per_minute=0),
+                          retry_policy=RetryPolicy(max_attempts=3, backoff_base=0.001, jitter=False, deadline=10),
+                          metrics=metrics)
+    yield transport
+    transport.close()
+
+
+@pytest.fixture
+def token_manager(server, transport) -> TokenManager:
+    """A token manager fetching its tokens from the stand-in, kept in memory."""
+    return TokenManager(token_url=f"{server.url}/token", cache_path=None, fallback_api_key=None,
+                        transport=transport)
+
+
+@pytest.fixture
+def client(server, transport, token_manager) -> InseeClient:
+    """A client of the stand-in."""
+    return InseeClient(transport=transport, base_url=f"{server.url}/", token_manager=token_manager)
+
+
+@pytest.fixture
+def shared_api(server, settings, monkeypatch) -> InseeStub:
+    """Point the settings, and the shared transport and token manager, at the stand-in (e.g. for the CLI)."""
+    monkeypatch.setattr(config, "_settings", settings.replace(insee_data_url=f"{server.url}/",
+                                                              insee_token_url=f"{server.url}/token"))
+    monkeypatch.setattr(auth, "_default_token_manager", None)
+    monkeypatch.setattr(ratelimit, "_default_rate_limiter", None)
+    monkeypatch.setattr(transport_module, "_default_transport", None)
+    yield server
+    if transport_module._default_transport is not None:
+        transport_module._default_transport.close()
@@ -0,0 +1,87 @@
+"""Retries, typed errors, the 401 token refresh and cursor paging of the async client."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+
+from pyinsee.exceptions import InseeRateLimitError, InseeServerError
+
+from .conftest import cursor_search, siren_number, unite_legale
+
+pytest.importorskip("aiohttp")
+
+from pyinsee.async_client import AsyncInseeClient
+
+
+@pytest.fixture
+def async_client(server, transport, token_manager) -> AsyncInseeClient:
+    """An async client of the stand-in, sharing the sync fixtures' transport."""
+    return AsyncInseeClient(transport=transport, base_url=f"{server.url}/", token_manager=token_manager)
+
+
+def found(siren: str) -> dict:
+    """The body of a `siren/<id>` response."""
+    return {"header": {"statut": 200, "message": "OK"}, "uniteLegale": unite_legale(siren)}
+
+
+async def get_by_number(client: AsyncInseeClient, siren: str) -> tuple | None:
+    async with client:
+        return await client.get_by_number(data_type="siren", id_code=siren)
+
+
+def test_server_errors_and_throttling_are_retried(server, async_client, metrics):
+    retries = []
+    metrics.add_hook("retry", lambda _, fields: retries.append(fields))
+    siren = "000325175"
+    server.add(f"/siren/{siren}", 503)
+    server.add(f"/siren/{siren}", 429, headers={"Retry-After": "0.2"})
+    server.add(f"/siren/{siren}", 200, found(siren))
+
+    record, _ = asyncio.run(get_by_number(async_client, siren))
+
+    assert record["siren"] == siren
+    assert len(server.hits(f"/siren/{siren}")) == 3
+    assert [(retry["error_class"], retry["delay"]) for retry in retries] == [("server", 0.001), ("throttle", 0.2)]
+
+
+@pytest.mark.parametrize(("status", "error_type"), [(500, InseeServerError), (429, InseeRateLimitError)])
+def test_typed_error_once_the_retries_run_out(server, async_client, status, error_type):
+    siren = "000325175"
+    server.route(f"/siren/{siren}", lambda _: (status, {}, {"Retry-After": "0"}))
+
+    with pytest.raises(error_type) as excinfo:
+        asyncio.run(get_by_number(async_client, siren))
+
+    assert excinfo.value.attempts == 3
+    assert len(server.hits(f"/siren/{siren}")) == 3
+
+
+def test_unauthorized_refreshes_the_token_and_retries_once(server, async_client):
+    siren = "000325175"
+    server.add(f"/siren/{siren}", 401, {"header": {"statut": 401, "message": "Invalid credentials"}})
+    server.add(f"/siren/{siren}", 200, found(siren))
+
+    record, _ = asyncio.run(get_by_number(async_client, siren))
+
+    assert record["siren"] == siren
+    assert [hit.headers["X-INSEE-Api-Key-Integration"] for hit in server.hits(f"/siren/{siren}")] == ["tok1", "tok2"]
+
+
+def test_iter_bulk_follows_the_cursor_and_skips_the_empty_last_page(server, async_client):
+    records = [unite_legale(siren_number(n)) for n in range(5)]
+    server.route("/siren", cursor_search(records))
+
+    async def pages() -> list:
+        async with async_client:
+            return [page async for page in async_client.iter_bulk(data_type="siren", by_page=True, nombre=2)]
+
+    result = asyncio.run(pages())
+
+    assert [[record["siren"] for record in page_records] for page_records, _ in result] == [
+        [records[0]["siren"], records[1]["siren"]],
+        [records[2]["siren"], records[3]["siren"]],
+        [records[4]["siren"]],
+    ]
+    # The fourth request returned the empty page that ends the cursor
+    assert [hit.params["curseur"] for hit in server.hits("/siren")] == ["*", "2", "4", "5"]
@@ -0,0 +1,87 @@
+"""The OAuth token lifecycle: caching, sharing, refresh and the 401 retry."""
+from __future__ import annotations
+
+import pytest
+
+from pyinsee.auth import TokenManager
+
+from .conftest import cursor_search, siren_number, unite_legale
+
+SIREN = "000325175"
+UNAUTHORIZED = {"header": {"statut": 401, "message": "Invalid credentials"}}
+
+
+def manager(server, transport, **kwargs: object) -> TokenManager:
+    """A token manager of the stand-in."""
+    return TokenManager(token_url=f"{server.url}/token", fallback_api_key=None, transport=transport, **kwargs)
+
+
+def test_tokens_are_fetched_once_while_fresh(server, token_manager):
+    assert token_manager.get_token() == "tok1"
+    assert token_manager.get_token() == "tok1"
+    assert server.tokens == 1
+
+
+def test_tokens_are_refreshed_before_they_expire(server, transport):
+    tokens = manager(server, transport, cache_path=None, refresh_margin=3601)
+
+    assert tokens.get_token() == "tok1"
+    assert tokens.get_token() == "tok2"
+
+
+def test_the_token_cache_is_shared_between_managers(server, transport, tmp_path):
+    cache_path = tmp_path / "token.json"
+    first = manager(server, transport, cache_path=cache_path)
+    second = manager(server, transport, cache_path=cache_path)
+
+    assert first.get_token() == "tok1"
+    assert second.get_token() == "tok1"
+    assert server.tokens == 1
+
+    # A rejected token is dropped from the cache, but only if it is still the cached one
+    second.invalidate("tok0")
+    assert cache_path.exists()
+    second.invalidate("tok1")
+    assert not cache_path.exists()
+    assert second.get_token() == "tok2"
+
+
+def test_the_fallback_key_is_used_when_authentication_fails(server, transport):
+    server.add("/nothing", 400, {"error": "invalid_client"})
+    tokens = TokenManager(token_url=f"{server.url}/nothing", cache_path=None, fallback_api_key="api-key",
+                          transport=transport)
+
+    assert tokens.get_token() == "api-key"
+
+
+def test_unauthorized_refreshes_the_token_and_retries_once(server, client):
+    server.add(f"/siren/{SIREN}", 401, UNAUTHORIZED)
+    server.add(f"/siren/{SIREN}", 200, {"header": {"statut": 200, "message": "OK"},
+                                        "uniteLegale": unite_legale(SIREN)})
+
+    record, header = client.get_by_number(data_type="siren", id_code=SIREN)
+
+    assert record["siren"] == SIREN
+    assert header["statut"] == 200
+    assert server.tokens == 2
+    assert [hit.headers["X-INSEE-Api-Key-Integration"] for hit in server.hits(f"/siren/{SIREN}")] == ["tok1", "tok2"]
+
+
+def test_unauthorized_twice_is_returned(server, client):
+    server.route(f"/siren/{SIREN}", lambda _: (401, UNAUTHORIZED))
+
+    assert client.get_by_number(data_type="siren", id_code=SIREN) is None
+    # One refresh, not a refresh loop
+    assert server.tokens == 2
+    assert len(server.hits(f"/siren/{SIREN}")) == 2
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_the_rejected_response_is_released_before_the_retry(server, client, transport, stream):
+    records = [unite_legale(siren_number(n)) for n in range(1, 3)]
+    server.add("/siren", 401, UNAUTHORIZED)
+    server.route("/siren", cursor_search(records))
+
+    assert len(list(client.iter_bulk(data_type="siren", stream=stream))) == len(records)
+    # The retry reuses the connection of the rejected (possibly streamed) response
+    assert transport.stats()["connections"] == 1
@@ -0,0 +1,139 @@
+"""TTL expiry, LRU eviction and counters of the response cache."""
+from __future__ import annotations
+
+import sqlite3
+import time
+
+import pytest
+
+from pyinsee import cache as cache_module
+from pyinsee.cache import TOUCH_INTERVAL, ResponseCache
+from pyinsee.insee_client import InseeClient
+
+from .conftest import unite_legale
+
+HEADER = {"statut": 200, "message": "OK"}
+
+
+class Clock:
+    """A settable `time.time`."""
+
+    def __init__(self) -> None:
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    """Freeze the time seen by the cache."""
+    clock = Clock()
+    monkeypatch.setattr(cache_module.time, "time", clock)
+    return clock
+
+
+def last_access(cache: ResponseCache, key: str) -> float:
+    """Read the recorded access time of an entry."""
+    with sqlite3.connect(cache.path) as connection:
+        return connection.execute("SELECT last_access FROM responses WHERE key = ?", (key,)).fetchone()[0]
+
+
+def test_entries_expire_after_the_ttl(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=0.1)
+    cache.set("a", {"siren": "1"}, HEADER)
+
+    assert cache.get("a") == ({"siren": "1"}, HEADER)
+    time.sleep(0.15)
+    assert cache.get("a") is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "entries": 1}
+
+
+def test_entries_without_ttl_never_expire(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=None)
+    cache.set("a", {"siren": "1"}, HEADER)
+
+    clock.now += 10 * 365 * 24 * 3600
+    assert cache.get("a") is not None
+
+
+def test_the_least_recently_used_entry_is_evicted(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=None, max_entries=3)
+    for key in ("a", "b", "c"):
+        cache.set(key, {"siren": key}, HEADER)
+        clock.now += 1
+
+    # "a" is read again once its access is older than TOUCH_INTERVAL: "b" is now the oldest
+    clock.now += TOUCH_INTERVAL
+    assert cache.get("a") is not None
+    cache.set("d", {"siren": "d"}, HEADER)
+
+    assert [key for key in ("a", "b", "c", "d") if cache.get(key) is not None] == ["a", "c", "d"]
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["entries"] == 3
+
+
+def test_recent_hits_are_read_only(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=None, max_entries=2)
+    cache.set("a", {"siren": "a"}, HEADER)
+    written = clock.now
+
+    clock.now += TOUCH_INTERVAL / 2
+    assert cache.get("a") is not None
+    assert last_access(cache, "a") == written
+
+    clock.now += TOUCH_INTERVAL / 2
+    assert cache.get("a") is not None
+    assert last_access(cache, "a") == clock.now
+
+
+def test_hits_within_the_touch_interval_do_not_save_an_entry_from_eviction(tmp_path, clock):
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=None, max_entries=2)
+    cache.set("a", {"siren": "a"}, HEADER)
+    clock.now += 1
+    cache.set("b", {"siren": "b"}, HEADER)
+    clock.now += 1
+    assert cache.get("a") is not None
+
+    cache.set("c", {"siren": "c"}, HEADER)
+
+    assert cache.get("a") is None
+    assert cache.get("b") is not None
+
+
+def test_stats_count_hits_and_misses(tmp_path):
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=60)
+    cache.set("a", {"siren": "a"}, HEADER)
+
+    for key in ("a", "a", "b", "a", "c"):
+        cache.get(key)
+
+    assert cache.stats() == {"hits": 3, "misses": 2, "evictions": 0, "entries": 1}
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+
+
+def test_keys_normalize_the_query():
+    assert ResponseCache.make_key("siren", 325175, {"champs": ["siren", "denominationUniteLegale"]}) == \
+        ResponseCache.make_key("siren", "325175", {"champs": "siren,denominationUniteLegale"})
+    assert ResponseCache.make_key("siren", "1", {"masquerValeursNulles": True}) != \
+        ResponseCache.make_key("siren", "1", {})
+
+
+def test_invalid_max_entries_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="max_entries"):
+        ResponseCache(tmp_path / "cache.sqlite", max_entries=0)
+
+
+def test_client_lookups_are_served_from_the_cache(server, transport, token_manager, tmp_path):
+    siren = "000325175"
+    server.route(f"/siren/{siren}", lambda _: (200, {"header": HEADER, "uniteLegale": unite_legale(siren)}))
+    cache = ResponseCache(tmp_path / "cache.sqlite", ttl=60)
+    client = InseeClient(transport=transport, base_url=f"{server.url}/", token_manager=token_manager, cache=cache)
+
+    first = client.get_by_number(data_type="siren", id_code=siren)
+    second = client.get_by_number(data_type="siren", id_code=siren)
+
+    assert first == second
+    assert len(server.hits(f"/siren/{siren}")) == 1
+    assert cache.stats()["hits"] == 1
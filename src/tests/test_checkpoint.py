@@ -0,0 +1,123 @@
+"""The checkpoint journal and resumed `InseeClient.iter_bulk` exports."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from pyinsee.checkpoint import CheckpointJournal
+
+from .conftest import cursor_search, siren_number, unite_legale
+
+
+@pytest.fixture
+def records(server) -> list[dict]:
+    """Seven records served by the stand-in's search endpoint."""
+    records = [unite_legale(siren_number(n)) for n in range(1, 8)]
+    server.route("/siren", cursor_search(records))
+    return records
+
+
+def sirens(records: list[dict]) -> list[str]:
+    """The SIREN numbers of records, in order."""
+    return [record["siren"] for record in records]
+
+
+def cursors(server) -> list[str]:
+    """The cursors of the searches received, in order."""
+    return [hit.params["curseur"] for hit in server.hits("/siren")]
+
+
+def page(number: int, fingerprint: str = "query") -> dict:
+    """A journal entry."""
+    return {"fingerprint": fingerprint, "page": number, "curseur": str(number - 1), "curseurSuivant": str(number)}
+
+
+def test_the_fingerprint_ignores_the_cursor():
+    fingerprint = CheckpointJournal.fingerprint("siren", {"q": "siren:1*", "nombre": 3})
+
+    assert CheckpointJournal.fingerprint("siren", {"nombre": 3, "q": "siren:1*", "curseur": "AoE"}) == fingerprint
+    assert CheckpointJournal.fingerprint("siret", {"q": "siren:1*", "nombre": 3}) != fingerprint
+    assert CheckpointJournal.fingerprint("siren", {"q": "siren:1*", "nombre": 4}) != fingerprint
+
+
+def test_entries_are_appended_with_the_context(tmp_path):
+    journal = CheckpointJournal(tmp_path, context={"prefix": "segments/siren"})
+    journal.append(page(1))
+    journal.append(page(2))
+
+    assert [entry["page"] for entry in journal.entries("query")] == [1, 2]
+    assert journal.last("query")["prefix"] == "segments/siren"
+    assert journal.last("other") is None
+    journal.clear("query")
+    assert journal.entries("query") == []
+
+
+def test_a_line_cut_short_by_a_crash_is_ignored(tmp_path):
+    journal = CheckpointJournal(tmp_path)
+    journal.append(page(1))
+    with journal.path("query").open("a") as file:
+        file.write(json.dumps(page(2))[:20])
+
+    assert [entry["page"] for entry in journal.entries("query")] == [1]
+    # The next entry starts on a line of its own
+    journal.append(page(3))
+    assert [entry["page"] for entry in journal.entries("query")] == [1, 3]
+
+
+def test_buffered_entries_wait_for_the_commit(tmp_path):
+    journal = CheckpointJournal(tmp_path, buffered=True)
+    journal.append(page(1))
+    journal.append(page(2, fingerprint="other"))
+
+    assert journal.entries("query") == []
+    journal.commit()
+    assert [entry["page"] for entry in journal.entries("query")] == [1]
+    assert [entry["page"] for entry in journal.entries("other")] == [2]
+
+
+def test_mark_durable_writes_the_next_entry_through(tmp_path):
+    journal = CheckpointJournal(tmp_path, buffered=True)
+    journal.append(page(1))
+    journal.mark_durable()
+    # The page held by the consumer when its output became durable
+    journal.append(page(2))
+    journal.append(page(3))
+
+    assert [entry["page"] for entry in journal.entries("query")] == [1, 2]
+    journal.commit()
+    assert [entry["page"] for entry in journal.entries("query")] == [1, 2, 3]
+
+
+def test_resume_continues_after_the_last_recorded_page(server, client, records):
+    pages = client.iter_bulk(data_type="siren", by_page=True, resume=True, nombre=3)
+    next(pages)
+    next(pages)
+    # Interrupted while holding the second page: only the first one is done
+    pages.close()
+
+    last = CheckpointJournal().last(client.checkpoint_fingerprint("siren", nombre=3))
+    assert (last["page"], last["curseur"], last["curseurSuivant"], last["records"]) == (1, "*", "3", 3)
+
+    resumed = list(client.iter_bulk(data_type="siren", by_page=True, resume=True, nombre=3))
+
+    assert [sirens(page) for page, _ in resumed] == [sirens(records[3:6]), sirens(records[6:])]
+    assert cursors(server) == ["*", "3", "3", "6", "7"]
+
+
+def test_resume_of_a_complete_export_sends_nothing(server, client, records):
+    assert len(list(client.iter_bulk(data_type="siren", resume=True, nombre=3))) == len(records)
+    requests = len(server.hits("/siren"))
+
+    assert list(client.iter_bulk(data_type="siren", resume=True, nombre=3)) == []
+    assert len(server.hits("/siren")) == requests
+
+
+def test_exports_are_only_journaled_when_asked(server, client, records, tmp_path):
+    list(client.iter_bulk(data_type="siren", nombre=3))
+    assert CheckpointJournal().last(client.checkpoint_fingerprint("siren", nombre=3)) is None
+
+    journal = CheckpointJournal(directory=tmp_path / "journal")
+    list(client.iter_bulk(data_type="siren", checkpoint=journal, nombre=3))
+    assert [entry["page"] for entry in journal.entries(client.checkpoint_fingerprint("siren", nombre=3))] == [
+        1, 2, 3, 4]
@@ -0,0 +1,77 @@
+"""Incremental decoding of bulk responses with `JsonArrayStream`."""
+from __future__ import annotations
+
+import json
+
+import pytest
+
+from pyinsee.decoding import JsonArrayStream
+
+RECORDS = [
+    {"siren": "000000001", "denominationUniteLegale": "A, B [et] {C}"},
+    {"siren": "000000002", "denominationUniteLegale": 'Le "quoted" \\ name', "periodesUniteLegale": [{"x": [1, 2]}]},
+    {"siren": "000000003", "denominationUniteLegale": "Établissements éè"},
+]
+HEADER = {"statut": 200, "message": "OK", "total": 3, "curseur": "*", "curseurSuivant": "AoE"}
+
+
+def decode(document: bytes, chunk_size: int) -> tuple[list, dict, int]:
+    """Feed a document in chunks and collect the records, the rest and the count."""
+    stream = JsonArrayStream("unitesLegales")
+    records = []
+    for start in range(0, len(document), chunk_size):
+        records.extend(stream.feed(document[start:start + chunk_size]))
+    return records, stream.close(), stream.count
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 7, 64, 100_000])
+def test_records_are_decoded_whatever_the_chunk_boundaries(chunk_size):
+    document = json.dumps({"header": HEADER, "unitesLegales": RECORDS}, ensure_ascii=False).encode()
+
+    records, rest, count = decode(document, chunk_size)
+
+    assert records == RECORDS
+    assert rest == {"header": HEADER, "unitesLegales": []}
+    assert count == len(RECORDS)
+
+
+def test_every_split_point_of_a_document():
+    document = json.dumps({"header": HEADER, "unitesLegales": RECORDS[:2]}, indent=1).encode()
+    for split in range(len(document) + 1):
+        stream = JsonArrayStream("unitesLegales")
+        records = stream.feed(document[:split]) + stream.feed(document[split:])
+        assert records == RECORDS[:2], split
+        assert stream.close()["header"] == HEADER
+
+
+def test_the_rest_of_the_document_is_kept_around_the_array():
+    document = json.dumps({"header": HEADER, "unitesLegales": RECORDS,
+                           "facettes": [{"nom": "x", "unitesLegales": [1]}]}).encode()
+
+    records, rest, _ = decode(document, 5)
+
+    assert records == RECORDS
+    assert rest == {"header": HEADER, "unitesLegales": [], "facettes": [{"nom": "x", "unitesLegales": [1]}]}
+
+
+def test_a_key_inside_a_string_or_a_nested_object_is_not_the_array():
+    document = json.dumps({"header": {"message": '"unitesLegales": [', "unitesLegales": [0]},
+                           "unitesLegales": RECORDS[:1]}).encode()
+
+    records, rest, _ = decode(document, 4)
+
+    assert records == RECORDS[:1]
+    assert rest["header"] == {"message": '"unitesLegales": [', "unitesLegales": [0]}
+
+
+def test_empty_array_and_missing_array():
+    assert decode(b'{"header": {"total": 0}, "unitesLegales": []}', 3) == (
+        [], {"header": {"total": 0}, "unitesLegales": []}, 0)
+    assert decode(b'{"header": {"statut": 404}}', 3) == ([], {"header": {"statut": 404}}, 0)
+
+
+def test_a_truncated_document_raises():
+    stream = JsonArrayStream("unitesLegales")
+    stream.feed(json.dumps({"header": HEADER, "unitesLegales": RECORDS}).encode()[:-30])
+    with pytest.raises(ValueError, match="Truncated"):
+        stream.close()
@@ -0,0 +1,139 @@
+"""Partitions and the parallel, merged reads of `export_bulk`."""
+from __future__ import annotations
+
+import datetime as dt
+import re
+import threading
+import time
+
+import pytest
+
+from pyinsee.exceptions import InseeServerError
+from pyinsee.export import (
+    date_partitions,
+    department_partitions,
+    export_bulk,
+    siren_partitions,
+)
+
+from .conftest import cursor_search, siren_number, unite_legale
+
+RANGE = re.compile(r"(\w+):\[(\S+) TO (\S+)\]")
+
+
+def ranges(partitions: list[str]) -> list[tuple[str, str]]:
+    """The bounds of range queries."""
+    return [RANGE.fullmatch(partition).group(2, 3) for partition in partitions]
+
+
+def partitioned_search(records: list[dict], tri: str | None = None):
+    """Answer bulk searches restricted to a SIREN range, each on its own cursor.
+
+    Like the API, the records of a search are sorted on `tri`, then on the SIREN.
+    """
+    if tri:
+        records = sorted(records, key=lambda record: (record[tri], record["siren"]))
+    searches = {}
+
+    def handler(request) -> tuple:
+        low, high = RANGE.search(request.params["q"]).group(2, 3)
+        if (low, high) not in searches:
+            searches[low, high] = cursor_search([record for record in records if low <= record["siren"] <= high])
+        return searches[low, high](request)
+
+    return handler
+
+
+@pytest.fixture
+def records() -> list[dict]:
+    """Records spread over the SIREN space, created on scattered dates."""
+    return [unite_legale(siren_number(n * 23_456_789),
+                         dateCreationUniteLegale=(dt.date(2000, 1, 1) + dt.timedelta(days=n * 7 % 40)).isoformat())
+            for n in range(1, 40)]
+
+
+@pytest.mark.parametrize("count", [1, 3, 7, 16])
+def test_siren_partitions_are_contiguous_and_disjoint(count):
+    bounds = [(int(low), int(high)) for low, high in ranges(siren_partitions(count))]
+
+    assert len(bounds) == count
+    assert bounds[0][0] == 0
+    assert bounds[-1][1] == 999_999_999
+    assert all(low <= high for low, high in bounds)
+    assert all(high + 1 == low for (_, high), (low, _) in zip(bounds, bounds[1:]))
+
+
+@pytest.mark.parametrize(("start", "end", "count"), [
+    ("2024-01-01", "2024-01-10", 3), ("2024-02-27", "2024-03-02", 2), ("2024-01-01", "2024-01-01", 4),
+    ("2000-01-01", "2023-12-31", 8),
+])
+def test_date_partitions_cover_every_day_once(start, end, count):
+    bounds = [(dt.date.fromisoformat(low), dt.date.fromisoformat(high))
+              for low, high in ranges(date_partitions("dateCreationUniteLegale", start, end, count))]
+
+    assert bounds[0][0].isoformat() == start
+    assert bounds[-1][1].isoformat() == end
+    assert all(low <= high for low, high in bounds)
+    assert all(high + dt.timedelta(days=1) == low for (_, high), (low, _) in zip(bounds, bounds[1:]))
+
+
+def test_invalid_partitions_are_rejected():
+    with pytest.raises(ValueError, match="after"):
+        date_partitions("dateCreationUniteLegale", "2024-01-02", "2024-01-01", 2)
+    with pytest.raises(ValueError, match="positive"):
+        siren_partitions(0)
+    assert department_partitions(["75", "2A"]) == ["codeCommuneEtablissement:75*", "codeCommuneEtablissement:2A*"]
+
+
+def test_sorted_exports_merge_in_the_single_cursor_order(server, client, records):
+    tri = "dateCreationUniteLegale"
+    server.route("/siren", partitioned_search(records, tri))
+
+    single = list(client.iter_bulk(data_type="siren", q="siren:[000000000 TO 999999999]", tri=tri, nombre=4))
+    merged = list(export_bulk(client, data_type="siren", partitions=siren_partitions(4), tri=tri, nombre=4))
+
+    assert [record["siren"] for record in merged] == [record["siren"] for record in single]
+    assert len(merged) == len(records)
+
+
+def test_unsorted_exports_yield_every_record_once(server, client, records):
+    server.route("/siren", partitioned_search(records))
+
+    exported = export_bulk(client, data_type="siren", partitions=siren_partitions(5), q="etat:A", nombre=3)
+
+    assert sorted(record["siren"] for record in exported) == sorted(record["siren"] for record in records)
+    assert all(hit.params["q"].startswith("(etat:A) AND siren:[") for hit in server.hits("/siren"))
+
+
+def test_a_failing_partition_reaches_the_consumer(server, client, records):
+    search = partitioned_search(records)
+
+    def handler(request) -> tuple:
+        if "500000000" in request.params["q"]:
+            return 503, {}
+        return search(request)
+
+    server.route("/siren", handler)
+
+    with pytest.raises(InseeServerError):
+        list(export_bulk(client, data_type="siren", partitions=siren_partitions(2), nombre=3))
+
+
+def test_closing_the_export_stops_the_workers(server, client, records):
+    server.route("/siren", partitioned_search(records))
+
+    exported = export_bulk(client, data_type="siren", partitions=siren_partitions(3), prefetch=1, nombre=1)
+    next(exported)
+    exported.close()
+
+    deadline = time.monotonic() + 5
+    while any(thread.name.startswith("insee-export-") for thread in threading.enumerate()):
+        assert time.monotonic() < deadline, "the export workers are still running"
+        time.sleep(0.05)
+    # The workers stopped reading ahead instead of paging through every partition
+    assert len(server.hits("/siren")) < len(records)
+
+
+def test_resumed_exports_are_rejected(client):
+    with pytest.raises(ValueError, match="resumed"):
+        next(export_bulk(client, partitions=siren_partitions(2), resume=True))
@@ -0,0 +1,142 @@
+"""Local facets and counts of `FacetIndex`, with and without NumPy."""
+from __future__ import annotations
+
+from collections import Counter
+
+import pytest
+
+from pyinsee import facets
+from pyinsee.facets import ENCODE_ATTEMPTS, FacetIndex
+from pyinsee.query import parse_query, record_fields
+from pyinsee.store import RecordStore
+
+from .conftest import siren_number
+
+FIELDS = ["activitePrincipaleUniteLegale", "trancheEffectifsUniteLegale", "categorieEntreprise",
+          "etatAdministratifUniteLegale"]
+QUERIES = [
+    "etatAdministratifUniteLegale:A",
+    "periode(activitePrincipaleUniteLegale:62.01Z) AND NOT categorieEntreprise:PME",
+    "trancheEffectifsUniteLegale:[01 TO 11] OR activitePrincipaleUniteLegale:47*",
+    "categorieEntreprise:GE OR etatAdministratifUniteLegale:C",
+]
+
+
+def unite_legale(number: int) -> dict:
+    """A record with scattered codes, some of them missing."""
+    return {
+        "siren": siren_number(number),
+        "trancheEffectifsUniteLegale": (None, "00", "01", "02", "11")[number % 5],
+        "categorieEntreprise": (None, "PME", "ETI", "GE")[number % 4],
+        "periodesUniteLegale": [
+            {"dateFin": None, "etatAdministratifUniteLegale": "AACA"[number % 4],
+             "activitePrincipaleUniteLegale": ("62.01Z", "47.11B", "70.22Z")[number % 3]},
+            {"dateFin": "2019-12-31", "etatAdministratifUniteLegale": "A", "activitePrincipaleUniteLegale": "62.01Z"},
+        ],
+    }
+
+
+@pytest.fixture(params=["numpy", "no numpy"])
+def numpy(request, monkeypatch) -> None:
+    """Run with NumPy, and with the standard library fallback."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(facets, "np", None)
+
+
+@pytest.fixture
+def records() -> list[dict]:
+    """Sixty records."""
+    return [unite_legale(number) for number in range(1, 61)]
+
+
+@pytest.fixture
+def index(tmp_path, records, numpy) -> FacetIndex:
+    """The facet index of a store holding the records."""
+    store = RecordStore(directory=tmp_path / "store")
+    store.put_many("siren", records)
+    yield FacetIndex.for_store(store, "siren")
+    store.close()
+
+
+def brute_force(records: list[dict], fields: list[str], q: str | None = None) -> list[dict]:
+    """Count the values of each field with a Counter, over the current values of the matching records."""
+    query = parse_query(q) if q else None
+    rows = [record_fields(record)[0] for record in records]
+    # The index evaluates `periode(...)` against the current period
+    rows = [row for row in rows if query is None or query.root.matches(row, [row])]
+    result = []
+    for field in fields:
+        counter = Counter(row.get(field) for row in rows)
+        missing = counter.pop(None, 0)
+        valeurs = sorted(counter.items(), key=lambda item: (-item[1], item[0]))
+        result.append({"nom": field, "total": len(rows), "manquants": missing, "modalites": len(valeurs),
+                       "valeurs": [{"valeur": valeur, "nombre": nombre} for valeur, nombre in valeurs]})
+    return result
+
+
+def test_facettes_match_a_brute_force_count(index, records):
+    assert index.facettes(FIELDS) == brute_force(records, FIELDS)
+    assert index.facettes(",".join(FIELDS[:2])) == brute_force(records, FIELDS[:2])
+
+
+@pytest.mark.parametrize("q", QUERIES)
+def test_filtered_facettes_and_counts_match_a_brute_force_count(index, records, q):
+    expected = brute_force(records, FIELDS, q)
+
+    assert index.facettes(FIELDS, q=q) == expected
+    assert index.count(q=q) == expected[0]["total"]
+
+
+def test_count_without_a_query(index, records):
+    assert index.count() == len(records)
+
+
+def test_encodings_are_rebuilt_when_the_source_changes(index, records):
+    assert index.facettes(["categorieEntreprise"]) == brute_force(records, ["categorieEntreprise"])
+
+    more = [unite_legale(number) for number in range(61, 70)]
+    index.source.store.put_many("siren", more)
+
+    assert index.count() == len(records) + len(more)
+    assert index.facettes(["categorieEntreprise"]) == brute_force(records + more, ["categorieEntreprise"])
+
+
+class ChangingSource:
+    """A source whose fingerprint changes `changes` times while it is read."""
+
+    name = "changing"
+
+    def __init__(self, changes: int) -> None:
+        self.changes = changes
+        self.version = 0
+        self.passes = 0
+
+    def fingerprint(self) -> str:
+        return str(self.version)
+
+    def rows(self, fields: list[str]):
+        self.passes += 1
+        if self.changes:
+            self.changes -= 1
+            self.version += 1
+        yield from ((f"value {number % 2}",) * len(fields) for number in range(4))
+
+
+def test_a_source_changing_once_is_read_again(tmp_path):
+    source = ChangingSource(changes=1)
+    index = FacetIndex(source, tmp_path / "facets")
+
+    assert index.facettes(["field"])[0]["valeurs"] == [{"valeur": "value 0", "nombre": 2},
+                                                       {"valeur": "value 1", "nombre": 2}]
+    assert source.passes == 2
+
+
+def test_a_source_that_keeps_changing_raises(tmp_path):
+    source = ChangingSource(changes=1000)
+    index = FacetIndex(source, tmp_path / "facets")
+
+    with pytest.raises(RuntimeError, match="changed while it was read"):
+        index.count()
+    assert source.passes == ENCODE_ATTEMPTS
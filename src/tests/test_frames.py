@@ -0,0 +1,115 @@
+"""Typed columns of `ColumnarFrame` and its NumPy, pandas and Arrow conversions."""
+from __future__ import annotations
+
+import datetime as dt
+from array import array
+
+import pytest
+
+from pyinsee.frames import NULL_INT, ColumnarFrame, field_kind, record_fields
+
+COLUMNS = ["siren", "dateCreationUniteLegale", "dateDernierTraitementUniteLegale", "nombrePeriodesUniteLegale",
+           "categorieJuridiqueUniteLegale", "unitePurgeeUniteLegale"]
+RECORDS = [
+    {"siren": "000000001", "dateCreationUniteLegale": "2001-02-03", "nombrePeriodesUniteLegale": 3,
+     "dateDernierTraitementUniteLegale": "2024-05-02T10:31:07", "unitePurgeeUniteLegale": True,
+     "periodesUniteLegale": [{"dateFin": None, "categorieJuridiqueUniteLegale": "5710"}]},
+    {"siren": "000000002", "dateCreationUniteLegale": None, "nombrePeriodesUniteLegale": None,
+     "dateDernierTraitementUniteLegale": None, "unitePurgeeUniteLegale": None,
+     "periodesUniteLegale": [{"dateFin": None, "categorieJuridiqueUniteLegale": None}]},
+    {"siren": "000000003", "dateCreationUniteLegale": "1970-01-01", "nombrePeriodesUniteLegale": 1,
+     "dateDernierTraitementUniteLegale": "1970-01-01T00:01:00", "unitePurgeeUniteLegale": False,
+     "periodesUniteLegale": [{"dateFin": None, "categorieJuridiqueUniteLegale": "5710"}]},
+]
+
+
+@pytest.fixture
+def frame() -> ColumnarFrame:
+    """A frame of the three records."""
+    return ColumnarFrame.from_records(RECORDS, columns=COLUMNS)
+
+
+def test_columns_are_stored_typed(frame):
+    assert len(frame) == 3
+    assert [(name, column.kind) for name, column in frame.columns.items()] == [
+        ("siren", "str"), ("dateCreationUniteLegale", "date"), ("dateDernierTraitementUniteLegale", "datetime"),
+        ("nombrePeriodesUniteLegale", "int"), ("categorieJuridiqueUniteLegale", "category"),
+        ("unitePurgeeUniteLegale", "bool")]
+
+    assert frame["siren"].values == ["000000001", "000000002", "000000003"]
+    assert frame["dateCreationUniteLegale"].values == array("q", [
+        (dt.date(2001, 2, 3) - dt.date(1970, 1, 1)).days, NULL_INT, 0])
+    assert frame["dateDernierTraitementUniteLegale"].values == array("q", [
+        int(dt.datetime(2024, 5, 2, 10, 31, 7, tzinfo=dt.timezone.utc).timestamp()), NULL_INT, 60])
+    assert frame["nombrePeriodesUniteLegale"].values == array("q", [3, NULL_INT, 1])
+    # Categories come from the current period, dictionary encoded
+    assert frame["categorieJuridiqueUniteLegale"].values == array("i", [0, -1, 0])
+    assert frame["categorieJuridiqueUniteLegale"].categories == ["5710"]
+    assert frame["unitePurgeeUniteLegale"].values == array("b", [1, -1, 0])
+
+
+def test_invalid_values_are_stored_as_nulls():
+    frame = ColumnarFrame.from_records([{"dateCreationUniteLegale": "2001-13-45", "anneeEffectifsUniteLegale": "n/a"}])
+
+    assert frame["dateCreationUniteLegale"].values == array("q", [NULL_INT])
+    assert frame["anneeEffectifsUniteLegale"].values == array("q", [NULL_INT])
+
+
+def test_columns_default_to_the_fields_of_the_first_record():
+    assert record_fields(RECORDS[0]) == [
+        "siren", "dateCreationUniteLegale", "nombrePeriodesUniteLegale", "dateDernierTraitementUniteLegale",
+        "unitePurgeeUniteLegale", "dateFin", "categorieJuridiqueUniteLegale"]
+    assert list(ColumnarFrame.from_records(RECORDS).columns) == record_fields(RECORDS[0])
+    assert list(ColumnarFrame("siren, dateCreationUniteLegale").columns) == ["siren", "dateCreationUniteLegale"]
+    assert (field_kind("dateFin"), field_kind("codePostalEtablissement"), field_kind("siret")) == (
+        "date", "category", "str")
+
+
+def test_to_numpy(frame):
+    np = pytest.importorskip("numpy")
+    arrays = frame.to_numpy()
+
+    assert arrays["dateCreationUniteLegale"].dtype == np.dtype("datetime64[D]")
+    assert arrays["dateCreationUniteLegale"][0] == np.datetime64("2001-02-03")
+    assert np.isnat(arrays["dateCreationUniteLegale"][1])
+    assert arrays["dateDernierTraitementUniteLegale"][0] == np.datetime64("2024-05-02T10:31:07")
+    assert np.isnat(arrays["dateDernierTraitementUniteLegale"][1])
+    assert arrays["categorieJuridiqueUniteLegale"].tolist() == [0, -1, 0]
+    assert arrays["nombrePeriodesUniteLegale"].tolist() == [3, NULL_INT, 1]
+    assert arrays["siren"].dtype == object
+    # The numeric buffers are shared with the columns
+    assert not arrays["nombrePeriodesUniteLegale"].flags.owndata
+
+
+def test_to_pandas(frame):
+    pd = pytest.importorskip("pandas")
+    df = frame.to_pandas()
+
+    assert df["dateCreationUniteLegale"].tolist()[0] == pd.Timestamp("2001-02-03")
+    assert df["dateCreationUniteLegale"].isna().tolist() == [False, True, False]
+    assert df["dateDernierTraitementUniteLegale"].isna().tolist() == [False, True, False]
+    assert isinstance(df["categorieJuridiqueUniteLegale"].dtype, pd.CategoricalDtype)
+    assert df["categorieJuridiqueUniteLegale"].tolist()[::2] == ["5710", "5710"]
+    assert df["categorieJuridiqueUniteLegale"].isna().tolist() == [False, True, False]
+    assert str(df["nombrePeriodesUniteLegale"].dtype) == "Int64"
+    assert df["nombrePeriodesUniteLegale"].isna().tolist() == [False, True, False]
+    assert str(df["unitePurgeeUniteLegale"].dtype) == "boolean"
+    assert df["unitePurgeeUniteLegale"].tolist()[::2] == [True, False]
+
+
+def test_to_arrow(frame):
+    pa = pytest.importorskip("pyarrow")
+    table = frame.to_arrow()
+
+    assert table.schema.field("dateCreationUniteLegale").type == pa.date32()
+    assert table.schema.field("dateDernierTraitementUniteLegale").type == pa.timestamp("s")
+    assert pa.types.is_dictionary(table.schema.field("categorieJuridiqueUniteLegale").type)
+    assert table.to_pydict() == {
+        "siren": ["000000001", "000000002", "000000003"],
+        "dateCreationUniteLegale": [dt.date(2001, 2, 3), None, dt.date(1970, 1, 1)],
+        "dateDernierTraitementUniteLegale": [dt.datetime(2024, 5, 2, 10, 31, 7), None,
+                                             dt.datetime(1970, 1, 1, 0, 1)],
+        "nombrePeriodesUniteLegale": [3, None, 1],
+        "categorieJuridiqueUniteLegale": ["5710", None, "5710"],
+        "unitePurgeeUniteLegale": [True, None, False],
+    }
@@ -0,0 +1,87 @@
+"""Batched lookups with `InseeClient.get_many`."""
+from __future__ import annotations
+
+import re
+
+import pytest
+
+from .conftest import siren_number, unite_legale
+
+
+def batch_ids(request) -> list[str]:
+    """The identifiers of a `q=siren:(A OR B ...)` batch."""
+    return re.findall(r"\d{9}", request.params["q"])
+
+
+def search(known: set[str], max_batch: int | None = None, status: int = 413):
+    """Answer batches with the known records, newest first, rejecting batches over `max_batch`."""
+    def handler(request) -> tuple:
+        ids = batch_ids(request)
+        if max_batch is not None and len(ids) > max_batch:
+            return status, {"header": {"statut": status, "message": "Too large"}}
+        records = [unite_legale(id_code) for id_code in reversed(ids) if id_code in known]
+        if not records:
+            return 404, {"header": {"statut": 404, "message": "Aucun élément trouvé"}}
+        return 200, {"header": {"statut": 200, "message": "OK", "total": len(records)}, "unitesLegales": records}
+    return handler
+
+
+def test_records_come_back_in_input_order(server, client):
+    ids = [siren_number(n) for n in range(1, 8)]
+    server.route("/siren", search(set(ids[::2])))
+
+    records, missing = client.get_many(data_type="siren", ids=[*ids, ids[0]])
+
+    assert [record["siren"] for record in records] == ids[::2]
+    assert missing == ids[1::2]
+    hit, = server.hits("/siren")
+    assert hit.method == "POST"
+    assert batch_ids(hit) == ids
+    assert hit.params["nombre"] == str(len(ids))
+
+
+def test_batches_are_split_by_batch_size(server, client):
+    ids = [siren_number(n) for n in range(1, 6)]
+    server.route("/siren", search(set(ids)))
+
+    records, missing = client.get_many(data_type="siren", ids=ids, batch_size=2)
+
+    assert [record["siren"] for record in records] == ids
+    assert missing == []
+    assert [len(batch_ids(hit)) for hit in server.hits("/siren")] == [2, 2, 1]
+
+
+@pytest.mark.parametrize("status", [413, 414])
+def test_batches_are_halved_when_rejected_as_too_large(server, client, status):
+    ids = [siren_number(n) for n in range(1, 11)]
+    server.route("/siren", search(set(ids), max_batch=3, status=status))
+
+    records, missing = client.get_many(data_type="siren", ids=ids)
+
+    assert [record["siren"] for record in records] == ids
+    assert missing == []
+    # 10 is rejected, then 5, then batches of 2 go through
+    assert [len(batch_ids(hit)) for hit in server.hits("/siren")] == [10, 5, 2, 2, 2, 2, 2]
+
+
+def test_batches_with_no_match_are_skipped(server, client):
+    ids = [siren_number(n) for n in range(1, 5)]
+    server.route("/siren", search({ids[3]}))
+
+    records, missing = client.get_many(data_type="siren", ids=ids, batch_size=2)
+
+    assert [record["siren"] for record in records] == [ids[3]]
+    assert missing == ids[:3]
+
+
+def test_failing_batches_raise(server, client):
+    server.route("/siren", lambda _: (400, {"header": {"statut": 400, "message": "Erreur de syntaxe"}}))
+
+    with pytest.raises(ValueError, match="response code 400"):
+        client.get_many(data_type="siren", ids=[siren_number(1)])
+
+
+def test_invalid_identifiers_are_rejected_before_any_request(server, client):
+    with pytest.raises(ValueError, match="Invalid SIREN number"):
+        client.get_many(data_type="siren", ids=[siren_number(1), "12345678"])
+    assert server.requests == []
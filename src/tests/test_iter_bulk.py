@@ -0,0 +1,80 @@
+"""Cursor paging of `InseeClient.iter_bulk` and of `insee_get_bulk --all`."""
+from __future__ import annotations
+
+import sys
+
+import pytest
+
+from pyinsee import insee_cli
+
+from .conftest import cursor_search, siren_number, unite_legale
+
+
+@pytest.fixture
+def records(server) -> list[dict]:
+    """Seven records served by the stand-in's search endpoint."""
+    records = [unite_legale(siren_number(n)) for n in range(1, 8)]
+    server.route("/siren", cursor_search(records))
+    return records
+
+
+def sirens(records: list[dict]) -> list[str]:
+    """The SIREN numbers of records, in order."""
+    return [record["siren"] for record in records]
+
+
+def cursors(server) -> list[str]:
+    """The cursors of the searches received, in order."""
+    return [hit.params["curseur"] for hit in server.hits("/siren")]
+
+
+def test_records_follow_the_cursor(server, client, records):
+    assert sirens(client.iter_bulk(data_type="siren", nombre=3)) == sirens(records)
+    assert cursors(server) == ["*", "3", "6", "7"]
+
+
+def test_pages_skip_the_empty_last_page(server, client, records):
+    pages = list(client.iter_bulk(data_type="siren", by_page=True, nombre=3))
+
+    assert [sirens(page) for page, _ in pages] == [sirens(records[:3]), sirens(records[3:6]), sirens(records[6:])]
+    assert pages[0][1]["curseurSuivant"] == "3"
+
+
+def test_streamed_records_follow_the_cursor(server, client, records):
+    assert sirens(client.iter_bulk(data_type="siren", stream=True, nombre=3)) == sirens(records)
+    assert cursors(server) == ["*", "3", "6", "7"]
+
+
+def test_pages_default_to_the_maximum_page_size(server, client, records):
+    assert sirens(client.iter_bulk(data_type="siren")) == sirens(records)
+    assert {hit.params["nombre"] for hit in server.hits("/siren")} == {"1000"}
+
+
+def test_nothing_matches(server, client):
+    assert list(client.iter_bulk(data_type="siren", q="siren:000000000")) == []
+
+
+def test_a_failing_page_after_the_first_raises(server, client):
+    records = [unite_legale(siren_number(n)) for n in range(1, 5)]
+    serve = cursor_search(records)
+    server.route("/siren", lambda request: serve(request) if request.params["curseur"] == "*" else (400, {}))
+
+    with pytest.raises(ValueError, match="Failed to fetch page 2"):
+        list(client.iter_bulk(data_type="siren", nombre=2))
+
+
+def test_debut_cannot_be_combined_with_the_cursor(client):
+    with pytest.raises(ValueError, match="'debut'"):
+        list(client.iter_bulk(data_type="siren", debut=10))
+
+
+@pytest.mark.parametrize(("options", "page_size"), [([], "1000"), (["--nombre", "2"], "2")])
+def test_cli_all_pages_at_the_maximum_page_size_unless_nombre_is_given(shared_api, records, monkeypatch,
+                                                                       capsys, options, page_size):
+    monkeypatch.setattr(sys, "argv", ["py-insee", "insee_get_bulk", "siren", "json", "--all", *options])
+
+    insee_cli.main()
+
+    assert {hit.params["nombre"] for hit in shared_api.hits("/siren")} == {page_size}
+    output = capsys.readouterr().out
+    assert all(record["siren"] in output for record in records)
@@ -0,0 +1,138 @@
+"""Logging set up on first use: sampling, JSON records, the queue mode and invalid settings."""
+from __future__ import annotations
+
+import itertools
+import json
+import logging
+import logging.handlers
+from pathlib import Path
+
+import pytest
+
+from pyinsee import config
+from pyinsee import logger as logger_module
+from pyinsee.logger import (
+    JsonFormatter,
+    log_request,
+    logger,
+    setup_logging,
+    shutdown_logging,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_logging(monkeypatch):
+    """Start from logging as it is after the import, and put the previous setup back afterwards."""
+    root = logging.getLogger()
+    root_handlers, root_level = list(root.handlers), root.level
+    package_handlers, package_level = list(logger.handlers), logger.level
+    monkeypatch.setattr(logger_module, "_setup_done", False)
+    monkeypatch.setattr(logger_module, "_listener", None)
+    monkeypatch.setattr(logger_module, "_sample_every", 1)
+    monkeypatch.setattr(logger_module, "_sample_counter", itertools.count())
+    root.handlers = []
+    logger.handlers = [logger_module._setup_handler]
+    logger.setLevel(logging.DEBUG)
+    yield
+    shutdown_logging()
+    for handler in root.handlers:
+        handler.close()
+    root.handlers = root_handlers
+    root.setLevel(root_level)
+    logger.handlers = package_handlers
+    logger.setLevel(package_level)
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    """The directory of the log file."""
+    return tmp_path / "logs"
+
+
+def read_json_log(log_dir) -> list[dict]:
+    """The records of the JSON log file."""
+    return [json.loads(line) for line in (log_dir / "insee_client.log").read_text(encoding="utf-8").splitlines()]
+
+
+def test_the_first_record_sets_logging_up(settings):
+    logger.info("first")
+
+    assert logger_module._setup_done
+    assert logger_module._setup_handler not in logger.handlers
+    assert {type(handler) for handler in logging.getLogger().handlers} == {
+        logging.handlers.RotatingFileHandler, logging.StreamHandler}
+    log_file = Path(settings.data_dir, "logs", "insee_client.log")
+    assert "first" in log_file.read_text(encoding="utf-8")
+
+
+def test_log_request_samples_the_messages(log_dir):
+    setup_logging(log_dir, console_level="CRITICAL", log_format="json", sample_rate=0.25)
+
+    for number in range(12):
+        log_request(logging.INFO, "request %d", number, number=number)
+    # Warnings are never sampled
+    logger.warning("retrying")
+
+    assert [entry["message"] for entry in read_json_log(log_dir)] == [
+        "request 0", "request 4", "request 8", "retrying"]
+
+
+def test_an_invalid_sample_rate_is_rejected(log_dir):
+    with pytest.raises(ValueError, match="sample rate"):
+        setup_logging(log_dir, sample_rate=2)
+    assert not logger_module._setup_done
+
+
+def test_json_records_carry_the_extra_fields(log_dir):
+    setup_logging(log_dir, console_level="CRITICAL", log_format="json")
+
+    log_request(logging.INFO, "GET %s", "https://api/siren", method="GET", url="https://api/siren",
+                data_type="siren", elapsed=0.25)
+    try:
+        1 / 0  # noqa: B018
+    except ZeroDivisionError:
+        logger.exception("failed")
+
+    request, failure = read_json_log(log_dir)
+    assert set(request) == {"time", "level", "logger", "message", "method", "url", "data_type", "elapsed"}
+    assert request["message"] == "GET https://api/siren"
+    assert (request["level"], request["logger"]) == ("INFO", "pyinsee.logger")
+    assert (request["method"], request["data_type"], request["elapsed"]) == ("GET", "siren", 0.25)
+    assert "ZeroDivisionError" in failure["exception"]
+
+
+def test_json_formatter_keeps_non_serializable_fields_as_text():
+    record = logging.LogRecord("pyinsee", logging.INFO, __file__, 1, "saved", (), None)
+    record.path = Path("data", "raw")
+
+    assert json.loads(JsonFormatter().format(record))["path"] == str(Path("data", "raw"))
+
+
+def test_the_queue_mode_is_drained_on_shutdown(log_dir):
+    setup_logging(log_dir, console_level="CRITICAL", mode="queue", log_format="json")
+    listener = logger_module._listener
+    (handler,) = logging.getLogger().handlers
+    assert isinstance(handler, logging.handlers.QueueHandler)
+
+    for number in range(500):
+        log_request(logging.DEBUG, "request %d", number)
+    shutdown_logging()
+
+    assert logger_module._listener is None
+    assert listener._thread is None
+    assert [entry["message"] for entry in read_json_log(log_dir)] == [f"request {number}" for number in range(500)]
+    # A second shutdown does nothing
+    shutdown_logging()
+
+
+def test_invalid_settings_are_reported_once(settings, monkeypatch, capsys):
+    monkeypatch.setattr(config, "_settings", settings.replace(insee_log_mode="fast"))
+
+    logger.info("first")
+    logger.info("second")
+
+    assert "Invalid logging mode: fast" in capsys.readouterr().err
+    assert not logger_module._setup_done
+    # Logging goes on without the setup
+    assert logger.handlers == []
+    assert capsys.readouterr().err == ""
@@ -0,0 +1,145 @@
+"""Request metrics: built-in counters and histograms, the Prometheus text file and hooks."""
+from __future__ import annotations
+
+import logging
+
+import pytest
+
+from pyinsee.metrics import LATENCY_BUCKETS, RECORDS_BUCKETS, endpoint_label
+
+from .conftest import siren_number, unite_legale
+
+SIREN = siren_number(1)
+
+
+@pytest.fixture
+def lookup(server):
+    """The lookup of one legal unit, failing with a 503 the first time."""
+    responses = [(503, {}), (200, {"header": {"statut": 200, "message": "OK"}, "uniteLegale": unite_legale(SIREN)})]
+    server.route(f"/siren/{SIREN}", lambda _: responses.pop(0))
+    return server
+
+
+def samples(snapshot: dict, name: str) -> dict:
+    """The samples of a metric, by their label values."""
+    return {tuple(sample["labels"].values()): sample for sample in snapshot[name]}
+
+
+def test_a_request_updates_the_snapshot(lookup, client, metrics):
+    client.get_by_number(data_type="siren", id_code=SIREN)
+    snapshot = metrics.snapshot()
+
+    requests = samples(snapshot, "pyinsee_requests_total")
+    assert {labels: sample["value"] for labels, sample in requests.items()} == {
+        ("GET", "siren/{id}", "503"): 1, ("GET", "siren/{id}", "200"): 1, ("POST", "token", "200"): 1}
+    assert samples(snapshot, "pyinsee_retries_total")[("siren/{id}", "server")]["value"] == 1
+    assert samples(snapshot, "pyinsee_token_refreshes_total")[("200",)]["value"] == 1
+    assert samples(snapshot, "pyinsee_response_bytes_total")[("siren/{id}",)]["value"] > 0
+    assert snapshot["pyinsee_requests_in_flight"] == [{"labels": {}, "value": 0}]
+
+    latency = samples(snapshot, "pyinsee_request_duration_seconds")[("siren/{id}", "200")]
+    assert latency["count"] == 1
+    assert list(latency["buckets"]) == [f"{bound:g}" for bound in LATENCY_BUCKETS] + ["+Inf"]
+    assert latency["buckets"]["+Inf"] == 1
+    assert 0 < latency["sum"] < LATENCY_BUCKETS[-1]
+
+
+def test_write_prometheus(lookup, client, metrics, tmp_path):
+    client.get_by_number(data_type="siren", id_code=SIREN)
+
+    path = metrics.write_prometheus(tmp_path / "textfile" / "pyinsee.prom")
+
+    assert [file.name for file in path.parent.iterdir()] == ["pyinsee.prom"]
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert "# TYPE pyinsee_requests_total counter" in lines
+    assert "# TYPE pyinsee_request_duration_seconds histogram" in lines
+    assert "# TYPE pyinsee_requests_in_flight gauge" in lines
+    assert 'pyinsee_requests_total{method="GET",endpoint="siren/{id}",status="503"} 1' in lines
+    assert 'pyinsee_retries_total{endpoint="siren/{id}",error_class="server"} 1' in lines
+    assert "pyinsee_requests_in_flight 0" in lines
+    buckets = [line for line in lines
+               if line.startswith('pyinsee_request_duration_seconds_bucket{endpoint="siren/{id}",status="200",')]
+    assert [line.split('le="')[1].split('"')[0] for line in buckets] == [
+        f"{bound:g}" for bound in LATENCY_BUCKETS] + ["+Inf"]
+    counts = [int(line.rsplit(" ", 1)[1]) for line in buckets]
+    assert counts == sorted(counts)
+    assert counts[-1] == 1
+    assert 'pyinsee_request_duration_seconds_count{endpoint="siren/{id}",status="200"} 1' in lines
+
+
+def test_histogram_buckets_are_cumulative(metrics):
+    for records in (0, 5, 20, 1000, 1500):
+        metrics.emit("page", data_type="siren", page=1, records=records, elapsed=0.1)
+
+    (page,) = metrics.snapshot()["pyinsee_page_records"]
+    assert page["labels"] == {"data_type": "siren"}
+    assert (page["count"], page["sum"]) == (5, 2525)
+    assert page["buckets"] == dict(zip([*map(str, RECORDS_BUCKETS), "+Inf"], [1, 1, 2, 3, 3, 3, 3, 3, 4, 5]))
+    text = metrics.prometheus_text()
+    assert 'pyinsee_page_records_bucket{data_type="siren",le="10"} 2\n' in text
+    assert 'pyinsee_page_records_sum{data_type="siren"} 2525\n' in text
+
+
+def test_label_values_are_escaped(metrics):
+    metrics.emit("throttle", endpoint="siren", reason='a "quoted"\\reason\n', wait=1.5)
+
+    assert 'pyinsee_throttle_wait_seconds_total{reason="a \\"quoted\\"\\\\reason\\n"} 1.5\n' in (
+        metrics.prometheus_text())
+
+
+def test_reset_keeps_the_in_flight_gauge(metrics):
+    metrics.emit("request_start", method="GET", url="https://api/siren", endpoint="siren", attempt=1)
+    metrics.emit("cache_hit", source="store", data_type="siren")
+
+    metrics.reset()
+
+    snapshot = metrics.snapshot()
+    assert snapshot["pyinsee_cache_hits_total"] == []
+    assert snapshot["pyinsee_requests_in_flight"] == [{"labels": {}, "value": 1}]
+
+
+def test_hooks_are_called_for_their_event(metrics):
+    calls = []
+    first = lambda event, fields: calls.append(("first", event, fields))
+    second = lambda event, fields: calls.append(("second", event, fields))
+    metrics.add_hook("cache_miss", first)
+    metrics.add_hook("cache_miss", second)
+    metrics.add_hook("retry", first)
+
+    metrics.emit("cache_miss", source="cache", data_type="siret")
+    metrics.remove_hook("cache_miss", first)
+    metrics.emit("cache_miss", source="store", data_type="siren")
+
+    assert calls == [("first", "cache_miss", {"source": "cache", "data_type": "siret"}),
+                     ("second", "cache_miss", {"source": "cache", "data_type": "siret"}),
+                     ("second", "cache_miss", {"source": "store", "data_type": "siren"})]
+    with pytest.raises(ValueError, match="Unknown metrics event"):
+        metrics.add_hook("response", first)
+
+
+def test_a_failing_hook_is_logged_and_ignored(metrics, caplog):
+    calls = []
+
+    def failing(event: str, fields: dict) -> None:
+        raise RuntimeError(event)
+
+    metrics.add_hook("cache_hit", failing)
+    metrics.add_hook("cache_hit", lambda event, _: calls.append(event))
+
+    with caplog.at_level(logging.ERROR, logger="pyinsee.logger"):
+        metrics.emit("cache_hit", source="store", data_type="siren")
+
+    assert calls == ["cache_hit"]
+    assert metrics.snapshot()["pyinsee_cache_hits_total"] == [{"labels": {"source": "store"}, "value": 1}]
+    (record,) = [record for record in caplog.records if "metrics hook" in record.getMessage()]
+    assert record.exc_info[0] is RuntimeError
+
+
+@pytest.mark.parametrize(("url", "endpoint"), [
+    ("https://api.insee.fr/api-sirene/3.11/siren", "siren"),
+    ("https://api.insee.fr/api-sirene/3.11/siret/55210055400013", "siret/{id}"),
+    ("https://api.insee.fr/token", "token"),
+    ("https://api.insee.fr/", "/"),
+])
+def test_endpoint_label(url, endpoint):
+    assert endpoint_label(url) == endpoint
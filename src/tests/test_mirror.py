@@ -0,0 +1,124 @@
+"""The local `SireneMirror` and its keyset (cursor) paging."""
+from __future__ import annotations
+
+import csv
+import gzip
+
+import pytest
+
+from pyinsee.insee_client import InseeClient
+from pyinsee.mirror import SireneMirror
+
+from .conftest import siren_number
+
+CATEGORIES = ("PME", "ETI", "GE")
+
+
+def write_stock(path, rows: list[dict]) -> None:
+    """Write a gzipped unités légales stock file."""
+    with gzip.open(path, "wt", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["siren", "denominationUniteLegale", "categorieEntreprise",
+                                               "etatAdministratifUniteLegale", "dateFin"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def stock_row(n: int) -> dict:
+    """The stock row of the n-th unité légale."""
+    return {"siren": siren_number(n), "denominationUniteLegale": f"SOCIETE {n}",
+            "categorieEntreprise": CATEGORIES[n % 3], "etatAdministratifUniteLegale": "A", "dateFin": ""}
+
+
+@pytest.fixture
+def mirror(tmp_path) -> SireneMirror:
+    """A mirror loaded with 25 unités légales, ingested in a shuffled order."""
+    write_stock(tmp_path / "StockUniteLegale.csv.gz", [stock_row(n) for n in (*range(25, 12, -1), *range(1, 13))])
+    mirror = SireneMirror(tmp_path / "mirror" / "sirene.sqlite")
+    assert mirror.ingest(tmp_path / "StockUniteLegale.csv.gz") == 25
+    return mirror
+
+
+def follow(mirror: SireneMirror, **kwargs: object) -> list[tuple[list[dict], dict]]:
+    """Read every page of a query by following the mirror's cursor."""
+    pages, cursor = [], "*"
+    while True:
+        page = mirror.get_bulk("siren", curseur=cursor, **kwargs)
+        if page is None:
+            return pages
+        pages.append(page)
+        if page[1]["curseurSuivant"] == cursor:
+            return pages
+        cursor = page[1]["curseurSuivant"]
+
+
+def test_records_have_the_api_structure(mirror):
+    record, header = mirror.get_by_number("siren", siren_number(7))
+
+    assert header["statut"] == 200
+    assert record["siren"] == siren_number(7)
+    assert record["categorieEntreprise"] == "ETI"
+    assert record["periodesUniteLegale"][0]["denominationUniteLegale"] == "SOCIETE 7"
+    assert mirror.get_by_number("siren", siren_number(99)) is None
+
+
+def test_the_cursor_pages_in_key_order(mirror):
+    pages = follow(mirror, nombre=4)
+
+    sirens = [record["siren"] for records, _ in pages for record in records]
+    assert sirens == [siren_number(n) for n in range(1, 26)]
+    assert [len(records) for records, _ in pages] == [4, 4, 4, 4, 4, 4, 1]
+    assert all(header["total"] == 25 for _, header in pages)
+    # The cursor stops changing on the last page, like the API's
+    assert pages[-1][1]["curseurSuivant"] == pages[-1][1]["curseur"]
+
+
+def test_the_cursor_pages_in_tri_order_with_a_query(mirror):
+    pages = follow(mirror, nombre=3, q="categorieEntreprise:(PME OR GE)", tri="categorieEntreprise")
+
+    records = [record for page_records, _ in pages for record in page_records]
+    expected = sorted((row for row in map(stock_row, range(1, 26)) if row["categorieEntreprise"] != "ETI"),
+                      key=lambda row: (row["categorieEntreprise"], row["siren"]))
+    assert [record["siren"] for record in records] == [row["siren"] for row in expected]
+    assert pages[0][1]["total"] == len(expected)
+
+
+def test_keyset_pages_are_stable_when_rows_are_added(mirror, tmp_path):
+    first, header = mirror.get_bulk("siren", curseur="*", nombre=5)
+    # A row sorting before the cursor is loaded while the query is paged
+    write_stock(tmp_path / "extra.csv.gz", [stock_row(0)])
+    mirror.ingest(tmp_path / "extra.csv.gz")
+
+    rest, cursor = [], header["curseurSuivant"]
+    while True:
+        records, header = mirror.get_bulk("siren", curseur=cursor, nombre=5)
+        rest.extend(records)
+        if header["curseurSuivant"] == cursor:
+            break
+        cursor = header["curseurSuivant"]
+
+    # Neither repeated nor skipped, as offset paging would
+    assert [record["siren"] for record in first + rest] == [siren_number(n) for n in range(1, 26)]
+
+
+def test_offset_pages(mirror):
+    records, header = mirror.get_bulk("siren", debut=20, nombre=10)
+
+    assert [record["siren"] for record in records] == [siren_number(n) for n in range(21, 26)]
+    assert (header["debut"], header["nombre"]) == (20, 5)
+    assert "curseurSuivant" not in header
+
+
+def test_invalid_cursors_and_tri_fields_are_rejected(mirror):
+    with pytest.raises(ValueError, match="Invalid mirror cursor"):
+        mirror.get_bulk("siren", curseur="not-a-cursor!")
+    with pytest.raises(ValueError, match="Unknown 'tri'"):
+        mirror.get_bulk("siren", tri="nomUniteLegale")
+
+
+def test_the_mirror_backend_follows_the_cursor(mirror):
+    client = InseeClient(backend="mirror", mirror=mirror)
+
+    sirens = [record["siren"] for record in client.iter_bulk(data_type="siren", nombre=7,
+                                                               q="categorieEntreprise:PME")]
+
+    assert sirens == [siren_number(n) for n in range(1, 26) if n % 3 == 0]
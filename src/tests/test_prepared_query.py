@@ -0,0 +1,110 @@
+"""Encoding and rebinding of `PreparedQuery`."""
+from __future__ import annotations
+
+import pytest
+
+from pyinsee.query import parse_query
+from pyinsee.utils import PreparedQuery
+
+from .conftest import siren_number, unite_legale
+
+TYPES = {"q": str, "nombre": int, "curseur": str, "champs": (str, list)}
+
+
+class Validator:
+    """A validator counting the values it checks."""
+
+    def __init__(self) -> None:
+        self.values = []
+
+    def __call__(self, value: str) -> None:
+        self.values.append(value)
+        parse_query(value)
+
+
+@pytest.mark.parametrize(("q", "encoded"), [
+    ("denominationUniteLegale:ACME SAS", "denominationUniteLegale:ACME%20SAS"),
+    ("periode(etatAdministratifUniteLegale:A)", "periode%28etatAdministratifUniteLegale:A%29"),
+    ("denominationUniteLegale:A&B", "denominationUniteLegale:A%26B"),
+    ("denominationUniteLegale:A+B", "denominationUniteLegale:A%2BB"),
+    ("denominationUniteLegale:A#1", "denominationUniteLegale:A%231"),
+    ("siren:0* AND nombrePeriodesUniteLegale:[1 TO 3]", "siren:0*%20AND%20nombrePeriodesUniteLegale:%5B1%20TO%203%5D"),
+])
+def test_q_is_percent_encoded(q, encoded):
+    prepared = PreparedQuery({"q": q, "nombre": 20}, TYPES, base_url="http://api/siren")
+
+    assert prepared.query_string() == f"q={encoded}&nombre=20"
+    assert prepared.params() == {"q": q, "nombre": "20"}
+
+
+@pytest.mark.parametrize(("cursor", "encoded"), [
+    ("*", "*"), ("AoEpMDAwMzI1MTc1", "AoEpMDAwMzI1MTc1"), ("AoE+MDA/MzI=", "AoE%2BMDA%2FMzI%3D"),
+])
+def test_cursors_are_percent_encoded(cursor, encoded):
+    prepared = PreparedQuery({"q": "siren:0*"}, TYPES, base_url="http://api/siren")
+
+    assert prepared.url(curseur=cursor) == f"http://api/siren?q=siren:0*&curseur={encoded}"
+
+
+def test_special_characters_reach_the_api_unchanged(server, client):
+    q = "denominationUniteLegale:(A&B + C #1) AND siren:0*"
+    server.route("/siren", lambda _: (200, {"header": {"statut": 200, "message": "OK", "total": 1,
+                                                       "curseur": "AoE+/x=", "curseurSuivant": "AoE+/x="},
+                                            "unitesLegales": [unite_legale(siren_number(1))]}))
+
+    list(client.iter_bulk(data_type="siren", q=q, nombre=1))
+
+    hits = server.hits("/siren")
+    assert [hit.params["q"] for hit in hits] == [q, q]
+    assert [hit.params["curseur"] for hit in hits] == ["*", "AoE+/x="]
+
+
+def test_rebinding_leaves_the_other_parts_untouched():
+    validator = Validator()
+    prepared = PreparedQuery({"q": "periode(etatAdministratifUniteLegale:A)", "nombre": 1000}, TYPES,
+                             validators={"q": validator}, base_url="http://api/siren")
+    query_string = prepared.query_string()
+
+    urls = [prepared.url(curseur=cursor) for cursor in ("*", "AoE+a/b", "AoE+c/d")]
+
+    assert urls[1] == f"http://api/siren?{query_string}&curseur=AoE%2Ba%2Fb"
+    assert prepared.query_string() == query_string
+    assert prepared.values == {"q": "periode(etatAdministratifUniteLegale:A)", "nombre": 1000}
+    # q was validated once, when the query was prepared
+    assert validator.values == ["periode(etatAdministratifUniteLegale:A)"]
+
+
+def test_rebound_values_are_validated_unless_trusted():
+    validator = Validator()
+    prepared = PreparedQuery({"nombre": 2}, TYPES, validators={"q": validator})
+
+    with pytest.raises(ValueError, match="Unexpected key"):
+        prepared.url(debut=0)
+    with pytest.raises(TypeError):
+        prepared.url(nombre="2")
+    with pytest.raises(ValueError, match="Invalid q query"):
+        prepared.params(q="siren:(")
+    assert validator.values == ["siren:("]
+
+    trusted = PreparedQuery({"nombre": 2}, TYPES, validators={"q": validator}, trusted=("q",))
+    assert trusted.params(q="siren:(000000001 OR 000000002)")["q"] == "siren:(000000001 OR 000000002)"
+    assert validator.values == ["siren:("]
+
+
+def test_get_many_does_not_validate_the_batch_queries(server, client, monkeypatch):
+    ids = [siren_number(n) for n in range(1, 8)]
+    server.route("/siren", lambda _: (404, {"header": {"statut": 404, "message": "Aucun élément trouvé"}}))
+    validated = []
+    validate = PreparedQuery._validate
+
+    def spy(self, key: str, value: object) -> None:
+        validated.append(key)
+        validate(self, key, value)
+
+    monkeypatch.setattr(PreparedQuery, "_validate", spy)
+
+    assert client.get_many(data_type="siren", ids=ids, batch_size=3, champs="siren") == ([], ids)
+    assert [hit.params["q"] for hit in server.hits("/siren")] == [
+        f"siren:({' OR '.join(ids[:3])})", f"siren:({' OR '.join(ids[3:6])})", f"siren:({ids[6]})"]
+    # The common parameters once, then the page size of each batch
+    assert validated == ["champs", "nombre", "nombre", "nombre"]
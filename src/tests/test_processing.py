@@ -0,0 +1,101 @@
+"""Flattening raw NDJSON segments into tables with `process_raw`."""
+from __future__ import annotations
+
+import csv
+
+import pytest
+
+from pyinsee.processing import flatten_record, iter_raw_files, process_raw
+from pyinsee.utils import get_save_dir
+from pyinsee.writer import SegmentWriter
+
+from .conftest import siren_number
+
+
+def unite_legale(number: int) -> dict:
+    """A record with `number % 3 + 1` periods, the current one first."""
+    return {
+        "siren": siren_number(number),
+        "dateCreationUniteLegale": "2001-02-03",
+        "periodesUniteLegale": [{"dateFin": None if period == 0 else "2020-12-31",
+                                 "etatAdministratifUniteLegale": "A" if period == 0 else "C",
+                                 "denominationUniteLegale": f"SOCIETE {number} {period}"}
+                                for period in range(number % 3 + 1)],
+    }
+
+
+@pytest.fixture
+def raw_segments() -> list[dict]:
+    """Save 25 records as two NDJSON segments (one gzip compressed) in the raw directory."""
+    records = [unite_legale(number) for number in range(1, 26)]
+    raw_dir = get_save_dir(response_data_type="siren", response_type="json")
+    with SegmentWriter(raw_dir, prefix="siren_a", compression="gzip") as writer:
+        writer.write_many(records[:15])
+    with SegmentWriter(raw_dir, prefix="siren_b", compression="none") as writer:
+        writer.write_many(records[15:])
+    return records
+
+
+def read_table(table: str) -> tuple[list[str], list[dict]]:
+    """Read back the part files of a processed csv table."""
+    directory = get_save_dir(response_data_type="siren", response_type="csv", data_type="processed") / table
+    parts = sorted(path.name for path in directory.glob("*.csv"))
+    rows = []
+    for part in parts:
+        with (directory / part).open(newline="", encoding="utf-8") as f:
+            rows.extend(csv.DictReader(f))
+    return parts, rows
+
+
+def test_raw_segments_are_processed_in_parallel(raw_segments):
+    assert [path.name for path in iter_raw_files("siren")] == ["siren_a-00001.ndjson.gz", "siren_b-00001.ndjson"]
+
+    counts = process_raw("siren", workers=2, batch_size=4)
+
+    periods = sum(len(record["periodesUniteLegale"]) for record in raw_segments)
+    assert counts == {"unites_legales": 25, "periodes_unites_legales": periods}
+
+    parts, rows = read_table("unites_legales")
+    assert sorted(row["siren"] for row in rows) == [record["siren"] for record in raw_segments]
+    # The current period is merged into the row
+    assert {row["etatAdministratifUniteLegale"] for row in rows} == {"A"}
+    # 15 and 10 records in batches of 4 records
+    assert parts == [f"siren_a-00001.{part:05d}.csv" for part in range(1, 5)] + [
+        f"siren_b-00001.{part:05d}.csv" for part in range(1, 4)]
+
+    parts, rows = read_table("periodes_unites_legales")
+    assert len(rows) == periods
+    assert len(parts) == 7
+
+
+def test_batch_size_bounds_the_part_files(raw_segments):
+    process_raw("siren", workers=2, batch_size=6)
+
+    directory = get_save_dir(response_data_type="siren", response_type="csv", data_type="processed")
+    for path in (directory / "unites_legales").glob("*.csv"):
+        with path.open(newline="", encoding="utf-8") as f:
+            assert 1 <= len(list(csv.DictReader(f))) <= 6
+
+
+def test_processing_again_replaces_the_parts(raw_segments):
+    process_raw("siren", workers=1, batch_size=2)
+    counts = process_raw("siren", workers=2, batch_size=10)
+
+    parts, rows = read_table("unites_legales")
+    assert counts["unites_legales"] == len(rows) == 25
+    assert len(parts) == 3
+
+
+def test_flatten_record_keeps_the_current_period():
+    row = flatten_record("siren", unite_legale(2))
+
+    assert row["siren"] == siren_number(2)
+    assert row["denominationUniteLegale"] == "SOCIETE 2 0"
+    assert "periodesUniteLegale" not in row
+
+
+def test_invalid_settings_are_rejected():
+    with pytest.raises(ValueError, match="batch_size"):
+        process_raw("siren", batch_size=0)
+    with pytest.raises(ValueError, match="output format"):
+        process_raw("siren", output_format="xlsx")
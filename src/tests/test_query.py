@@ -0,0 +1,97 @@
+"""Parsing and local evaluation of `q` queries."""
+from __future__ import annotations
+
+import pytest
+
+from pyinsee.query import (
+    And,
+    Exists,
+    Fuzzy,
+    MatchAll,
+    Not,
+    Or,
+    Periode,
+    Range,
+    Term,
+    Wildcard,
+    parse_query,
+)
+
+RECORD = {
+    "siren": "552100554",
+    "categorieEntreprise": "PME",
+    "trancheEffectifsUniteLegale": 12,
+    "nomUsageUniteLegale": None,
+    "periodesUniteLegale": [
+        {"dateFin": None, "etatAdministratifUniteLegale": "A", "denominationUniteLegale": "ACME SERVICES",
+         "activitePrincipaleUniteLegale": "56.10A"},
+        {"dateFin": "2019-12-31", "etatAdministratifUniteLegale": "C", "denominationUniteLegale": "ACME",
+         "activitePrincipaleUniteLegale": "62.01Z"},
+    ],
+}
+
+
+@pytest.mark.parametrize(("text", "tree"), [
+    ("siren:552100554", Term("siren", "552100554")),
+    ('denominationUniteLegale:"ACME SERVICES"', Term("denominationUniteLegale", "ACME SERVICES")),
+    ("codePostalEtablissement:75*", Wildcard("codePostalEtablissement", "75*")),
+    ("denominationUniteLegale:ACMF~1", Fuzzy("denominationUniteLegale", "ACMF", 1)),
+    ("denominationUniteLegale:ACMF~", Fuzzy("denominationUniteLegale", "ACMF", 2)),
+    ("dateCreationUniteLegale:[2020-01-01 TO *]", Range("dateCreationUniteLegale", "2020-01-01", None)),
+    ("trancheEffectifsUniteLegale:{10 TO 50]", Range("trancheEffectifsUniteLegale", "10", "50", False, True)),
+    ("codeCommuneEtablissement:(75101 OR 75102)",
+     Or([Term("codeCommuneEtablissement", "75101"), Term("codeCommuneEtablissement", "75102")])),
+    ("nomUsageUniteLegale:*", Exists("nomUsageUniteLegale")),
+    ("*:*", MatchAll()),
+    ("a:1 AND b:2 OR c:3", Or([And([Term("a", "1"), Term("b", "2")]), Term("c", "3")])),
+    ("a:1 b:2", Or([Term("a", "1"), Term("b", "2")])),
+    ("NOT a:1 AND -b:2", And([Not(Term("a", "1")), Not(Term("b", "2"))])),
+    ("a:1 && (b:2 || c:3)", And([Term("a", "1"), Or([Term("b", "2"), Term("c", "3")])])),
+    ("periode(etat:A AND activite:56.10A)", Periode(And([Term("etat", "A"), Term("activite", "56.10A")]))),
+    (r"denominationUniteLegale:A\:B\*", Term("denominationUniteLegale", "A:B*")),
+])
+def test_queries_compile_to_trees(text, tree):
+    assert parse_query(text).root == tree
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "siren",
+    "siren:",
+    "siren:(1 OR 2",
+    "a:1)",
+    "a:[1 TO]",
+    "a:[1 2]",
+    "a:(b:1)",
+    "x:1 AND",
+    "foo:*:1",
+])
+def test_malformed_queries_are_rejected(text):
+    with pytest.raises(ValueError, match="Invalid q query"):
+        parse_query(text)
+
+
+@pytest.mark.parametrize(("text", "expected"), [
+    ("siren:552100554", True),
+    ("denominationUniteLegale:services", True),
+    ('denominationUniteLegale:"acme services"', True),
+    ("denominationUniteLegale:ACMF~1", True),
+    ("activitePrincipaleUniteLegale:56*", True),
+    ("activitePrincipaleUniteLegale:62*", False),
+    ("trancheEffectifsUniteLegale:[10 TO 50]", True),
+    ("trancheEffectifsUniteLegale:{12 TO 50]", False),
+    ("nomUsageUniteLegale:*", False),
+    ("categorieEntreprise:(ETI OR PME)", True),
+    ("-categorieEntreprise:PME", False),
+    # Outside periode(...), period fields are matched against the current period
+    ("etatAdministratifUniteLegale:C", False),
+    ("periode(etatAdministratifUniteLegale:C)", True),
+    ("periode(etatAdministratifUniteLegale:C AND activitePrincipaleUniteLegale:56.10A)", False),
+])
+def test_queries_match_records_locally(text, expected):
+    assert parse_query(text).matches(RECORD) is expected
+
+
+def test_fields_of_a_query():
+    query = parse_query("periode(etatAdministratifUniteLegale:A) AND NOT (siren:1 OR codePostal:[1 TO 2])")
+    assert query.fields() == {"etatAdministratifUniteLegale", "siren", "codePostal"}
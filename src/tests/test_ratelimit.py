@@ -0,0 +1,104 @@
+"""The token-bucket rate limiter and `Retry-After` handling."""
+from __future__ import annotations
+
+import email.utils
+import time
+
+import pytest
+
+from pyinsee.ratelimit import RateLimiter, parse_retry_after
+from pyinsee.retry import RetryPolicy
+from pyinsee.transport import Transport
+
+
+@pytest.mark.parametrize(("value", "expected"), [
+    (None, None), ("", None), ("2", 2.0), ("0.5", 0.5), ("-3", 0.0), ("soon", None),
+])
+def test_parse_retry_after_seconds(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    value = email.utils.formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= parse_retry_after(value) <= 30
+
+
+def test_the_bucket_allows_a_burst_then_the_rate():
+    limiter = RateLimiter(requests_per_minute=600, burst=3)
+
+    assert [limiter.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # 10 requests per second: the next token comes within 0.1 second
+    assert 0 < limiter.try_acquire() <= 0.1
+
+
+def test_a_disabled_limiter_never_waits():
+    limiter = RateLimiter(requests_per_minute=0)
+
+    assert all(limiter.try_acquire() == 0 for _ in range(100))
+    assert limiter.pause(10) == 0.0
+
+
+def test_a_pause_holds_every_request():
+    limiter = RateLimiter(requests_per_minute=6000, burst=10)
+    limiter.pause(0.2)
+
+    assert 0.1 < limiter.try_acquire() <= 0.2
+    time.sleep(0.2)
+    assert limiter.try_acquire() == 0.0
+
+
+def test_the_bucket_is_shared_through_its_state_file(tmp_path):
+    state_path = tmp_path / "ratelimit.json"
+    first = RateLimiter(requests_per_minute=60, burst=2, state_path=state_path)
+    second = RateLimiter(requests_per_minute=60, burst=2, state_path=state_path)
+
+    assert first.try_acquire() == 0.0
+    assert second.try_acquire() == 0.0
+    assert first.try_acquire() > 0
+    second.pause(30)
+    assert first.try_acquire() > 29
+
+
+def test_requests_wait_for_the_limiter(server, metrics):
+    throttles = []
+    metrics.add_hook("throttle", lambda _, fields: throttles.append(fields))
+    transport = Transport(rate_limiter=RateLimiter(requests_per_minute=600, burst=1), metrics=metrics)
+    server.route("/ping", lambda _: (200, {"ok": True}))
+
+    start = time.monotonic()
+    with transport:
+        for _ in range(3):
+            transport.get(f"{server.url}/ping")
+
+    assert time.monotonic() - start >= 0.18
+    assert [throttle["reason"] for throttle in throttles] == ["limiter", "limiter"]
+
+
+def test_throttled_requests_wait_for_retry_after(server, transport, metrics):
+    retries = []
+    metrics.add_hook("retry", lambda _, fields: retries.append(fields))
+    server.add("/ping", 429, headers={"Retry-After": "0.2"})
+    server.add("/ping", 200, {"ok": True})
+
+    start = time.monotonic()
+    response = transport.get(f"{server.url}/ping")
+
+    assert response.status_code == 200
+    assert time.monotonic() - start >= 0.2
+    assert [(retry["error_class"], retry["delay"]) for retry in retries] == [("throttle", 0.2)]
+
+
+def test_throttled_requests_pause_the_rate_limiter(server, metrics):
+    limiter = RateLimiter(requests_per_minute=6000, burst=10)
+    transport = Transport(rate_limiter=limiter, retry_policy=RetryPolicy(backoff_base=0.001, jitter=False),
+                          metrics=metrics)
+    server.add("/ping", 429, headers={"Retry-After": "0.2"})
+    server.add("/ping", 200, {"ok": True})
+
+    start = time.monotonic()
+    with transport:
+        assert transport.get(f"{server.url}/ping").status_code == 200
+    assert time.monotonic() - start >= 0.2
+    # The pause also holds the requests that follow
+    limiter.pause(0.2)
+    assert limiter.try_acquire() > 0
@@ -0,0 +1,113 @@
+"""Compact record types: lazy sections, interning, mapping behaviour and their memory."""
+from __future__ import annotations
+
+import json
+import pickle
+
+import pytest
+
+from pyinsee.benchmark import measure_record_memory
+from pyinsee.records import Adresse, Etablissement, Periode, UniteLegale, to_records
+
+UNITE_LEGALE = {
+    "siren": "552100554",
+    "dateCreationUniteLegale": "1955-01-01",
+    "nombrePeriodesUniteLegale": 2,
+    "periodesUniteLegale": [
+        {"dateFin": None, "etatAdministratifUniteLegale": "A", "categorieJuridiqueUniteLegale": "5710",
+         "denominationUniteLegale": "ACME"},
+        {"dateFin": "2008-12-31", "etatAdministratifUniteLegale": "A", "categorieJuridiqueUniteLegale": "5499",
+         "denominationUniteLegale": "ACME SA"},
+    ],
+}
+ETABLISSEMENT = {
+    "siret": "55210055400013",
+    "uniteLegale": {"denominationUniteLegale": "ACME", "categorieJuridiqueUniteLegale": "5710"},
+    "adresseEtablissement": {"codePostalEtablissement": "75008", "libelleCommuneEtablissement": "PARIS"},
+    "adresse2Etablissement": {"codePostalEtablissement": None},
+    "periodesEtablissement": [{"dateFin": None, "activitePrincipaleEtablissement": "62.01Z"}],
+}
+
+
+def decoded(record: dict) -> dict:
+    """A fresh copy of a record, as decoded from a response."""
+    return json.loads(json.dumps(record))
+
+
+def test_nested_sections_are_decoded_on_first_access():
+    unite_legale = UniteLegale(decoded(UNITE_LEGALE))
+    position = list(UNITE_LEGALE).index("periodesUniteLegale")
+    # Still compact: (schema, values) pairs, not Periode objects
+    assert not any(isinstance(item, Periode) for item in unite_legale._values[position])
+
+    periodes = unite_legale.periodes
+
+    assert [type(periode) for periode in periodes] == [Periode, Periode]
+    assert periodes[0].denominationUniteLegale == "ACME"
+    # The decoded sections are kept
+    assert unite_legale._values[position] is periodes
+    assert unite_legale.periodes is periodes
+
+
+def test_sections_of_an_etablissement_have_their_own_types():
+    etablissement = Etablissement(decoded(ETABLISSEMENT))
+
+    assert isinstance(etablissement.uniteLegale, UniteLegale)
+    assert isinstance(etablissement.adresseEtablissement, Adresse)
+    assert isinstance(etablissement["adresse2Etablissement"], Adresse)
+    assert etablissement.adresseEtablissement.libelleCommuneEtablissement == "PARIS"
+    assert etablissement.periodes[0].activitePrincipaleEtablissement == "62.01Z"
+
+
+def test_codes_are_interned_and_field_names_shared():
+    first, second = to_records("siren", [decoded(UNITE_LEGALE), decoded(UNITE_LEGALE)])
+
+    assert first.periodes[0].categorieJuridiqueUniteLegale is second.periodes[0].categorieJuridiqueUniteLegale
+    assert first.periodes[0].etatAdministratifUniteLegale is second.periodes[1].etatAdministratifUniteLegale
+    # Free text is not interned
+    assert first.periodes[0].denominationUniteLegale is not second.periodes[0].denominationUniteLegale
+    assert first._schema is second._schema
+    assert first.periodes[0]._schema is second.periodes[1]._schema
+
+
+def test_records_are_read_only_mappings():
+    unite_legale = UniteLegale(decoded(UNITE_LEGALE))
+
+    assert unite_legale["siren"] == unite_legale.siren == "552100554"
+    assert list(unite_legale) == list(UNITE_LEGALE)
+    assert len(unite_legale) == len(UNITE_LEGALE)
+    assert "siren" in unite_legale
+    assert "siret" not in unite_legale
+    assert unite_legale.get("siret") is None
+    with pytest.raises(KeyError):
+        unite_legale["siret"]
+    with pytest.raises(AttributeError, match="no field 'siret'"):
+        _ = unite_legale.siret
+    with pytest.raises(TypeError):
+        unite_legale["siren"] = "000000000"
+    with pytest.raises(AttributeError):
+        unite_legale.siren = "000000000"
+    with pytest.raises(TypeError):
+        hash(unite_legale)
+
+
+def test_to_dict_gives_back_the_api_structure():
+    unite_legale = UniteLegale(decoded(UNITE_LEGALE))
+    etablissement = Etablissement(decoded(ETABLISSEMENT))
+
+    assert unite_legale.to_dict() == UNITE_LEGALE
+    # Whether the sections were decoded or not
+    _ = unite_legale.periodes, etablissement.uniteLegale
+    assert unite_legale.to_dict() == UNITE_LEGALE
+    assert etablissement.to_dict() == ETABLISSEMENT
+    assert unite_legale == UNITE_LEGALE
+    assert unite_legale == UniteLegale(decoded(UNITE_LEGALE))
+    assert pickle.loads(pickle.dumps(etablissement)) == etablissement
+
+
+def test_compact_records_take_less_memory():
+    result = measure_record_memory(count=2000, periods=3)
+
+    assert result["bytes_per_record"]["records"] < result["bytes_per_record"]["dicts"]
+    # About -45% on such pages
+    assert result["reduction"] > 0.35
@@ -0,0 +1,123 @@
+"""The retry policy, and the retries, backoff and typed errors of the sync transport."""
+from __future__ import annotations
+
+import socket
+import time
+
+import pytest
+
+from pyinsee.exceptions import (
+    InseeConnectionError,
+    InseeRateLimitError,
+    InseeServerError,
+    InseeTimeoutError,
+)
+from pyinsee.ratelimit import RateLimiter
+from pyinsee.retry import RetryPolicy
+from pyinsee.transport import Transport
+
+
+def events(metrics, event: str) -> list[dict]:
+    """Record the events of one kind reported to the metrics."""
+    recorded = []
+    metrics.add_hook(event, lambda _, fields: recorded.append(fields))
+    return recorded
+
+def test_the_attempt_budget_is_per_error_class():
+    policy = RetryPolicy(max_attempts={"throttle": 5, "server": 3}, backoff_base=1, jitter=False, deadline=100)
+
+    assert policy.max_attempts["throttle"] == 5
+    assert policy.next_delay("throttle", class_attempts=4, attempt=4, elapsed=0) == 8
+    assert policy.next_delay("throttle", class_attempts=5, attempt=5, elapsed=0) is None
+    assert policy.next_delay("server", class_attempts=3, attempt=3, elapsed=0) is None
+    assert policy.next_delay(None, class_attempts=0, attempt=1, elapsed=0) is None
+
+
+def test_backoff_is_capped_and_jittered():
+    policy = RetryPolicy(backoff_base=1, backoff_max=5, jitter=False)
+    assert [policy.backoff(attempt) for attempt in range(1, 6)] == [1, 2, 4, 5, 5]
+
+    jittered = RetryPolicy(backoff_base=1, backoff_max=5)
+    assert all(0 <= jittered.backoff(4) <= 5 for _ in range(50))
+
+
+def test_retry_after_and_the_deadline():
+    policy = RetryPolicy(backoff_base=1, jitter=False, deadline=10)
+
+    assert policy.next_delay("throttle", class_attempts=1, attempt=1, elapsed=0, retry_after=7) == 7
+    # Retry-After only applies to throttling
+    assert policy.next_delay("server", class_attempts=1, attempt=1, elapsed=0, retry_after=7) == 1
+    assert policy.next_delay("throttle", class_attempts=1, attempt=1, elapsed=4, retry_after=7) is None
+
+
+@pytest.mark.parametrize("max_attempts", [0, {"throttle": 0}, {"unknown": 2}])
+def test_invalid_attempt_budgets_are_rejected(max_attempts):
+    with pytest.raises(ValueError, match="max_attempts|Unknown error classes"):
+        RetryPolicy(max_attempts=max_attempts)
+
+
+@pytest.mark.parametrize(("status", "error_class"), [(429, "throttle"), (503, "server"), (501, None), (404, None)])
+def test_statuses_are_classified(status, error_class):
+    assert RetryPolicy().classify_status(status) == error_class
+
+
+def test_server_errors_are_retried_with_backoff(server, transport, metrics):
+    retries = events(metrics, "retry")
+    server.add("/ping", 503)
+    server.add("/ping", 502)
+    server.add("/ping", 200, {"ok": True})
+
+    response = transport.get(f"{server.url}/ping")
+
+    assert response.status_code == 200
+    assert response.json() == {"ok": True}
+    assert len(server.hits("/ping")) == 3
+    # Exponential backoff without jitter: base, then twice the base
+    assert [(retry["status"], retry["error_class"]) for retry in retries] == [(503, "server"), (502, "server")]
+    assert [retry["delay"] for retry in retries] == pytest.approx([0.001, 0.002])
+
+
+def test_client_errors_are_not_retried(server, transport):
+    server.add("/ping", 400, {"header": {"statut": 400, "message": "Erreur de syntaxe"}})
+
+    assert transport.get(f"{server.url}/ping").status_code == 400
+    assert len(server.hits("/ping")) == 1
+
+
+@pytest.mark.parametrize(("status", "error_type"), [(503, InseeServerError), (429, InseeRateLimitError)])
+def test_typed_error_once_the_retries_run_out(server, transport, status, error_type):
+    server.route("/ping", lambda _: (status, {}, {"Retry-After": "0"}))
+
+    with pytest.raises(error_type) as excinfo:
+        transport.get(f"{server.url}/ping")
+
+    assert excinfo.value.attempts == 3
+    assert excinfo.value.status_code == status
+    assert len(server.hits("/ping")) == 3
+
+
+def test_connection_errors_raise_insee_connection_error(transport):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    # Nothing listens on the port any more
+
+    with pytest.raises(InseeConnectionError) as excinfo:
+        transport.get(f"http://127.0.0.1:{port}/ping")
+    assert excinfo.value.attempts == 3
+
+
+def test_timeouts_raise_insee_timeout_error(server, metrics):
+    transport = Transport(timeout=(1, 0.05), rate_limiter=RateLimiter(requests_per_minute=0),
+                          retry_policy=RetryPolicy(max_attempts=2, backoff_base=0.001, jitter=False),
+                          metrics=metrics)
+
+    def stall() -> bytes:
+        time.sleep(0.3)
+        return b"{}"
+
+    server.route("/slow", lambda _: (200, stall))
+
+    with transport, pytest.raises(InseeTimeoutError) as excinfo:
+        transport.get(f"{server.url}/slow")
+    assert excinfo.value.attempts == 2
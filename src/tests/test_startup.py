@@ -0,0 +1,49 @@
+"""Importing the client has no side effects: no files, no environment changes, no logging setup."""
+from __future__ import annotations
+
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1]
+
+SCRIPT = """
+import json, logging, os
+
+environ = dict(os.environ)
+root_handlers = list(logging.getLogger().handlers)
+
+import pyinsee.insee_client
+from pyinsee import config, logger
+
+print(json.dumps({
+    "environ": dict(os.environ) == environ,
+    "root_handlers": logging.getLogger().handlers == root_handlers,
+    "package_handlers": [type(handler).__name__ for handler in logger.logger.handlers],
+    "setup_done": logger._setup_done,
+    "settings_read": config._settings is not None,
+}))
+"""
+
+
+def test_importing_the_client_leaves_the_disk_environment_and_logging_alone(tmp_path):
+    home = tmp_path / "home"
+    home.mkdir()
+    env = {name: value for name, value in os.environ.items()
+           if not name.startswith(("INSEE_", "PYINSEE_", "DATA_", "LOG"))}
+    env.update(HOME=str(home), PYTHONPATH=str(SRC), PYTHONDONTWRITEBYTECODE="1", PYTHONNOUSERSITE="1")
+
+    completed = subprocess.run([sys.executable, "-c", SCRIPT], cwd=tmp_path, env=env,
+                               capture_output=True, text=True, check=True)
+
+    assert json.loads(completed.stdout) == {
+        "environ": True,
+        "root_handlers": True,
+        # Only the handler setting logging up on the first record
+        "package_handlers": ["_SetupOnFirstRecord"],
+        "setup_done": False,
+        "settings_read": False,
+    }
+    assert [path.name for path in tmp_path.rglob("*")] == ["home"]
@@ -0,0 +1,68 @@
+"""The local `RecordStore`."""
+from __future__ import annotations
+
+import pytest
+
+from pyinsee.store import RecordStore
+
+from .conftest import siren_number, unite_legale
+
+
+@pytest.fixture
+def store(tmp_path) -> RecordStore:
+    """A store of its own in the test directory."""
+    store = RecordStore(directory=tmp_path / "store")
+    yield store
+    store.close()
+
+
+def test_put_and_get(store):
+    record = unite_legale("552100554", categorieEntreprise="PME")
+    store.put("siren", record)
+
+    assert store.get("siren", "552100554") == record
+    assert store.get("siren", 552100554) == record
+    assert ("siren", "552100554") in store
+    assert store.get("siren", "000000001") is None
+    assert store.get("siren", "not a number") is None
+    assert store.get("siret", "552100554") is None
+
+
+def test_put_many_replaces_previous_copies(store):
+    records = [unite_legale(siren_number(n), version=1) for n in range(1, 101)]
+    assert store.put_many("siren", records, batch_size=30) == 100
+
+    store.put_many("siren", [unite_legale(siren_number(n), version=2) for n in range(1, 11)])
+
+    assert store.count("siren") == 100
+    assert store.get("siren", siren_number(5))["version"] == 2
+    assert store.get("siren", siren_number(50))["version"] == 1
+    assert sorted(record["siren"] for record in store.records("siren")) == [siren_number(n) for n in range(1, 101)]
+
+
+def test_records_survive_reopening_and_compaction(tmp_path):
+    store = RecordStore(directory=tmp_path / "store", journal_max_entries=0)
+    store.put_many("siren", [unite_legale(siren_number(n)) for n in range(1, 21)])
+    store.put("siren", unite_legale(siren_number(3), categorieEntreprise="ETI"))
+    store.close()
+
+    reopened = RecordStore(directory=tmp_path / "store")
+    assert reopened.count("siren") == 20
+    assert reopened.get("siren", siren_number(3))["categorieEntreprise"] == "ETI"
+    reopened.compact("siren")
+    assert reopened.get("siren", siren_number(3))["categorieEntreprise"] == "ETI"
+    assert reopened.get("siren", siren_number(20))["siren"] == siren_number(20)
+    reopened.close()
+
+
+def test_search_evaluates_queries_locally(store):
+    store.put_many("siren", [unite_legale(siren_number(n), categorieEntreprise="PME" if n % 2 else "GE")
+                             for n in range(1, 7)])
+
+    assert sorted(record["siren"] for record in store.search("siren", "categorieEntreprise:PME")) == [
+        siren_number(1), siren_number(3), siren_number(5)]
+
+
+def test_records_without_a_number_are_rejected(store):
+    with pytest.raises(ValueError, match="valid siren number"):
+        store.put("siren", {"denominationUniteLegale": "ACME"})
@@ -0,0 +1,168 @@
+"""Delta syncs: watermarks, idempotent and resumed runs, and change reports."""
+from __future__ import annotations
+
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from pyinsee import config
+from pyinsee.exceptions import InseeServerError
+from pyinsee.store import RecordStore
+from pyinsee.sync import DeltaSync
+from pyinsee.utils import get_save_dir
+
+from .conftest import cursor_search, siren_number, unite_legale
+
+FIELD = "dateDernierTraitementUniteLegale"
+SINCE = re.compile(rf"{FIELD}:\[(\S+) TO \*\]")
+
+
+class ChangedSince:
+    """Answer the delta searches over mutable records, two records per page.
+
+    `fail_after` makes the pages after that many records fail.
+    """
+
+    def __init__(self, records: list[dict]) -> None:
+        self.records = records
+        self.fail_after: int | None = None
+
+    def __call__(self, request: SimpleNamespace) -> tuple:
+        since = SINCE.fullmatch(request.params["q"]).group(1)
+        changed = sorted((record for record in self.records if record[FIELD] >= since),
+                         key=lambda record: record["siren"])
+        cursor = request.params["curseur"]
+        if self.fail_after is not None and cursor != "*" and int(cursor) >= self.fail_after:
+            return 503, {}
+        return cursor_search(changed)(SimpleNamespace(params={**request.params, "nombre": "2"}))
+
+
+@pytest.fixture
+def records() -> list[dict]:
+    """Five records processed on May 1st and 2nd."""
+    return [unite_legale(siren_number(n), **{FIELD: f"2024-05-0{1 + n % 2}T0{n}:00:00"}) for n in range(1, 6)]
+
+
+@pytest.fixture
+def api(server, records) -> ChangedSince:
+    """The stand-in's search endpoint, serving the records."""
+    search = ChangedSince(records)
+    server.route("/siren", search)
+    return search
+
+
+@pytest.fixture
+def store(tmp_path) -> RecordStore:
+    """A store of its own in the test directory."""
+    store = RecordStore(directory=tmp_path / "store")
+    yield store
+    store.close()
+
+
+def cursors(server) -> list[str]:
+    """The cursors of the searches received, in order."""
+    return [hit.params["curseur"] for hit in server.hits("/siren")]
+
+
+def test_the_first_run_needs_a_starting_point(client, store):
+    with pytest.raises(ValueError, match="pass `since`"):
+        DeltaSync(client, store=store).run("siren")
+
+
+def test_a_run_upserts_the_records_and_reports_the_changes(server, client, store, api, records):
+    sync = DeltaSync(client, store=store)
+
+    report = sync.run("siren", since="2024-05-01")
+
+    assert (report["records"], report["new"], report["updated"], report["unchanged"]) == (5, 5, 0, 0)
+    assert report["since"] == "2024-05-01"
+    assert report["watermark"] == sync.watermark("siren") == "2024-05-02T05:00:00"
+    assert report["resumed"] is False
+    assert [store.get("siren", record["siren"]) for record in records] == records
+    assert cursors(server) == ["*", "2", "4", "5"]
+    assert sync.reports("siren") == [report]
+
+
+def test_a_second_run_is_idempotent(server, client, store, api):
+    sync = DeltaSync(client, store=store)
+    sync.run("siren", since="2024-05-01")
+
+    report = sync.run("siren")
+
+    # The bound is inclusive: the record processed at the watermark comes again, unchanged
+    assert report["since"] == "2024-05-02T05:00:00"
+    assert (report["records"], report["new"], report["updated"], report["unchanged"]) == (1, 0, 0, 1)
+    assert report["watermark"] == "2024-05-02T05:00:00"
+    assert len(sync.reports("siren")) == 2
+
+
+def test_updated_records_and_fields_are_reported(client, store, api, records):
+    sync = DeltaSync(client, store=store)
+    sync.run("siren", since="2024-05-01")
+    records[0].update({FIELD: "2024-05-03T08:00:00", "categorieEntreprise": "PME"})
+    records[0]["periodesUniteLegale"][0]["etatAdministratifUniteLegale"] = "C"
+    records.append(unite_legale(siren_number(9), **{FIELD: "2024-05-03T09:00:00"}))
+
+    report = sync.run("siren")
+
+    assert (report["new"], report["updated"], report["unchanged"]) == (1, 1, 1)
+    assert report["changed_fields"] == {FIELD: 1, "categorieEntreprise": 1, "etatAdministratifUniteLegale": 1}
+    assert report["watermark"] == "2024-05-03T09:00:00"
+    assert store.get("siren", records[0]["siren"])["categorieEntreprise"] == "PME"
+
+
+def test_an_interrupted_run_keeps_the_watermark_and_resumes(server, client, store, api, records):
+    sync = DeltaSync(client, store=store)
+    api.fail_after = 4
+
+    with pytest.raises(InseeServerError):
+        sync.run("siren", since="2024-05-01")
+
+    # The watermark only moves once the whole run is durable
+    assert sync.watermark("siren") is None
+    assert sync.reports("siren") == []
+    assert [record["siren"] for record in records if store.get("siren", record["siren"])] == [
+        record["siren"] for record in records[:4]]
+
+    api.fail_after = None
+    report = sync.run("siren", since="2024-05-01")
+
+    assert report["resumed"] is True
+    # The pages read before the interruption are not asked for again
+    assert cursors(server)[-2:] == ["4", "5"]
+    assert report["records"] == 1
+    assert sync.watermark("siren") == "2024-05-02T05:00:00"
+
+
+def test_saved_runs_move_the_watermark_once_the_segments_are_durable(client, store, api, settings, monkeypatch):
+    # One segment per page, so that the pages of the interrupted run are durable
+    monkeypatch.setattr(config, "_settings", settings.replace(insee_segment_max_records=2))
+    sync = DeltaSync(client, store=store, save=True, compression="none")
+    raw_dir = get_save_dir(response_data_type="siren")
+    api.fail_after = 4
+
+    with pytest.raises(InseeServerError):
+        sync.run("siren", since="2024-05-01")
+    assert sync.watermark("siren") is None
+
+    durable = []
+    set_watermark = DeltaSync._set_watermark
+
+    def check_durable(self, data_type: str, watermark: str) -> None:
+        (manifest,) = raw_dir.glob("siren_delta_*.manifest.json")
+        durable.append(json.loads(manifest.read_text())["complete"])
+        set_watermark(self, data_type, watermark)
+
+    monkeypatch.setattr(DeltaSync, "_set_watermark", check_durable)
+    api.fail_after = None
+    report = sync.run("siren", since="2024-05-01")
+
+    assert durable == [True]
+    assert report["resumed"] is True
+    # The resumed run appends to the segments of the interrupted one
+    (manifest,) = raw_dir.glob("siren_delta_*.manifest.json")
+    written = json.loads(manifest.read_text())
+    assert [segment["name"] for segment in written["segments"]] == report["segments"]
+    assert [segment["records"] for segment in written["segments"]] == [2, 2, 1]
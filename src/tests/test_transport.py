@@ -0,0 +1,39 @@
+"""Connection pooling of the transport and its reuse statistics."""
+from __future__ import annotations
+
+from pyinsee.ratelimit import RateLimiter
+from pyinsee.transport import Transport
+
+
+def test_keep_alive_connections_are_reused(server, transport):
+    for _ in range(5):
+        server.add("/ping", 200, {"ok": True})
+        assert transport.get(f"{server.url}/ping").json() == {"ok": True}
+
+    assert transport.stats() == {"requests": 5, "pool_requests": 5, "connections": 1, "reused": 4}
+
+
+def test_counts_survive_evicted_pools(server, metrics):
+    # One pool is cached: alternating between two hosts drops the other host's pool
+    transport = Transport(pool_connections=1, rate_limiter=RateLimiter(requests_per_minute=0), metrics=metrics)
+    port = server.url.rsplit(":", 1)[1]
+    server.route("/ping", lambda _: (200, {"ok": True}))
+
+    with transport:
+        for host in ("127.0.0.1", "localhost", "127.0.0.1", "localhost"):
+            assert transport.get(f"http://{host}:{port}/ping").status_code == 200
+
+        assert transport.stats() == {"requests": 4, "pool_requests": 4, "connections": 4, "reused": 0}
+
+
+def test_client_requests_share_the_transport(server, client, transport):
+    siren = "000325175"
+    server.route(f"/siren/{siren}", lambda _: (200, {"header": {"statut": 200, "message": "OK"},
+                                                     "uniteLegale": {"siren": siren}}))
+
+    for _ in range(3):
+        assert client.get_by_number(data_type="siren", id_code=siren)[0]["siren"] == siren
+
+    stats = transport.stats()
+    # The token request goes over the same connection
+    assert (stats["requests"], stats["pool_requests"], stats["connections"]) == (4, 4, 1)
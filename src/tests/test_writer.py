@@ -0,0 +1,140 @@
+"""Segment files, manifests and resumed writes of `SegmentWriter`."""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+
+import pytest
+
+from pyinsee.writer import SegmentWriter
+
+RECORDS = [{"siren": f"{n:09d}", "denominationUniteLegale": f"Société {n}"} for n in range(10)]
+
+
+@pytest.fixture
+def directory(tmp_path):
+    """An empty output directory."""
+    return tmp_path / "segments"
+
+
+def manifest(directory, prefix: str = "siren") -> dict:
+    """Read the manifest of a prefix."""
+    return json.loads((directory / f"{prefix}.manifest.json").read_text())
+
+
+def read_segments(directory, prefix: str = "siren") -> list[dict]:
+    """Read back the records of the segments listed in a manifest, in order."""
+    records = []
+    for segment in manifest(directory, prefix)["segments"]:
+        data = (directory / segment["name"]).read_bytes()
+        if segment["name"].endswith(".gz"):
+            data = gzip.decompress(data)
+        records.extend(json.loads(line) for line in data.splitlines())
+    return records
+
+
+def assert_segments_match(directory, prefix: str = "siren") -> None:
+    """Check the records, sizes and checksums of the manifest against the files."""
+    for segment in manifest(directory, prefix)["segments"]:
+        data = (directory / segment["name"]).read_bytes()
+        assert segment["bytes"] == len(data)
+        assert segment["sha256"] == hashlib.sha256(data).hexdigest()
+        if segment["name"].endswith(".gz"):
+            data = gzip.decompress(data)
+        assert segment["records"] == len(data.splitlines())
+
+
+@pytest.mark.parametrize("compression", ["none", "gzip"])
+def test_records_are_written_to_rolling_segments(directory, compression):
+    with SegmentWriter(directory, prefix="siren", compression=compression, max_records=4) as writer:
+        writer.write_many(RECORDS[:3])
+        writer.write_many(RECORDS[3:6])
+        writer.write_many(RECORDS[6:])
+
+    written = manifest(directory)
+    suffix = {"none": "", "gzip": ".gz"}[compression]
+    # Segments are cut between two batches, once they hold at least 4 records
+    assert [segment["name"] for segment in written["segments"]] == [
+        f"siren-00001.ndjson{suffix}", f"siren-00002.ndjson{suffix}"]
+    assert [segment["records"] for segment in written["segments"]] == [6, 4]
+    assert (written["complete"], written["records"], written["compression"]) == (True, 10, compression)
+    assert read_segments(directory) == RECORDS
+    assert_segments_match(directory)
+    # Every file of the prefix is listed in the manifest, and no temporary file is left
+    assert sorted(path.name for path in directory.iterdir()) == sorted(
+        [segment["name"] for segment in written["segments"]] + ["siren.manifest.json"])
+
+
+def test_segments_are_capped_by_size(directory):
+    with SegmentWriter(directory, prefix="siren", compression="none", max_bytes=100, max_records=0) as writer:
+        for record in RECORDS:
+            writer.write(record)
+
+    segments = manifest(directory)["segments"]
+    assert len(segments) > 1
+    assert all(segment["bytes"] >= 100 for segment in segments[:-1])
+    assert read_segments(directory) == RECORDS
+
+
+def test_abort_drops_the_open_segment(directory):
+    writer = SegmentWriter(directory, prefix="siren", compression="gzip", max_records=4)
+    writer.write_many(RECORDS[:4])
+    writer.write_many(RECORDS[4:6])
+    writer.abort()
+
+    written = manifest(directory)
+    assert written["complete"] is False
+    assert [segment["records"] for segment in written["segments"]] == [4]
+    assert sorted(path.name for path in directory.iterdir()) == ["siren-00001.ndjson.gz", "siren.manifest.json"]
+    with pytest.raises(ValueError, match="closed"):
+        writer.write(RECORDS[6])
+
+
+def test_a_failing_block_aborts_the_writer(directory):
+    with pytest.raises(RuntimeError), SegmentWriter(directory, prefix="siren", compression="none") as writer:
+        writer.write_many(RECORDS)
+        raise RuntimeError
+
+    assert not (directory / "siren.manifest.json").exists()
+    assert list(directory.iterdir()) == []
+
+
+def test_resume_continues_the_listed_segments(directory):
+    writer = SegmentWriter(directory, prefix="siren", compression="gzip", max_records=3)
+    writer.write_many(RECORDS[:3])
+    writer.write_many(RECORDS[3:5])
+    writer.abort()
+
+    with SegmentWriter(directory, prefix="siren", compression="gzip", max_records=3, resume=True) as writer:
+        writer.write_many(RECORDS[3:6])
+        writer.write_many(RECORDS[6:])
+
+    written = manifest(directory)
+    assert [segment["name"] for segment in written["segments"]] == [
+        "siren-00001.ndjson.gz", "siren-00002.ndjson.gz", "siren-00003.ndjson.gz"]
+    assert (written["complete"], written["records"]) == (True, 10)
+    assert read_segments(directory) == RECORDS
+    assert_segments_match(directory)
+
+
+def test_an_existing_prefix_is_not_overwritten(directory):
+    with SegmentWriter(directory, prefix="siren", compression="none") as writer:
+        writer.write_many(RECORDS)
+
+    with pytest.raises(FileExistsError):
+        SegmentWriter(directory, prefix="siren", compression="none")
+    with pytest.raises(ValueError, match="Cannot resume"):
+        SegmentWriter(directory, prefix="siren", compression="gzip", resume=True)
+    # Another prefix in the same directory is fine
+    SegmentWriter(directory, prefix="siret", compression="none").close()
+
+
+def test_zstd_segments(directory):
+    zstandard = pytest.importorskip("zstandard")
+    with SegmentWriter(directory, prefix="siren", compression="zstd") as writer:
+        writer.write_many(RECORDS)
+
+    (segment,) = manifest(directory)["segments"]
+    data = zstandard.ZstdDecompressor().stream_reader((directory / segment["name"]).read_bytes()).read()
+    assert [json.loads(line) for line in data.splitlines()] == RECORDS